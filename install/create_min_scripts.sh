@@ -22,6 +22,11 @@ if [ "$RAPD_HOME" != "" ]; then
   echo "$SAFE_PREFIX\/bin\/rapd.python $SAFE_PREFIX\/src\/utils\/overwatch.py --managed_file $SAFE_PREFIX\/src\/launch\/rapd_launcher.py \"\$@\"" >>$RAPD_HOME/bin/rapd.launcher
   chmod +x $RAPD_HOME/bin/rapd.launcher
 
+  # Cluster submission service
+  echo "#! /bin/bash" > $RAPD_HOME/bin/rapd.drmaa_service
+  echo "$SAFE_PREFIX\/bin\/rapd.python $SAFE_PREFIX\/src\/sites\/cluster\/drmaa_service.py \"\$@\"" >>$RAPD_HOME/bin/rapd.drmaa_service
+  chmod +x $RAPD_HOME/bin/rapd.drmaa_service
+
   # Launch process
   echo "#! /bin/bash" > $RAPD_HOME/bin/rapd.launch
   echo "$SAFE_PREFIX\/bin\/rapd.python $SAFE_PREFIX\/src\/launch\/rapd_launch.py \"\$@\"" >>$RAPD_HOME/bin/rapd.launch
@@ -0,0 +1,253 @@
+"""
+Staged, multithreaded handling of new images for the control process
+"""
+
+__license__ = """
+This file is part of RAPD
+
+Copyright (C) 2018, Cornell University
+All rights reserved.
+
+RAPD is free software: you can redistribute it and/or modify
+it under the terms of the GNU Affero General Public License as published by
+the Free Software Foundation, version 3.
+
+RAPD is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU Affero General Public License for more details.
+
+You should have received a copy of the GNU Affero General Public License
+along with this program.  If not, see <http://www.gnu.org/licenses/>.
+"""
+__created__ = "2026-10-18"
+__maintainer__ = "Frank Murphy"
+__email__ = "fmurphy@anl.gov"
+__status__ = "Development"
+
+# Standard imports
+import logging
+import Queue
+import threading
+import time
+
+# Constants
+QUEUE_SIZE = 256        # Maximum number of jobs waiting in front of a stage
+STAGE_WORKERS = 4       # Default number of worker threads for a stage
+
+# Marker to shut down a worker thread
+_STOP = object()
+
+class ImagePipeline(object):
+    """
+    Run image jobs through a series of stages, each served by its own pool of
+    worker threads and fed by a bounded queue.
+
+    Jobs are dicts. Each stage is a function that takes the job and returns it
+    (possibly modified) or None to drop it. The last stage is always run by a
+    single thread and sees the jobs sharing an order_key in the order they
+    were put into the pipeline, so work can be done in parallel while the
+    caller still gets ordered hand-offs (runs, pairs of snaps).
+    """
+
+    def __init__(self,
+                 stages,
+                 final_stage,
+                 drop_callback=None,
+                 queue_size=QUEUE_SIZE,
+                 logger=None):
+        """
+        Set up the queues and start the worker threads
+
+        Keyword arguments
+        stages -- list of (name, function, number of workers) tuples
+        final_stage -- (name, function) tuple run in order on one thread
+        drop_callback -- called on the final stage thread with dropped jobs
+        queue_size -- maximum number of jobs waiting for each stage
+        logger -- logger instance (default RAPDLogger)
+        """
+
+        self.logger = logger or logging.getLogger("RAPDLogger")
+        self.drop_callback = drop_callback
+
+        self.stages = []
+        self.queues = {}
+        self.threads = []
+
+        # Latency counters
+        self.stats_lock = threading.Lock()
+        self.stats = {}
+
+        # Ordering of jobs for the final stage. Entries for an order_key are
+        # dropped once all its jobs have been handed off.
+        self.order_lock = threading.Lock()
+        self.order_issued = {}
+        self.order_next = {}
+        self.order_waiting = {}
+
+        # Build the stages
+        for name, function, workers in stages:
+            self.stages.append((name, function, workers, Queue.Queue(queue_size)))
+        final_name, final_function = final_stage
+        self.stages.append((final_name, final_function, 1, Queue.Queue(queue_size)))
+
+        for name, __, __, queue in self.stages:
+            self.queues[name] = queue
+            self.stats[name] = {"count":0,
+                                "dropped":0,
+                                "total_time":0.0,
+                                "max_time":0.0,
+                                "total_wait":0.0}
+
+        # Start the workers
+        for index, (name, __, workers, __) in enumerate(self.stages):
+            self.threads.append([])
+            for worker_number in range(workers):
+                thread = threading.Thread(target=self._work,
+                                          args=(index,),
+                                          name="ImagePipeline-%s-%d" % (name, worker_number))
+                thread.daemon = True
+                thread.start()
+                self.threads[index].append(thread)
+
+    def put(self, job, order_key=None):
+        """
+        Put a job into the pipeline, blocking while the first stage is full
+
+        Keyword arguments
+        job -- dict describing the image
+        order_key -- jobs sharing the key reach the final stage in put order
+        """
+
+        with self.order_lock:
+            if order_key not in self.order_issued:
+                self.order_issued[order_key] = 0
+                self.order_next[order_key] = 0
+                self.order_waiting[order_key] = {}
+            sequence = self.order_issued[order_key]
+            self.order_issued[order_key] += 1
+
+        job["_pipeline"] = {"order_key":order_key,
+                            "sequence":sequence,
+                            "dropped":False,
+                            "queued":time.time()}
+
+        self.stages[0][3].put(job)
+
+    def stop(self):
+        """Stop all the worker threads once the queued work is done"""
+
+        for index, (__, __, workers, queue) in enumerate(self.stages):
+            for __ in range(workers):
+                queue.put(_STOP)
+            for thread in self.threads[index]:
+                thread.join()
+
+    def get_stats(self):
+        """Return a copy of the per-stage counters with mean latencies added"""
+
+        with self.stats_lock:
+            stats = {}
+            for name, counters in self.stats.iteritems():
+                stats[name] = counters.copy()
+                if counters["count"]:
+                    stats[name]["mean_time"] = counters["total_time"] / counters["count"]
+                    stats[name]["mean_wait"] = counters["total_wait"] / counters["count"]
+                else:
+                    stats[name]["mean_time"] = 0.0
+                    stats[name]["mean_wait"] = 0.0
+                stats[name]["queued"] = self.queues[name].qsize()
+        return stats
+
+    def _record(self, name, wait_time, run_time, dropped):
+        """Update the counters for a stage"""
+
+        with self.stats_lock:
+            counters = self.stats[name]
+            counters["count"] += 1
+            counters["total_time"] += run_time
+            counters["total_wait"] += wait_time
+            counters["max_time"] = max(counters["max_time"], run_time)
+            if dropped:
+                counters["dropped"] += 1
+
+    def _work(self, index):
+        """Worker loop for a stage"""
+
+        name, function, __, queue = self.stages[index]
+        final = (index == len(self.stages) - 1)
+
+        while True:
+
+            job = queue.get()
+            if job is _STOP:
+                break
+
+            if final:
+                self._release(job)
+                continue
+
+            start = time.time()
+            wait_time = start - job["_pipeline"]["queued"]
+            try:
+                result = function(job)
+            except:
+                self.logger.exception("Error in image pipeline stage %s", name)
+                result = None
+            run_time = time.time() - start
+
+            if result is None:
+                self._record(name, wait_time, run_time, True)
+                job["_pipeline"]["dropped"] = True
+                # Skip straight to the end
+                self.stages[-1][3].put(job)
+            else:
+                self._record(name, wait_time, run_time, False)
+                result["_pipeline"] = job["_pipeline"]
+                result["_pipeline"]["queued"] = time.time()
+                self.stages[index + 1][3].put(result)
+
+    def _release(self, job):
+        """
+        Hold jobs until all earlier jobs with the same order_key have been
+        handed to the final stage, then run the final stage on them in order
+        """
+
+        name, function, __, __ = self.stages[-1]
+        order_key = job["_pipeline"]["order_key"]
+
+        # Only the single final thread gets here, so the lock only guards
+        # against put() creating new keys
+        with self.order_lock:
+            waiting = self.order_waiting[order_key]
+            waiting[job["_pipeline"]["sequence"]] = job
+
+        while True:
+            with self.order_lock:
+                next_job = waiting.pop(self.order_next[order_key], None)
+                if next_job is None:
+                    # Forget the key once every job put for it has been seen
+                    if not waiting and self.order_next[order_key] == self.order_issued[order_key]:
+                        del self.order_issued[order_key]
+                        del self.order_next[order_key]
+                        del self.order_waiting[order_key]
+                    break
+                self.order_next[order_key] += 1
+
+            if next_job["_pipeline"]["dropped"]:
+                next_job.pop("_pipeline")
+                if self.drop_callback:
+                    try:
+                        self.drop_callback(next_job)
+                    except:
+                        self.logger.exception("Error handling dropped image job")
+                continue
+
+            start = time.time()
+            wait_time = start - next_job["_pipeline"]["queued"]
+            next_job.pop("_pipeline")
+            try:
+                function(next_job)
+            except:
+                self.logger.exception("Error in image pipeline stage %s", name)
+            self._record(name, wait_time, time.time() - start, False)
@@ -37,11 +37,14 @@ from pprint import pprint
 # import redis
 # import socket
 import sys
+import threading
 import time
 import types
 
 # RAPD imports
 from control.control_server import LaunchAction, ControllerServer
+import control.image_pipeline as image_pipeline
+import control.run_index as run_index
 from utils.modules import load_module
 from utils.site import get_ip_address
 from utils.text import json
@@ -69,7 +72,9 @@ class Model(object):
     indexing_active = collections.deque()
 
     # Managing runs and images without going to the db
-    recent_runs = collections.OrderedDict()
+    recent_runs = None
+    # Guards run status and pairs, used by the monitor and pipeline threads
+    image_lock = None
 
     data_root_dir = None
     database = None
@@ -78,6 +83,7 @@ class Model(object):
     # return_address = None
     alt_image_path_server = None
     image_monitor = None
+    image_pipeline = None
     run_monitor = None
     cloud_monitor = None
     site_adapter = None
@@ -125,6 +131,9 @@ class Model(object):
         # Import the detector
         self.init_detectors()
 
+        # Start the workers for handling new images
+        self.start_image_pipeline()
+
         # start the alt_image_path_server
         self.start_image_path_server()
 
@@ -152,6 +161,13 @@ class Model(object):
     def init_site(self):
         """Process the site definitions to set up instance variables"""
 
+        self.image_lock = threading.RLock()
+
+        # Index of recent runs - runs unused for RUN_WINDOW minutes are dropped
+        self.recent_runs = run_index.RunIndex(
+            max_runs=getattr(self.site, "RUN_INDEX_SIZE", run_index.MAX_RUNS),
+            max_age=getattr(self.site, "RUN_WINDOW", 60) * 60)
+
         # Single or multiple IDs
         # A string is input - one tag
         if isinstance(self.site.ID, str):
@@ -200,6 +216,14 @@ class Model(object):
                                               password=site.CONTROL_DATABASE_SETTINGS['DATABASE_PASSWORD'])
         #self.database = database.Database(string=site.CONTROL_DATABASE_SETTINGS['DATABASE_STRING'])
 
+    def stop_database(self):
+        """Finish saving queued results and buffered inserts"""
+
+        if hasattr(self.database, "stop_result_writers"):
+            self.database.stop_result_writers()
+        if hasattr(self.database, "stop_write_buffer"):
+            self.database.stop_write_buffer()
+
     def start_server(self):
         """Start up the listening process for core"""
 
@@ -389,7 +413,10 @@ class Model(object):
         print "send_command"
         pprint(command)
 
-        self.redis.lpush(channel, json.dumps(command))
+        # Lets the launcher manager and launchers report dispatch latency
+        command["dispatch_time"] = time.time()
+
+        self.redis.enqueue_job(channel, command)
         print "Command sent"
 
     def stop(self):
@@ -400,18 +427,46 @@ class Model(object):
         self.stop_server()
         self.stop_launcher_manager()
         self.stop_image_monitor()
+        self.stop_image_pipeline()
         self.stop_run_monitor()
+        self.stop_database()
         #self.stop_cloud_monitor()
 
+    def start_image_pipeline(self):
+        """Start up the worker threads that handle new images"""
+
+        self.logger.debug("Starting image pipeline")
+
+        # Allow the site to tune the number of workers per stage
+        workers = getattr(self.site, "IMAGE_PIPELINE_WORKERS", image_pipeline.STAGE_WORKERS)
+
+        self.image_pipeline = image_pipeline.ImagePipeline(
+            stages=(("stat", self.wait_for_image, workers),
+                    ("metadata", self.get_image_site_data, workers),
+                    ("header", self.read_image_header, workers),
+                    ("database", self.store_image, workers)),
+            final_stage=("dispatch", self.dispatch_image),
+            drop_callback=self.image_dropped,
+            logger=self.logger)
+
+    def stop_image_pipeline(self):
+        """Stop the image pipeline worker threads"""
+
+        self.logger.debug("Stopping image pipeline")
+        if self.image_pipeline:
+            self.image_pipeline.stop()
+            self.logger.debug("Image pipeline stats %s", self.image_pipeline.get_stats())
+
     def add_image(self, image_data):
         """
         Handle a new image being recorded by the site
 
+        The image is sorted into run or snap here and the rest of the work is
+        handed off to the image pipeline
+
         Keyword argument
         image_data -- information gathered about the image, primarily from the header
         """
-        # Placeholder for site info not in image header
-        site_header = {}
 
         # Unpack image_data
         fullname = image_data.get("fullname", None)
@@ -455,61 +510,22 @@ class Model(object):
             # self.logger.debug(current_run)
 
             # If not integrating trigger integration
-
-            if not current_run.get("rapd_status", None) in ("INTEGRATING", "FINISHED"):
-            #if True:
-                #print 'run_status: %s'%current_run.get("rapd_status", None)
+            with self.image_lock:
+                trigger = not current_run.get("rapd_status", None) in ("QUEUED", "INTEGRATING", "FINISHED")
+                # Keep later images from triggering while this one is
+                # making its way through the pipeline
+                if trigger and place_in_run == 1:
+                    current_run["rapd_status"] = "QUEUED"
+            if trigger:
                 # Right on time
                 if place_in_run == 1:
-                    # Grab extra data for the image and add to the header
-                    if self.site_adapter:
-                        if self.site_adapter.settings.has_key(site_tag.upper()):
-                            site_data = self.site_adapter.get_image_data(site_tag.upper())
-                        else:
-                            site_data = self.site_adapter.get_image_data()
-                        site_header = site_data
-
-                    # Get all the image information
-                    attempt_counter = 0
-                    while attempt_counter < 5:
-                        try:
-                            attempt_counter += 1
-                            if os.path.exists(fullname):
-                                header = detector.read_header(
-                                    fullname,
-                                    beam_settings=self.site.BEAM_INFO[site_tag.upper()],
-                                    extra_header=site_header)
-                                break
-                            else:
-                                time.sleep(0.2)
-                        except IOError:
-                            self.logger.exception("Unable to access image")
-                    else:
-                        self.logger.error("Unable to access image after %d tries", attempt_counter)
-                        return False
-
-                    # Put data about run in the header object
-                    header["collect_mode"] = "RUN"
-                    header["run_id"] = str(run_id)
-                    header["run"] = self.recent_runs[str(run_id)].copy()
-                    header["place_in_run"] = 1
-                    header["site_tag"] = site_tag
-
-                    # Add to the database
-                    image_id = self.database.add_image(data=header, return_type="id")
-
-                    # Add extra stuff to the header
-                    header["_id"] = image_id
-                    header["xdsinp"] = detector.XDSINP
-
-                    # Add the image template to the run information
-                    header["run"]["image_template"] = detector.create_image_template(
-                        image_prefix=header["image_prefix"],
-                        run_number=header["run_number"]
-                        )
-
-                    # Send to be processed
-                    self.new_data_image(image1=header)
+
+                    # Images in a run are handed off in order
+                    self.image_pipeline.put({"fullname":fullname,
+                                             "site_tag":site_tag,
+                                             "collect_mode":"RUN",
+                                             "run_id":str(run_id)},
+                                            order_key=str(run_id))
 
                 # Handle getting to the party late
                 else:
@@ -529,57 +545,177 @@ class Model(object):
 
             self.logger.debug("%s is a snap", fullname)
 
-            # Grab extra data for the image and add to the header
-            if self.site_adapter:
-                if self.site_adapter.settings.has_key(site_tag.upper()):
-                    site_data = self.site_adapter.get_image_data(site_tag.upper())
-                else:
-                    site_data = self.site_adapter.get_image_data()
-                site_header = site_data
-
-            # Get all the image information
-            attempt_counter = 0
-            while attempt_counter < 5:
-                try:
-                    attempt_counter += 1
-                    if os.path.exists(fullname):
-                        header = detector.read_header(
-                            fullname,
-                            beam_settings=self.site.BEAM_INFO[site_tag.upper()],
-                            extra_header=site_header)
-                        # Break out of loop
-                        break
-                    else:
-                        time.sleep(0.2)
-                except IOError:
-                    self.logger.exception("Unable to access image")
+            # Snaps are processed in parallel, but handed off in order so
+            # pairs can be found
+            self.image_pipeline.put({"fullname":fullname,
+                                     "site_tag":site_tag,
+                                     "collect_mode":"SNAP",
+                                     "run_id":None},
+                                    order_key=site_tag)
+
+        # No information is findable
+        else:
+            self.logger.debug("Unable to figure out %s", fullname)
+
+    def wait_for_image(self, job):
+        """
+        Image pipeline stage - wait for the image file to be accessible
+
+        Keyword argument
+        job -- dict describing the image
+        """
+
+        attempt_counter = 0
+        while attempt_counter < 5:
+            attempt_counter += 1
+            if os.path.exists(job["fullname"]):
+                return job
             else:
-                self.logger.error("Unable to access image after %d tries", attempt_counter)
-                return False
+                time.sleep(0.2)
+
+        self.logger.error("Unable to access image after %d tries", attempt_counter)
+        return None
+
+    def get_image_site_data(self, job):
+        """
+        Image pipeline stage - grab extra data for the image from the beamline
+
+        Keyword argument
+        job -- dict describing the image
+        """
+
+        # Placeholder for site info not in image header
+        job["site_header"] = {}
+
+        site_tag = job["site_tag"]
+
+        if self.site_adapter:
+            if self.site_adapter.settings.has_key(site_tag.upper()):
+                site_data = self.site_adapter.get_image_data(site_tag.upper())
+            else:
+                site_data = self.site_adapter.get_image_data()
+            job["site_header"] = site_data
+
+        return job
+
+    def read_image_header(self, job):
+        """
+        Image pipeline stage - read the image header
+
+        Keyword argument
+        job -- dict describing the image
+        """
+
+        fullname = job["fullname"]
+        site_tag = job["site_tag"]
+
+        # Shortcut to detector
+        detector = self.detectors[site_tag]
 
-            # Add some data to the header - no run_id for snaps
-            header["collect_mode"] = "SNAP"
+        # Get all the image information
+        attempt_counter = 0
+        while attempt_counter < 5:
+            try:
+                attempt_counter += 1
+                header = detector.read_header(
+                    fullname,
+                    beam_settings=self.site.BEAM_INFO[site_tag.upper()],
+                    extra_header=job["site_header"])
+                break
+            except IOError:
+                self.logger.exception("Unable to access image")
+                time.sleep(0.2)
+        else:
+            self.logger.error("Unable to access image after %d tries", attempt_counter)
+            return None
+
+        header["collect_mode"] = job["collect_mode"]
+        header["site_tag"] = site_tag
+
+        # Put data about run in the header object
+        if job["collect_mode"] == "RUN":
+            header["run_id"] = job["run_id"]
+            header["run"] = self.recent_runs[job["run_id"]].copy()
+            header["place_in_run"] = 1
+        # No run_id for snaps
+        else:
             header["run_id"] = None
-            header["site_tag"] = site_tag
 
-            # Add to database
-            image_id = self.database.add_image(data=header, return_type="id")
+        job["header"] = header
+
+        return job
+
+    def store_image(self, job):
+        """
+        Image pipeline stage - add the image to the database
+
+        Keyword argument
+        job -- dict describing the image
+        """
+
+        header = job["header"]
+
+        # Add to the database - images in a run are written behind, snaps
+        # right away to catch duplicates
+        image_id = self.database.add_image(data=header,
+                                           return_type="id",
+                                           buffered=(job["collect_mode"] == "RUN"))
+
+        if job["collect_mode"] == "RUN":
+
+            # Shortcut to detector
+            detector = self.detectors[job["site_tag"]]
+
+            # Add extra stuff to the header
+            header["_id"] = image_id
+            header["xdsinp"] = detector.XDSINP
+
+            # Add the image template to the run information
+            header["run"]["image_template"] = detector.create_image_template(
+                image_prefix=header["image_prefix"],
+                run_number=header["run_number"]
+                )
+
+        else:
             if image_id:
                 header["_id"] = image_id
             # Duplicate entry
             else:
-                return False
+                return None
 
-            # Update remote client
-            if self.remote_adapter:
-                self.remote_adapter.add_image(header)
+        return job
 
-            # KBO
-            self.new_data_image(image1=header)
+    def dispatch_image(self, job):
+        """
+        Image pipeline final stage - send the image to be processed
 
-        # No information is findable
-        else:
-            self.logger.debug("Unable to figure out %s", fullname)
+        Keyword argument
+        job -- dict describing the image
+        """
+
+        header = job["header"]
+
+        # Update remote client
+        if job["collect_mode"] == "SNAP" and self.remote_adapter:
+            self.remote_adapter.add_image(header)
+
+        # Send to be processed
+        self.new_data_image(image1=header)
+
+    def image_dropped(self, job):
+        """
+        Called by the image pipeline when an image could not be handled - lets
+        a later image in the run trigger processing again
+
+        Keyword argument
+        job -- dict describing the image
+        """
+
+        if job["collect_mode"] == "RUN":
+            with self.image_lock:
+                current_run = self.recent_runs.get(job["run_id"], {})
+                if current_run.get("rapd_status", None) == "QUEUED":
+                    del current_run["rapd_status"]
 
     def query_for_run(self, run_data, boolean=True):
         """
@@ -591,12 +727,12 @@ class Model(object):
         """
 
         # Look in local store of information
-        for run_id, run in self.recent_runs.iteritems():
-            if run_data.get("run_id", 0) == run_id:
-                if boolean:
-                    return True
-                else:
-                    return run
+        run = self.recent_runs.get(run_data.get("run_id", 0))
+        if run:
+            if boolean:
+                return True
+            else:
+                return run
 
         # Look in the database since the local attempt has failed
         return self.database.get_run(run_data=run_data,
@@ -630,28 +766,19 @@ class Model(object):
         boolean -- return just True if there is a or False
         """
 
-        # Query local runs in reverse chronological order
-        for run_id, run in self.recent_runs.iteritems():
-            # print 'run_id:%s'%run_id
-            # print 'run: %s'%run
-            #self.logger.debug('run_id:%s'%run_id)
-            #self.logger.debug('run:%s'%run)
-
-            #self.logger.debug("_id:%s run:%s" % (run_id, str(run)))
-
-            if run.get("site_tag", None) == site_tag and \
-               run.get("directory", None) == directory and \
-               run.get("image_prefix", None) == image_prefix and \
-               run.get("run_number", None) == run_number:
-
-                # Check image number
-                run_start = run.get("start_image_number")
-                run_end = run.get("number_images") + run_start - 1
-                if image_number >= run_start and image_number <= run_end:
-                    if return_type == "boolean":
-                        return True
-                    else:
-                        return [run]
+        # Query the local run index - most recently stored match
+        run = self.recent_runs.find(site_tag=site_tag,
+                                    directory=directory,
+                                    image_prefix=image_prefix,
+                                    run_number=run_number,
+                                    image_number=image_number)
+        if run:
+            if return_type == "boolean":
+                return True
+            elif return_type == "id":
+                return [str(run["_id"])]
+            else:
+                return [run]
 
         # If no run has been identified in local store, then search database
         identified_runs = self.database.query_in_run(site_tag=site_tag,
@@ -672,8 +799,9 @@ class Model(object):
             elif return_type == "id":
                 return identified_runs
             elif return_type == "dict":
-                # Update the local store
-                for run in identified_runs:
+                # Update the local store - oldest first so the most recent
+                # run wins future lookups
+                for run in reversed(identified_runs):
                     self.recent_runs[str(run["_id"])] = run
                 # Return runs
                 return identified_runs
@@ -705,7 +833,7 @@ class Model(object):
             self.logger.debug("Adding run")
 
             # Save to the database
-            run_id = self.database.add_run(run_data=run_data, return_type="id")
+            run_id = self.database.add_run(run_data=run_data, return_type="id", buffered=True)
 
             # Update the run data with the db run_id
             run_data["run_id"] = run_id
@@ -736,18 +864,11 @@ class Model(object):
         # The detector
         detector = self.detectors[site_tag.upper()]
 
-<<<<<<< HEAD
         # If the detector can determine if run or snap from the image name
         if hasattr(detector, "is_run_from_imagename"):
             # Make sure we have a function
             if isinstance(detector.is_run_from_imagename, types.FunctionType):
                 self.logger.debug("Have function")
-=======
-        # If the detector can determine if run or snap
-        # Make sure we have a function
-        if getattr(detector, "is_run_from_imagename", None):
-            if isinstance(detector.is_run_from_imagename, types.FunctionType):
->>>>>>> origin/jon_working
                 # See if we have a SNAP
                 if detector.is_run_from_imagename(fullname) == True:
                     self.logger.debug("Could NOT be a snap")
@@ -858,8 +979,10 @@ class Model(object):
 
         if image1.get("collect_mode", None) == "SNAP":
 
-            # Add the image to self.pair
-            self.pairs[site_tag].append((image1["fullname"].lower(), image1["_id"]))
+            # Add the image to self.pair and work from a copy of the last two
+            with self.image_lock:
+                self.pairs[site_tag].append((image1["fullname"].lower(), image1["_id"]))
+                pair = list(self.pairs[site_tag])
 
             work_dir = self.get_work_dir(type_level="single",
                                          image_data1=image1)
@@ -896,7 +1019,7 @@ class Model(object):
             self.send_command(command, "RAPD_JOBS")
 
             # If the last two images have "pair" in their name - look more closely
-            if ("pair" in self.pairs[site_tag][0][0]) and ("pair" in self.pairs[site_tag][1][0]):
+            if ("pair" in pair[0][0]) and ("pair" in pair[1][0]):
                 self.logger.debug("Potentially a pair of images")
 
                 # Break down the image name
@@ -904,13 +1027,13 @@ class Model(object):
                  basename1,
                  prefix1,
                  run_number1,
-                 image_number1) = self.detectors[site_tag].parse_file_name(self.pairs[site_tag][0][0])
+                 image_number1) = self.detectors[site_tag].parse_file_name(pair[0][0])
 
                 (directory2,
                  basename2,
                  prefix2,
                  run_number2,
-                 image_number2) = self.detectors[site_tag].parse_file_name(self.pairs[site_tag][1][0])
+                 image_number2) = self.detectors[site_tag].parse_file_name(pair[1][0])
 
                 # Everything matches up to the image number, which is incremented by 1
                 #if (directory1, basename1, prefix1) == (directory2, basename2, prefix2) and (image_number1 == image_number2-1):
@@ -918,14 +1041,14 @@ class Model(object):
                 #if (basename1, prefix1) == (basename2, prefix2) and (image_number1 == image_number2-1):
                 if basename1[0:basename1.rfind('_')] == basename2[0:basename2.rfind('_')] and (image_number1 == image_number2-1):
                     self.logger.info("This looks like a pair to me: %s, %s",
-                                     self.pairs[site_tag][0][0],
-                                     self.pairs[site_tag][1][0])
+                                     pair[0][0],
+                                     pair[1][0])
 
                     # Make a copy of the second pair to be LESS confusing
                     image2 = image1.copy()
 
                     # Get the data for the first image
-                    image1 = self.database.get_image_by_image_id(image_id=self.pairs[site_tag][0][1])
+                    image1 = self.database.get_image_by_image_id(image_id=pair[0][1])
 
                     # Derive  directory and repr
                     work_dir = self.get_work_dir(type_level="pair",
@@ -1016,7 +1139,8 @@ class Model(object):
             self.send_command(command, "RAPD_JOBS")
 
             # Set the run status
-            self.recent_runs[image1["run_id"]]["rapd_status"] = "INTEGRATING"
+            with self.image_lock:
+                self.recent_runs[image1["run_id"]]["rapd_status"] = "INTEGRATING"
             # TODO - update database version of run as well
 
     def get_session_id(self, header):
@@ -1102,32 +1226,50 @@ class Model(object):
         # Save the results for the plugin
         if "results" in message:
 
-            # Save the result
-            __ = self.database.save_plugin_result(message)
+            # Save the result in the background so the server is not held up
+            if hasattr(self.database, "queue_plugin_result"):
+                self.database.queue_plugin_result(message)
+            else:
+                __ = self.database.save_plugin_result(message)
 
         else:
 
             self.logger.debug(message)
 
-            """
-            # Release hold on dataset in RAMDISK
-            if self.site.ALT_IMAGE_LOCATION and self.site.ALT_IMAGE_SERVER_NAME:
-                _id = False
-                if message.get('process', False):
-                    if message.get('process').get('status', 1) in (-1, 100):
-                        # snaps
-                        if message.get('process').has_key('image1_id'):
-                            _id = message.get('process').get('image1_id', False)
-                        # integration
-                        if message.get('process').has_key('image_id'):
-                            _id = message.get('process').get('image_id', False)
-                        if _id:
-                            # get the header from the DB
-                            header = self.database.get_image_by_image_id(image_id=_id)
-                            if self.alt_image_path_server.has_key(header.get('site_tag').upper()):
-                                # send fullname to release_data
-                                self.alt_image_path_server[header.get('site_tag').upper()].release_data(header.get('fullname'))
-            """
+        # Finished or failed plugins no longer need their images held
+        self.release_alt_image(message)
+
+    def release_alt_image(self, message):
+        """
+        Release the hold on a dataset in RAMDISK once the plugin using it is done
+
+        Keyword arguments
+        message -- dict of pertinent information.
+        """
+
+        if not (getattr(self.site, "ALT_IMAGE_LOCATION", False) and self.alt_image_path_server):
+            return
+
+        process = message.get("process", False)
+        if not process or process.get("status", 1) not in (-1, 100):
+            return
+
+        # snaps hold both images of a pair, integration its one image
+        for key in ("image1_id", "image2_id", "image_id"):
+            _id = process.get(key, False)
+            if not _id:
+                continue
+
+            try:
+                # get the header from the DB
+                header = self.database.get_image_by_image_id(image_id=_id)
+                site_tag = header.get("site_tag").upper()
+                if self.alt_image_path_server.has_key(site_tag):
+                    # send fullname to release_data
+                    self.alt_image_path_server[site_tag].release_data(header.get("fullname"))
+            except:
+                self.logger.exception("Unable to release image %s", _id)
+
     def receive(self, message):
         """
         Receive information from ControllerServer (self.SERVER) and handle accordingly.
@@ -1135,7 +1277,7 @@ class Model(object):
         Keyword arguments
         message -- information to be preocessed, a dict
 
-        Types currently handled: NEWIMAGE, NEWRUN
+        Types currently handled: NEWIMAGE, NEWIMAGES, NEWRUN
         """
 
         # self.logger.debug("Received: %s", message)
@@ -1151,6 +1293,11 @@ class Model(object):
         elif message.get("message_type", None) == "NEWIMAGE":
             self.add_image(message)
 
+        # NEWIMAGES - a batch of NEWIMAGE messages from the image monitor
+        elif message.get("message_type", None) == "NEWIMAGES":
+            for image_message in message.get("images", []):
+                self.add_image(image_message)
+
         # NEWRUN
         elif message.get("message_type", None) == "NEWRUN":
             self.add_run(message)
@@ -0,0 +1,209 @@
+"""
+In-memory index of recent runs for resolving images to runs without going to
+the database
+"""
+
+__license__ = """
+This file is part of RAPD
+
+Copyright (C) 2018, Cornell University
+All rights reserved.
+
+RAPD is free software: you can redistribute it and/or modify
+it under the terms of the GNU Affero General Public License as published by
+the Free Software Foundation, version 3.
+
+RAPD is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU Affero General Public License for more details.
+
+You should have received a copy of the GNU Affero General Public License
+along with this program.  If not, see <http://www.gnu.org/licenses/>.
+"""
+__created__ = "2026-10-18"
+__maintainer__ = "Frank Murphy"
+__email__ = "fmurphy@anl.gov"
+__status__ = "Development"
+
+# Standard imports
+import bisect
+import collections
+import itertools
+import threading
+import time
+
+# Constants
+MAX_RUNS = 1000         # Maximum number of runs held
+MAX_AGE = 3600          # Seconds a run may go unused before it is evicted
+
+class RunIndex(object):
+    """
+    Store of recent runs, keyed by run_id, that also indexes the image number
+    range of every run by (site_tag, directory, image_prefix, run_number).
+
+    Behaves like the dict of runs it replaces for get/set/iteration, with
+    find() to resolve an image to the most recently stored run containing it.
+    Runs are evicted least recently used first when there are more than
+    max_runs, or when they have not been used for max_age seconds.
+    """
+
+    def __init__(self, max_runs=MAX_RUNS, max_age=MAX_AGE):
+        """
+        Set up the index
+
+        Keyword arguments
+        max_runs -- maximum number of runs held (default MAX_RUNS)
+        max_age -- seconds a run may go unused before eviction (default MAX_AGE)
+        """
+
+        self.max_runs = max_runs
+        self.max_age = max_age
+
+        # run_id -> run, least recently used first
+        self.runs = collections.OrderedDict()
+        # run_id -> last time used
+        self.last_used = {}
+        # key -> sorted list of (start_image_number, order, end_image_number, run_id)
+        self.ranges = {}
+        # run_id -> (key, entry) for removal
+        self.entries = {}
+
+        # Recency of insertion for breaking ties between overlapping runs
+        self.counter = itertools.count()
+
+        self.lock = threading.RLock()
+
+        # Hit/miss counters
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def get_key(run):
+        """Return the index key for a run dict or None if it cannot be indexed"""
+
+        key = (run.get("site_tag", None),
+               run.get("directory", None),
+               run.get("image_prefix", None),
+               run.get("run_number", None))
+
+        if None in key[1:] or run.get("start_image_number", None) is None or \
+           run.get("number_images", None) is None:
+            return None
+
+        return key
+
+    def __setitem__(self, run_id, run):
+        """Store a run, replacing any run already stored under run_id"""
+
+        with self.lock:
+
+            if run_id in self.runs:
+                self._remove(run_id)
+
+            self.runs[run_id] = run
+            self.last_used[run_id] = time.time()
+
+            key = self.get_key(run)
+            if key:
+                start = run["start_image_number"]
+                end = start + run["number_images"] - 1
+                entry = (start, self.counter.next(), end, run_id)
+                bisect.insort(self.ranges.setdefault(key, []), entry)
+                self.entries[run_id] = (key, entry)
+
+            self._evict()
+
+    def __getitem__(self, run_id):
+        with self.lock:
+            run = self.runs[run_id]
+            self._touch(run_id)
+            return run
+
+    def __delitem__(self, run_id):
+        with self.lock:
+            self._remove(run_id)
+
+    def __contains__(self, run_id):
+        return run_id in self.runs
+
+    def __len__(self):
+        return len(self.runs)
+
+    def get(self, run_id, default=None):
+        """Return the run stored under run_id or default"""
+
+        with self.lock:
+            if run_id in self.runs:
+                return self[run_id]
+            return default
+
+    def iteritems(self):
+        """Iterate over a snapshot of (run_id, run) pairs, most recently used last"""
+
+        with self.lock:
+            items = self.runs.items()
+        return iter(items)
+
+    def find(self, site_tag, directory, image_prefix, run_number, image_number):
+        """
+        Return the most recently stored run containing the image or None
+
+        Keyword arguments
+        site_tag -- string describing site
+        directory -- where the image is located
+        image_prefix -- the image prefix
+        run_number -- number for the run
+        image_number -- number for the image
+        """
+
+        with self.lock:
+
+            self._evict()
+
+            entries = self.ranges.get((site_tag, directory, image_prefix, run_number), [])
+
+            # All runs starting at or before the image
+            position = bisect.bisect_right(entries, (image_number, float("inf")))
+
+            best = None
+            for start, order, end, run_id in entries[:position]:
+                if image_number <= end:
+                    if best is None or order > best[0]:
+                        best = (order, run_id)
+
+            if best is None:
+                self.misses += 1
+                return None
+
+            self.hits += 1
+            self._touch(best[1])
+            return self.runs[best[1]]
+
+    def _touch(self, run_id):
+        """Mark a run as most recently used"""
+
+        self.last_used[run_id] = time.time()
+        self.runs[run_id] = self.runs.pop(run_id)
+
+    def _remove(self, run_id):
+        """Drop a run from all the structures"""
+
+        self.runs.pop(run_id, None)
+        self.last_used.pop(run_id, None)
+        key, entry = self.entries.pop(run_id, (None, None))
+        if key:
+            entries = self.ranges[key]
+            entries.remove(entry)
+            if not entries:
+                del self.ranges[key]
+
+    def _evict(self):
+        """Evict runs over the size limit or unused for too long"""
+
+        oldest_allowed = time.time() - self.max_age
+        for run_id in list(self.runs.iterkeys()):
+            if len(self.runs) > self.max_runs or self.last_used[run_id] < oldest_allowed:
+                self._remove(run_id)
+            else:
+                break
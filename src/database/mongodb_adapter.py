@@ -35,13 +35,16 @@ sudo docker run --name mongodb -p 27017:27017 -d mongo:3.4
 import base64
 import bson.errors
 from bson.objectid import ObjectId
+from collections import OrderedDict
 import copy
 import datetime
 import logging
 import os
 from pprint import pprint
+import Queue
 # import shutil
 import threading
+import time
 
 import pymongo
 import gridfs
@@ -50,6 +53,17 @@ from utils.text import json
 
 CONNECTION_ATTEMPTS = 30
 
+# Bytes of a file encoded to base64 at a time - a multiple of 3 so the pieces join
+ENCODE_BYTES = 3 * 256 * 1024
+# GridFS file _ids remembered by hash
+HASH_CACHE_SIZE = 1024
+# Threads saving plugin results in the background
+RESULT_WRITERS = 2
+# Buffered documents for a collection that are written together
+WRITE_BATCH = 100
+# Longest a buffered document waits to be written in seconds
+WRITE_DELAY = 0.25
+
 #
 # Utility functions
 #
@@ -90,6 +104,198 @@ def traverse_and_objectidify(input_object):
 
     return input_object
 
+class Base64Reader(object):
+    """
+    File-like object that reads a file as base64, so it can be streamed into
+    GridFS without reading or encoding the whole file at once
+    """
+
+    def __init__(self, input_object):
+        """
+        Keyword arguments
+        input_object -- file object open for reading
+        """
+
+        self.input_object = input_object
+        self.encoded = ""
+
+    def read(self, size=-1):
+        """Return up to size bytes of base64, all that is left if size is negative"""
+
+        while size < 0 or len(self.encoded) < size:
+            raw = self.input_object.read(ENCODE_BYTES)
+            if not raw:
+                break
+            self.encoded += base64.b64encode(raw)
+
+        if size < 0:
+            size = len(self.encoded)
+        data, self.encoded = self.encoded[:size], self.encoded[size:]
+        return data
+
+class WriteBuffer(object):
+    """
+    Collects documents to be inserted and writes them per collection with one
+    unordered insert_many once WRITE_BATCH have built up or the oldest has
+    waited WRITE_DELAY
+    """
+
+    def __init__(self, get_db, batch=WRITE_BATCH, delay=WRITE_DELAY, logger=None):
+        """
+        Keyword arguments
+        get_db -- function returning the database to write to
+        batch -- documents for a collection written together (default WRITE_BATCH)
+        delay -- longest a document waits in seconds (default WRITE_DELAY)
+        logger -- logger instance (default RAPDLogger)
+        """
+
+        self.logger = logger or logging.getLogger("RAPDLogger")
+
+        self.get_db = get_db
+        self.batch = batch
+        self.delay = delay
+
+        # collection -> list of (time queued, document)
+        self.pending = {}
+        self.condition = threading.Condition()
+        # Writes taken off pending and not yet finished
+        self.writing = 0
+
+        # Flush latencies
+        self.stats = {"flushes":0,
+                      "documents":0,
+                      "errors":0,
+                      "last_latency":0.0,
+                      "max_latency":0.0}
+
+        self.running = True
+        self.thread = threading.Thread(target=self.run, name="WriteBuffer")
+        self.thread.daemon = True
+        self.thread.start()
+
+    def add(self, collection, document):
+        """Queue a document to be inserted into collection"""
+
+        with self.condition:
+            documents = self.pending.setdefault(collection, [])
+            documents.append((time.time(), document))
+            # A new batch or a full one changes when the writer has to wake
+            if len(documents) == 1 or len(documents) >= self.batch:
+                self.condition.notify_all()
+
+    def run(self):
+        """Write batches as they become due until stopped"""
+
+        while True:
+            with self.condition:
+                while True:
+                    due = self.take_due()
+                    if due or not self.running:
+                        break
+                    self.condition.wait(self.next_due())
+                if not due and not self.running:
+                    break
+                self.writing += 1
+
+            try:
+                for collection, documents in due.iteritems():
+                    self.write(collection, documents)
+            finally:
+                with self.condition:
+                    self.writing -= 1
+                    self.condition.notify_all()
+
+    def take_due(self, everything=False):
+        """
+        Remove and return the collections that are full or have waited long
+        enough, or all of them if everything or stopping - call with the
+        condition held
+        """
+
+        now = time.time()
+        due = {}
+        for collection, documents in self.pending.items():
+            if everything or not self.running or \
+               len(documents) >= self.batch or \
+               now - documents[0][0] >= self.delay:
+                due[collection] = documents
+                del self.pending[collection]
+        return due
+
+    def next_due(self):
+        """Return seconds until the oldest buffered document is due, or None if none are"""
+
+        if not self.pending:
+            return None
+        oldest = min(documents[0][0] for documents in self.pending.itervalues())
+        return max(0.0, oldest + self.delay - time.time())
+
+    def write(self, collection, documents):
+        """Insert the queued documents, logging any that could not be"""
+
+        start = time.time()
+        try:
+            self.get_db()[collection].insert_many([document for __, document in documents],
+                                                  ordered=False)
+        except pymongo.errors.BulkWriteError as error:
+            # Duplicates are expected, as with insert_one
+            write_errors = error.details.get("writeErrors", [])
+            duplicates = len([e for e in write_errors if e.get("code") == 11000])
+            if duplicates < len(write_errors):
+                self.logger.error("Failed to write %d of %d to %s",
+                                  len(write_errors) - duplicates,
+                                  len(documents),
+                                  collection)
+            self.stats["errors"] += len(write_errors) - duplicates
+        except:
+            self.logger.exception("Failed to write %d to %s", len(documents), collection)
+            self.stats["errors"] += len(documents)
+
+        finished = time.time()
+        latency = finished - documents[0][0]
+        self.stats["flushes"] += 1
+        self.stats["documents"] += len(documents)
+        self.stats["last_latency"] = latency
+        self.stats["max_latency"] = max(self.stats["max_latency"], latency)
+        self.logger.debug("Wrote %d to %s in %.3f s, %.3f s after the first was queued",
+                          len(documents),
+                          collection,
+                          finished - start,
+                          latency)
+
+    def flush(self, collection=None):
+        """
+        Write the buffered documents now and wait until they are written
+
+        Keyword argument
+        collection -- only wait if this collection has documents buffered (default any)
+        """
+
+        with self.condition:
+            if collection and collection not in self.pending and not self.writing:
+                return
+            due = self.take_due(everything=True)
+            # Let the writer finish anything it has taken
+            while self.writing:
+                self.condition.wait()
+            self.writing += 1
+
+        try:
+            for collection_name, documents in due.iteritems():
+                self.write(collection_name, documents)
+        finally:
+            with self.condition:
+                self.writing -= 1
+                self.condition.notify_all()
+
+    def stop(self):
+        """Write what is buffered and stop the writer thread"""
+
+        with self.condition:
+            self.running = False
+            self.condition.notify_all()
+        self.thread.join()
+
 class Database(object):
     """
     Provides connection to MongoDB for Model.
@@ -152,6 +358,18 @@ class Database(object):
         # A lock for troublesome fast-acting data entry
         self.LOCK = threading.Lock()
 
+        # GridFS bucket, made on first use
+        self.grid_bucket = None
+
+        # GridFS _ids of saved files by hash, oldest first
+        self.file_hashes = OrderedDict()
+
+        # (thread, queue) for each background result writer
+        self.result_writers = []
+
+        # Buffer for image and run inserts, started on first use
+        self.write_buffer = None
+
     ############################################################################
     # Functions for connecting to the database                                 #
     ############################################################################
@@ -162,22 +380,66 @@ class Database(object):
 
         # No client - then connect
         if not self.client:
-            self.logger.debug("Connecting to MongDB at %s:%d", self.db_host, self.db_port)
-            # Connect
-            if self.db_string:
-                # When using login and pass.
-                self.client = pymongo.MongoClient(self.db_string)
-            else:
-                # Not using user/password for now
-                self.client = pymongo.MongoClient(host=self.db_host,
-                                                  port=self.db_port,
-                                                  )
+            # Writer threads may get here together
+            with self.LOCK:
+                if not self.client:
+                    self.logger.debug("Connecting to MongDB at %s:%d", self.db_host, self.db_port)
+                    # Connect
+                    if self.db_string:
+                        # When using login and pass.
+                        self.client = pymongo.MongoClient(self.db_string)
+                    else:
+                        # Not using user/password for now
+                        self.client = pymongo.MongoClient(host=self.db_host,
+                                                          port=self.db_port,
+                                                          )
 
         # Get the db
         db = self.client.rapd
 
         return db
 
+    def get_write_buffer(self):
+        """
+        Returns the buffer for image and run inserts
+        """
+
+        if not self.write_buffer:
+            with self.LOCK:
+                if not self.write_buffer:
+                    self.write_buffer = WriteBuffer(get_db=self.get_db_connection,
+                                                    logger=self.logger)
+
+        return self.write_buffer
+
+    def flush_writes(self, collection=None):
+        """
+        Make sure buffered inserts are in the database before reading it
+
+        Keyword argument
+        collection -- only flush if this collection has buffered documents (default any)
+        """
+
+        if self.write_buffer:
+            self.write_buffer.flush(collection)
+
+    def stop_write_buffer(self):
+        """Write buffered inserts and stop the buffer"""
+
+        if self.write_buffer:
+            self.write_buffer.stop()
+            self.logger.debug("Write buffer %s", self.write_buffer.stats)
+
+    def get_grid_bucket(self):
+        """
+        Returns the GridFS bucket for files saved with results
+        """
+
+        if not self.grid_bucket:
+            self.grid_bucket = gridfs.GridFSBucket(self.get_db_connection())
+
+        return self.grid_bucket
+
     ############################################################################
     # Functions for groups                                                     #
     ############################################################################
@@ -286,21 +548,31 @@ class Database(object):
     ############################################################################
     # Functions for images                                                     #
     ############################################################################
-    def add_image(self, data, return_type="id"):
+    def add_image(self, data, return_type="id", buffered=False):
         """
         Add new image to the MySQL database.
 
         Keyword arguments
         data -- dict with all the requisite parts
         return_type -- "boolean", "id", or "dict" (default = "id")
+        buffered -- write with the next batch and return the new _id at once. Duplicates
+                    are not detected, and "dict" is always written immediately (default False)
         """
 
-        db = self.get_db_connection()
-
         # Add timestamp
         data_copy = copy.deepcopy(data)
         data_copy["timestamp"] = datetime.datetime.utcnow()
 
+        # Write behind
+        if buffered and return_type in ("boolean", "id"):
+            data_copy["_id"] = ObjectId()
+            self.get_write_buffer().add("images", data_copy)
+            if return_type == "boolean":
+                return True
+            return str(data_copy["_id"])
+
+        db = self.get_db_connection()
+
         # Insert into db
         try:
             result = db.images.insert_one(data_copy)
@@ -330,6 +602,9 @@ class Database(object):
         # Make sure we are querying by ObjectId
         _image_id = get_object_id(image_id)
 
+        # The image may still be buffered
+        self.flush_writes("images")
+
         # Get connection to database
         db = self.get_db_connection()
 
@@ -341,12 +616,13 @@ class Database(object):
     ############################################################################
     # Functions for results                                                    #
     ############################################################################
-    def save_plugin_result(self, plugin_result):
+    def save_plugin_result(self, plugin_result, update_session=True):
         """
         Add a result from a plugin
 
         Keyword argument
         plugin_result -- dict of information from plugin - must have a process key pointing to entry
+        update_session -- set last_process of the session (default True)
         """
 
         self.logger.debug("save_plugin_result %s:%s", plugin_result["plugin"]["type"], plugin_result["process"])
@@ -356,8 +632,7 @@ class Database(object):
 
         # Connect to the database
         db = self.get_db_connection()
-        grid_fs = gridfs.GridFS(db)
-        grid_bucket = gridfs.GridFSBucket(db)
+        grid_bucket = self.get_grid_bucket()
 
         # Clear _id from plugin_result
         if plugin_result.get("_id"):
@@ -383,100 +658,57 @@ class Database(object):
 
             self.logger.debug("remove_files_from_db files:%s results_id:%s file_type:%s", files, result_id, file_type)
 
-            # Cycle through file list
+            # The hashes being saved for each description
+            new_hashes = {}
             for file_to_remove in files:
+                new_hashes.setdefault(file_to_remove.get("description"), set()).add(file_to_remove.get("hash"))
 
-                # Find files to remove
-                files_in_database = db.fs.files.find({"metadata.result_id":result_id,
+            # Find files for all the descriptions at once
+            files_in_database = db.fs.files.find({"metadata.result_id":result_id,
                                                   "metadata.file_type":file_type,
-                                                  "metadata.description":file_to_remove.get("description")})
-                # self.logger.debug("Looking for %s", {"metadata.result_id":result_id,
-                #                                      "metadata.file_type":file_type,
-                #                                      "metadata.description":file_to_remove.get("description")})
-                
-                # Remove them
-                for file_in_database in files_in_database:
+                                                  "metadata.description":{"$in":new_hashes.keys()}},
+                                                 {"metadata":1})
 
-                    # self.logger.debug("file_in_database: %s", file_in_database)
-                    # self.logger.debug(">>> %s %s", file_in_database["metadata"]["hash"], file_to_remove["hash"])
+            # Remove if hashes don't match
+            for file_in_database in files_in_database:
+                metadata = file_in_database["metadata"]
+                if metadata.get("hash") not in new_hashes[metadata.get("description")]:
+                    self.logger.debug("Removing file with _id:%s", file_in_database["_id"])
+                    grid_bucket.delete(file_in_database["_id"])
+                    self.forget_file_hash(metadata.get("hash"))
 
-                    # Remove if hashes don't match
-                    if file_in_database["metadata"]["hash"] != file_to_remove["hash"]:
-                        self.logger.debug("Removing file with _id:%s", file_to_remove["_id"])
-                        grid_bucket.delete(file_in_database["_id"])
+        def add_file_to_db(path, metadata=None, replace=False, encode=False):
+            """Add files to MongoDB, in base64 if encode"""
 
-        def add_raw_file_to_db(path, metadata=None, replace=False):
-            """Add files to MongoDB"""
-
-            self.logger.debug("add_raw_file_to_db path:%s metadata:%s", path, metadata)
+            self.logger.debug("add_file_to_db path:%s metadata:%s", path, metadata)
 
             # See if we already have this file
-            file_in_database = db.fs.files.find_one({"metadata.hash":metadata["hash"]})
+            file_id = None
+            if not replace:
+                file_id = self.find_file_hash(metadata["hash"])
 
             # File already saved
-            if file_in_database:
-                # Overwrite
-                if replace:
-                    self.logger.debug("Overwriting file")
-                    # Open the path
-                    with open(path, "r") as input_object:
-                        file_id = grid_bucket.upload_from_stream(filename=os.path.basename(path),
-                                                                 source=input_object,
-                                                                 metadata=metadata)
-                # Do not overwrite
-                else:
-                    self.logger.debug("Not overwriting file")
-                    file_id = file_in_database["_id"]
-            # New file
+            if file_id:
+                self.logger.debug("Not overwriting file")
+            # New file, or overwrite
             else:
-                self.logger.debug("Writing new file")
-                # Open the path
-                with open(path, "r") as input_object:
+                self.logger.debug("Writing file")
+                # Stream the file in so it is never read whole
+                with open(path, "rb") as input_object:
+                    if encode:
+                        input_object = Base64Reader(input_object)
                     file_id = grid_bucket.upload_from_stream(filename=os.path.basename(path),
                                                              source=input_object,
                                                              metadata=metadata)
-            
-            return file_id
-
-        def add_archive_file_to_db(path, metadata=None, replace=False):
-            """Add archive files to MongoDB - for use with client download"""
-            
-            self.logger.debug("add_archive_file_to_db path:%s metadata:%s", path, metadata)
-            
-            # See if we already have this file
-            file_in_database = db.fs.files.find_one({"metadata.hash":metadata["hash"]})
-
-            # File already saved
-            if file_in_database:
-                # Overwrite
-                if replace:
-                    self.logger.debug("Overwriting file")
-                    # Encode file in base64
-                    b64_encoded = base64.b64encode(open(path, "r").read())
-                    # Save to MongoDB
-                    file_id = grid_bucket.upload_from_stream(filename=os.path.basename(path),
-                                                             source=b64_encoded,
-                                                             metadata=metadata)
-                # Do not overwrite
-                else:
-                    self.logger.debug("Not overwriting file")
-                    file_id = file_in_database["_id"]
-            # New file
-            else:
-                self.logger.debug("Writing new file")
-                # Encode file in base64
-                b64_encoded = base64.b64encode(open(path, "r").read())
-                # Save to MongoDB
-                file_id = grid_bucket.upload_from_stream(filename=os.path.basename(path),
-                                                         source=b64_encoded,
-                                                         metadata=metadata)
+                self.remember_file_hash(metadata["hash"], file_id)
 
             return file_id
 
-        add_funcs = {
-            "archive_files":add_archive_file_to_db,
-            "data_produced":add_raw_file_to_db,
-            "for_display":add_raw_file_to_db
+        # Archive files are kept in base64 for the client to download
+        encode_files = {
+            "archive_files":True,
+            "data_produced":False,
+            "for_display":False
         }
 
         for file_type in ("archive_files", "data_produced", "for_display"):
@@ -493,7 +725,7 @@ class Database(object):
 
                 # Save the new
                 for index in range(len(plugin_result["results"].get(file_type, []))):
-                    
+
                     self.logger.debug("Saving the %d file", index)
 
                     # The file to save
@@ -508,11 +740,12 @@ class Database(object):
                         self.logger.debug("Saving %s", _file)
 
                         # Upload the file to MongoDB
-                        grid_id = add_funcs[file_type](path=_file,
-                                                       metadata={"description":data.get("description", "archive"),
-                                                                 "hash":data.get("hash"),
-                                                                 "result_id":_result_id,
-                                                                 "file_type":file_type})
+                        grid_id = add_file_to_db(path=_file,
+                                                 metadata={"description":data.get("description", "archive"),
+                                                           "hash":data.get("hash"),
+                                                           "result_id":_result_id,
+                                                           "file_type":file_type},
+                                                 encode=encode_files[file_type])
 
                         self.logger.debug("Saved %s", grid_id)
 
@@ -529,8 +762,6 @@ class Database(object):
                     else:
                         plugin_result["results"][file_type][index]["_id"] = None
 
-
-
         #
         # Add to plugin-specific results
         #
@@ -540,33 +771,22 @@ class Database(object):
                           collection_name,
                           _result_id)
 
-        # Debugging call to query db
-        # debug_result = db[collection_name].find_one({"process.result_id":_result_id})
-        # self.logger.debug("Found previous plugin result %s" % debug_result._id)
-
-        # Update the plugin-specific table
-        result1 = db[collection_name].update_one(
+        # Update the plugin-specific table and get the _id in the same trip
+        plugin_result_id = db[collection_name].find_one_and_update(
             {"process.result_id":_result_id},
             {"$set":plugin_result},
-            upsert=True)
-
-        # Get the _id from updated entry
-        if result1.raw_result.get("updatedExisting", False):
-            plugin_result_id = db[collection_name].find_one(
-                {"process.result_id":_result_id},
-                {"_id":1})["_id"]
-            self.logger.debug("%s _id from updatedExisting %s", collection_name, plugin_result_id)
-        # upsert
-        else:
-            plugin_result_id = result1.upserted_id
-            self.logger.debug("%s _id  from upserting %s", collection_name, plugin_result_id)
+            projection={"_id":1},
+            upsert=True,
+            return_document=pymongo.ReturnDocument.AFTER)["_id"]
+        self.logger.debug("%s _id %s", collection_name, plugin_result_id)
+
         # Add _id to plugin_result
         plugin_result["_id"] = get_object_id(plugin_result_id)
 
         #
         # Update results collection
         #
-        result2 = db.results.update_one(
+        result_id = db.results.find_one_and_update(
             {"_id":_result_id},
             {"$set":{
                 "data_type":plugin_result["plugin"]["data_type"],
@@ -581,35 +801,157 @@ class Database(object):
                 "timestamp":now,
                 }
             },
-            upsert=True)
-
-        # Get the _id from updated entry in results
-        # Upserted
-        if result2.upserted_id:
-            result_id = result2.upserted_id
-
-        # Modified
-        else:
-            result_id = db.results.find_one(
-                {"result_id":get_object_id(plugin_result_id)},
-                {"_id":1})["_id"]
+            projection={"_id":1},
+            upsert=True,
+            return_document=pymongo.ReturnDocument.AFTER)["_id"]
 
         # Update parent processes
         if plugin_result.get("process", {}).get("parent_id", False):
             self.updateParentProcess(plugin_result)
 
         # Update the session last_process field
-        db.sessions.update_one(
-            {"_id":get_object_id(plugin_result["process"]["session_id"])},
-            {"$set": {
-                "last_process": now
-            }}
-        )
+        if update_session:
+            self.touch_session(plugin_result["process"]["session_id"], now)
 
         # Return the _ids for the two collections
         return {"plugin_results_id":str(plugin_result_id),
                 "result_id":str(result_id)}
 
+    def touch_session(self, session_id, timestamp):
+        """
+        Move the last_process of a session forward to timestamp
+
+        Keyword arguments
+        session_id -- _id of the session
+        timestamp -- time of the latest process
+        """
+
+        db = self.get_db_connection()
+
+        # $max so a late write cannot move it back
+        db.sessions.update_one(
+            {"_id":get_object_id(session_id)},
+            {"$max": {
+                "last_process": timestamp
+            }}
+        )
+
+    def queue_plugin_result(self, plugin_result):
+        """
+        Hand a result from a plugin to the writer threads and return at once
+
+        Results with the same result_id go to the same writer, so they are
+        saved in the order they arrive.
+
+        Keyword argument
+        plugin_result -- dict of information from plugin - must have a process key pointing to entry
+        """
+
+        # Start the writers on first use
+        with self.LOCK:
+            if not self.result_writers:
+                for index in range(RESULT_WRITERS):
+                    writer_queue = Queue.Queue()
+                    writer = threading.Thread(target=self.write_plugin_results,
+                                              args=(writer_queue,),
+                                              name="ResultWriter-%d" % index)
+                    writer.daemon = True
+                    writer.start()
+                    self.result_writers.append((writer, writer_queue))
+
+        shard = hash(str(plugin_result["process"].get("result_id"))) % len(self.result_writers)
+        self.result_writers[shard][1].put(plugin_result)
+
+    def write_plugin_results(self, writer_queue):
+        """
+        Save the results on writer_queue until a None comes down it. The
+        sessions touched are updated once the queue runs dry.
+
+        Keyword argument
+        writer_queue -- Queue.Queue of plugin results
+        """
+
+        # session_id -> latest timestamp
+        sessions = {}
+
+        while True:
+
+            plugin_result = writer_queue.get()
+            if plugin_result is None:
+                break
+
+            try:
+                self.save_plugin_result(plugin_result, update_session=False)
+                session_id = plugin_result["process"]["session_id"]
+                timestamp = plugin_result["timestamp"]
+                if session_id not in sessions or timestamp > sessions[session_id]:
+                    sessions[session_id] = timestamp
+            except:
+                self.logger.exception("Error saving %s result", plugin_result.get("plugin"))
+
+            if writer_queue.empty():
+                self.flush_sessions(sessions)
+
+        self.flush_sessions(sessions)
+
+    def flush_sessions(self, sessions):
+        """Update last_process for the sessions dict of session_id:timestamp and empty it"""
+
+        for session_id, timestamp in sessions.items():
+            try:
+                self.touch_session(session_id, timestamp)
+            except:
+                self.logger.exception("Error updating session %s", session_id)
+        sessions.clear()
+
+    def stop_result_writers(self):
+        """Save the results still queued and stop the writer threads"""
+
+        with self.LOCK:
+            result_writers = self.result_writers
+            self.result_writers = []
+
+        for __, writer_queue in result_writers:
+            writer_queue.put(None)
+        for writer, __ in result_writers:
+            writer.join()
+
+    def find_file_hash(self, file_hash):
+        """Return the GridFS _id of a file with file_hash, or None"""
+
+        with self.LOCK:
+            file_id = self.file_hashes.get(file_hash)
+            if file_id:
+                # Most recently used goes to the end
+                self.file_hashes[file_hash] = self.file_hashes.pop(file_hash)
+                return file_id
+
+        db = self.get_db_connection()
+        file_in_database = db.fs.files.find_one({"metadata.hash":file_hash}, {"_id":1})
+        if file_in_database:
+            self.remember_file_hash(file_hash, file_in_database["_id"])
+            return file_in_database["_id"]
+
+        return None
+
+    def remember_file_hash(self, file_hash, file_id):
+        """Keep the GridFS _id for file_hash, dropping the oldest past HASH_CACHE_SIZE"""
+
+        if not file_hash:
+            return
+
+        with self.LOCK:
+            self.file_hashes.pop(file_hash, None)
+            self.file_hashes[file_hash] = file_id
+            while len(self.file_hashes) > HASH_CACHE_SIZE:
+                self.file_hashes.popitem(last=False)
+
+    def forget_file_hash(self, file_hash):
+        """Drop file_hash once its file has been removed"""
+
+        with self.LOCK:
+            self.file_hashes.pop(file_hash, None)
+
     # def getArrayStats(self, in_array, mode="float"):
     #     """
     #     return the max,min,mean and std_dev of an input array
@@ -654,13 +996,15 @@ class Database(object):
     ############################################################################
     # Functions for runs                                                       #
     ############################################################################
-    def add_run(self, run_data, return_type="id"):
+    def add_run(self, run_data, return_type="id", buffered=False):
         """
         Add new run to the MySQL database.
 
         Keyword arguments
         data -- dict with all the requisite parts
         return_type -- "boolean", "id", or "dict" (default = "id")
+        buffered -- write with the next batch and return the new _id at once. Duplicates
+                    are not detected, and "dict" is always written immediately (default False)
         """
 
         self.logger.debug(run_data)
@@ -668,6 +1012,14 @@ class Database(object):
         # Add timestamp to the run_data
         run_data.update({"timestamp":datetime.datetime.utcnow()})
 
+        # Write behind - the _id goes into run_data as insert_one would put it
+        if buffered and return_type in ("boolean", "id"):
+            run_data["_id"] = ObjectId()
+            self.get_write_buffer().add("runs", copy.deepcopy(run_data))
+            if return_type == "boolean":
+                return True
+            return str(run_data["_id"])
+
         db = self.get_db_connection()
 
         try:
@@ -712,6 +1064,9 @@ class Database(object):
 
         self.logger.debug("run_data:%s minutes:%d", run_data, minutes)
 
+        # The run may still be buffered
+        self.flush_writes("runs")
+
         # Get connection to database
         db = self.get_db_connection()
 
@@ -797,6 +1152,9 @@ class Database(object):
         else:
             raise Exception("get_run_data order argument must be None, ascending, or descending")
 
+        # The run may still be buffered
+        self.flush_writes("runs")
+
         # Get connection to database
         db = self.get_db_connection()
 
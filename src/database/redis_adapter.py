@@ -38,11 +38,13 @@ __status__ = "Production"
 # Standard imports
 import atexit
 import datetime
+import hashlib
 import logging
 import os
 from pprint import pprint
 import threading
 import time
+import uuid
 
 #from bson.objectid import ObjectId
 import redis
@@ -56,6 +58,34 @@ ATTEMPT_LIMIT = 3600
 ATTEMPT_PAUSE = 1.0
 CONNECTION_ATTEMPT_LIMIT = 3600
 
+# Reliable queues
+INFLIGHT_SUFFIX = ":inflight"   # List of jobs taken but not acked
+LEASES_SUFFIX = ":leases"       # Hash of job_id:time first seen in flight
+DEAD_SUFFIX = ":dead"           # List of jobs that could not be delivered
+VISIBILITY_TIMEOUT = 120        # Seconds a job may be in flight before redelivery
+MAX_DELIVERIES = 3              # Deliveries before a job is dead-lettered
+
+# Moves a job off its in-flight list, if it is still there, onto another list
+# in one step, so a crash cannot lose it between the two
+#   KEYS - in-flight list, list to push onto, leases hash
+#   ARGV - job as reserved, job to push, LPUSH or RPUSH, job_id
+MOVE_JOB_SCRIPT = """
+if redis.call("LREM", KEYS[1], 1, ARGV[1]) == 0 then
+    return 0
+end
+redis.call(ARGV[3], KEYS[2], ARGV[2])
+redis.call("HDEL", KEYS[3], ARGV[4])
+return 1
+"""
+
+def get_job_id(raw):
+    """Return the job_id of a raw queued job, or a digest of it if it has none"""
+    try:
+        job_id = json.loads(raw).get("job_id")
+    except (ValueError, AttributeError):
+        job_id = None
+    return job_id or hashlib.sha1(raw).hexdigest()
+
 def connectionErrorWrapper(func):
     def wrapper(*args, **kwargs):
         attempts = 0
@@ -590,12 +620,16 @@ class Database:
         self.redis.lpush(key, value)
 
     @connectionErrorWrapper
-    def brpop(self, key):
+    def brpop(self, key, timeout=0):
         """
-        RPOP a value off a given list
+        BRPOP a value off the first non-empty list of key (str or list of str),
+        blocking for up to timeout seconds (0 blocks indefinitely)
+
+        Returns a (list, value) tuple or None if the timeout expires
         """
-        value = self.redis.brpop(key)
+        value = self.redis.brpop(key, timeout=timeout)
         return value
+
     @connectionErrorWrapper
     def rpop(self, key):
         """
@@ -603,14 +637,30 @@ class Database:
         """
         value = self.redis.rpop(key)
         return value
+
+    @connectionErrorWrapper
+    def rpop_batch(self, key, count):
+        """
+        RPOP up to count values off a given list in one atomic round trip
+
+        Values are returned oldest first, the order repeated RPOPs would give
+        """
+        pipe = self.redis.pipeline(transaction=True)
+        pipe.lrange(key, -count, -1)
+        pipe.ltrim(key, 0, -(count + 1))
+        values, __ = pipe.execute()
+        values.reverse()
+        return values
     
     @connectionErrorWrapper
     def rpoplpush(self, list1, list2):
         """
         RPOPLPUSH pop a value off a given list and push on another list
+
+        Returns the value moved or None if list1 is empty
         """
         value = self.redis.rpoplpush(list1, list2)
-        #return value
+        return value
                
     ##############
     # HASH Methods
@@ -643,6 +693,132 @@ class Database:
         """
         self.redis.hset(key, field, value)
 
+    ########################
+    # RELIABLE QUEUE Methods
+    ########################
+    @connectionErrorWrapper
+    def enqueue_job(self, key, job):
+        """
+        LPUSH a job dict onto a reliable queue list, giving it a job_id if it
+        does not have one
+
+        Returns the job_id
+        """
+        if not job.get("job_id"):
+            job["job_id"] = uuid.uuid4().hex
+        self.redis.lpush(key, json.dumps(job))
+        return job["job_id"]
+
+    @connectionErrorWrapper
+    def reserve_job(self, key, timeout=0):
+        """
+        Move the oldest job on a reliable queue onto its in-flight list,
+        blocking for up to timeout seconds (0 blocks indefinitely)
+
+        The job stays in flight until ack_job is called or it is redelivered
+        by requeue_expired_jobs.
+
+        Returns a (job dict, raw value) tuple or None if the timeout expires.
+        The raw value is what must be passed to ack_job.
+        """
+        raw = self.redis.brpoplpush(key, key+INFLIGHT_SUFFIX, timeout)
+        if raw is None:
+            return None
+        return json.loads(raw), raw
+
+    @connectionErrorWrapper
+    def ack_job(self, key, raw):
+        """
+        Remove a job reserved with reserve_job from the in-flight list of key
+
+        Returns True if the job was still in flight
+        """
+        pipe = self.redis.pipeline(transaction=True)
+        # LREM argument order differs between redis-py versions
+        pipe.execute_command("LREM", key+INFLIGHT_SUFFIX, 1, raw)
+        pipe.hdel(key+LEASES_SUFFIX, get_job_id(raw))
+        removed, __ = pipe.execute()
+        return bool(removed)
+
+    @connectionErrorWrapper
+    def requeue_expired_jobs(self,
+                             key,
+                             visibility_timeout=VISIBILITY_TIMEOUT,
+                             max_deliveries=MAX_DELIVERIES,
+                             destination=None):
+        """
+        Put jobs that have been in flight on key for more than
+        visibility_timeout seconds back on destination (default key), to be
+        the next taken. Jobs that have been delivered max_deliveries times go
+        to the dead-letter list of key instead.
+
+        The time a job went in flight is the first time this method sees it,
+        so it should be called regularly. A visibility_timeout of 0 requeues
+        everything in flight. Several callers may reap the same
+        list, as only one of them can remove a given job.
+
+        Returns a (number requeued, number dead-lettered) tuple
+        """
+        if destination is None:
+            destination = key
+
+        inflight = key+INFLIGHT_SUFFIX
+        leases_key = key+LEASES_SUFFIX
+
+        now = time.time()
+        requeued = 0
+        dead = 0
+
+        jobs = self.redis.lrange(inflight, 0, -1)
+        leases = self.redis.hgetall(leases_key)
+        move_job = self.redis.register_script(MOVE_JOB_SCRIPT)
+
+        seen = set()
+        for raw in jobs:
+            job_id = get_job_id(raw)
+            seen.add(job_id)
+
+            # First sighting starts the clock
+            if job_id not in leases:
+                self.redis.hset(leases_key, job_id, now)
+                leases[job_id] = now
+
+            if now - float(leases[job_id]) < visibility_timeout:
+                continue
+
+            job = json.loads(raw)
+            job["deliveries"] = job.get("deliveries", 1) + 1
+            if job["deliveries"] > max_deliveries:
+                # Only the caller that removes the job may move it
+                if not move_job(keys=[inflight, key+DEAD_SUFFIX, leases_key],
+                                args=[raw, json.dumps(job), "LPUSH", job_id]):
+                    continue
+                dead += 1
+                if self.logger:
+                    self.logger.error("Job %s delivered %d times - moved to %s",
+                                      job_id,
+                                      max_deliveries,
+                                      key+DEAD_SUFFIX)
+            else:
+                # Back on the consuming end so it is taken next
+                if not move_job(keys=[inflight, destination, leases_key],
+                                args=[raw, json.dumps(job), "RPUSH", job_id]):
+                    continue
+                requeued += 1
+                if self.logger:
+                    self.logger.debug("Job %s in flight on %s for over %d s - requeued on %s",
+                                      job_id,
+                                      key,
+                                      visibility_timeout,
+                                      destination)
+
+        # Forget leases of jobs that were acked before being seen
+        stale = [job_id for job_id in leases if job_id not in seen]
+        if stale:
+            self.redis.hdel(leases_key, *stale)
+
+        return requeued, dead
+
     ################
     # PUBSUB Methods
     ################
@@ -689,12 +865,12 @@ class Database:
     #         self._raise_ConnectionError(error)
 
     @connectionErrorWrapper
-    def get_message(self, id):
+    def get_message(self, id, timeout=0):
         """
-        Get message on pubsub connection
+        Get message on pubsub connection, waiting up to timeout seconds for one
         """
 
-        message = self.pubsubs[id].get_message()
+        message = self.pubsubs[id].get_message(timeout=timeout)
 
         return message
 
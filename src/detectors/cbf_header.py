@@ -0,0 +1,200 @@
+"""
+Shared miniCBF header reading for the Dectris detector modules
+"""
+
+__license__ = """
+This file is part of RAPD
+
+Copyright (C) 2018 Cornell University
+All rights reserved.
+
+RAPD is free software: you can redistribute it and/or modify
+it under the terms of the GNU Affero General Public License as published by
+the Free Software Foundation, version 3.
+
+RAPD is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU Affero General Public License for more details.
+
+You should have received a copy of the GNU Affero General Public License
+along with this program.  If not, see <http://www.gnu.org/licenses/>.
+"""
+
+__created__ = "2026-10-18"
+__maintainer__ = "Frank Murphy"
+__email__ = "fmurphy@anl.gov"
+__status__ = "Development"
+
+# Standard imports
+import argparse
+import re
+import time
+
+# The last line of the text header before the binary data
+PADDING_MARKER = "X-Binary-Size-Padding"
+# Size of each read from the file
+READ_BLOCK = 4096
+# Give up looking for the marker after this many bytes
+MAX_HEADER_BYTES = 65536
+
+def mmorm(x):
+    """Return a distance in mm, converting from m if needed"""
+    d = float(x)
+    if d < 2:
+        return d*1000
+    else:
+        return d
+
+def compile_header_items(header_items):
+    """
+    Compile a dict of label:(pattern, transform) header items once, returning
+    a dict of label:(compiled pattern, transform) for parse_header
+
+    Keyword arguments
+    header_items -- dict of label:(regular expression string, transform function)
+    """
+
+    compiled_items = {}
+    for label, (pattern, transform) in header_items.iteritems():
+        # A line-start ^ is tried at every position of the header, so anchor
+        # on the preceding newline instead to get a fast literal prefix search
+        if pattern.startswith("^"):
+            pattern = "\n" + pattern[1:]
+        compiled_items[label] = (re.compile(pattern, re.MULTILINE), transform)
+
+    return compiled_items
+
+def read_header_block(fullname, attempts=10, logger=False):
+    """
+    Return the text header of a miniCBF file, up to and including the
+    X-Binary-Size-Padding line, reading at most MAX_HEADER_BYTES
+
+    Keyword arguments
+    fullname -- full path name of the image file
+    attempts -- number of tries at opening the file (default 10)
+    logger -- logger instance (default False)
+    """
+
+    count = 0
+    while count < attempts:
+        try:
+            header = ""
+            with open(fullname, "rb") as raw:
+                while len(header) < MAX_HEADER_BYTES:
+                    block = raw.read(READ_BLOCK)
+                    if not block:
+                        break
+                    # Only search the new block plus enough overlap for the marker
+                    search_start = max(0, len(header) - len(PADDING_MARKER))
+                    header += block
+                    marker = header.find(PADDING_MARKER, search_start)
+                    if marker > -1:
+                        line_end = header.find("\n", marker)
+                        if line_end > -1:
+                            return header[:line_end+1]
+            return header[:MAX_HEADER_BYTES]
+        except IOError:
+            count += 1
+            if logger:
+                logger.exception("Error opening %s" % fullname)
+            time.sleep(0.1)
+
+    raise IOError("Unable to read header from %s" % fullname)
+
+def parse_header(header, compiled_items, parameters=None):
+    """
+    Fill parameters with the typed values of the header items, using the last
+    match of each pattern, or None if there is no match
+
+    Keyword arguments
+    header -- text header as returned by read_header_block
+    compiled_items -- header items as returned by compile_header_items
+    parameters -- dict to fill (default new dict)
+    """
+
+    if parameters is None:
+        parameters = {}
+
+    # Line-start patterns are anchored on a newline, so the first line needs one
+    header = "\n" + header
+
+    for label, (pattern, transform) in compiled_items.iteritems():
+        matches = pattern.findall(header)
+        if matches:
+            parameters[label] = transform(matches[-1])
+        else:
+            parameters[label] = None
+
+    return parameters
+
+def get_commandline():
+    """
+    Grabs the commandline
+    """
+
+    # Parse the commandline arguments
+    commandline_description = "Benchmark miniCBF header reading"
+    parser = argparse.ArgumentParser(description=commandline_description)
+
+    # Number of reads
+    parser.add_argument("-n", "--number",
+                        action="store",
+                        dest="number",
+                        type=int,
+                        default=1000,
+                        help="Number of header reads to time")
+
+    # Image file to read
+    parser.add_argument(action="store",
+                        dest="file",
+                        help="miniCBF image to read")
+
+    return parser.parse_args()
+
+def main(args):
+    """
+    Time the shared header reading against the per-call compile and line by
+    line read the detector modules used to do
+    """
+
+    import detectors.dectris.dectris_pilatus6m as detector
+
+    # The way the detector modules used to read headers
+    def old_read(fullname):
+        header = ""
+        with open(fullname, "rb") as raw:
+            for line in raw:
+                header += line
+                if line.count(PADDING_MARKER):
+                    break
+        parameters = {}
+        for label, pat in detector.HEADER_ITEMS.iteritems():
+            pattern = re.compile(pat[0], re.MULTILINE)
+            matches = pattern.findall(header)
+            if len(matches) > 0:
+                parameters[label] = pat[1](matches[-1])
+            else:
+                parameters[label] = None
+        return parameters
+
+    def new_read(fullname):
+        return parse_header(read_header_block(fullname), detector.HEADER_PATTERNS)
+
+    if old_read(args.file) != new_read(args.file):
+        print "WARNING - header values differ"
+
+    for tag, function in (("before", old_read), ("after", new_read)):
+        start = time.time()
+        for __ in range(args.number):
+            function(args.file)
+        elapsed = time.time() - start
+        print "%-6s %10.1f headers/s" % (tag, args.number / elapsed)
+
+if __name__ == "__main__":
+
+    # Get the commandline args
+    commandline_args = get_commandline()
+
+    # Execute code
+    main(args=commandline_args)
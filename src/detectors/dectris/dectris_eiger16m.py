@@ -28,12 +28,12 @@ __status__ = "Production"
 import argparse
 import os
 from pprint import pprint
-import re
 import shutil
 # import sys
 import tempfile
 
 # RAPD imports
+import detectors.cbf_header as cbf_header
 import utils.convert_hdf5_cbf as convert_hdf5_cbf
 
 
@@ -86,6 +86,27 @@ XDSINP = [
     ('VALUE_RANGE_FOR_TRUSTED_DETECTOR_PIXELS', '6000 30000') ,
     ]
 
+# item:(pattern,transform)
+HEADER_ITEMS = {
+    "detector": ("^# Detector\: ([\w\s]+)\, S\/N [\w\d\-]*\s*", lambda x: str(x)),
+    "detector_sn": ("^# Detector\:[\w\s]+\, S\/N ([\w\d\-]*)\s*", lambda x: str(x)),
+    "pixel_size": ("^# Pixel_size\s*(\d+)e-6 m.*", lambda x: int(x)/1000),
+    "sensor_thickness": ("^#\sSilicon\ssensor\,\sthickness\s*([\d\.]+)\sm", lambda x: float(x)*1000),
+    "time": ("^# Exposure_time\s*([\d\.]+) s", lambda x: float(x)),
+    "period": ("^# Exposure_period\s*([\d\.]+) s", lambda x: float(x)),
+    "count_cutoff": ("^# Count_cutoff\s*(\d+) counts", lambda x: int(x)),
+    "wavelength": ("^# Wavelength\s*([\d\.]+) A", lambda x: float(x)),
+    "distance": ("^# Detector_distance\s*([\d\.]+) m", cbf_header.mmorm),
+    "beam_x": ("^# Beam_xy\s*\(([\d\.]+)\,\s[\d\.]+\) pixels", lambda x: float(x)),
+    "beam_y": ("^# Beam_xy\s*\([\d\.]+\,\s([\d\.]+)\) pixels", lambda x: float(x)),
+    "osc_start": ("^# Start_angle\s*([\d\.]+)\s*deg", lambda x: float(x)),
+    "osc_range": ("^# Angle_increment\s*([\d\.]*)\s*deg", lambda x: float(x)),
+    #"transmission": ("^# Filter_transmission\s*([\d\.]+)", lambda x: float(x)),
+    #"size1": ("X-Binary-Size-Fastest-Dimension:\s*([\d\.]+)", lambda x: int(x)),
+    #"size2": ("X-Binary-Size-Second-Dimension:\s*([\d\.]+)", lambda x: int(x)),
+    }
+HEADER_PATTERNS = cbf_header.compile_header_items(HEADER_ITEMS)
+
 def read_header(image,
                 mode=None,
                 run_id=None,
@@ -102,49 +123,8 @@ def read_header(image,
     # Make sure the image is a full path image
     image = os.path.abspath(image)
 
-    def mmorm(x):
-        d = float(x)
-        if d < 2:
-            return d*1000
-        else:
-            return d
-
-    #item:(pattern,transform)
-    header_items = {
-        "detector": ("^# Detector\: ([\w\s]+)\, S\/N [\w\d\-]*\s*", lambda x: str(x)),
-        "detector_sn": ("^# Detector\:[\w\s]+\, S\/N ([\w\d\-]*)\s*", lambda x: str(x)),
-        "pixel_size": ("^# Pixel_size\s*(\d+)e-6 m.*", lambda x: int(x)/1000),
-        "sensor_thickness": ("^#\sSilicon\ssensor\,\sthickness\s*([\d\.]+)\sm", lambda x: float(x)*1000),
-        "time": ("^# Exposure_time\s*([\d\.]+) s", lambda x: float(x)),
-        "period": ("^# Exposure_period\s*([\d\.]+) s", lambda x: float(x)),
-        "count_cutoff": ("^# Count_cutoff\s*(\d+) counts", lambda x: int(x)),
-        "wavelength": ("^# Wavelength\s*([\d\.]+) A", lambda x: float(x)),
-        "distance": ("^# Detector_distance\s*([\d\.]+) m", mmorm),
-        "beam_x": ("^# Beam_xy\s*\(([\d\.]+)\,\s[\d\.]+\) pixels", lambda x: float(x)),
-        "beam_y": ("^# Beam_xy\s*\([\d\.]+\,\s([\d\.]+)\) pixels", lambda x: float(x)),
-        "osc_start": ("^# Start_angle\s*([\d\.]+)\s*deg", lambda x: float(x)),
-        "osc_range": ("^# Angle_increment\s*([\d\.]*)\s*deg", lambda x: float(x)),
-        #"transmission": ("^# Filter_transmission\s*([\d\.]+)", lambda x: float(x)),
-        #"size1": ("X-Binary-Size-Fastest-Dimension:\s*([\d\.]+)", lambda x: int(x)),
-        #"size2": ("X-Binary-Size-Second-Dimension:\s*([\d\.]+)", lambda x: int(x)),
-        }
-
-    count = 0
-    while (count < 10):
-        try:
-            # Use 'with' to make sure file closes properly. Only read header.
-            header = ""
-            with open(image, "rb") as raw:
-                for line in raw:
-                    header += line
-                    if line.count("X-Binary-Size-Padding"):
-                        break
-            break
-        except:
-            count +=1
-            if logger:
-                logger.exception('Error opening %s' % image)
-            time.sleep(0.1)
+    # Read just the text header
+    header = cbf_header.read_header_block(image, logger=logger)
 
     # try:
     #tease out the info from the file name
@@ -165,19 +145,11 @@ def read_header(image,
         # "size2": 2527}
         }
 
-    for label, pat in header_items.iteritems():
-        # print label
-        pattern = re.compile(pat[0], re.MULTILINE)
-        matches = pattern.findall(header)
-        if len(matches) > 0:
-            parameters[label] = pat[1](matches[-1])
-        else:
-            parameters[label] = None
+    cbf_header.parse_header(header, HEADER_PATTERNS, parameters)
     if parameters.has_key('size1'):
         if parameters['size1'] == 4150:
             parameters['detector'] = 'Eiger-16M'
 
-    pprint(parameters)
 
     # Put beam center into RAPD format mm
     parameters["x_beam"] = parameters["beam_y"] * parameters["pixel_size"]
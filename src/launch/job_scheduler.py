@@ -0,0 +1,188 @@
+"""
+Priority and fair-share ordering of jobs waiting in the launcher manager
+"""
+
+__license__ = """
+This file is part of RAPD
+
+Copyright (C) 2018, Cornell University
+All rights reserved.
+
+RAPD is free software: you can redistribute it and/or modify
+it under the terms of the GNU Affero General Public License as published by
+the Free Software Foundation, version 3.
+
+RAPD is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU Affero General Public License for more details.
+
+You should have received a copy of the GNU Affero General Public License
+along with this program.  If not, see <http://www.gnu.org/licenses/>.
+"""
+
+__created__ = "2026-10-18"
+__maintainer__ = "Frank Murphy"
+__email__ = "fmurphy@anl.gov"
+__status__ = "Development"
+
+# Standard imports
+import collections
+
+# RAPD imports
+import utils.launch_tools as launch_tools
+from utils.schedule import monotonic
+
+# Priority class of each command - lower goes first
+PRIORITIES = {
+    "ECHO":0,
+    "INDEX":0,
+    "INTEGRATE":1,
+    "ANALYSIS":2,
+    "PDBQUERY":3,
+    "MR":3,
+    }
+# Priority class for commands not in PRIORITIES
+DEFAULT_PRIORITY = 2
+
+def get_priority(command, priorities=PRIORITIES):
+    """
+    Return the priority class for a command, matching on the leading word
+    for compound commands such as INDEX+STRATEGY
+    """
+
+    if command in priorities:
+        return priorities[command]
+    for name, priority in priorities.iteritems():
+        if command.startswith(name):
+            return priority
+    return DEFAULT_PRIORITY
+
+class JobScheduler(object):
+    """
+    Holds jobs until there is a launcher free to take them, handing them out
+    by priority class, then by weighted fair share between site tags, then
+    in arrival order.
+
+    Fair share is kept as a virtual time for each site tag that advances by
+    1/share with every job dispatched for that site, and the waiting site
+    with the lowest virtual time goes next. A site that has been idle starts
+    again from the lowest virtual time of the busy sites, so it cannot save
+    up a burst.
+    """
+
+    def __init__(self, priorities=PRIORITIES, shares=None):
+        """
+        Keyword arguments
+        priorities -- dict of command:priority class (default PRIORITIES)
+        shares -- dict of site_tag:relative share (default 1 for every site)
+        """
+
+        self.priorities = priorities
+        self.shares = shares or {}
+
+        # priority -> site_tag -> deque of (job, raw, time added)
+        self.queues = {}
+        # site_tag -> virtual time
+        self.virtual_times = {}
+
+        # (priority, site_tag) -> wait counters
+        self.stats = {}
+
+    def __len__(self):
+        return sum(len(jobs) for sites in self.queues.itervalues() for jobs in sites.itervalues())
+
+    def add(self, job, raw):
+        """
+        Hold a job
+
+        Keyword arguments
+        job -- command dict
+        raw -- value to ack the job with once it has been dispatched
+        """
+
+        priority = get_priority(job.get("command", ""), self.priorities)
+        site_tag = launch_tools.get_site_tag(job)
+
+        waiting = self._waiting_sites()
+        if site_tag not in waiting:
+            # Catch up with the sites that have been busy
+            busy = [self.virtual_times.get(tag, 0.0) for tag in waiting]
+            if busy:
+                self.virtual_times[site_tag] = max(self.virtual_times.get(site_tag, 0.0), min(busy))
+
+        sites = self.queues.setdefault(priority, {})
+        sites.setdefault(site_tag, collections.deque()).append((job, raw, monotonic()))
+
+    def candidates(self):
+        """
+        Return the job at the head of each site queue as a list of
+        (job, raw) tuples, best first
+        """
+
+        candidates = []
+        for priority in sorted(self.queues):
+            sites = self.queues[priority]
+            for site_tag in sorted(sites, key=lambda tag: self.virtual_times.get(tag, 0.0)):
+                job, raw, __ = sites[site_tag][0]
+                candidates.append((job, raw))
+        return candidates
+
+    def remove(self, job):
+        """
+        Take a job returned by candidates() out of the scheduler once it has
+        been dispatched, charging its site and recording its wait
+        """
+
+        priority = get_priority(job.get("command", ""), self.priorities)
+        site_tag = launch_tools.get_site_tag(job)
+
+        sites = self.queues[priority]
+        __, __, added = sites[site_tag].popleft()
+        if not sites[site_tag]:
+            del sites[site_tag]
+            if not sites:
+                del self.queues[priority]
+
+        share = float(self.shares.get(site_tag, 1.0))
+        self.virtual_times[site_tag] = self.virtual_times.get(site_tag, 0.0) + 1.0 / share
+
+        wait = monotonic() - added
+        counters = self.stats.setdefault((priority, site_tag),
+                                         {"count":0, "total_wait":0.0, "max_wait":0.0})
+        counters["count"] += 1
+        counters["total_wait"] += wait
+        counters["max_wait"] = max(counters["max_wait"], wait)
+
+        return wait
+
+    def get_stats(self):
+        """
+        Return the queue-wait statistics as a dict keyed by
+        "<priority>:<site_tag>" with counts, mean and max wait and the number
+        of jobs still waiting
+        """
+
+        stats = {}
+        for (priority, site_tag), counters in self.stats.iteritems():
+            key = "%d:%s" % (priority, site_tag)
+            stats[key] = counters.copy()
+            stats[key]["mean_wait"] = counters["total_wait"] / counters["count"]
+            stats[key]["waiting"] = 0
+        for priority, sites in self.queues.iteritems():
+            for site_tag, jobs in sites.iteritems():
+                key = "%d:%s" % (priority, site_tag)
+                stats.setdefault(key, {"count":0,
+                                       "total_wait":0.0,
+                                       "max_wait":0.0,
+                                       "mean_wait":0.0})
+                stats[key]["waiting"] = len(jobs)
+        return stats
+
+    def _waiting_sites(self):
+        """Return the site tags that have jobs waiting"""
+
+        tags = set()
+        for sites in self.queues.itervalues():
+            tags.update(sites)
+        return tags
@@ -33,6 +33,10 @@ from subprocess import Popen
 # RAPD imports
 import utils.launch_tools as launch_tools
 from utils.modules import load_module
+from utils.processes import total_nproc
+
+# Processes started by this launcher
+RUNNING = []
 
 class LauncherAdapter(object):
     """
@@ -56,6 +60,18 @@ class LauncherAdapter(object):
 
         self.run()
 
+    @staticmethod
+    def get_load(settings):
+        """
+        Return a dict of the slots this launcher has and how many are busy
+
+        Keyword arguments
+        settings -- the launcher settings
+        """
+        RUNNING[:] = [process for process in RUNNING if process.poll() is None]
+        return {"slots":int(settings.get("pool_size", False) or max(1, total_nproc()-1)),
+                "busy":len(RUNNING)}
+
     def run(self):
         """
         Orchestrate the adapter's actions
@@ -82,7 +98,7 @@ class LauncherAdapter(object):
     
             # Call the launch process on the command file
             self.logger.debug("rapd.launch -s %s %s", site_tag, command_file)
-            Popen(["rapd.launch", "-s",site_tag, command_file])
+            RUNNING.append(Popen(["rapd.launch", "-s",site_tag, command_file]))
             # Can use a queue to get the PID of the launched job
             #Process(target=local_subprocess,
             #        kwargs={"command": "rapd.launch -s %s %s" %(site_tag, command_file)
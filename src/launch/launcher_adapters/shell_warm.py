@@ -0,0 +1,291 @@
+"""
+Provides a launcher adapter that runs jobs in long-lived, preforked worker
+processes that have already imported the site, utils and common plugins
+"""
+
+"""
+This file is part of RAPD
+
+Copyright (C) 2018 Cornell University
+All rights reserved.
+
+RAPD is free software: you can redistribute it and/or modify
+it under the terms of the GNU Affero General Public License as published by
+the Free Software Foundation, version 3.
+
+RAPD is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU Affero General Public License for more details.
+
+You should have received a copy of the GNU Affero General Public License
+along with this program.  If not, see <http://www.gnu.org/licenses/>.
+"""
+
+__created__ = "2026-10-18"
+__maintainer__ = "Frank Murphy"
+__email__ = "fmurphy@anl.gov"
+__status__ = "Development"
+
+# Standard imports
+import atexit
+import importlib
+import logging
+import multiprocessing
+import os
+import time
+
+# RAPD imports
+import utils.launch_tools as launch_tools
+from utils.modules import load_module
+from utils.processes import total_nproc
+
+# Modules imported by each worker before it takes jobs
+# Can be overridden by "warm_modules" in the launcher settings
+WARM_MODULES = (
+    "utils.credits",
+    "utils.exceptions",
+    "utils.global_vars",
+    "utils.log",
+    "utils.site",
+    "utils.text",
+    "utils.xutils",
+    "database.redis_adapter",
+    "plugins.echo.plugin",
+    "plugins.index.plugin",
+    "plugins.integrate.plugin",
+    )
+
+# The pool of workers for this launcher process
+WARM_POOL = None
+
+class WarmWorker(multiprocessing.Process):
+    """
+    Long-lived process that imports the expensive modules once, then runs the
+    command files it is handed with rapd_launch.Launch
+    """
+
+    def __init__(self, job_queue, busy, warm_modules):
+        """
+        Keyword arguments
+        job_queue -- multiprocessing.Queue of (site_tag, command_file, queued time)
+        busy -- multiprocessing.Value counting jobs submitted and not finished
+        warm_modules -- module names to import before taking jobs
+        """
+
+        multiprocessing.Process.__init__(self)
+
+        # Plugins start their own processes, so workers cannot be daemonic
+        self.daemon = False
+
+        self.job_queue = job_queue
+        self.busy = busy
+        self.warm_modules = warm_modules
+
+        # Set while a job is running, so the pool can tell if one died with it
+        self.working = multiprocessing.Value("i", 0)
+
+        # Imported site modules
+        self.sites = {}
+
+    def run(self):
+        """Warm up, then take jobs until a None comes down the queue"""
+
+        logger = logging.getLogger("RAPDLogger")
+
+        # Import everything a fresh rapd.launch would have to
+        start = time.time()
+        for module in self.warm_modules:
+            try:
+                importlib.import_module(module)
+            except ImportError:
+                logger.exception("Unable to warm up %s", module)
+        import launch.rapd_launch as rapd_launch
+        import utils.site
+        warm_time = time.time() - start
+
+        logger.debug("Warm worker %d ready in %.2f s", self.pid, warm_time)
+
+        while True:
+
+            job = self.job_queue.get()
+            if job is None:
+                break
+
+            site_tag, command_file, queued = job
+            self.working.value = 1
+
+            try:
+                # Import the site once per site tag
+                if site_tag not in self.sites:
+                    site_file = utils.site.determine_site(site_arg=site_tag)
+                    self.sites[site_tag] = importlib.import_module(site_file)
+
+                launch = rapd_launch.Launch(self.sites[site_tag], command_file)
+
+                # Report what a cold start would have cost
+                launch.new_logger.debug("Started %s %.3f s after queueing, %.3f s of startup saved",
+                                        command_file,
+                                        time.time() - queued,
+                                        warm_time)
+
+                # One job at a time per worker
+                if launch.plugin_process:
+                    launch.plugin_process.join()
+
+            except:
+                logger.exception("Error running %s", command_file)
+
+            with self.busy.get_lock():
+                self.busy.value -= 1
+                self.working.value = 0
+
+            # Launch adds a log handler for every job
+            for handler in logger.handlers[:]:
+                logger.removeHandler(handler)
+                handler.close()
+
+class WarmPool(object):
+    """
+    A fixed set of WarmWorkers fed by one queue. Workers that die are
+    replaced when the next job is submitted or the load is asked for.
+    """
+
+    def __init__(self, size, warm_modules=WARM_MODULES):
+        """
+        Start the workers
+
+        Keyword arguments
+        size -- number of workers
+        warm_modules -- module names each worker imports before taking jobs
+        """
+
+        self.logger = logging.getLogger("RAPDLogger")
+
+        self.size = size
+        self.warm_modules = warm_modules
+        self.job_queue = multiprocessing.Queue()
+        self.busy = multiprocessing.Value("i", 0)
+        self.workers = [self.start_worker() for __ in range(size)]
+
+    def start_worker(self):
+        """Start and return a worker"""
+
+        worker = WarmWorker(self.job_queue, self.busy, self.warm_modules)
+        worker.start()
+        return worker
+
+    def replace_dead(self):
+        """Start a worker in place of each one that has died, returning how many"""
+
+        replaced = 0
+        for index, worker in enumerate(self.workers):
+            if worker.is_alive():
+                continue
+            self.logger.error("Warm worker %s exited with %s, replacing it",
+                              worker.pid,
+                              worker.exitcode)
+            # The job it was running will not finish
+            with self.busy.get_lock():
+                if worker.working.value:
+                    self.busy.value -= 1
+            self.workers[index] = self.start_worker()
+            replaced += 1
+
+        return replaced
+
+    def submit(self, site_tag, command_file):
+        """Queue a command file to be run by the next free worker"""
+
+        self.replace_dead()
+
+        with self.busy.get_lock():
+            self.busy.value += 1
+        self.job_queue.put((site_tag, command_file, time.time()))
+
+    def stop(self):
+        """Let the workers finish their jobs and exit"""
+
+        for __ in self.workers:
+            self.job_queue.put(None)
+        for worker in self.workers:
+            worker.join()
+
+def get_warm_pool(settings):
+    """
+    Return the pool of warm workers, starting it on first use
+
+    Keyword arguments
+    settings -- the launcher settings
+    """
+
+    global WARM_POOL
+
+    if WARM_POOL is None:
+        size = int(settings.get("pool_size", False) or max(1, total_nproc()-1))
+        WARM_POOL = WarmPool(size=size,
+                             warm_modules=settings.get("warm_modules", WARM_MODULES))
+        # Workers are not daemonic, so they have to be told to exit
+        atexit.register(WARM_POOL.stop)
+
+    return WARM_POOL
+
+class LauncherAdapter(object):
+    """
+    An adapter for launcher process.
+
+    Hands the requested job to a warm worker process on the current machine
+    """
+
+    def __init__(self, site, message, settings):
+        """
+        Initialize the adapter
+        """
+
+        # Get the logger Instance
+        self.logger = logging.getLogger("RAPDLogger")
+        self.logger.debug("__init__")
+
+        self.site = site
+        self.message = message
+        self.settings = settings
+
+        self.run()
+
+    @staticmethod
+    def get_load(settings):
+        """
+        Return a dict of the slots this launcher has and how many are busy
+
+        Keyword arguments
+        settings -- the launcher settings
+        """
+        pool = get_warm_pool(settings)
+        pool.replace_dead()
+        return {"slots":pool.size, "busy":pool.busy.value}
+
+    def run(self):
+        """
+        Orchestrate the adapter's actions
+        """
+        # Check if command is ECHO
+        if self.message['command'] == 'ECHO':
+            # Load the simple_echo module
+            echo = load_module(seek_module='launch.launcher_adapters.echo_simple')
+            # send message to simple_echo
+            echo.LauncherAdapter(self.site, self.message, self.settings)
+        else:
+            # Adjust the message to this site
+            self.message = launch_tools.fix_command(self.message)
+
+            # Put the command into a file
+            command_file = launch_tools.write_command_file(os.path.join(self.settings["launch_dir"],'command_files'),
+                                                           self.message["command"],
+                                                           self.message)
+
+            # Set the site tag from input
+            site_tag = launch_tools.get_site_tag(self.message).split('_')[0]
+
+            # Hand off to a warm worker
+            self.logger.debug("warm launch -s %s %s", site_tag, command_file)
+            get_warm_pool(self.settings).submit(site_tag, command_file)
@@ -47,6 +47,7 @@ class Launch(object):
 
     command = None
     plugin = None
+    plugin_process = None
     new_logger = None
 
     def __init__(self, site, command_file):
@@ -76,12 +77,12 @@ class Launch(object):
         self.load_plugin(self.command.get("command"))
 
         # Run the plugin
-        plugin = self.plugin.RapdPlugin(site=self.site,
-                                        command=self.command,
-                                        tprint=False,
-                                        logger=self.new_logger)
+        self.plugin_process = self.plugin.RapdPlugin(site=self.site,
+                                                     command=self.command,
+                                                     tprint=False,
+                                                     logger=self.new_logger)
 
-        plugin.start()
+        self.plugin_process.start()
 
     def load_command(self):
         """
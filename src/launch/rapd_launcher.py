@@ -41,11 +41,12 @@ from utils.commandline import base_parser
 from utils.lock import lock_file, close_lock_file
 import utils.log
 from utils.modules import load_module
-from utils.overwatch import Registrar
+from utils.overwatch import Registrar, OVERWATCH_TIMEOUT
 import utils.site
 import utils.text as text
 from utils.text import json
 from utils.processes import mp_pool, total_nproc
+from utils.schedule import PeriodicTasks
 from bson.objectid import ObjectId
 from threading import Thread
 
@@ -53,6 +54,10 @@ import multiprocessing
 from multiprocessing.util import Finalize
 
 BUFFER_SIZE = 8192
+# Seconds to block waiting for a job before checking on scheduled tasks
+BLOCKING_TIMEOUT = 1
+# Seconds between Overwatch updates
+OW_INTERVAL = 1
 
 class Launcher(object):
     """
@@ -112,34 +117,27 @@ class Launcher(object):
             self.ow_registrar.register({"site_id":json.dumps(self.launcher.get('site_tag')),
                                         "job_list":self.job_list})
 
+        # Have Registrar update status and report load every second
+        schedule = PeriodicTasks(logger=self.logger)
+        if self.overwatch_id:
+            schedule.add(OW_INTERVAL, self.update_overwatch)
+        schedule.add(OW_INTERVAL, self.report_load)
+
         try:
-            timer = 0
             # This is the server portion of the code
             while self.running:
-                # Have Registrar update status every second
-                if round(timer%1,1) in (0.0,1.0):
-                    if self.overwatch_id:
-                        #self.ow_registrar.update({"site_id":self.site.ID,
-                        self.ow_registrar.update({"site_id":json.dumps(self.launcher.get('site_tag')),
-                                                  "job_list":self.job_list})
-                        #self.ow_registrar.update({"job_list":self.job_list})
-
-                # Look for a new command
+                schedule.run_pending()
+
+                # Look for a new command, waiting at most BLOCKING_TIMEOUT
                 # This will throw a redis.exceptions.ConnectionError if redis is unreachable
-                #command = self.redis.brpop(["RAPD_JOBS",], 5)
                 try:
-                    while self.redis.llen(self.job_list) != 0:
-                        command = self.redis.rpop(self.job_list)
-                        # Handle the message
-                        if command:
-                            self.handle_command(json.loads(command))
-
-                            # Only run 1 command
-                            # self.running = False
-                            # break
-                    # sleep a little when jobs aren't coming in.
-                    time.sleep(0.2)
-                    timer += 0.2
+                    result = self.redis.reserve_job(self.job_list, timeout=BLOCKING_TIMEOUT)
+                    # Handle the message
+                    if result:
+                        command, raw = result
+                        self.handle_command(command)
+                        # The adapter has started the job, so it must not be redelivered
+                        self.redis.ack_job(self.job_list, raw)
                 except redis.exceptions.ConnectionError:
                     if self.logger:
                         self.logger.exception("Remote Redis is not up. Waiting for Sentinal to switch to new host")
@@ -148,6 +146,21 @@ class Launcher(object):
         except KeyboardInterrupt:
             self.stop()
 
+    def update_overwatch(self):
+        """Have the Registrar update status"""
+        self.ow_registrar.update({"site_id":json.dumps(self.launcher.get('site_tag')),
+                                  "job_list":self.job_list})
+
+    def report_load(self):
+        """
+        Tell the launcher manager how many jobs this launcher can run and how
+        many it is running, for adapters that keep track
+        """
+        if hasattr(self.adapter, "get_load"):
+            self.redis.setex("OW:%s:load" % self.job_list,
+                             OVERWATCH_TIMEOUT,
+                             json.dumps(self.adapter.get_load(self.launcher)))
+
     def stop(self):
         """Stop everything smoothly."""
         self.running = False
@@ -182,6 +195,10 @@ class Launcher(object):
         message = command
         if self.logger:
             self.logger.debug("Command received channel:%s  message: %s", self.job_list, message)
+            # Time from Model.send_command to here
+            if message.get("dispatch_time"):
+                self.logger.debug("Dispatch latency %.1f ms",
+                                  (time.time() - message["dispatch_time"]) * 1000)
 
         # Use the adapter to launch
         #self.adapter(self.site, message, self.launcher)
@@ -37,18 +37,30 @@ import time
 from threading import Thread
 
 # RAPD imports
+from launch.job_scheduler import JobScheduler, PRIORITIES
 import utils.launch_tools as launch_tools
 from utils.commandline import base_parser
 #from utils.lock import file_lock
 import utils.site
 import utils.log
 from utils.overwatch import Registrar
+from utils.schedule import PeriodicTasks
 from utils.text import json
 #import json
 #from bson.objectid import ObjectId
 
 # Timer (s) for checking which launchers are alive.
 TIMER = 5
+# Seconds to block waiting for a job before checking on scheduled tasks
+BLOCKING_TIMEOUT = 1
+# Seconds a job may sit unacknowledged on a launcher before it is reassigned
+VISIBILITY_TIMEOUT = 120
+# Deliveries of a job before it is put on a dead-letter list
+MAX_DELIVERIES = 3
+# Jobs allowed on a launcher that does not report its load
+DEFAULT_LAUNCHER_SLOTS = 2
+# Seconds between reports of queue-wait statistics
+STATS_INTERVAL = 60
 
 class Launcher_Manager(Thread):
     """
@@ -80,9 +92,20 @@ class Launcher_Manager(Thread):
         self.overwatch_id = overwatch_id
 
         self.running = True
-        self.timer = 0
         self.job_list = []
 
+        # Settings for redelivery of jobs
+        self.visibility_timeout = self.site.LAUNCHER_SETTINGS.get("JOB_VISIBILITY_TIMEOUT",
+                                                                  VISIBILITY_TIMEOUT)
+        self.max_deliveries = self.site.LAUNCHER_SETTINGS.get("JOB_MAX_DELIVERIES",
+                                                              MAX_DELIVERIES)
+
+        # Jobs wait here until a launcher has room for them
+        priorities = PRIORITIES.copy()
+        priorities.update(self.site.LAUNCHER_SETTINGS.get("JOB_PRIORITIES", {}))
+        self.scheduler = JobScheduler(priorities=priorities,
+                                      shares=self.site.LAUNCHER_SETTINGS.get("SITE_SHARES", {}))
+
         self.connect_to_redis()
 
         self.start()
@@ -98,60 +121,37 @@ class Launcher_Manager(Thread):
             self.ow_registrar.register()
 
         # Get the initial possible jobs lists
-        full_job_list = [x.get('job_list') for x in self.site.LAUNCHER_SETTINGS["LAUNCHER_SPECIFICATIONS"]]
+        self.full_job_list = [x.get('job_list') for x in self.site.LAUNCHER_SETTINGS["LAUNCHER_SPECIFICATIONS"]]
+
+        # Jobs held by a previous manager go back on the list
+        self.redis.requeue_expired_jobs('RAPD_JOBS',
+                                        visibility_timeout=0,
+                                        max_deliveries=self.max_deliveries)
+
+        # Check which launchers are alive now and every TIMER seconds after
+        schedule = PeriodicTasks(logger=self.logger)
+        schedule.add(TIMER, self.update_launchers)
+        schedule.add(STATS_INTERVAL, self.report_stats, run_now=False)
 
         try:
             # This is the server portion of the code
             while self.running:
-                # Get updated job list by checking which launchers are running
-                # Reassign jobs if launcher(s) status changes
-                if round(self.timer%TIMER,1) == 1.0:
-                    try:
-                        # Have Registrar update status
-                        if self.overwatch_id:
-                            self.ow_registrar.update()
-
-                        # Check which launchers are running
-                        temp = [l for l in full_job_list if self.redis.get("OW:"+l)]
-
-                        # Determine which launcher(s) went offline
-                        offline = [line for line in self.job_list if temp.count(line) == False]
-                        if len(offline) > 0:
-                            # Pop waiting jobs off their job_lists and push back in RAPD_JOBS for reassignment.
-                            for _l in offline:
-                                while self.redis.llen(_l) != 0:
-                                    self.redis.rpoplpush(_l, 'RAPD_JOBS')
-
-                        # Determine which launcher(s) came online (Also runs at startup!)
-                        online = [line for line in temp if self.job_list.count(line) == False]
-                        if len(online) > 0:
-                            # Pop jobs off RAPD_JOBS_WAITING and push back onto RAPD_JOBS for reassignment.
-                            while self.redis.llen('RAPD_JOBS_WAITING') != 0:
-                                self.redis.rpoplpush('RAPD_JOBS_WAITING', 'RAPD_JOBS')
-
-                        # Update the self.job_list
-                        self.job_list = temp
-
-                    except redis.exceptions.ConnectionError:
-                        if self.logger:
-                            self.logger.exception("Remote Redis is not up. Waiting for Sentinal to switch to new host")
-                        time.sleep(1)
+                schedule.run_pending()
 
-                # Look for a new command
+                # Look for a new command, waiting at most BLOCKING_TIMEOUT
                 # This will throw a redis.exceptions.ConnectionError if redis is unreachable
-                #command = self.redis.brpop(["RAPD_JOBS",], 5)
                 try:
-                    while self.redis.llen("RAPD_JOBS") != 0:
-                        command = self.redis.rpop("RAPD_JOBS")
-                        # Handle the message
-                        if command:
-                            self.push_command(json.loads(command))
-                            # Only run 1 command
-                            # self.running = False
-                            # break
-                    # sleep a little when jobs aren't coming in.
-                    time.sleep(0.2)
-                    self.timer += 0.2
+                    result = self.redis.reserve_job("RAPD_JOBS", timeout=BLOCKING_TIMEOUT)
+                    # Handle the message
+                    if result:
+                        command, raw = result
+                        self.scheduler.add(command, raw)
+                        if self.logger:
+                            self.logger.debug("Command received channel:RAPD_JOBS  message: %s", command)
+
+                    # Hand out whatever the launchers have room for
+                    if len(self.scheduler):
+                        self.dispatch_jobs()
                 except redis.exceptions.ConnectionError:
                     if self.logger:
                         self.logger.exception("Remote Redis is not up. Waiting for Sentinal to switch to new host")
@@ -160,6 +160,49 @@ class Launcher_Manager(Thread):
         except KeyboardInterrupt:
             self.stop()
 
+    def update_launchers(self):
+        """
+        Get updated job list by checking which launchers are running and
+        reassign jobs if launcher(s) status changes
+        """
+        try:
+            # Have Registrar update status
+            if self.overwatch_id:
+                self.ow_registrar.update()
+
+            # Check which launchers are running
+            temp = [l for l in self.full_job_list if self.redis.get("OW:"+l)]
+
+            # Determine which launcher(s) went offline
+            offline = [line for line in self.job_list if temp.count(line) == False]
+            if len(offline) > 0:
+                # Pop waiting jobs off their job_lists and push back in RAPD_JOBS for reassignment.
+                for _l in offline:
+                    while self.redis.rpoplpush(_l, 'RAPD_JOBS'):
+                        pass
+
+            # Determine which launcher(s) came online (Also runs at startup!)
+            online = [line for line in temp if self.job_list.count(line) == False]
+            if len(online) > 0:
+                # Pop jobs off RAPD_JOBS_WAITING and push back onto RAPD_JOBS for reassignment.
+                while self.redis.rpoplpush('RAPD_JOBS_WAITING', 'RAPD_JOBS'):
+                    pass
+
+            # Update the self.job_list
+            self.job_list = temp
+
+            # Reassign single jobs a launcher took but never started
+            for _l in self.full_job_list:
+                self.redis.requeue_expired_jobs(_l,
+                                                visibility_timeout=self.visibility_timeout,
+                                                max_deliveries=self.max_deliveries,
+                                                destination='RAPD_JOBS')
+
+        except redis.exceptions.ConnectionError:
+            if self.logger:
+                self.logger.exception("Remote Redis is not up. Waiting for Sentinal to switch to new host")
+            time.sleep(1)
+
     def stop(self):
         if self.logger:
             self.logger.debug('shutting down launcher manager')
@@ -167,14 +210,87 @@ class Launcher_Manager(Thread):
         if self.overwatch_id:
             self.ow_registrar.stop()
 
-    def set_launcher(self, command=False, site_tag=False):
-        """Find the correct running launcher to launch a specific job COMMAND"""
+    def report_stats(self):
+        """Log the queue-wait statistics and leave them in redis for others"""
+
+        stats = self.scheduler.get_stats()
+        if self.logger:
+            for key in sorted(stats):
+                self.logger.debug("Queue wait %s  count:%d  mean:%.2f s  max:%.2f s  waiting:%d",
+                                  key,
+                                  stats[key]["count"],
+                                  stats[key]["mean_wait"],
+                                  stats[key]["max_wait"],
+                                  stats[key]["waiting"])
+        self.redis.set("RAPD_JOBS:stats", json.dumps(stats))
+
+    def dispatch_jobs(self):
+        """
+        Send held jobs to launchers with room for them, best jobs first, until
+        no more can be placed
+        """
+
+        loads = self.get_launcher_loads()
+
+        dispatched = True
+        while dispatched:
+            dispatched = False
+            for command, raw in self.scheduler.candidates():
+                site_tag = launch_tools.get_site_tag(command)
+
+                # Nothing running could take the job, so it waits for a launcher
+                if not self.get_launchers(command['command'], site_tag):
+                    launcher, launch_dir = False, False
+                else:
+                    launcher, launch_dir = self.set_launcher(command['command'], site_tag, loads)
+                    # Every launcher that could take the job is full
+                    if not launcher:
+                        continue
+                    loads[launcher]["queued"] += 1
+
+                wait = self.scheduler.remove(command)
+                if self.logger:
+                    self.logger.debug("Dispatching %s after %.3f s in the scheduler",
+                                      command['command'],
+                                      wait)
+                self.push_command(command, launcher, launch_dir)
+                # Only let go of the job once it is on the next list
+                self.redis.ack_job("RAPD_JOBS", raw)
+                dispatched = True
+
+    def get_launcher_loads(self):
+        """
+        Return a dict of job_list:{"slots", "busy", "queued"} for the running
+        launchers from their list depths and the load they report to Overwatch
+        """
+
+        pipe = self.redis.pipeline()
+        for _l in self.job_list:
+            pipe.llen(_l)
+            pipe.llen(_l+":inflight")
+            pipe.get("OW:%s:load" % _l)
+        results = pipe.execute()
+
+        specifications = dict((x.get('job_list'), x) for x in self.site.LAUNCHER_SETTINGS["LAUNCHER_SPECIFICATIONS"])
+
+        loads = {}
+        for index, _l in enumerate(self.job_list):
+            waiting, inflight, report = results[index*3:index*3+3]
+            report = json.loads(report) if report else {}
+            loads[_l] = {"slots":report.get("slots") or specifications[_l].get("pool_size") or DEFAULT_LAUNCHER_SLOTS,
+                         "busy":report.get("busy", 0),
+                         "queued":waiting + inflight}
+        return loads
+
+    def get_launchers(self, command=False, site_tag=False):
+        """Return the specifications of the running launchers that can take a job COMMAND"""
         # list of commands to look for in the 'job_types'
-        # If the highest prioity launcher is 'ALL', it is chosen.
         search = ['ALL']
         if command:
             search.append(command)
 
+        launchers = []
+
         # Search through launchers
         for x in self.site.LAUNCHER_SETTINGS["LAUNCHER_SPECIFICATIONS"]:
             # Is launcher running?
@@ -183,35 +299,51 @@ class Launcher_Manager(Thread):
                 for j in search:
                     if j in x.get('job_types'):
                         # Check if launcher is accepting jobs for this beamline
-                        if site_tag:
-                            if site_tag in x.get('site_tag'):
-                                return (x.get('job_list'), x.get('launch_dir'))
-                        else:
-                            return (x.get('job_list'), x.get('launch_dir'))
+                        if not site_tag or site_tag in x.get('site_tag'):
+                            launchers.append(x)
+                        break
+
+        return launchers
+
+    def set_launcher(self, command=False, site_tag=False, loads=None):
+        """
+        Find the correct running launcher to launch a specific job COMMAND
+
+        With loads from get_launcher_loads, the launcher with the most free
+        slots for its size is chosen, and launchers with no free slots are
+        passed over. Without, the first that can take the job is chosen.
+        """
+
+        best = (False, False)
+        best_free = 0
+
+        for x in self.get_launchers(command, site_tag):
+            if loads is None:
+                return (x.get('job_list'), x.get('launch_dir'))
+
+            load = loads[x.get('job_list')]
+            free = float(load["slots"] - load["busy"] - load["queued"]) / load["slots"]
+            if free > best_free:
+                best = (x.get('job_list'), x.get('launch_dir'))
+                best_free = free
 
         # Return False if no running launchers are appropriate
-        return (False, False)
+        return best
 
-    def push_command(self, command):
+    def push_command(self, command, launcher, launch_dir):
         """
-        Handle an incoming command
+        Send a command to a launcher
 
         Keyword arguments:
         command -- command from redis
+        launcher -- job_list of the launcher or False to hold the job for one
+        launch_dir -- launch directory of the launcher
         """
         print "push_command"
         #pprint(command)
 
         # Split up the command
         message = command
-        if self.logger:
-            self.logger.debug("Command received channel:RAPD_JOBS  message: %s", message)
-
-        # get the site_tag from the image header to determine beamline where is was collected.
-        site_tag = launch_tools.get_site_tag(message)
-
-        # get the correct running launcher and launch_dir
-        launcher, launch_dir = self.set_launcher(message['command'], site_tag)
 
         if message['command'].startswith('INTEGRATE'):
             print 'type: %s...%s' % (message['preferences']['xdsinp'][:100], message['preferences']['xdsinp'][-100:])
@@ -228,11 +360,16 @@ class Launcher_Manager(Thread):
             message["directories"]["launch_dir"] = launch_dir
 
             # Push the job on the correct launcher job list
-            self.redis.lpush(launcher, json.dumps(message))
+            self.redis.enqueue_job(launcher, message)
             if self.logger:
                 self.logger.debug("Command sent channel:%s  message: %s", launcher, message)
+                # Time from Model.send_command to here
+                if message.get("dispatch_time"):
+                    self.logger.debug("Routed to %s %.1f ms after sending",
+                                      launcher,
+                                      (time.time() - message["dispatch_time"]) * 1000)
         else:
-            self.redis.lpush('RAPD_JOBS_WAITING', json.dumps(message))
+            self.redis.enqueue_job('RAPD_JOBS_WAITING', message)
             if self.logger:
                 self.logger.debug("Could not find a running launcher for this job. Putting job on RAPD_JOBS_WAITING list")
 
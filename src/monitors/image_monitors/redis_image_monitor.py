@@ -26,6 +26,7 @@ __email__ = "fmurphy@anl.gov"
 __status__ = "Development"
 
 # Standard imports
+import collections
 import logging
 # import redis
 from threading import Thread
@@ -38,8 +39,9 @@ import database.redis_adapter as redis_database
 # from utils import pysent
 
 # Constants
-#POLLING_REST = 0.1      # Time to rest between checks for new image
-POLLING_REST = 0.01      # Time to rest between checks for new image
+BLOCKING_TIMEOUT = 1     # Seconds to block waiting for an image before checking state
+BATCH_SIZE = 100         # Maximum number of images handed off per wakeup
+OW_INTERVAL = 5          # Seconds between overwatch updates
 
 class Monitor(Thread):
     """Monitor for new data collection images to be submitted to a redis instance"""
@@ -132,41 +134,51 @@ class Monitor(Thread):
             # Register
             self.ow_registrar.register()
 
-        # Determine interval for overwatch update
-        ow_round_interval = 50 # int((5 * len(self.image_lists)) / POLLING_REST)
-
         # If we are starting clean
         if self.clean_start:
             for tag in self.tags:
                 self.redis.delete("images_collected:%s" % tag)
 
-        while self.running:
+        # The lists to watch and the tags they belong to
+        image_lists = collections.OrderedDict(
+            [("images_collected:%s" % tag, tag) for tag in self.tags])
 
-            # ~5 seconds between overwatch updates
-            for __ in range(ow_round_interval):
+        # Allow the site to tune the number of images handed off at once
+        batch_size = self.site.IMAGE_MONITOR_SETTINGS.get("BATCH_SIZE", BATCH_SIZE)
 
-                for tag in self.tags:
+        ow_last_update = time.time()
+
+        while self.running:
 
-                    # Try to pop the oldest image off the list
-                    new_image = self.redis.rpop("images_collected:%s" % tag)
-                    #new_image = self.redis.rpop("images_collected_%s" % tag)
+            # Block on all the lists at once - no round trips while idle
+            popped = self.redis.brpop(image_lists.keys(), timeout=BLOCKING_TIMEOUT)
 
-                    # Have a new_image
-                    if new_image:
-                        # self.logger.debug("New image %s - %s", tag, new_image)
+            # Have a new image
+            if popped:
+                image_list, new_image = popped
+                new_images = [{"message_type":"NEWIMAGE",
+                               "fullname":new_image,
+                               "site_tag":image_lists[image_list]}]
 
-                        # Notify core thread that an image has been collected
-                        self.notify({"message_type":"NEWIMAGE",
-                                     "fullname":new_image,
-                                     "site_tag":tag})
+                # Drain whatever else has piled up during a fast collection
+                for image_list, tag in image_lists.iteritems():
+                    room = batch_size - len(new_images)
+                    if room <= 0:
+                        break
+                    for new_image in self.redis.rpop_batch(image_list, room):
+                        new_images.append({"message_type":"NEWIMAGE",
+                                           "fullname":new_image,
+                                           "site_tag":tag})
 
-                        # self.logger.debug("New image data %s", new_image)
+                # self.logger.debug("New images %d", len(new_images))
 
-                    # Slow it down a little
-                    time.sleep(POLLING_REST)
+                # Notify core thread that images have been collected
+                self.notify({"message_type":"NEWIMAGES",
+                             "images":new_images})
 
             # Have Registrar update status
-            if self.overwatch_id:
+            if self.overwatch_id and (time.time() - ow_last_update) >= OW_INTERVAL:
                 self.ow_registrar.update()
+                ow_last_update = time.time()
 
         self.logger.debug("Exit image monitor loop")
@@ -66,10 +66,8 @@ import utils.exceptions as exceptions
 from utils.text import json
 from bson.objectid import ObjectId
 import utils.xutils as xutils
-from utils.processes import local_subprocess
+from utils.processes import local_subprocess, JobExecutor
 import info
-import plugins.pdbquery.commandline
-import plugins.pdbquery.plugin
 
 # Software dependencies
 VERSIONS = {
@@ -127,6 +125,8 @@ class RapdPlugin(Process):
     redis = False
 
     jobs = {}
+    # Runs the jobs and finishes each as it completes
+    executor = False
 
 
     results = {
@@ -370,7 +370,9 @@ calculation",
             self.logger.debug("preprocess")
 
         self.tprint("\nAnalyzing the data file", level=30, color="blue")
-        
+
+        self.executor = JobExecutor(nproc=3, logger=self.logger)
+
         self.run_xtriage()
         self.tprint(arg=10, level="progress")
         self.run_molrep()
@@ -413,58 +415,24 @@ calculation",
         self.logger.debug('Analysis finished')
 
     def jobs_monitor(self):
-        """Monitor running jobs and finsh them when they complete."""
-        timed_out = False
-        timer = 0
-        jobs = self.jobs.keys()
-        if jobs != ['None']:
-            counter = len(jobs)
-            while counter != 0:
-                for job in jobs:
-                    if job.is_alive() == False:
-                        if self.jobs[job].get('name') == 'xtriage':
-                            self.finish_xtriage()
-                        if self.jobs[job].get('name') == 'molrep':
-                            self.finish_molrep()
-                        if self.jobs[job].get('name') == 'NCS':
-                            self.finish_phaser_ncs()
-                        jobs.remove(job)
-                        del self.jobs[job]
-                        counter -= 1
-                time.sleep(0.2)
-                timer += 0.2
-                """
-                if self.verbose:
-                  if round(timer%1,1) in (0.0,1.0):
-                      print 'Waiting for AutoStat jobs to finish '+str(timer)+' seconds'
-                """
-                if self.stats_timer:
-                    if timer >= self.stats_timer:
-                        timed_out = True
-                        break
-            if timed_out:
-                if self.verbose:
-                    self.logger.debug('AutoStat timed out.')
-                    print 'AutoStat timed out.'
-                
-                pids = [self.jobs[job].get('pid') for job in self.jobs]
-                for pid in pids:
-                    xutils.kill_children(pid, self.logger)
-                """
-                for pid in self.pids.values():
-                    #jobs are not sent to cluster
-                    Utils.killChildren(self,pid)
-                for job in jobs:
-                    if self.jobs_output[job] == 'xtriage':
-                        self.postprocessXtriage()
-                    if self.jobs_output[job] == 'molrep':
-                        self.postprocessMolrep()
-                    if self.jobs_output[job] == 'NCS':
-                        self.postprocessNCS()
-                """
+        """Wait for the jobs, which are finished by callbacks as they complete."""
+
+        if not self.executor.wait(self.stats_timer):
             if self.verbose:
-                self.logger.debug('AutoStats Queue finished.')
+                self.logger.debug('AutoStat timed out.')
+                print 'AutoStat timed out.'
+
+            # Stop the jobs still running without finishing them
+            pids = self.executor.cancel()
+            for name, pid in pids.iteritems():
+                self.logger.debug('Killing %s' % name)
+                if pid:
+                    xutils.kill_children(pid, self.logger)
 
+        self.executor.close()
+
+        if self.verbose:
+            self.logger.debug('AutoStats Queue finished.')
 
     def run_xtriage(self):
         """
@@ -484,14 +452,9 @@ calculation",
         if self.verbose and self.logger:
             self.logger.debug(command)
 
-        pid_queue = Queue()
-        job = Process(target=local_subprocess, kwargs={'command': command,
-                                                        'pid_queue':pid_queue})
-        job.start()
-        self.jobs[job] = {'name': 'xtriage',
-                          'pid': pid_queue.get()}
+        self.executor.submit('xtriage', self.finish_xtriage, command=command)
 
-    def finish_xtriage(self):
+    def finish_xtriage(self, output=False):
         if self.verbose and self.logger:
             self.logger.debug('finish_xtriage')
         # Read raw output
@@ -528,17 +491,13 @@ calculation",
             command = "molrep -f %s -i <<stop\n_DOC  Y\n_RESMAX 4\n_RESMIN 9\nstop" % \
                       self.data_file
 
-            molrep_queue = Queue()
-            job = Process(target=local_subprocess, kwargs={'command': command,
-                                                           #'result_queue': self.molrep_queue,
-                                                           #'logfile' : "molrep_selfrf.log",
-                                                           'pid_queue':molrep_queue,
-                                                           'shell': True})
-            job.start()
-            self.jobs[job] = {'name': 'molrep',
-                              'pid': molrep_queue.get()}
+            self.executor.submit('molrep',
+                                 self.finish_molrep,
+                                 command=command,
+                                 #logfile="molrep_selfrf.log",
+                                 shell=True)
 
-    def finish_molrep(self):
+    def finish_molrep(self, output=False):
         """Get Molrep results"""
         if self.verbose and self.logger:
             self.logger.debug('finish_molrep')
@@ -650,22 +609,17 @@ calculation",
             command = "phenix.phaser << eof\nMODE NCS\nHKLIn %s\nLABIn F=F SIGF=SIGF\neof\n" % \
                       self.data_file
             
-            self.phaser_queue = Queue()
-            job = Process(target=local_subprocess, kwargs={'command': command,
-                                                           'result_queue': self.phaser_queue,
-                                                           'logfile' : "phaser_ncs.log",
-                                                           'pid_queue':self.phaser_queue,
-                                                           'shell': True})
-            job.start()
-            self.jobs[job] = {'name': 'NCS',
-                              'pid': self.phaser_queue.get()}
+            self.executor.submit('NCS',
+                                 self.finish_phaser_ncs,
+                                 command=command,
+                                 logfile="phaser_ncs.log",
+                                 shell=True)
 
-    def finish_phaser_ncs(self):
+    def finish_phaser_ncs(self, output):
         if self.verbose and self.logger:
             self.logger.debug('finish_phaser_ncs')
 
         # Store raw output
-        output = self.phaser_queue.get()
         self.results["results"]["raw"]["phaser"] = output['stdout'].split("\n")
 
         self.results["results"]["parsed"]["phaser"] = parse.parse_phaser_ncs_output(output['stdout'])
@@ -55,6 +55,7 @@ import utils.credits as rcredits
 import utils.global_vars as rglobals
 from utils.text import json
 from bson.objectid import ObjectId
+from utils.model_cache import get_model_cache
 from utils.processes import local_subprocess
 
 # Cache of CIF files
@@ -253,7 +254,25 @@ class RapdPlugin(multiprocessing.Process):
         info_string = rcredits.get_credits_text(programs, "    ")
         self.tprint(info_string, level=99, color="white")
 
-class NECATRepository():
+class CachedRepository(object):
+    """
+    Gets CIF files through the shared model cache. Repositories provide
+    fetch_cif(pdb_code, fname) to download one.
+    """
+
+    def download_cif(self, pdb_code, fname):
+        """Get the CIF file to fname through the model cache"""
+        return get_model_cache(self.logger or None).install(pdb_code, "cif", fname, self.fetch_cif)
+
+    def prefetch_cifs(self, pdb_codes):
+        """Start downloading the CIF files not in the model cache in the background"""
+        return get_model_cache(self.logger or None).prefetch(pdb_codes, "cif", self.fetch_cif)
+
+    def has_cif(self, pdb_code):
+        """Return True if the CIF file is in the model cache"""
+        return get_model_cache(self.logger or None).has(pdb_code, "cif")
+
+class NECATRepository(CachedRepository):
     """Class for locat NE-CAT PDB repository"""
     # Save results from all the PDB's so we don't have to keeps querying the same ones..
 
@@ -358,33 +377,30 @@ class NECATRepository():
 
         return output_dict
     
-    def download_cif(self, pdb_code, fname):
+    def fetch_cif(self, pdb_code, fname):
         """Download the CIF file to fname"""
-        
-        if os.path.exists(fname):
+
+        try:
+            response = urllib2.urlopen(urllib2.Request(\
+                        "%s/entry/get_cif/%s" % \
+                        (self.server, pdb_code.lower()))\
+                        , timeout=60).read()
+            # Write the  gzip file
+            with open('%s.gz'%fname, "wb") as outfile:
+                outfile.write(response)
+                outfile.close()
+            # Unzip the file and pass back path
+            local_subprocess(command = ['gunzip', '%s.gz'%fname])
+            #subprocess.Popen(["gunzip", '%s.gz'%fname]).wait()
+
             return fname
-        else:
-            try:
-                response = urllib2.urlopen(urllib2.Request(\
-                            "%s/entry/get_cif/%s" % \
-                            (self.server, pdb_code.lower()))\
-                            , timeout=60).read()
-                # Write the  gzip file
-                with open('%s.gz'%fname, "wb") as outfile:
-                    outfile.write(response)
-                    outfile.close()
-                # Unzip the file and pass back path
-                local_subprocess(command = ['gunzip', '%s.gz'%fname])
-                #subprocess.Popen(["gunzip", '%s.gz'%fname]).wait()
-                
-                return fname
-    
-            except urllib2.HTTPError as http_error:
-                if self.tprint:
-                    self.tprint("      %s when fetching %s" % (http_error, pdb_code),
-                                level=50,
-                                color="red")
-                return False
+
+        except urllib2.HTTPError as http_error:
+            if self.tprint:
+                self.tprint("      %s when fetching %s" % (http_error, pdb_code),
+                            level=50,
+                            color="red")
+            return False
 
     def cell_search(self, search_params):
         """search for PDBs within unit cell range."""
@@ -403,7 +419,7 @@ class NECATRepository():
 
         return search_results
 
-class RCSBRepository():
+class RCSBRepository(CachedRepository):
     """Class for RCSB PDB repository. NOT VERY RELIABLE"""
     # Save results from all the PDB's so we don't have to keeps querying the same ones..
     results = {}
@@ -465,23 +481,20 @@ class RCSBRepository():
         # Return results
         return output_dict
 
-    def download_cif(self, pdb_code, fname):
+    def fetch_cif(self, pdb_code, fname):
         """Download the CIF file to fname"""
-        if os.path.exists(fname):
+        try:
+            # PDBe is more reliable
+            wget = ['wget', '-O', '%s.gz'%fname, 'ftp://ftp.ebi.ac.uk/pub/databases/rcsb/pdb/data/structures/divided/mmCIF/%s/%s.cif.gz'%(pdb_code.lower()[1:-1], pdb_code.lower())]
+            local_subprocess(command = wget)
+            local_subprocess(command = ['gunzip', '%s.gz'%fname])
             return fname
-        else:
-            try:
-                # PDBe is more reliable
-                wget = ['wget', 'ftp://ftp.ebi.ac.uk/pub/databases/rcsb/pdb/data/structures/divided/mmCIF/%s/%s.cif.gz'%(pdb_code.lower()[1:-1], pdb_code.lower())]
-                local_subprocess(command = wget)
-                local_subprocess(command = ['gunzip', '%s.gz'%fname])
-                return fname
-            except:
-                if self.tprint:
-                    self.tprint("     Error when fetching %s" % (pdb_code),
-                                level=50,
-                                color="red")
-                return False
+        except:
+            if self.tprint:
+                self.tprint("     Error when fetching %s" % (pdb_code),
+                            level=50,
+                            color="red")
+            return False
 
     def cell_search(self, search_params):
         """search for PDBs within unit cell range."""
@@ -510,7 +523,7 @@ class RCSBRepository():
         # Get the molecular descriptions
         return self.check_for_pdbs(search_results)
 
-class PDBERepository():
+class PDBERepository(CachedRepository):
     """Class for locat RCSB PDB repository"""
     # Save results from all the PDB's so we don't have to keeps querying the same ones..
     results = {}
@@ -557,40 +570,37 @@ class PDBERepository():
         output_dict.update(self.solr_search(query))
         return output_dict
 
-    def download_cif(self, pdb_code, fname):
+    def fetch_cif(self, pdb_code, fname):
         """Download the CIF file to fname"""
-        if os.path.exists(fname):
+        try:
+            wget = ['wget', '-O', '%s.gz'%fname, 'ftp://ftp.ebi.ac.uk/pub/databases/rcsb/pdb/data/structures/divided/mmCIF/%s/%s.cif.gz'%(pdb_code.lower()[1:-1], pdb_code.lower())]
+            local_subprocess(command = wget)
+            local_subprocess(command = ['gunzip', '%s.gz'%fname])
             return fname
-        else:
-            try:
-                wget = ['wget', 'ftp://ftp.ebi.ac.uk/pub/databases/rcsb/pdb/data/structures/divided/mmCIF/%s/%s.cif.gz'%(pdb_code.lower()[1:-1], pdb_code.lower())]
-                local_subprocess(command = wget)
-                local_subprocess(command = ['gunzip', '%s.gz'%fname])
-                return fname
-            except:
-                if self.tprint:
-                    self.tprint("     Error when fetching %s" % (pdb_code),
-                                level=50,
-                                color="red")
-                return False
-    
-    def download_pdb(self, pdb_code, fname):
+        except:
+            if self.tprint:
+                self.tprint("     Error when fetching %s" % (pdb_code),
+                            level=50,
+                            color="red")
+            return False
+
+    def fetch_pdb(self, pdb_code, fname):
         """Download the PDB file to fname"""
-        if os.path.exists(fname):
+        try:
+            wget = ['wget', '-O', '%s.gz'%fname, 'ftp://ftp.ebi.ac.uk/pub/databases/rcsb/pdb/data/structures/divided/pdb/%s/pdb%s.ent.gz'%(pdb_code.lower()[1:-1], pdb_code.lower())]
+            local_subprocess(command = wget)
+            local_subprocess(command = ['gunzip', '%s.gz'%fname])
             return fname
-        else:
-            try:
-                wget = ['wget', 'ftp://ftp.ebi.ac.uk/pub/databases/rcsb/pdb/data/structures/divided/pdb/%s/pdb%s.ent.gz'%(pdb_code.lower()[1:-1], pdb_code.lower())]
-                local_subprocess(command = wget)
-                shutil.move('pdb%s.ent.gz'%pdb_code.lower(), '%s.gz'%os.path.basename(fname))
-                local_subprocess(command = ['gunzip', '%s.gz'%fname])
-                return fname
-            except:
-                if self.tprint:
-                    self.tprint("     Error when fetching %s" % (pdb_code),
-                                level=50,
-                                color="red")
-                return False
+        except:
+            if self.tprint:
+                self.tprint("     Error when fetching %s" % (pdb_code),
+                            level=50,
+                            color="red")
+            return False
+
+    def download_pdb(self, pdb_code, fname):
+        """Get the PDB file to fname through the model cache"""
+        return get_model_cache(self.logger or None).install(pdb_code, "pdb", fname, self.fetch_pdb)
  
     def cell_search(self, search_params):
         """search for PDBs within unit cell range."""
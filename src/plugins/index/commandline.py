@@ -169,6 +169,9 @@ def construct_command(image_headers, commandline_args, detector_module):
     #command["preferences"]["multiprocessing"] = True
     command["preferences"]["nproc"] = commandline_args.nproc
 
+    # Work in the RAM disk
+    command["preferences"]["ram"] = commandline_args.ram
+
     # The run mode for rapd
     command["preferences"]["run_mode"] = commandline_args.run_mode
 
@@ -309,6 +312,12 @@ def get_commandline():
                         type=float,
                         help="Calculates the second image in a pair based on this oscillation angle wedge size between images")
 
+    # Work in RAM
+    parser.add_argument("--ram",
+                        action="store_true",
+                        dest="ram",
+                        help="Work in the RAM disk scratch space")
+
     # Directory or files
     parser.add_argument(action="store",
                         dest="sources",
@@ -146,6 +146,8 @@ DEFAULT_PREFERENCES = {
     "multiprocessing": True,
     # 8 will be full speed. If set to 1, then everything is run sequentially
     "nproc" : 8,
+    # Work in the RAM disk scratch space (not with a cluster)
+    "ram": False,
     # Change these if user wants to continue dataset with other crystal(s).
     # "reference_data_id": None, #MOSFLM
     # #"reference_data_id": 1,#MOSFLM
@@ -43,9 +43,9 @@ from distutils.spawn import find_executable
 import functools
 # import glob
 import logging
-from multiprocessing import Process, Event, Pool
+from multiprocessing import Process, Event, Pool, active_children
 from multiprocessing import Queue as mp_Queue
-from Queue import Queue
+from Queue import Queue, Empty
 from threading import Thread
 import numpy
 import os
@@ -72,7 +72,8 @@ from utils.r_numbers import try_int, try_float
 import utils.exceptions as exceptions
 import utils.global_vars as global_vars
 #from utils.processes import local_subprocess, LocalSubprocess
-from utils.processes import local_subprocess
+from utils.processes import local_subprocess, total_nproc
+from utils.scratch import Scratch
 from utils.text import json
 from bson.objectid import ObjectId
 import utils.xutils as xutils
@@ -93,6 +94,11 @@ VERSIONS = {
     "raddose": (),
 }
 
+# Labelit fallbacks that can start before the run they back up has failed.
+# Fallbacks that edit files the failed run writes (bumpiness, Mosflm
+# resolution) start once the failure has been parsed.
+SPECULATIVE_LABELIT = ("min_spots",)
+
 class RapdPlugin(Process):
     """
     command format
@@ -123,6 +129,9 @@ class RapdPlugin(Process):
 
     # Runs in RAM (slightly faster), but difficult to debug.
     ram = False
+    # Scratch space manager when running in RAM and the staged images
+    scratch = None
+    staged_key = None
 
     # Will not use RAM if self.cluster_use=True since runs would be on separate nodes. Slower
     # (>10%).
@@ -193,6 +202,14 @@ class RapdPlugin(Process):
     iso_B = False
     # Dicts for running the Queues
     jobs = {}
+    # Strategy runs - Mosflm is run 4, the rest are BEST at reduced resolution
+    strategy_pending = []
+    strategy_started = {}
+    strategy_events = {}
+    strategy_done = None
+    strategy_slots = 1
+    # Event for the strategy run in this process, passed to the cluster
+    strategy_event = None
 
     # The results of the plugin
     results = {"_id":str(ObjectId())}
@@ -299,6 +316,9 @@ class RapdPlugin(Process):
         # then continues...(much better!!)
         self.multiproc = self.preferences.get("multiprocessing", True)
 
+        # Work in the RAM disk, which cannot be shared with cluster nodes
+        self.ram = self.preferences.get("ram", self.ram) and not self.cluster_use
+
 	    # Set for Eisenberg peptide work.
         self.sample_type = self.preferences.get("sample_type", "Protein").lower()
         if self.sample_type == "peptide":
@@ -474,16 +494,16 @@ class RapdPlugin(Process):
 
         # Determine detector vendortype
         self.vendortype = xutils.get_vendortype(self.image1)
-        #self.dest_dir = self.setup.get("work")
-        self.working_dir = self.setup.get("work")
+        self.dest_dir = self.setup.get("work")
+        self.working_dir = self.dest_dir
         if self.ram:
-            self.working_dir = "/dev/shm%s"%self.working_dir
+            self.start_scratch()
         if os.path.exists(self.working_dir) == False:
             os.makedirs(self.working_dir)
         os.chdir(self.working_dir)
 
         # Check if pair are in different folders, then make symlink for Labelit.
-        if self.image2:
+        if self.image2 and not self.staged_key:
           if os.path.dirname(self.image1['fullname']) != os.path.dirname(self.image2['fullname']):
             os.symlink(self.image1['fullname'], os.path.basename(self.image1['fullname']))
             self.image1['fullname'] = os.path.join(os.getcwd(), os.path.basename(self.image1['fullname']))
@@ -570,6 +590,47 @@ class RapdPlugin(Process):
                         level=30,
                         color="red")
 
+    def start_scratch(self):
+        """
+        Move the working directory to the RAM disk and stage the images
+        there, staying on disk for whatever does not fit
+        """
+
+        self.scratch = Scratch(logger=self.logger)
+
+        working_dir = self.scratch.allocate(self.dest_dir)
+        if not working_dir:
+            self.logger.debug("No room in RAM disk - running in %s", self.dest_dir)
+            self.ram = False
+            self.scratch = None
+            return
+        self.working_dir = working_dir
+
+        # Labelit reads the images over and over
+        images = [self.image1]
+        if self.image2:
+            images.append(self.image2)
+        key = "+".join(image["fullname"] for image in images)
+        staged = self.scratch.stage(key, [image["fullname"] for image in images])
+        if staged:
+            self.staged_key = key
+            for image in images:
+                image["fullname"] = staged[image["fullname"]]
+
+    def stop_scratch(self):
+        """Unpin the images and copy the working directory back to disk"""
+
+        if self.staged_key:
+            self.scratch.unpin(self.staged_key)
+            self.staged_key = None
+
+        if not os.path.isdir(self.dest_dir):
+            os.makedirs(self.dest_dir)
+        if os.getcwd().startswith(self.working_dir):
+            os.chdir(self.dest_dir)
+        self.scratch.release(self.working_dir, self.dest_dir)
+        self.working_dir = self.dest_dir
+
     def preprocess_raddose(self):
         """
         Create the raddose.com file which will run in process_raddose. Several beamline specific
@@ -783,6 +844,7 @@ class RapdPlugin(Process):
         params['kill_job'] = self.kill_job
         if self.ram:
             command = self.command.copy()
+            command["directories"] = command["directories"].copy()
             command["directories"]["work"] = self.working_dir
         else:
             command = self.command
@@ -1082,6 +1144,9 @@ class RapdPlugin(Process):
                               'logfile': log}
                 # Update batch queue info if using a compute cluster
                 inp_kwargs.update(self.batch_queue)
+                # Terminated on the cluster when the run is cancelled
+                if self.cluster_use and self.strategy_event:
+                    inp_kwargs['mp_event'] = self.strategy_event
 
                 # Launch the job
                 # jobs[str(i)] = Thread(target=self.launcher,
@@ -1197,58 +1262,114 @@ class RapdPlugin(Process):
                               'logfile': log}
                 # Update batch queue info if using a compute cluster
                 inp_kwargs.update(self.batch_queue)
+                # Terminated on the cluster when the run is cancelled
+                if self.cluster_use and self.strategy_event:
+                    inp_kwargs['mp_event'] = self.strategy_event
 
                 # Launch the job
                 Process(target=self.launcher,
                         kwargs=inp_kwargs).start()
 
-    def process_strategy(self, iteration=False):
+    def process_strategy(self):
         """
-        Initiate all the strategy runs using multiprocessing.
-
-        Keyword arguments
-        iteration -- (default False)
+        Start the strategy runs, as many at once as there are slots for. The
+        rest are started by run_queue as slots free up.
         """
 
-        self.logger.debug("process_strategy iteration:%s", str(iteration))
+        self.logger.debug("process_strategy")
 
-        if iteration:
-            st = iteration
-            end = iteration+1
+        self.best_version = False
+        if self.strategy == "mosflm":
+            pending = [4]
         else:
-            st = 0
-            end = 5
-            if self.strategy == "mosflm":
-                st = 4
+            # Only check best info if we are going to use best
+            # Get the Best version for this machine
+            self.best_version = xutils.get_best_version()
+            # Make sure that the BEST install has the detector
+            detector_found = best.check_best_detector(info.DETECTOR_TO_BEST.get(self.image1.get("detector"), None), self.tprint)
+            # No detector in best param file - bail on best
+            if not detector_found:
+                self.logger.debug("Detector not support by best. Failing over to mosflm strategy")
+                self.strategy = "mosflm"
+                pending = [4]
             else:
-                # Only check best info if we are going to use best
-                # Get the Best version for this machine
-                best_version = xutils.get_best_version()
-                # Make sure that the BEST install has the detector
-                detector_found = best.check_best_detector(info.DETECTOR_TO_BEST.get(self.image1.get("detector"), None), self.tprint)
-                # No detector in best param file - bail on best
-                if not detector_found:
-                    self.logger.debug("Detector not support by best. Failing over to mosflm strategy")
-                    self.strategy = "mosflm"
-                    st = 4
-
-            if self.multiproc == False:
-                end = st+1
-
-        for i in range(st, end):
-            # Print for 1st BEST run
-            if i == 1:
+                pending = [0, 1, 2, 3, 4]
+
+        # Each BEST run is a normal and an anomalous job
+        if not self.multiproc:
+            self.strategy_slots = 1
+        elif self.cluster_use:
+            self.strategy_slots = len(pending)
+        else:
+            self.strategy_slots = max(1, self.preferences.get("nproc", 8) // 2)
+
+        # With room for more than one run, get the Mosflm fallback going early
+        if self.strategy_slots > 1 and len(pending) > 1:
+            pending.remove(4)
+            pending.insert(1, 4)
+
+        self.strategy_pending = pending
+        self.strategy_started = {}
+        self.strategy_events = {}
+        self.strategy_done = mp_Queue()
+
+        while self.strategy_pending and len(self.strategy_started) < self.strategy_slots:
+            self.start_strategy_job(self.strategy_pending.pop(0))
+
+    def start_strategy_job(self, i):
+        """
+        Start one strategy run in its own process
+
+        Keyword arguments
+        i -- 0-3 for BEST at reduced resolution, 4 for Mosflm
+        """
+
+        if i == 4:
+            self.tprint(arg="  Starting Mosflm runs", level=98, color="white")
+            target = self.process_mosflm
+            args = ()
+        else:
+            if not [j for j in self.strategy_started if j < 4]:
                 self.tprint(arg="  Starting BEST runs", level=98, color="white")
-            # Run Mosflm for strategy
-            if i == 4:
-                self.tprint(arg="  Starting Mosflm runs", level=98, color="white")
-                job = Process(target=self.process_mosflm, name="mosflm%s" % i)
-            # Run BEST
-            else:
-                # Reduces resolution and reruns Mosflm to calc new files, then runs Best.
-                job = Process(target=self.check_best, name="best%s" % i, args=(i, best_version))
-            job.start()
-            self.jobs[str(i)] = job
+            # Reduces resolution and reruns Mosflm to calc new files, then runs Best.
+            target = self.check_best
+            args = (i, self.best_version)
+
+        event = Event()
+        event.set()
+        job = Process(target=self.run_strategy_job,
+                      name="%s%d" % ("mosflm" if i == 4 else "best", i),
+                      args=(i, event, target, args))
+        job.start()
+        self.jobs[str(i)] = job
+        self.strategy_events[i] = event
+        self.strategy_started[i] = time.time()
+
+    def run_strategy_job(self, i, event, target, args):
+        """Run a strategy in a child process and report on strategy_done when it is finished"""
+
+        self.strategy_event = event
+        try:
+            target(*args)
+            # The programs run in processes of their own
+            for child in active_children():
+                child.join()
+        finally:
+            self.strategy_done.put(i)
+
+    def cancel_strategy_job(self, i):
+        """Stop a strategy run whose result is no longer needed"""
+
+        job = self.jobs[str(i)]
+        if self.verbose and self.logger:
+            self.logger.debug("terminating job: %s" % job)
+        if self.cluster_use:
+            # kill child process on DRMAA job causes error on cluster.
+            # Clearing the event terminates the job on the cluster.
+            self.strategy_events[i].clear()
+        elif job.is_alive():
+            # The programs are children of the job
+            xutils.kill_children(job.pid, self.logger)
 
     def process_xoalign(self):
         """
@@ -1528,112 +1649,115 @@ Distance | % Transmission", level=98, color="white")
 
     def run_queue(self):
         """
-        run_queue for strategy.
+        Wait for the strategy runs, taking the first acceptable result for
+        each of the normal and anomalous strategies in order of preference
+        (BEST at full resolution first, Mosflm last) and cancelling the runs
+        that can no longer be used.
         """
 
         self.logger.debug("AutoindexingStrategy::run_queue")
         self.tprint(arg="\nStarting strategy calculations", level=98, color="blue")
         self.tprint(90, level="progress")
 
-        # try:
-        def set_best_results(i, x):
-            # Set Best output if it failed after 3 tries
-            if i == 3:
-                if x == 0:
-                    self.best_results = {"best_results_norm":"FAILED"}
-                    self.best_failed = True
-                else:
-                    self.best_anom_results = {"best_results_anom":"FAILED"}
-                    self.best_anom_failed = True
+        # Order of preference
+        preference = sorted(self.strategy_pending + self.strategy_started.keys())
+        best_runs = set(i for i in preference if i < 4)
+        # Run twice for regular(0) and anomalous(1) strategies
+        l = ["", "_anom"]
+        decided = [False, False]
+        # Runs looked at for each strategy without an acceptable result
+        rejected = [set(), set()]
+        finished = set()
+        timed_out = set()
+        cancelled = set()
+
+        def get_log(i, x):
+            if i == 4:
+                return os.path.join(self.labelit_dir, "mosflm_strat%s.out" % l[x])
+            return os.path.join(self.labelit_dir, str(i), "best%s.log" % l[x])
+
+        self.tprint(arg="    Waiting for strategy to finish", level=10, color="white")
 
         try:
-            st = 0
-            if self.strategy == "mosflm":
-                st = 4
-            # dict = {}
-            # Run twice for regular(0) and anomalous(1) strategies
-            l = ["", "_anom"]
-            first_print = False
-            for x in range(0, 2):
-                for i in range(st, 5):
-                    timed_out = False
-                    timer = 0
-                    job = self.jobs[str(i)]
-                    while 1:
-                        # print i, ">>>", job
-
-                        if job.is_alive() == False:
-                            if i == 4:
-                                log = os.path.join(self.labelit_dir, "mosflm_strat%s.out" % l[x])
-                            else:
-                                log = os.path.join(self.labelit_dir, str(i))+"/best%s.log" % l[x]
+            while not all(decided):
+
+                running = [i for i in self.strategy_started
+                           if i not in finished and i not in timed_out and i not in cancelled]
+                if not running:
+                    break
+
+                # Wait for the next run to finish or time out
+                timeout = None
+                if global_vars.STRATEGY_TIMEOUT:
+                    timeout = max(0, min(self.strategy_started[i] for i in running) + \
+                                     global_vars.STRATEGY_TIMEOUT - time.time())
+                try:
+                    i = self.strategy_done.get(timeout=timeout)
+                    if i not in cancelled:
+                        self.jobs[str(i)].join()
+                        finished.add(i)
+                except Empty:
+                    for i in running:
+                        if time.time() - self.strategy_started[i] >= global_vars.STRATEGY_TIMEOUT:
+                            self.tprint(arg="  Strategy calculation timed out", level=30, color="red")
+                            self.cancel_strategy_job(i)
+                            timed_out.add(i)
+
+                # Take the first acceptable result for each strategy, in order
+                for x in range(0, 2):
+                    for i in preference:
+                        if decided[x] or i in rejected[x]:
+                            continue
+                        # Still waiting on a preferred run
+                        if i not in finished and i not in timed_out:
                             break
-                        time.sleep(1)
-                        timer += 1
-                        if self.verbose and self.logger:
-                            number = round(timer % 1, 1)
-                            if number in (0.0, 1.0):
-                                if first_print:
-                                    self.tprint(arg=".",
-                                                level=10,
-                                                color="white",
-                                                newline=False)
-                                else:
-                                    first_print = True
-                                    self.tprint(arg="    Waiting for strategy to finish",
-                                                level=10,
-                                                color="white",
-                                                newline=False)
-                        if global_vars.STRATEGY_TIMEOUT:
-                            if timer >= global_vars.STRATEGY_TIMEOUT:
-                                timed_out = True
-                                # print "Timed out"
-                                job.terminate()
-                                break
-                    if timed_out:
-                        self.tprint(arg="  Strategy calculation timed out", level=30, color="red")
-                        set_best_results(i, x)
-                        if i < 4:
-                            if self.multiproc == False:
-                                self.process_strategy(i+1)
-                    else:
-                        if i == 4:
+                        log = get_log(i, x)
+                        if i in timed_out or not os.path.exists(log):
+                            rejected[x].add(i)
+                        elif i == 4:
                             self.postprocess_mosflm(log)
+                            decided[x] = True
+                        elif self.postprocess_best(log) == "OK":
+                            decided[x] = True
                         else:
-                            self.jobs[str(i)].join()
-                            # print "Looking at %s" % log
-                            job1 = self.postprocess_best(log)
-                            # print "  job=%s" % job1
-                            if job1 == "OK":
-                                # print "  OK"
-                                break
-                            # If Best failed...
-                            else:
-                                print "  failed"
-                                if self.multiproc == False:
-                                    self.process_strategy(i+1)
-                                set_best_results(i, x)
+                            rejected[x].add(i)
+                    # Set Best output if every BEST run failed
+                    if best_runs and best_runs <= rejected[x]:
+                        if x == 0:
+                            self.best_results = {"best_results_norm":"FAILED"}
+                            self.best_failed = True
+                        else:
+                            self.best_anom_results = {"best_results_anom":"FAILED"}
+                            self.best_anom_failed = True
+                    if 4 in rejected[x]:
+                        decided[x] = True
+
+                # Runs still wanted by a strategy without a result
+                wanted = set()
+                for x in range(0, 2):
+                    if not decided[x]:
+                        wanted.update(i for i in preference if i not in rejected[x])
+
+                # Cancel the losers and start what is left as slots free up
+                for i in running:
+                    if i not in wanted and i not in finished and i not in timed_out:
+                        self.cancel_strategy_job(i)
+                        cancelled.add(i)
+                self.strategy_pending = [i for i in self.strategy_pending if i in wanted]
+                busy = len([i for i in self.strategy_started if i not in finished and \
+                            i not in timed_out and i not in cancelled])
+                while self.strategy_pending and busy < self.strategy_slots:
+                    self.start_strategy_job(self.strategy_pending.pop(0))
+                    busy += 1
 
         except KeyboardInterrupt:
             pass
 
         if self.test == False:
-            if self.multiproc:
-                if self.cluster_use:
-                    # kill child process on DRMAA job causes error on cluster.
-                    # turn off multiprocessing.event so any jobs still running on cluster are terminated.
-                    self.running.clear()
-                else:
-                    #pass
-                    # kill all the remaining running jobs
-                    # self.Pool.terminate()
-                    for i in range(st, 5):
-                        if self.jobs[str(i)].is_alive():
-                            if self.verbose and self.logger:
-                                self.logger.debug("terminating job: %s" % self.jobs[str(i)])
-                            # print "Terminating %d" % i
-                            self.jobs[str(i)].terminate()
-                            #xutils.kill_children(self.jobs[str(i)].pid, self.logger)
+            # kill all the remaining running jobs
+            for i in self.strategy_started:
+                if i not in finished and i not in timed_out and i not in cancelled:
+                    self.cancel_strategy_job(i)
 
     def labelit_cell_sym(self):
       """
@@ -2051,9 +2175,7 @@ Distance | % Transmission", level=98, color="white")
         # try:
         if self.labelit_failed == False:
             os.chdir(self.labelit_dir)
-            working_dir = self.working_dir
-            if self.ram:
-                working_dir = self.working_dir.replace('/dev/shm', '')
+            working_dir = self.dest_dir
             files = ["%s.mat" % self.index_number, "bestfile.par"]
             for x in range(len(files)):
                 if os.path.exists(files[x]):
@@ -2159,21 +2281,15 @@ Distance | % Transmission", level=98, color="white")
                         self.logger.debug("Cleaning up files and folders")
                     os.system("rm -rf labelit_iteration* dataset_preferences.py distl*.log")
                     for i in range(self.iterations):
-                        os.system("rm -rf %s" % i)
+                        # Along with any speculative and replaced Labelit runs
+                        os.system("rm -rf %s %s_*" % (i, i))
         except:
             self.logger.exception("**Could not cleanup**")
 
-        # Move files from RAM to destination folder
+        # Copy files from RAM to destination folder while finishing up
         try:
-            if self.ram:
-                dest_dir = self.working_dir.replace('/dev/shm', '')
-                if self.gui:
-                    if os.path.exists(dest_dir):
-                        shutil.rmtree(dest_dir)
-                    shutil.move(self.working_dir, dest_dir)
-                else:
-                    os.system("cp -R * %s" % dest_dir)
-                    os.system("rm -rf %s" % self.working_dir)
+            if self.scratch and self.working_dir != self.dest_dir:
+                self.stop_scratch()
         except:
             self.logger.exception("**Could not move files from RAM to destination dir.**")
 
@@ -2189,6 +2305,9 @@ Distance | % Transmission", level=98, color="white")
         self.tprint(arg="\nRAPD autoindexing & strategy complete", level=98, color="green")
         self.tprint(arg="  Total elapsed time: %s seconds" % t, level=10, color="white")
 
+        if self.scratch:
+            self.scratch.wait()
+
     def html_best_plots(self):
         """
         generate plots html/php file
@@ -2366,6 +2485,17 @@ class RunLabelit(Thread):
         # For results passing
         self.indexing_results_queue = eval('%sQueue()'%self.queue_type)
 
+        # Speculative fallback runs as tag:(iteration, problem, overrides), the
+        # ones taken over for their iteration as tag:iteration, and results
+        # that came in before their iteration failed
+        self.speculative = {}
+        self.adopted = {}
+        self.speculative_results = {}
+        # Spot count Labelit reported for the first run that had too few spots
+        self.spot_count = False
+        # Number of Labelit runs to keep going at once
+        self.slots = total_nproc()
+
         # This is where I place my overall folder settings.
         self.working_dir = self.setup.get("work")
 
@@ -2502,7 +2632,9 @@ rerunning.\n" % new_res)
 
         # Decrease the number of spots required
         if overrides.get("min_spots"):
-            spot_count = labelit.decrease_spot_requirements(overrides.get("min_spots"))
+            spot_count = labelit.decrease_spot_requirements(
+                overrides.get("min_spots"),
+                os.path.join(self.working_dir, str(iteration), "dataset_preferences.py"))
             #self.log[iteration].extend("\nDecreasing spot requirments to %d and \
             self.log[iteration].append("\nDecreasing spot requirements to %d and \
 rerunning.\n" % spot_count)
@@ -2698,6 +2830,7 @@ rerunning.\n" % spot_count)
 
             # setup input kwargs
             inp_kwargs = {"command": command,
+                          "work_dir": os.path.join(self.working_dir, str(iteration)),
                           "logfile": log,
                           "pid_queue": pid_queue,
                           "result_queue": self.indexing_results_queue,
@@ -2804,7 +2937,10 @@ rerunning.\n" % spot_count)
         else:
             problem_flag = parsed_result
 
-        if problem_flag:
+        if not problem_flag:
+            self.cancel_speculative(iteration)
+
+        else:
             # Change to the correct folder for rerunning.
             xutils.create_folders_labelit(self.working_dir, iteration)
 
@@ -2823,6 +2959,13 @@ rerunning.\n" % spot_count)
                 spot_count = parsed_result[1]
                 # If only run once and more than 25 spots
                 if spot_count > 25 and ex:
+                    # The same fix may already be running
+                    if self.adopt_speculative(iteration, problem_flag, {"min_spots": spot_count}):
+                        return
+                    self.cancel_speculative(iteration)
+                    # Other runs still going can start on this fix
+                    if not self.spot_count:
+                        self.spot_count = spot_count
                     potential_problems['run_command'](overrides={"min_spots": spot_count})
                 else:
                     # Failed since not enough spots
@@ -2857,11 +3000,109 @@ rerunning.\n" % spot_count)
             else:
                 failed = True
 
+            # Fallbacks that were not taken over are not needed
+            self.cancel_speculative(iteration)
+
             # If failed, save the log and results
             if failed:
                 self.log[iteration].append("\n%s\n" % er)
                 self.results[iteration] = {"labelit_results": "FAILED"}
 
+    def start_speculative(self):
+        """
+        Start the fallback runs for iterations that are still running while
+        there are idle cores, so a failure does not have to wait for its rerun
+        """
+
+        if not self.multiproc or self.tot_runs == 1 or self.test:
+            return
+
+        for iteration in range(self.tot_runs):
+            # Only for first runs still going
+            if iteration not in self.jobids or self.tracker[iteration]['nruns'] > 1:
+                continue
+            for problem in SPECULATIVE_LABELIT:
+                if len(self.jobids) >= self.slots:
+                    return
+                tag = "%d_%s" % (iteration, problem)
+                if tag in self.speculative:
+                    continue
+                overrides = self.get_speculative_overrides(problem)
+                if not overrides:
+                    continue
+
+                # Start from the settings of the iteration, staying out of
+                # the folder so it can be removed if the run is cancelled
+                folder = os.path.join(self.working_dir, tag)
+                xutils.create_folder(folder, move_to=False)
+                shutil.copy(os.path.join(self.working_dir, str(iteration), "dataset_preferences.py"),
+                            os.path.join(folder, "dataset_preferences.py"))
+                self.log[tag] = []
+                self.speculative[tag] = (iteration, problem, overrides)
+                self.logger.debug("Starting speculative Labelit run %s", tag)
+                self.process_labelit(iteration=tag, overrides=overrides)
+
+    def get_speculative_overrides(self, problem):
+        """
+        Return the overrides a rerun for problem would use, or False if they
+        are not known yet
+
+        Keyword arguments
+        problem -- problem_flag the fallback is for
+        """
+
+        # Labelit reports the spot count when it fails, so it is taken from
+        # the first run that had too few spots
+        if problem == "min_spots" and self.spot_count:
+            return {"min_spots": self.spot_count}
+        return False
+
+    def adopt_speculative(self, iteration, problem, overrides):
+        """
+        Take over the fallback run for an iteration that failed with problem,
+        returning False if there is none run with the same overrides
+
+        Keyword arguments
+        iteration -- Labelit iteration that failed
+        problem -- problem_flag from parsing the output
+        overrides -- overrides the rerun would use
+        """
+
+        tag = "%d_%s" % (iteration, problem)
+        if tag not in self.speculative or self.speculative[tag][2] != overrides:
+            return False
+        del self.speculative[tag]
+
+        self.logger.debug("Using speculative Labelit run %s", tag)
+
+        # The fallback becomes the iteration
+        folder = os.path.join(self.working_dir, str(iteration))
+        os.rename(folder, "%s_%s" % (folder, "failed"))
+        os.rename(os.path.join(self.working_dir, tag), folder)
+        self.log[iteration].extend(self.log.pop(tag))
+        self.tracker[iteration]['nruns'] += 1
+
+        if tag in self.speculative_results:
+            result = self.speculative_results.pop(tag)
+            result["tag"] = iteration
+            self.postprocess_labelit(raw_result=result)
+        else:
+            self.adopted[tag] = iteration
+
+        return True
+
+    def cancel_speculative(self, iteration):
+        """Stop the fallback runs of an iteration that does not need them"""
+
+        for tag, (base, __, __) in self.speculative.items():
+            if base == iteration:
+                del self.speculative[tag]
+                self.speculative_results.pop(tag, None)
+                self.log.pop(tag, None)
+                if tag in self.jobids:
+                    self.kill_job(self.jobids.pop(tag), self.logger)
+                shutil.rmtree(os.path.join(self.working_dir, tag), ignore_errors=True)
+
     def print_warning(self, warn_type):
         """ """
 
@@ -2892,44 +3133,62 @@ $RAPD_HOME/install/sources/cctbx/README.md\n",
         self.logger.debug('RunLabelit::labelit_run_queue')
 
         kill_jobs = True
-        timer = 0
         start_time = time.time()
-
-        ellapsed_time = time.time() - start_time
         current_progress = 0
+        # Seconds for each tenth of the progress
+        progress_step = 60 / 7.0
+
+        self.start_speculative()
 
-        while ellapsed_time < global_vars.LABELIT_TIMEOUT:
-            prog = int(7*ellapsed_time / 60)
+        while self.jobids:
+            ellapsed_time = time.time() - start_time
+            if ellapsed_time >= global_vars.LABELIT_TIMEOUT:
+                break
+            prog = int(ellapsed_time / progress_step)
             if prog > current_progress:
                 self.tprint(prog*10, level="progress")
                 current_progress = prog
-            if not self.indexing_results_queue.empty():
-                result = self.indexing_results_queue.get(False)
-                # join the Process
-                self.jobs[result["tag"]].join()
-                # Remove jobid from running jobs
-                del self.jobids[result["tag"]]
+
+            # Wait for a result, waking to move the progress on
+            timeout = min(global_vars.LABELIT_TIMEOUT,
+                          (current_progress + 1) * progress_step) - ellapsed_time
+            try:
+                result = self.indexing_results_queue.get(True, max(timeout, 0.1))
+            except Empty:
+                continue
+
+            tag = result["tag"]
+            # Cancelled
+            if tag not in self.jobids:
+                continue
+            # join the Process
+            self.jobs[tag].join()
+            # Remove jobid from running jobs
+            del self.jobids[tag]
+
+            if tag in self.speculative:
+                # Finished before the run it backs up
+                self.speculative_results[tag] = result
+            else:
+                if tag in self.adopted:
+                    result["tag"] = self.adopted.pop(tag)
                 # Postprocess the labelit job
                 self.postprocess_labelit(raw_result=result)
-                # All jobs have finished
-                if not len(self.jobids.keys()):
-                    # print "All jobs done"
-                    kill_jobs = False
-                    break
-            if self.tot_runs == 1:
-                # For beam center plugin, slow it down
-                time.sleep(1)
-            else:
-                time.sleep(0.1)
-            ellapsed_time = time.time() - start_time
+
+            # Use the cores freed up
+            self.start_speculative()
+
+        else:
+            # All jobs have finished
+            kill_jobs = False
 
         if kill_jobs:
             # Make sure all jobs are killed
             for i, pid in self.jobids.iteritems():
-                self.results[i] = {"labelit_results": "FAILED"}
+                if i not in self.speculative:
+                    self.results[self.adopted.get(i, i)] = {"labelit_results": "FAILED"}
                 self.kill_job(pid, self.logger)
 
-
     def condense_logs(self):
         """Put the Labelit logs together"""
 
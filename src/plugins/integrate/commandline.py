@@ -84,6 +84,20 @@ def get_commandline():
                         choices=["auto", "pointless", "xds"],
                         help="Set the spacegroup decider")
 
+    # Integrate new frames onto the partial wedge
+    parser.add_argument("--incremental",
+                        action="store_true",
+                        dest="incremental",
+                        default=False,
+                        help="Integrate only new frames after the partial wedge")
+
+    # Run COLSPOT and INTEGRATE in blocks of frames
+    parser.add_argument("--distribute",
+                        action="store_true",
+                        dest="distribute_xds",
+                        default=False,
+                        help="Run XDS spot finding and integration in blocks of frames")
+
     # Don't clean up
     parser.add_argument("--dirty",
                         action="store_false",
@@ -254,6 +268,8 @@ def construct_command(image_0_data, run_data, commandline_args, detector_module)
         "show_plots": commandline_args.show_plots,
         "xdsinp": detector_module.XDSINP,
         "spacegroup_decider": commandline_args.spacegroup_decider,
+        "incremental": commandline_args.incremental,
+        "distribute_xds": commandline_args.distribute_xds,
         "rounds_polishing": commandline_args.rounds_polishing
     }
 
@@ -9,6 +9,8 @@ DEFAULT_PREFERENCES = {'multiprocessing': False, # Should be False for non-qsub
                        "show_plots": False, # plots for command line
                        "progress": False, # progress bar for command line
                        "spacegroup_decider": 'auto', # choices=["auto", "pointless", "xds"],
+                       "incremental": False, # integrate new frames onto the partial wedge
+                       "distribute_xds": False, # run COLSPOT and INTEGRATE in blocks of frames
                        "computer_cluster": True,
                        #"rounds_polishing": 1, # not used yet...
                        }
@@ -64,12 +64,15 @@ import numpy
 from plugins.subcontractors.xdsme.xds2mos import Xds2Mosflm
 from plugins.subcontractors.aimless import parse_aimless
 from plugins.subcontractors.xds import get_avg_mosaicity_from_integratelp, get_isa_from_correctlp
+from plugins.subcontractors.xds import get_shells_from_correctlp, get_resolution_cutoff
+import plugins.subcontractors.xds_distribute as xds_distribute
 import utils.archive as archive
 from utils.communicate import rapd_send
 import utils.credits as rcredits
 import utils.exceptions as exceptions
+from utils.frame_tracker import FrameTracker
 # from utils.r_numbers import try_int, try_float
-from utils.processes import local_subprocess
+from utils.processes import local_subprocess, total_nproc
 import utils.text as text
 from utils.text import json
 import utils.xutils as Utils
@@ -85,6 +88,17 @@ from detectors.detector_utils import get_resolution_at_edge
 
 import info
 
+# Tables from XYCORR, INIT and DEFPIX that incremental integration reuses
+XDS_TABLES = (
+    "X-CORRECTIONS.cbf",
+    "Y-CORRECTIONS.cbf",
+    "BKGINIT.cbf",
+    "BLANK.cbf",
+    "GAIN.cbf",
+    "BKGPIX.cbf",
+    "ABS.cbf",
+)
+
 # Software dependencies
 VERSIONS = {
     "aimless": (
@@ -141,6 +155,9 @@ class RapdPlugin(Process):
     # Connection to redis database
     redis = None
 
+    # Tracks frames of the run as they are written
+    frames = None
+
     # Dict for holding results
     results = {"_id": str(ObjectId())}
 
@@ -270,6 +287,27 @@ class RapdPlugin(Process):
                 if self.logger:
                     self.logger.debug('The cluster_adapter could not be loaded, defaulting to shell launching!!!')
 
+        # Split COLSPOT and INTEGRATE into blocks of frames over the cluster
+        # or local processes
+        self.distributor = False
+        if self.preferences.get("distribute_xds", False):
+            if self.computer_cluster:
+                runner = xds_distribute.ClusterRunner(self.launcher,
+                                                      batch_queue=self.batch_queue,
+                                                      nproc=self.procs,
+                                                      logger=self.logger)
+                slots = self.jobs
+                nproc = None
+            else:
+                runner = xds_distribute.local_runner
+                slots = total_nproc() // self.procs
+                nproc = total_nproc()
+            self.distributor = xds_distribute.XdsDistributor(runner,
+                                                             slots=slots,
+                                                             osc_range=self.image_data.get("osc_range"),
+                                                             nproc=nproc,
+                                                             logger=self.logger)
+
 
         self.standalone = self.preferences.get('standalone', False)
 
@@ -405,90 +443,112 @@ class RapdPlugin(Process):
 
         self.tprint("\nPreparing integration", level=10, color="blue")
 
-        # First and last present frame numbers
-        first, last = self.get_current_images()
-        # print first, last
-        partial_integration_results = False
-        full_integration_results = False
-        xds_input = self.xds_default
+        # Start following the frames of the run
+        self.start_frame_tracker()
 
-        # If all images are present, then process all
-        if self.preferences.get("end_frame", False):
-            final_image = self.preferences["end_frame"]
-        else:
-            final_image = self.run_data["number_images"] - self.run_data["start_image_number"] + 1
+        try:
+            # First and last present frame numbers
+            first, last = self.get_current_images()
+            # print first, last
+            partial_integration_results = False
+            full_integration_results = False
+            # Last frame of a partial wedge the rest can be built on
+            partial_end = False
+            xds_input = self.xds_default
+
+            # If all images are present, then process all
+            if self.preferences.get("end_frame", False):
+                final_image = self.preferences["end_frame"]
+            else:
+                final_image = self.run_data["number_images"] - self.run_data["start_image_number"] + 1
 
-        if last >= final_image:
-            self.tprint("  Images to %d present" % final_image, level=10, color="white")
-            full_integration_results = self.xds_total(xds_input, last=final_image)
+            if last >= final_image:
+                self.tprint("  Images to %d present" % final_image, level=10, color="white")
+                full_integration_results = self.xds_total(xds_input, last=final_image)
 
-        # Not all images are present
-        else:
-            self.tprint("  Not all images present", level=10, color="white")
-
-            # If current last > 10 deg wedge, run it
-            current_sweep = (last - first) *  self.image_data["osc_range"]
-            if current_sweep > 10:
-                last = int(10.0/self.image_data["osc_range"])
-                self.tprint("  Have more than threshold degrees of data, running prliminary integration for frames to %d" % last, level=10, color="white")
-                partial_integration_results = self.xds_partial(xdsinput=xds_input,
-                                                               end=last)
-
-            # Have less than threshold degrees, but expect more than threshold
-            elif final_image * self.image_data["osc_range"] > 10:
-                self.tprint("  Less than threshold degrees of data, waiting...")
-                last = int(10.0/self.image_data["osc_range"])
-                result = self.wait_for_image(last)
-                # Image now exists
-                if result:
-                    self.tprint("\n  Launching integration for frames to %d" % last, level=10, color="white")
+            # Not all images are present
+            else:
+                self.tprint("  Not all images present", level=10, color="white")
+
+                # If current last > 10 deg wedge, run it
+                current_sweep = (last - first) *  self.image_data["osc_range"]
+                if current_sweep > 10:
+                    last = int(10.0/self.image_data["osc_range"])
+                    self.tprint("  Have more than threshold degrees of data, running prliminary integration for frames to %d" % last, level=10, color="white")
                     partial_integration_results = self.xds_partial(xdsinput=xds_input,
                                                                    end=last)
-                # Timeout
-                else:
-                    self.tprint("\n  Seems that data collection has stalled. Integrating what data there is", level=10, color="white")
-                    first, last = self.get_current_images()
-                    full_integration_results = self.xds_total(xds_input, last=last)
+                    partial_end = last
+
+                # Have less than threshold degrees, but expect more than threshold
+                elif final_image * self.image_data["osc_range"] > 10:
+                    self.tprint("  Less than threshold degrees of data, waiting...")
+                    last = int(10.0/self.image_data["osc_range"])
+                    result = self.wait_for_image(last)
+                    # Image now exists
+                    if result:
+                        self.tprint("\n  Launching integration for frames to %d" % last, level=10, color="white")
+                        partial_integration_results = self.xds_partial(xdsinput=xds_input,
+                                                                       end=last)
+                        partial_end = last
+                    # Timeout
+                    else:
+                        self.tprint("\n  Seems that data collection has stalled. Integrating what data there is", level=10, color="white")
+                        first, last = self.get_current_images()
+                        full_integration_results = self.xds_total(xds_input, last=last)
 
-            # Have less than threshold, but expecting less than threshold
-            else:
-                self.tprint("  Waiting for data collection to complete", level=10, color="white")
+                # Have less than threshold, but expecting less than threshold
+                else:
+                    self.tprint("  Waiting for data collection to complete", level=10, color="white")
+                    result = self.wait_for_image(final_image)
+                    # Image now exists
+                    if result:
+                        partial_integration_results = self.xds_total(xds_input)
+                    # Timeout
+                    else:
+                        self.tprint("\n  Seems that data collection has stalled. Integrating what data there is", level=10, color="white")
+                        first, last = self.get_current_images()
+                        full_integration_results = self.xds_total(xds_input, last=last)
+
+
+            # Have a partial result
+            if partial_integration_results:
+                # self.logger.debug(partial_integration_results)
+                # Update the class object
+                self.results["results"].update(partial_integration_results)
+                # Update interested parties
+                self.send_results(self.results)
+                # Print to local parties
+                self.tprint("\nPartial dataset summary %d-%d" % (first, last), 99, "blue")
+                self.print_results(partial_integration_results)
+                self.tprint(20, "progress")
+        
+            # Integrate only the new frames onto the partial wedge
+            if not full_integration_results and \
+               partial_integration_results and \
+               partial_end and \
+               self.preferences.get("incremental", False):
+                full_integration_results = self.xds_incremental(xds_input,
+                                                                partial_integration_results,
+                                                                partial_end + 1,
+                                                                final_image)
+
+            # if no full results, then wait for full dataset
+            if not full_integration_results:
+                # Run XDS for the whole wedge of data
+                self.tprint("Preparing for full dataset integration", 10, "blue")
                 result = self.wait_for_image(final_image)
                 # Image now exists
                 if result:
-                    partial_integration_results = self.xds_total(xds_input)
+                    full_integration_results = self.xds_total(xds_input)
                 # Timeout
                 else:
-                    self.tprint("\n  Seems that data collection has stalled. Integrating what data there is", level=10, color="white")
                     first, last = self.get_current_images()
+                    self.tprint("\n  Seems that data collection has stalled. Integrating data to frame %d" % last, level=10, color="white")
                     full_integration_results = self.xds_total(xds_input, last=last)
 
-
-        # Have a partial result
-        if partial_integration_results:
-            # self.logger.debug(partial_integration_results)
-            # Update the class object
-            self.results["results"].update(partial_integration_results)
-            # Update interested parties
-            self.send_results(self.results)
-            # Print to local parties
-            self.tprint("\nPartial dataset summary %d-%d" % (first, last), 99, "blue")
-            self.print_results(partial_integration_results)
-            self.tprint(20, "progress")
-        
-        # if no full results, then wait for full dataset
-        if not full_integration_results:
-            # Run XDS for the whole wedge of data
-            self.tprint("Preparing for full dataset integration", 10, "blue")
-            result = self.wait_for_image(final_image)
-            # Image now exists
-            if result:
-                full_integration_results = self.xds_total(xds_input)
-            # Timeout
-            else:
-                first, last = self.get_current_images()
-                self.tprint("\n  Seems that data collection has stalled. Integrating data to frame %d" % last, level=10, color="white")
-                full_integration_results = self.xds_total(xds_input, last=last)
+        finally:
+            # No more frames to wait for
+            self.frames.stop()
 
         # Finish up with the data
         final_results = self.finish_data(full_integration_results)
@@ -500,31 +560,40 @@ class RapdPlugin(Process):
         #self.send_results(self.results)
         os.chdir(self.dirs['work'])
 
-    def get_current_images(self):
+    def start_frame_tracker(self):
         """
-        Look for images that match the input
+        Start tracking the frames of the run as they arrive, by inotify or
+        the image_collected messages on redis
         """
-        # self.tprint('get_current_images')
 
-        glob_pattern = os.path.join(self.run_data["directory"], self.run_data["image_template"]).replace("?", "*")
-        # self.tprint(glob_pattern)
-        files = glob.glob(glob_pattern)
-        files.sort()
-        # self.tprint(files)
-        pattern = ".*"+re.sub(r"\?+", "([0-9]+)", self.run_data["image_template"])
-        # self.tprint(pattern)
+        first_frame = min(int(self.run_data["start_image_number"]), int(self.image_data["start"]))
+        last_frame = max(int(self.run_data["start_image_number"]) + int(self.run_data["number_images"]) - 1,
+                         int(self.image_data["end"]))
 
-        # Find first & last frame numbers
-        fm = re.match(pattern, files[0])
-        if fm:
-            first_frame = int(fm.group(1))
-        else:
-            first_frame = 0
-        fm = re.match(pattern, files[-1])
-        if fm:
-            last_frame = int(fm.group(1))
-        else:
-            last_frame = 0
+        # The server already has redis for when inotify cannot see the writes
+        redis = None
+        if self.preferences.get("run_mode") == "server":
+            try:
+                if not self.redis:
+                    self.connect_to_redis()
+                redis = self.redis
+            except:
+                self.logger.exception("Unable to connect to redis to follow the frames")
+
+        self.frames = FrameTracker(directory=self.run_data["directory"],
+                                   image_template=self.run_data["image_template"],
+                                   first_frame=first_frame,
+                                   last_frame=last_frame,
+                                   redis=redis,
+                                   logger=self.logger)
+        self.frames.start()
+
+    def get_current_images(self):
+        """
+        Return the first and last frame numbers present
+        """
+
+        first_frame, last_frame = self.frames.first_last()
         # self.tprint((first_frame, last_frame))
 
         return first_frame, last_frame
@@ -535,32 +604,23 @@ class RapdPlugin(Process):
         """
         self.logger.debug("wait_for_image  image_number:%d", image_number)
 
-        # Determine image to look for
-        target_image = re.sub(r"\?+", "%s0%dd", os.path.join(self.run_data["directory"], self.run_data["image_template"])) % ("%", self.run_data["image_template"].count("?")) % image_number
-
         # Get a bead on where we are now
         first, last = self.get_current_images()
 
-        if image_number <= last:
+        if self.frames.has_frame(image_number):
             self.logger.debug("Image %d already present", image_number)
             return True
 
         # Estimate max time to get to target_image
         max_time = (image_number - last) * (self.image_data["time"]) * 4
 
-        # Look for images in cycle
-        start_time = time.time()
-        self.tprint("  Watching for %s " % target_image, level=10, color="white", newline=False)
-        while (time.time() - start_time) < max_time:
-            self.tprint(".", level=10, color="white", newline=False)
-            #if os.path.exists(target_image):
-            if os.path.isfile(target_image):
-                self.tprint(".", level=10, color="white")
-                return True
-            time.sleep(1)
-
+        self.tprint("  Watching for %s " % self.frames.frame_path(image_number),
+                    level=10,
+                    color="white",
+                    newline=False)
+        result = self.frames.wait_for(image_number, max_time)
         self.tprint(".", level=10, color="white")
-        return False
+        return result
 
     def connect_to_redis(self):
         """Connect to the redis instance"""
@@ -1058,10 +1118,12 @@ class RapdPlugin(Process):
                 os.rename('%s/XDS.LOG' %xdsdir, '%s/XDS.LOG.nocutoff' %xdsdir)
                 newinp = self.change_xds_inp(
                     newinp,
-                    "%sINCLUDE_RESOLUTION_RANGE=%.2f %.2f\n" % (newinp[-2], self.low_res, new_rescut))
+                    "INCLUDE_RESOLUTION_RANGE=%.2f %.2f\n" % (self.low_res, new_rescut))
                 # newinp[-2] = '%sINCLUDE_RESOLUTION_RANGE=200.0 %.2f\n' % (newinp[-2], new_rescut)
-                self.write_file(xdsfile, newinp)
-                self.tprint(arg="  Reintegrating with new resolution cutoff",
+                # Only the scaling changes with the cutoff - polishing
+                # integrates again with it
+                self.write_file(xdsfile, self.change_xds_inp(newinp, "JOB=CORRECT\n"))
+                self.tprint(arg="  Rescaling with new resolution cutoff",
                             level=99,
                             color="white",
                             newline=False)
@@ -1099,8 +1161,8 @@ class RapdPlugin(Process):
             if new_rescut != False:
                 os.rename('%s/CORRECT.LP' %xdsdir, '%s/CORRECT.LP.oldcutoff' %xdsdir)
                 os.rename('%s/XDS.LOG' %xdsdir, '%s/XDS.LOG.oldcutoff' %xdsdir)
-                newinp[-2] = '%sINCLUDE_RESOLUTION_RANGE=200.0 %.2f\n' % (newinp[-2], new_rescut)
-                self.write_file(xdsfile, newinp)
+                newinp = self.change_xds_inp(newinp, 'INCLUDE_RESOLUTION_RANGE=200.0 %.2f\n' % new_rescut)
+                self.write_file(xdsfile, self.change_xds_inp(newinp, "JOB=CORRECT\n"))
                 self.tprint(arg="  New resolution cutoff", level=99, color="white", newline=False)
                 self.xds_run(xdsdir)
         polishing_rounds += 1
@@ -1124,6 +1186,203 @@ class RapdPlugin(Process):
         proc_dir = 'wedge_%s_%s' % (self.image_data['start'], end)
         return(self.xds_wedge(proc_dir, end, xdsinput))
 
+    def xds_incremental(self, xdsinput, base_results, block_start, last):
+        """
+        Integrate the frames collected after a partial wedge in blocks as they
+        arrive, reusing the XYCORR, INIT and DEFPIX tables and the refined
+        geometry of the wedge, then run CORRECT over all of the integrated
+        reflections.
+
+        Returns False if the wedge cannot be built on, so the caller can fall
+        back to xds_total.
+
+        Keyword arguments
+        xdsinput -- XDS.INP lines
+        base_results -- results of the partial wedge from xds_wedge
+        block_start -- first frame after the partial wedge
+        last -- last frame of the data set
+        """
+        self.logger.debug("FastIntegration::xds_incremental")
+
+        if not isinstance(base_results, dict) or not base_results.get("dir"):
+            return False
+
+        base_dir = base_results["dir"]
+        first = int(self.image_data["start"])
+        block_start = int(block_start)
+        last = int(last)
+
+        for needed in XDS_TABLES + ("GXPARM.XDS", "INTEGRATE.HKL"):
+            if not os.path.isfile(os.path.join(base_dir, needed)):
+                self.logger.debug("%s has no %s - cannot integrate incrementally",
+                                  base_dir,
+                                  needed)
+                return False
+
+        if block_start > last:
+            return False
+
+        # Same size blocks as the partial wedge
+        block_size = block_start - first
+
+        if not self.low_res:
+            self.low_res = 200.0
+        if not self.hi_res:
+            self.hi_res = 0.9
+
+        self.tprint(arg="\nIncremental XDS processing", level=99, color="blue")
+
+        block_dirs = [base_dir]
+
+        while block_start <= last:
+            block_end = min(block_start + block_size - 1, last)
+
+            # Stop at the last contiguous frame if collection stalls
+            if not self.wait_for_image(block_end):
+                block_end = self.frames.contiguous_last()
+                self.tprint("\n  Seems that data collection has stalled. Integrating data to frame %d" % block_end,
+                            level=10,
+                            color="white")
+                if block_end < block_start:
+                    break
+                last = block_end
+
+            block_dir = self.xds_block(xdsinput, base_dir, block_start, block_end)
+            if not block_dir:
+                return False
+            block_dirs.append(block_dir)
+            block_start = block_end + 1
+
+        return self.xds_merge(xdsinput, base_results, block_dirs, first, block_start - 1)
+
+    def xds_block(self, xdsinput, base_dir, start, end):
+        """
+        Spot search and integrate one block of frames with the tables and
+        refined geometry of the base wedge. Returns the directory of the block
+        or False if it failed.
+        """
+        self.logger.debug("FastIntegration::xds_block %d %d", start, end)
+
+        xdsdir = os.path.join(self.dirs['work'], 'block_%d_%d' % (start, end))
+        if os.path.isdir(xdsdir) == False:
+            os.mkdir(xdsdir)
+
+        for table in XDS_TABLES:
+            shutil.copyfile(os.path.join(base_dir, table), os.path.join(xdsdir, table))
+        shutil.copyfile(os.path.join(base_dir, "GXPARM.XDS"), os.path.join(xdsdir, "XPARM.XDS"))
+
+        xdsinp = xdsinput[:]
+        xdsinp = self.change_xds_inp(
+            xdsinp,
+            "INCLUDE_RESOLUTION_RANGE=%.2f %.2f\n" % (self.low_res, self.hi_res))
+        xdsinp = self.change_xds_inp(xdsinp, "MAXIMUM_NUMBER_OF_PROCESSORS=%s\n" % self.procs)
+        xdsinp = self.change_xds_inp(xdsinp, "MAXIMUM_NUMBER_OF_JOBS=%s\n" % self.jobs)
+        xdsinp = self.change_xds_inp(xdsinp, "JOB=COLSPOT INTEGRATE\n")
+        xdsinp = self.change_xds_inp(xdsinp, "SPOT_RANGE=%d %d\n" % (start, end))
+        xdsinp = self.change_xds_inp(xdsinp, "DATA_RANGE=%d %d\n" % (start, end))
+        self.write_file(os.path.join(xdsdir, 'XDS.INP'), xdsinp)
+        self.tprint(arg="  Integrating frames %d-%d" % (start, end),
+                    level=99,
+                    color="white",
+                    newline=False)
+        self.xds_run(xdsdir)
+
+        if not os.path.isfile(os.path.join(xdsdir, "INTEGRATE.HKL")):
+            self.logger.debug("Integration of frames %d-%d failed", start, end)
+            self.tprint(arg="\n  Integration of frames %d-%d failed" % (start, end),
+                        level=30,
+                        color="red")
+            return False
+
+        return xdsdir
+
+    def xds_merge(self, xdsinput, base_results, block_dirs, first, last):
+        """
+        Run CORRECT over the reflections integrated in block_dirs, the first
+        of which is the base wedge. Returns the results or False if CORRECT
+        failed.
+        """
+        self.logger.debug("FastIntegration::xds_merge %d %d", first, last)
+
+        base_dir = base_results["dir"]
+        xdsdir = os.path.join(self.dirs['work'], 'wedge_%s_%s' % (first, last))
+        if os.path.isdir(xdsdir) == False:
+            os.mkdir(xdsdir)
+
+        for table in XDS_TABLES + ("GXPARM.XDS", "IDXREF.LP"):
+            shutil.copyfile(os.path.join(base_dir, table), os.path.join(xdsdir, table))
+        shutil.copyfile(os.path.join(base_dir, "GXPARM.XDS"), os.path.join(xdsdir, "XPARM.XDS"))
+
+        xds_distribute.merge_integrate_hkl(
+            [os.path.join(block_dir, "INTEGRATE.HKL") for block_dir in block_dirs],
+            os.path.join(xdsdir, "INTEGRATE.HKL"),
+            first,
+            last)
+        xds_distribute.concatenate(
+            [os.path.join(block_dir, "INTEGRATE.LP") for block_dir in block_dirs],
+            os.path.join(xdsdir, "INTEGRATE.LP"))
+        xds_distribute.concatenate(
+            [os.path.join(block_dir, "SPOT.XDS") for block_dir in block_dirs],
+            os.path.join(xdsdir, "SPOT.XDS"))
+
+        xdsinp = xdsinput[:]
+        xdsinp = self.change_xds_inp(
+            xdsinp,
+            "INCLUDE_RESOLUTION_RANGE=%.2f %.2f\n" % (self.low_res, self.hi_res))
+        xdsinp = self.change_xds_inp(xdsinp, "MAXIMUM_NUMBER_OF_PROCESSORS=%s\n" % self.procs)
+        xdsinp = self.change_xds_inp(xdsinp, "MAXIMUM_NUMBER_OF_JOBS=%s\n" % self.jobs)
+        xdsinp = self.change_xds_inp(xdsinp, "JOB=CORRECT\n")
+        xdsinp = self.change_xds_inp(xdsinp, "DATA_RANGE=%d %d\n" % (first, last))
+
+        # Use the spacegroup Pointless found for the partial wedge
+        if self.preferences["spacegroup_decider"] in ("auto", "pointless") and \
+           not self.spacegroup:
+            sg_num_pointless = spacegroup.ccp4_to_number[base_results["summary"]["scaling_spacegroup"]]
+            if sg_num_pointless != base_results["xparm"]["sg_num"]:
+                xdsinp = self.change_xds_inp(
+                    xdsinp,
+                    "UNIT_CELL_CONSTANTS=%.2f %.2f %.2f %.2f %.2f %.2f\n" %
+                    tuple(base_results["summary"]["scaling_unit_cell"]))
+                xdsinp = self.change_xds_inp(xdsinp, "SPACE_GROUP_NUMBER=%d\n" % sg_num_pointless)
+
+        xdsfile = os.path.join(xdsdir, 'XDS.INP')
+        self.write_file(xdsfile, xdsinp)
+        self.tprint(arg="  Scaling frames %d-%d" % (first, last),
+                    level=99,
+                    color="white",
+                    newline=False)
+        self.xds_run(xdsdir)
+
+        if not os.path.isfile(os.path.join(xdsdir, "XDS_ASCII.HKL")):
+            self.logger.debug("CORRECT failed for frames %d-%d", first, last)
+            return False
+
+        # Only CORRECT has to be rerun for a new resolution cutoff
+        if not self.preferences.get("hi_res", False):
+            new_rescut = self.find_correct_res(xdsdir, 1.0)
+            if new_rescut != False:
+                os.rename('%s/CORRECT.LP' % xdsdir, '%s/CORRECT.LP.nocutoff' % xdsdir)
+                os.rename('%s/XDS.LOG' % xdsdir, '%s/XDS.LOG.nocutoff' % xdsdir)
+                xdsinp = self.change_xds_inp(
+                    xdsinp,
+                    "INCLUDE_RESOLUTION_RANGE=%.2f %.2f\n" % (self.low_res, new_rescut))
+                self.write_file(xdsfile, xdsinp)
+                self.tprint(arg="  Rescaling with new resolution cutoff",
+                            level=99,
+                            color="white",
+                            newline=False)
+                self.xds_run(xdsdir)
+
+        final_results = self.run_results(xdsdir)
+
+        # Put data into the commanline
+        self.tprint("\nFinal results summary", 99, "blue")
+        self.print_results(final_results)
+        self.print_plots(final_results)
+        self.tprint(90, "progress")
+
+        return final_results
+
     def xds_split(self, xdsinput):
         """
         Controls xds processing for unibinned ADSC data
@@ -1137,44 +1396,22 @@ class RapdPlugin(Process):
         last_frame = int(self.image_data['start']) + int(self.image_data['total']) - 1
         frame_count = first_frame + 1
 
-        file_template = os.path.join(self.image_data['directory'], self.image_template)
-        # Figure out how many digits needed to pad image number.
-        # First split off the <image number>.<extension> portion of the file_template.
-        numimg = self.image_template.split('_')[-1]
-        # Then split off the image number portion.
-        num = numimg.split('.')[0]
-        # Then find the length of the number portion
-        pad = len(num)
-        replace_string = ''
-        for _ in range(0, pad, 1):
-            replace_string += '?'
-
-        look_for_file = file_template.replace(replace_string,
-                                              '%0*d' %(pad, frame_count))
-
         # Maximum wait time for next image is exposure time + 30 seconds.
         wait_time = int(math.ceil(float(self.image_data['time']))) + 30
 
-        timer = Process(target=time.sleep, args=(wait_time,))
-        timer.start()
+        xds_job = False
 
         while frame_count < last_frame:
-            if os.path.isfile(look_for_file) == True:
-                if timer.is_alive():
-                    timer.terminate()
-                timer = Process(target=time.sleep, args=(wait_time,))
-                timer.start()
+            if self.frames.wait_for(frame_count, wait_time):
                 if frame_count == half_set:
                     proc_dir = 'wedge_%s_%s' % (first_frame, frame_count)
                     xds_job = Process(target=self.xds_wedge,
                                       args=(proc_dir, frame_count, xdsinput))
                     xds_job.start()
                 frame_count += 1
-                look_for_file = file_template.replace(replace_string,
-                                                      '%0*d' %(pad, frame_count))
-            elif timer.is_alive() == False:
+            else:
                 self.logger.debug('     Image %s not found after waiting %s seconds.',
-                                  look_for_file,
+                                  self.frames.frame_path(frame_count),
                                   wait_time)
                 self.logger.debug('     RAPD assumes the data collection has been aborted.')
                 self.logger.debug('         Launching a final xds job with last image detected.')
@@ -1182,23 +1419,17 @@ class RapdPlugin(Process):
                 results = self.xds_total(xdsinput)
                 return results
 
-        # If you reach here, frame_count equals the last frame, so look for the
-        # last frame and then launch xds_total.
-        while timer.is_alive():
-            if os.path.isfile(self.last_image):
-                if xds_job.is_alive():
-                    xds_job.terminate()
-                results = self.xds_total(xdsinput)
-                timer.terminate()
-                break
+        # If you reach here, frame_count equals the last frame, so wait for
+        # the last frame and then launch xds_total.
+        found = self.frames.wait_for(int(self.image_data['end']), wait_time)
+        if xds_job and xds_job.is_alive():
+            xds_job.terminate()
 
-        # If timer expires (ending the above loop) and last frame has not been
-        # detected, launch xds_total with last detected image.
-        if os.path.isfile(self.last_image) == False:
-            if xds_job.is_alive():
-                xds_job.terminate()
+        # If the last frame has not been detected, launch xds_total with last
+        # detected image.
+        if not found:
             self.image_data['last'] = frame_count - 1
-            results = self.xds_total(xdsinput)
+        results = self.xds_total(xdsinput)
 
         return results
 
@@ -1241,61 +1472,31 @@ class RapdPlugin(Process):
             self.logger.debug('                 Setting wedge size to 10.')
             wedge_size = 10
 
-        file_template = os.path.join(self.image_data['directory'], self.image_template)
-        # Figure out how many digits needed to pad image number.
-        # First split off the <image number>.<extension> portion of the file_template.
-        numimg = self.image_template.split('_')[-1]
-        # Then split off the image number portion.
-        num = numimg.split('.')[0]
-        # Then find the length of the number portion
-        pad = len(num)
-        replace_string = ''
-        for _ in range(0, pad, 1):
-            replace_string += '?'
-
-        look_for_file = file_template.replace(replace_string,
-                                              '%0*d' % (pad, frame_count))
-
-        timer = Process(target=time.sleep, args=(wait_time,))
-        timer.start()
-        # Create the process xds_job (runs a timer with no delay).
-        # This is so xds_job exists when it is checked for later on.
         # Eventually xds_job is replaced by the actual integration jobs.
-        xds_job = Process(target=time.sleep, args=(0,))
-        xds_job.start()
+        xds_job = False
 
         while frame_count < last_frame:
-            # Look for next look_for_file to see if it exists.
+            # Wait for the next frame to arrive.
             # If it does, check to see if it is a tenth image.
             # If it is a tenth image, launch an xds job.
-            # If it isn't a tenth image, index the look_for_file
-            # If it doesn't exist, keep checking until time_process expires.
-            if os.path.isfile(look_for_file) == True:
-                # Reset the timer process
-                if timer.is_alive():
-                    timer.terminate()
-                timer = Process(target=time.sleep, args=(wait_time,))
-                timer.start()
+            # If it doesn't arrive before wait_time, assume an abort.
+            if self.frames.wait_for(frame_count, wait_time):
                 # If frame_count is a tenth image, launch and xds job
                 # remainder = ((frame_count + 1) - first_frame) % wedge_size
                 # self.logger.debug('	remainder = %s' % remainder)
-                if xds_job.is_alive == True:
+                if xds_job and xds_job.is_alive():
                     self.logger.debug('		xds_job.is_alive = True')
-                if (((frame_count + 1) - first_frame) % wedge_size == 0 and
-                        xds_job.is_alive() == False):
+                elif ((frame_count + 1) - first_frame) % wedge_size == 0:
                     proc_dir = 'wedge_%s_%s' %(first_frame, frame_count)
                     xds_job = Process(target=self.xds_wedge,
                                       args=(proc_dir, frame_count, xdsinput))
                     xds_job.start()
                 # Increment the frame count to look for next image
                 frame_count += 1
-                look_for_file = file_template.replace(replace_string,
-                                                      '%0*d' % (pad, frame_count))
-            # If next frame does not exist, check to see if timer has expired.
-            # If timer has expired, assume an abort has occurred.
-            elif timer.is_alive() == False:
+            # If next frame has not arrived in time, assume an abort has occurred.
+            else:
                 self.logger.debug('     Image %s not found after waiting %s seconds.',
-                                  look_for_file,
+                                  self.frames.frame_path(frame_count),
                                   wait_time)
                 # There have been a few cases, particularly with Pilatus's
                 # Furka file transfer has failed to copy an image to disk.
@@ -1304,27 +1505,15 @@ class RapdPlugin(Process):
                 self.logger.debug('     RAPD assumes the data collection has been aborted.')
                 self.logger.debug('     RAPD checking for next two subsequent images to be sure.')
                 frame_count += 1
-                look_for_file = file_template.replace(replace_string, '%0*d' % (pad, frame_count))
-                if os.path.isfile(look_for_file) == True:
-                    timer = Process(target=time.sleep, args=(wait_time,))
-                    timer.start()
+                if self.frames.has_frame(frame_count):
                     # Increment the frame count to look for next image
                     frame_count += 1
-                    look_for_file = file_template.replace(replace_string,
-                                                          '%0*d' %(pad, frame_count))
                 else:
                     self.logger.debug(
                         '    RAPD did not fine the next image, checking for one more.')
                     frame_count += 1
-                    look_for_file = file_template.replace(replace_string,
-                                                          '%0*d' % (pad, frame_count))
-                    if os.path.isfile(look_for_file) == True:
-                        timer = Process(target=time.sleep, args=(wait_time,))
-                        timer.start()
+                    if self.frames.has_frame(frame_count):
                         frame_count += 1
-                        look_for_file = file_template.replace(
-                            replace_string,
-                            '%0*d' % (pad, frame_count))
                     else:
                         self.logger.debug('         RAPD did not find the next image either.')
                         self.logger.debug(
@@ -1333,23 +1522,17 @@ class RapdPlugin(Process):
                         results = self.xds_total(xdsinput)
                         return results
 
-        # If you reach here, frame_count equals the last frame, so look for the
-        # last frame and then launch xds_total.
-        while timer.is_alive():
-            if os.path.isfile(self.last_image):
-                if xds_job.is_alive():
-                    xds_job.terminate()
-                results = self.xds_total(xdsinput)
-                timer.terminate()
-                break
+        # If you reach here, frame_count equals the last frame, so wait for
+        # the last frame and then launch xds_total.
+        found = self.frames.wait_for(int(self.image_data['end']), wait_time)
+        if xds_job and xds_job.is_alive():
+            xds_job.terminate()
 
-        # If timer expires (ending the above loop) and last frame has not been
-        # detected, launch xds_total with last detected image.
-        if os.path.isfile(self.last_image) == False:
-            if xds_job.is_alive():
-                xds_job.terminate()
+        # If the last frame has not been detected, launch xds_total with last
+        # detected image.
+        if not found:
             self.image_data['total'] = frame_count - first_frame
-            results = self.xds_total(xdsinput)
+        results = self.xds_total(xdsinput)
 
         return results
 
@@ -1404,10 +1587,11 @@ class RapdPlugin(Process):
                 os.rename('%s/XDS.LOG' %xdsdir, '%s/XDS.LOG.nocutoff' %xdsdir)
                 #newinp[-2] = 'JOB=INTEGRATE CORRECT\n'
                 #newinp[-2] = '%sINCLUDE_RESOLUTION_RANGE=200.0 %.2f\n' % (newinp[-2], new_rescut)
-                newinp = self.change_xds_inp(newinp, 'JOB=INTEGRATE CORRECT\n')
+                # Only the scaling changes with the cutoff
+                newinp = self.change_xds_inp(newinp, 'JOB=CORRECT\n')
                 newinp = self.change_xds_inp(newinp, 'INCLUDE_RESOLUTION_RANGE=200.0 %.2f\n' % new_rescut)
                 self.write_file(xdsfile, newinp)
-                self.tprint(arg="  Reintegrating", level=99, color="white", newline=False)
+                self.tprint(arg="  Rescaling", level=99, color="white", newline=False)
                 self.xds_run(xdsdir)
             results = self.run_results(xdsdir)
         return results
@@ -1558,10 +1742,17 @@ class RapdPlugin(Process):
     #         input.append('SPOT_RANGE=%s %s\n\n' %(spot2_start, spot2_end))
     #     return input
 
-    def xds_run(self, directory):
+    def xds_run(self, directory, split=True):
         """
         Launches the running of xds.
+
+        With a distributor, COLSPOT and INTEGRATE are run in blocks unless
+        split is False.
         """
+        if split and self.distributor:
+            self.distributor.run(directory, lambda whole_dir: self.xds_run(whole_dir, split=False))
+            return
+
         self.logger.debug("directory = %s", directory)
         self.logger.debug("detector = %s", self.image_data["detector"])
 
@@ -1612,8 +1803,8 @@ class RapdPlugin(Process):
 
     def find_correct_res(self, directory, isigi):
         """
-        Looks at CORRECT.LP to find a resolution cutoff, where I/sigma is
-        approximately 1.5
+        Looks at the statistics by resolution shell in CORRECT.LP to find a
+        resolution cutoff, where I/sigma falls to isigi or CC(1/2) to 30%
         """
         self.logger.debug('     directory = %s', directory)
         self.logger.debug('     isigi = %s', isigi)
@@ -1622,69 +1813,26 @@ class RapdPlugin(Process):
                     color="white",
                     newline=False)
 
-        new_hi_res = False
         correctlp = os.path.join(directory, 'CORRECT.LP')
         try:
-            correct_log = open(correctlp, 'r').readlines()
+            shells = get_shells_from_correctlp(correctlp)
         except IOError as e:
             self.logger.debug('Could not open CORRECT.LP')
             self.logger.debug(e)
-            return new_hi_res
-
-        flag = 0
-        IsigI = 0
-        hires = 0
-
-        # Read from the bottom of CORRECT.LP up, looking for the first
-        # occurence of "total", which signals that you've found the
-        # last statistic table given giving I/sigma values in the file.
-        for i in range(len(correct_log)-1, 0, -1):
-            # print hires, correct_log[i].strip()
-            if correct_log[i].strip().startswith('total'):
-                flag = 1
-            elif flag == 1:
-                if len(correct_log[i]) == 1:
-                    new_hi_res = hires
-                    break
-                line = correct_log[i].split()
-                if line[0][0].isdigit():
-                    #if line[8] == '-99.00':
-                    #    self.logger.debug('    IsigI = -99.00')
-                    #    return False
-                    prev_hires = hires
-                    prev_IsigI = IsigI
-                    hires = float(line[0])
-                    try:
-                        IsigI = float(line[8])
-                    except ValueError:
-                        pass
-                    #self.logger.debug('		hires = %s, IsigI = %s' %(hires, IsigI))
-                    if IsigI >= isigi:
-                        # If the first IsigI value greater than 2, break and
-                        # return False as new_hires.
-                        if prev_IsigI == 0:
-                            break
-                        else:
-                            new_hi_res = '%0.2f' % numpy.interp([isigi],
-                                                                [prev_IsigI, IsigI],
-                                                                [prev_hires, hires])
-                            # print [isigi]
-                            # print [prev_IsigI, IsigI]
-                            # print [prev_hires, hires]
-                            # print numpy.interp([isigi], [prev_IsigI, IsigI], [prev_hires, hires])
-                            break
-                else: # If first character in line is not a digit, you;ve
-                    # read through the entire table, so break.
-                    new_hi_res = hires
-                    break
-        self.logger.debug('     prev_hires = %s     prev_IsigI = %s' % (prev_hires, prev_IsigI))
-        self.logger.debug('     hires = %s          IsigI = %s' %(hires, IsigI))
-        self.logger.debug('	New cutoff = %s' % new_hi_res)
-        hi_res = float(new_hi_res)
+            return False
+        if shells is None:
+            self.logger.debug('No resolution shells in CORRECT.LP')
+            return False
 
-        self.tprint(arg="new cutoff = %4.2f %s" % (hi_res, text.aring),
-                    level=99,
-                    color="white")
+        hi_res, report = get_resolution_cutoff(shells, isigi=isigi)
+        self.logger.debug('	Cutoff report = %s' % report)
+
+        if hi_res == False:
+            self.tprint(arg="none needed", level=99, color="white")
+        else:
+            self.tprint(arg="new cutoff = %4.2f %s" % (hi_res, text.aring),
+                        level=99,
+                        color="white")
 
         return hi_res
 
@@ -2085,43 +2233,34 @@ class RapdPlugin(Process):
         # Run pointless to convert XDS_ASCII.HKL to mtz format.
         mtzfile, pointless_log = self.pointless()
 
-        # Run dummy run of aimless to generate various stats and plots.
-        # i.e. We don't use aimless for actual scaling, it's already done by XDS.
-        if mtzfile != 'Failed':
-            aimless_log = self.aimless(mtzfile)
-        else:
+        if mtzfile == 'Failed':
             self.logger.debug('    Pointless did not run properly!')
             self.logger.debug('    Please check logs and files in %s', self.dirs['work'])
             return 'Failed'
 
-        # Parse the aimless logfile to look for resolution cutoff.
+        # Work out the resolution cutoff from the statistics by shell that
+        # CORRECT has already calculated, using the aimless criteria of
+        # CC(1/2) and Mn(I/sd) > 1.5
+        shells = get_shells_from_correctlp()
+        res_cut = False
+        if shells is not None:
+            current_resolution = shells["d_min"][-1]
+            # If manually overiding the hi_res
+            if self.preferences.get("hi_res", False):
+                res_cut = self.preferences.get("hi_res")
+            # Determine from data
+            else:
+                res_cut, orig_rescut = get_resolution_cutoff(shells)
+                self.logger.debug("Resolution cutoff %s", orig_rescut)
+            # Only cut if the suggested resolution is greater than the
+            # highest resolution + 0.05.
+            if res_cut and float(res_cut) <= float(current_resolution) + 0.05:
+                res_cut = False
+
+        # Run aimless once to generate various stats and plots.
+        # i.e. We don't use aimless for actual scaling, it's already done by XDS.
+        aimless_log = self.aimless(mtzfile, res_cut)
         aimlog = open(aimless_log, "r").readlines()
-        for line in aimlog:
-            if 'High resolution limit' in line:
-                current_resolution = line.split()[-1]
-            elif 'from half-dataset correlation' in line:
-                resline = line
-            elif 'from Mn(I/sd) >  1.50' in line:
-                resline2 = line
-                break
-
-        # If manually overiding the hi_res
-        if self.preferences.get("hi_res", False):
-            res_cut = self.preferences.get("hi_res")
-        # Determine from data
-        else:
-            res_cut = resline.split('=')[1].split('A')[0].strip()
-            res_cut2 = resline2.split('=')[1].split('A')[0].strip()
-            if float(res_cut2) < float(res_cut):
-                res_cut = res_cut2
-
-        # Run aimless with a higher resolution cutoff if the suggested resolution
-        # is greater than the initial resolution + 0.05.
-        if float(res_cut) > float(current_resolution) + 0.05:
-            # Save information on original resolution suggestions
-            orig_rescut = resline
-            # rerun aimless
-            aimless_log = self.aimless(mtzfile, res_cut)
 
         graphs, summary = parse_aimless(aimless_log)
 
@@ -2156,6 +2295,7 @@ class RapdPlugin(Process):
             "mtzfile": scalamtz,
             "xparm": xparm,
             "dir": directory,
+            "resolution_cutoff": orig_rescut,
             }
         self.logger.debug("Returning results!")
         #self.logger.debug(results)
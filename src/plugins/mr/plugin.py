@@ -48,9 +48,12 @@ import shutil
 import time
 import importlib
 import random
+import signal
 
 # RAPD 
 from bson.objectid import ObjectId
+from plugins.subcontractors import mr_scheduler
+from plugins.subcontractors.phaser_service import PhaserService
 from plugins.subcontractors.rapd_phaser import run_phaser
 from plugins.subcontractors.rapd_cctbx import get_pdb_info, get_mtz_info, get_res
 from plugins.get_cif.plugin import check_pdbq
@@ -117,8 +120,10 @@ class RapdPlugin(Thread):
 
     redis = False
     pool = False
+    phaser_service = False
     batch_queue = False
     manager = False
+    scheduler = False
 
     # Timers for processes
     phaser_timer = rglobals.PHASER_TIMEOUT
@@ -189,7 +194,9 @@ class RapdPlugin(Thread):
         else:
             # if NOT using a computer cluster setup a multiprocessing.pool and manager for queues. 
             self.launcher = local_subprocess
-            self.pool = mp_pool(self.preferences.get("nproc", cpu_count()-1))
+            self.nproc = self.preferences.get("nproc", cpu_count()-1)
+            # Phaser runs in a PhaserService unless it is turned off
+            self.phaser_service = self.preferences.get("phaser_service", True)
             self.manager = mp_manager()
 
         # Set Python path for subcontractors.rapd_phaser
@@ -410,6 +417,18 @@ class RapdPlugin(Thread):
             self.redis.lpush("RAPD_RESULTS", json_results)
             self.redis.publish("RAPD_RESULTS", json_results)
 
+    def start_pool(self):
+        """
+        Start the local Phaser workers. They are forked, so this is done
+        before the plugin starts any threads of its own.
+        """
+
+        if self.phaser_service:
+            # Read the data once for all the jobs
+            self.pool = PhaserService(self.data_file, self.nproc, self.logger)
+        else:
+            self.pool = mp_pool(self.nproc)
+
     def process(self):
         """Run plugin action"""
 
@@ -425,6 +444,10 @@ class RapdPlugin(Thread):
 
         self.tprint("  Assembling Phaser runs", level=10, color="white")
 
+        # A round after a cancelled one needs new workers
+        if not self.computer_cluster and not self.pool:
+            self.start_pool()
+
         def launch_job(inp):
             """Launch the Phaser job"""
             #self.logger.debug("process_phaser Launching %s"%inp['name'])
@@ -437,21 +460,41 @@ class RapdPlugin(Thread):
                 # Don't need result queue since results will be sent via Redis
                 queue = False
             else:
-                inp['pool'] = self.pool
+                if self.phaser_service:
+                    inp['service'] = self.pool
+                else:
+                    inp['pool'] = self.pool
                 # Add result queue
                 queue = self.manager.Queue()
                 inp['result_queue'] = queue
+                # The PID of the local job, so it can be killed
+                inp['pid_queue'] = self.manager.Queue()
             #inp['result_queue'] = queue
             #inp['result_queue_ip'] = self.manager_queue.address
             # Launch the job
             job, pid = run_phaser(**inp)
             self.jobs[job] = {'name': inp['name'],
                               'pid' : pid,
+                              'pid_queue': inp.get('pid_queue'),
                               'tag' : tag,
                               'result_queue': queue,
-                              'spacegroup': inp['spacegroup'] # Need for jobs that timeout.
+                              'spacegroup': inp['spacegroup'], # Need for jobs that timeout.
+                              'started': time.time()
                               }
 
+        # Runs the quick jobs first and stops at a definitive solution
+        if self.computer_cluster:
+            max_jobs = self.preferences.get("max_jobs", mr_scheduler.MAX_CLUSTER_JOBS)
+        else:
+            max_jobs = self.preferences.get("max_jobs", self.nproc)
+        self.scheduler = mr_scheduler.MRScheduler(
+            launch=launch_job,
+            max_jobs=max_jobs,
+            early_stop=self.preferences.get("early_stop", True),
+            tfz=self.preferences.get("definitive_tfz", mr_scheduler.DEFINITIVE_TFZ),
+            llg=self.preferences.get("definitive_llg", mr_scheduler.DEFINITIVE_LLG),
+            logger=self.logger)
+
         # Determine which SG's to run MR.
         run_sg = xutils.get_sub_groups(self.laue, "phaser")
         # Prune if only one chain present, b/c 'all' and 'A' will be the same.
@@ -471,7 +514,7 @@ class RapdPlugin(Thread):
                 res = xutils.set_phaser_res(self.pdb_info[chain]["res"],
                                             self.large_cell,
                                             self.dres)
-                for sg in run_sg:
+                for sg_rank, sg in enumerate(run_sg):
                     # Convert SG number to name
                     sg = xutils.convert_spacegroup(sg, True)
                     # Setup MR job description
@@ -496,7 +539,7 @@ class RapdPlugin(Thread):
                         xutils.create_folder(work_dir)
                         job_description.update({"work_dir": work_dir,
                                                 "name": name})
-                        launch_job(job_description)
+                        self.scheduler.submit(job_description, (0, sg_rank))
                     # Launch full MR
                     if self.computer_cluster or full:
                         name = "%s_%s_1" % (sg, chain)
@@ -505,7 +548,7 @@ class RapdPlugin(Thread):
                         job_description.update({"work_dir": work_dir,
                                                 "full": True,
                                                 "name": name})
-                        launch_job(job_description)
+                        self.scheduler.submit(job_description, (1, sg_rank))
                 
             else:
                 self.postprocess_phaser(chain, {"solution": False,
@@ -513,10 +556,11 @@ class RapdPlugin(Thread):
 
         # Save number of jobs launched for correct status reply
         if not full:
+            njobs = len(self.jobs.keys()) + len(self.scheduler.pending)
             if self.computer_cluster:
-                self.calculate_status_increment(len(self.jobs.keys()))
+                self.calculate_status_increment(njobs)
             else:
-                self.calculate_status_increment(len(self.jobs.keys())*2)
+                self.calculate_status_increment(njobs*2)
 
     def postprocess_phaser(self, job_name, results):
         """fix Phaser results and pass back"""
@@ -556,33 +600,39 @@ class RapdPlugin(Thread):
 
         self.logger.debug("jobs_monitor")
 
-        def finish_job(job):
+        def job_results(job):
+            """Return the results of a job, or None if it is still running"""
+            info = self.jobs[job]
+            if self.computer_cluster:
+                # Results are in Redis as soon as Phaser is done with them
+                alive = job.is_alive()
+                results_json = self.redis.get(info['tag'])
+                if results_json:
+                    return json.loads(results_json)
+                if alive:
+                    return None
+                self.logger.error('No results in Redis for %s' % info['name'])
+                return {"solution": False,
+                        "spacegroup": info['spacegroup'],
+                        "message": "No results"}
+            elif job.ready():
+                results = info['result_queue'].get()
+                return json.loads(results.get('stdout'))
+            return None
+
+        def finish_job(job, results):
             """Finish the jobs and send to postprocess_phaser"""
             info = self.jobs.pop(job)
             print 'Finished Phaser on %s with id: %s'%(info['name'], info['tag'])
             self.logger.debug('Finished Phaser on %s'%info['name'])
             if self.computer_cluster:
-                results_json = self.redis.get(info['tag'])
-                # This try/except is for when results aren't in Redis in time.
-                try:
-                    results = json.loads(results_json)
-                    self.postprocess_phaser(info['name'], results)
-                    self.redis.delete(info['tag'])
-                except Exception as e:
-                    self.logger.error('Error '+ str(e))
-                    #print 'PROBLEM: %s %s'%(info['name'], info['output_id'])
-                    #print results_json
-            else:
-                results = info['result_queue'].get()
-                self.postprocess_phaser(info['name'], json.loads(results.get('stdout')))
-            jobs.remove(job)
+                self.redis.delete(info['tag'])
+            self.postprocess_phaser(info['name'], results)
+            # Start the next job, or stop if this one is solved
+            if self.scheduler.done(info['name'], results):
+                print 'Definitive solution from %s' % info['name']
+                self.cancel_jobs("Cancelled")
 
-        # Signal to the pool that no more processes will be added
-        if self.pool and full:
-            self.pool.close()
-
-        timed_out = False
-        timer = 0
         if full:
             jobs = [job for job in self.jobs.keys() if self.jobs[job]['name'][-1] == '1']
         else:
@@ -590,50 +640,34 @@ class RapdPlugin(Thread):
 
         # Run loop to see when jobs finish
         while len(jobs):
-            for job in jobs:
-                if self.pool:
-                    if job.ready():
-                        finish_job(job)
-                elif job.is_alive() == False:
-                    finish_job(job)
+            for job in jobs[:]:
+                # Gone if a solution has cancelled it
+                if job not in self.jobs:
+                    jobs.remove(job)
+                    continue
+                results = job_results(job)
+                # Each job has the whole time from when it was started
+                if results is None and self.phaser_timer and \
+                   time.time() - self.jobs[job]['started'] >= self.phaser_timer:
+                    print 'Timed out Phaser on %s' % self.jobs[job]['name']
+                    self.logger.debug('Timed out Phaser on %s' % self.jobs[job]['name'])
+                    self.stop_job(self.jobs[job])
+                    results = {"solution": False,
+                               "spacegroup": self.jobs[job]['spacegroup'],
+                               "message": "Timed out"}
+                if results is not None:
+                    jobs.remove(job)
+                    finish_job(job, results)
+            # Pick up jobs the scheduler started in place of finished ones
+            jobs.extend(job for job in self.jobs.keys()
+                        if job not in jobs and self.jobs[job]['name'][-1] == ('1' if full else '0'))
             time.sleep(1)
-            timer += 1
-            """
-            if self.verbose:
-              if round(timer%1,1) in (0.0,1.0):
-                  print 'Waiting for AutoStat jobs to finish '+str(timer)+' seconds'
-            """
-            if self.phaser_timer:
-                if timer >= self.phaser_timer:
-                    timed_out = True
-                    break
-        if timed_out:
-            if self.verbose:
-                self.logger.debug('MR timed out.')
-                print 'MR timed out.'
-            for job in self.jobs.keys():
-                if self.computer_cluster:
-                    # Kill job on cluster:
-                    self.computer_cluster.kill_job(self.jobs[job].get('pid'))
-                else:
-                    # terminate the job
-                    job.terminate()
-                # Get the job info
-                info = self.jobs.pop(job)
-                print 'Timeout Phaser on %s'%info['name']
-                self.logger.debug('Timeout Phaser on %s'%info['name'])
-                # Send timeout result to postprocess
-                self.postprocess_phaser(info['name'], {"solution": False,
-                                                       "spacegroup": info['spacegroup'],
-                                                       "message": "Timed out"})
-                # Delete the Redis key
-                if self.redis:
-                    self.redis.delete(info['output_id'])
-
-        # Join the self.pool if used
+
+        # Signal to the pool that no more processes will be added and join it
         if self.pool and full:
             # Close the multiprocessing.manager
             self.manager.shutdown()
+            self.pool.close()
             self.pool.join()
 
         if self.verbose and self.logger:
@@ -643,6 +677,59 @@ class RapdPlugin(Thread):
         if not full:
           self.check_solution()
 
+    def cancel_jobs(self, message):
+        """
+        Stop the running jobs and drop the ones not started, reporting those
+        for spacegroups that have no result yet
+        """
+
+        self.logger.debug("cancel_jobs")
+
+        names = [info['name'] for info in self.jobs.values()] + \
+                [job_description['name'] for job_description in self.scheduler.cancel()]
+
+        for job, info in self.jobs.items():
+            self.stop_job(info)
+        self.jobs = {}
+
+        # Pool jobs are stopped with their workers, and a new pool is made
+        # if there is another round
+        if self.pool:
+            self.pool.terminate()
+            self.pool = False
+
+        for name in names:
+            print '%s Phaser on %s' % (message, name)
+            self.logger.debug('%s Phaser on %s' % (message, name))
+            # Keep the result of the other run in the same spacegroup
+            if name[:-2] not in self.results['results']['mr_results']:
+                self.postprocess_phaser(name, {"solution": False,
+                                               "spacegroup": name.split('_')[0],
+                                               "message": message})
+
+    def stop_job(self, info):
+        """Kill a running Phaser job"""
+
+        if self.computer_cluster:
+            # Kill job on cluster:
+            self.computer_cluster.kill_job(info.get('pid'))
+            self.redis.delete(info['tag'])
+            return
+
+        try:
+            pid = info['pid_queue'].get_nowait()
+        except Exception:
+            # Still waiting for a worker
+            return
+        if self.phaser_service:
+            self.pool.kill(pid)
+        else:
+            # Stopping the pool leaves the phaser_script.py it started running
+            try:
+                os.kill(pid, signal.SIGKILL)
+            except OSError:
+                pass
+
     def check_solution(self):
         """
         Check if solution is found. If not alter input and rerun.
@@ -659,20 +746,12 @@ class RapdPlugin(Thread):
                 solution = True
         if solution:
             #Kill the jobs and remove the full results since not needed.
+            self.cancel_jobs("Cancelled")
             for job in keys1:
-                if self.computer_cluster:
-                    # Kill job on cluster:
-                    self.computer_cluster.kill_job(self.jobs[job].get('pid'))
-                else:
-                    # terminate the job
-                    job.terminate()
                 del self.phaser_results[job]
-            # Close the pool to new jobs and join the thread.
-            if self.pool:
-                # Close the multiprocessing.manager
+            # The pool went with the jobs, close the multiprocessing.manager
+            if self.manager:
                 self.manager.shutdown()
-                self.pool.close()
-                self.pool.join()
             # Update status
             self.update_status(90)
             # Send updated status
@@ -0,0 +1,371 @@
+"""
+Local index of the unit cells in the PDB for pdbquery
+"""
+
+"""
+This file is part of RAPD
+
+Copyright (C) 2018, Cornell University
+All rights reserved.
+
+RAPD is free software: you can redistribute it and/or modify
+it under the terms of the GNU Affero General Public License as published by
+the Free Software Foundation, version 3.
+
+RAPD is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU Affero General Public License for more details.
+
+You should have received a copy of the GNU Affero General Public License
+along with this program.  If not, see <http://www.gnu.org/licenses/>.
+"""
+
+__created__ = "2026-10-18"
+__maintainer__ = "Jon Schuermann"
+__email__ = "schuerjp@anl.gov"
+__status__ = "Development"
+
+"""
+The index is built from the crystal.idx and compound.idx files the wwPDB
+publishes, and kept as an npz file of:
+
+  codes         PDB codes
+  cells         deposited cells
+  reduced       reduced cells, in order of the reduced a edge
+  descriptions  compound names, one string joined by newlines
+  built         when the index was built
+
+A search reduces the query cell the same way, takes the range of entries
+whose a edge is close enough with a binary search, and ranks that range by
+the largest relative difference over the six parameters. That is the
+measure the old cell_search windows used, so a distance of 0.005 is the old
+1% window.
+
+The index is rebuilt when it is older than CELL_INDEX_MAX_AGE, either by a
+plugin in the background or from cron with:
+
+  rapd.python -m plugins.pdbquery.cell_index --refresh
+"""
+
+# Standard imports
+import argparse
+import logging
+import os
+import threading
+import time
+import urllib2
+
+# RAPD imports
+import utils.global_vars as rglobals
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+try:
+    from cctbx import uctbx
+except ImportError:
+    uctbx = None
+
+# Index files from the wwPDB
+CRYSTAL_IDX = "https://files.wwpdb.org/pub/pdb/derived_data/index/crystal.idx"
+COMPOUND_IDX = "https://files.wwpdb.org/pub/pdb/derived_data/index/compound.idx"
+# Seconds before the index is rebuilt
+CELL_INDEX_MAX_AGE = 7 * 24 * 3600
+# Seconds before a refresh that holds the lock is taken to have died
+REFRESH_LOCK_AGE = 3600
+# Largest distance a search returns - the old 25% window
+MAX_DISTANCE = 0.125
+
+def reduce_cells(cells):
+    """
+    Return the reduced form of an array of cells, one per row. Niggli cells
+    when cctbx is available, otherwise the edges in ascending order with the
+    angles permuted to match.
+
+    Keyword arguments
+    cells -- numpy array of a, b, c, alpha, beta, gamma rows
+    """
+
+    cells = numpy.asarray(cells, dtype=float).reshape(-1, 6)
+
+    # Edges in order, angle i staying opposite edge i
+    order = numpy.argsort(cells[:, :3], axis=1)
+    rows = numpy.arange(len(cells))[:, None]
+    reduced = numpy.hstack((cells[rows, order], cells[rows, order + 3]))
+
+    if uctbx:
+        for index, cell in enumerate(cells):
+            try:
+                reduced[index] = uctbx.unit_cell(tuple(cell)).niggli_cell().parameters()
+            except RuntimeError:
+                # Not a real cell, leave it sorted
+                pass
+
+    return reduced
+
+class CellIndex(object):
+    """
+    Unit cells of the PDB, searchable by distance from a cell
+    """
+
+    def __init__(self, codes, cells, reduced, descriptions, built):
+        """
+        Keyword arguments
+        codes -- array of PDB codes
+        cells -- array of deposited cells
+        reduced -- array of reduced cells
+        descriptions -- list of compound names
+        built -- time the index was built
+        """
+
+        # Keep in order of reduced a for the range search
+        order = numpy.argsort(reduced[:, 0], kind="mergesort")
+        self.codes = codes[order]
+        self.cells = cells[order]
+        self.reduced = reduced[order]
+        self.descriptions = [descriptions[index] for index in order]
+        self.built = built
+
+    def __len__(self):
+        return len(self.codes)
+
+    @classmethod
+    def build(cls, crystal_lines, compound_lines):
+        """
+        Return an index made from the lines of crystal.idx and compound.idx
+
+        Keyword arguments
+        crystal_lines -- iterable of lines of crystal.idx
+        compound_lines -- iterable of lines of compound.idx
+        """
+
+        compounds = {}
+        for line in compound_lines:
+            fields = line.rstrip("\n").split("\t", 1)
+            if len(fields) == 2:
+                compounds[fields[0].strip().upper()] = fields[1].strip()
+
+        codes = []
+        cells = []
+        for line in crystal_lines:
+            fields = line.split()
+            if len(fields) < 7:
+                continue
+            try:
+                cell = [float(field) for field in fields[1:7]]
+            except ValueError:
+                # Header lines
+                continue
+            # NMR and EM entries have a placeholder cell
+            if cell[:3] == [1.0, 1.0, 1.0]:
+                continue
+            codes.append(fields[0].upper())
+            cells.append(cell)
+
+        cells = numpy.array(cells, dtype=float).reshape(-1, 6)
+        return cls(codes=numpy.array(codes),
+                   cells=cells,
+                   reduced=reduce_cells(cells),
+                   descriptions=[compounds.get(code, "") for code in codes],
+                   built=time.time())
+
+    @classmethod
+    def load(cls, path):
+        """Return the index saved in path"""
+
+        with numpy.load(path) as saved:
+            return cls(codes=saved["codes"],
+                       cells=saved["cells"],
+                       reduced=saved["reduced"],
+                       descriptions=str(saved["descriptions"]).split("\n"),
+                       built=float(saved["built"]))
+
+    def save(self, path):
+        """Write the index to path, replacing any index already there"""
+
+        directory = os.path.dirname(path)
+        if directory and not os.path.isdir(directory):
+            os.makedirs(directory)
+
+        # Write elsewhere and move so readers never see half an index
+        temp_path = "%s.%d.tmp" % (path, os.getpid())
+        with open(temp_path, "wb") as output_file:
+            numpy.savez(output_file,
+                        codes=self.codes,
+                        cells=self.cells,
+                        reduced=self.reduced,
+                        descriptions=numpy.array("\n".join(description.replace("\n", " ")
+                                                           for description in self.descriptions)),
+                        built=numpy.array(self.built))
+        os.rename(temp_path, path)
+
+    def search(self, cell, limit, max_distance=MAX_DISTANCE, within=0.0):
+        """
+        Return a list of (code, distance, description) for the entries
+        closest to a cell, nearest first
+
+        Keyword arguments
+        cell -- a, b, c, alpha, beta, gamma
+        limit -- number of entries to return
+        max_distance -- leave out entries further than this (default MAX_DISTANCE)
+        within -- also return every entry closer than this, even past limit (default 0.0)
+        """
+
+        query = reduce_cells(cell)[0]
+
+        # Entries with the a edge in range
+        start = numpy.searchsorted(self.reduced[:, 0], query[0] * (1 - max_distance), side="left")
+        end = numpy.searchsorted(self.reduced[:, 0], query[0] * (1 + max_distance), side="right")
+
+        distances = (numpy.abs(self.reduced[start:end] - query) / query).max(axis=1)
+        candidates = numpy.nonzero(distances <= max_distance)[0]
+        candidates = candidates[numpy.argsort(distances[candidates], kind="mergesort")]
+
+        number = max(limit, int((distances[candidates] <= within).sum()))
+
+        return [(str(self.codes[start + index]), float(distances[index]), self.descriptions[start + index])
+                for index in candidates[:number]]
+
+def fetch_lines(url):
+    """Return the lines of a file on the web"""
+
+    return urllib2.urlopen(url, timeout=60).read().splitlines()
+
+def refresh_index(path=rglobals.PDBQ_CELL_INDEX, logger=None):
+    """
+    Build the index from the wwPDB files and save it, returning the index or
+    None if another process is already building it or it could not be built
+
+    Keyword arguments
+    path -- where to save the index (default rglobals.PDBQ_CELL_INDEX)
+    logger -- logger instance (default RAPDLogger)
+    """
+
+    logger = logger or logging.getLogger("RAPDLogger")
+
+    directory = os.path.dirname(path)
+    if directory and not os.path.isdir(directory):
+        os.makedirs(directory)
+
+    # One refresh at a time
+    lock_path = path + ".lock"
+    try:
+        if time.time() - os.path.getmtime(lock_path) > REFRESH_LOCK_AGE:
+            os.remove(lock_path)
+    except OSError:
+        pass
+    try:
+        os.close(os.open(lock_path, os.O_CREAT | os.O_EXCL))
+    except OSError:
+        logger.debug("Cell index %s is already being refreshed", path)
+        return None
+
+    try:
+        start = time.time()
+        cell_index = CellIndex.build(fetch_lines(CRYSTAL_IDX), fetch_lines(COMPOUND_IDX))
+        cell_index.save(path)
+        logger.debug("Built cell index of %d entries in %.1f s", len(cell_index), time.time() - start)
+        return cell_index
+    except (urllib2.URLError, IOError, OSError, ValueError):
+        logger.exception("Unable to refresh cell index %s", path)
+        return None
+    finally:
+        os.remove(lock_path)
+
+def get_index(path=rglobals.PDBQ_CELL_INDEX, max_age=CELL_INDEX_MAX_AGE, logger=None):
+    """
+    Return the saved index, or None if there is none. An index older than
+    max_age is still returned, and rebuilt in the background for next time.
+
+    Keyword arguments
+    path -- saved index (default rglobals.PDBQ_CELL_INDEX)
+    max_age -- seconds before the index is rebuilt (default CELL_INDEX_MAX_AGE)
+    logger -- logger instance (default RAPDLogger)
+    """
+
+    logger = logger or logging.getLogger("RAPDLogger")
+
+    if not numpy:
+        return None
+
+    cell_index = None
+    if os.path.exists(path):
+        try:
+            cell_index = CellIndex.load(path)
+        except (IOError, KeyError, ValueError):
+            logger.exception("Unable to read cell index %s", path)
+
+    if not cell_index or time.time() - cell_index.built > max_age:
+        refresher = threading.Thread(target=refresh_index, args=(path, logger))
+        refresher.daemon = True
+        refresher.start()
+
+    return cell_index
+
+def get_commandline():
+    """
+    Grabs the commandline
+    """
+
+    # Parse the commandline arguments
+    commandline_description = "Local index of the unit cells in the PDB"
+    parser = argparse.ArgumentParser(description=commandline_description)
+
+    # Rebuild the index
+    parser.add_argument("--refresh",
+                        action="store_true",
+                        dest="refresh",
+                        help="Rebuild the index from the wwPDB")
+
+    # Index file
+    parser.add_argument("--index",
+                        action="store",
+                        dest="index",
+                        default=rglobals.PDBQ_CELL_INDEX,
+                        help="Index file")
+
+    # Cell to search for
+    parser.add_argument("--cell",
+                        action="store",
+                        dest="cell",
+                        nargs=6,
+                        type=float,
+                        help="Unit cell to search for")
+
+    # Number of entries
+    parser.add_argument("--limit",
+                        action="store",
+                        dest="limit",
+                        type=int,
+                        default=10,
+                        help="Number of entries to return")
+
+    return parser.parse_args()
+
+def main(args):
+    """Refresh the index and/or search it"""
+
+    logging.basicConfig(level=logging.DEBUG)
+    logger = logging.getLogger("RAPDLogger")
+
+    if args.refresh:
+        refresh_index(args.index, logger)
+
+    if args.cell:
+        cell_index = CellIndex.load(args.index)
+        start = time.time()
+        found = cell_index.search(args.cell, args.limit)
+        for code, distance, description in found:
+            print "%s  %.4f  %s" % (code, distance, description)
+        print "%d of %d entries in %.1f ms" % (len(found), len(cell_index), (time.time() - start) * 1000)
+
+if __name__ == "__main__":
+
+    # Get the commandline args
+    commandline_args = get_commandline()
+
+    # Execute code
+    main(args=commandline_args)
@@ -47,6 +47,7 @@ import os
 from pprint import pprint
 import random
 import shutil
+import signal
 import sys
 import time
 import importlib
@@ -57,6 +58,9 @@ from bson.objectid import ObjectId
 from plugins.subcontractors.rapd_phaser import run_phaser
 from plugins.subcontractors.rapd_cctbx import get_pdb_info, get_mtz_info, get_res, get_spacegroup_info
 from plugins.get_cif.plugin import check_pdbq
+from plugins.pdbquery import cell_index
+from plugins.subcontractors import mr_scheduler
+from plugins.subcontractors.phaser_service import PhaserService
 # from plugins.subcontractors.parse import parse_phaser_output, set_phaser_failed
 from utils import archive
 import utils.credits as rcredits
@@ -137,7 +141,9 @@ class RapdPlugin(Thread):
     
     redis = False
     pool = False
+    phaser_service = False
     batch_queue = False
+    scheduler = False
 
     # Timers for processes
     phaser_timer = rglobals.PHASER_TIMEOUT
@@ -202,7 +208,9 @@ class RapdPlugin(Thread):
             self.batch_queue = self.computer_cluster.check_queue(self.command.get('command'))
         else:
             self.launcher = local_subprocess
-            self.pool = mp_pool(self.preferences.get("nproc", cpu_count()-1))
+            self.nproc = self.preferences.get("nproc", cpu_count()-1)
+            # Phaser runs in a PhaserService unless it is turned off
+            self.phaser_service = self.preferences.get("phaser_service", True)
             self.manager = mp_manager()
 
         # Setup a multiprocessing pool if not using a computer cluster.
@@ -275,6 +283,22 @@ class RapdPlugin(Thread):
         if self.preferences.get("run_mode") == "server" or self.computer_cluster:
             self.connect_to_redis()
 
+        # Before the cell search and model downloads start their threads
+        if not self.computer_cluster:
+            self.start_pool()
+
+    def start_pool(self):
+        """
+        Start the local Phaser workers. They are forked, so this is done
+        before the plugin starts any threads of its own.
+        """
+
+        if self.phaser_service:
+            # Read the data once for all the jobs
+            self.pool = PhaserService(self.data_file, self.nproc, self.logger)
+        else:
+            self.pool = mp_pool(self.nproc)
+
     def update_status(self):
         """Update the status of the run."""
         iter = 90/len(self.cell_output.keys())
@@ -487,40 +511,59 @@ class RapdPlugin(Thread):
         else:
             limit = 8
 
-        # Limit the unit cell difference to 25%. Also stops it if errors are received.
-        pdbq_results = {}
-        counter = 0
-        while counter < 25:
-            self.tprint("  Querying server at %s" % PDBQ_SERVER,
+        # Search the local index of unit cells if there is one
+        local_index = cell_index.get_index(path=self.preferences.get("cell_index",
+                                                                     rglobals.PDBQ_CELL_INDEX),
+                                           logger=self.logger)
+        if local_index:
+            self.tprint("  Searching local index of %d unit cells" % len(local_index),
                         level=20,
                         color="white")
+            pdbq_results = {}
+            # Keep everything in the old first windows if there is no limit
+            for pdb_code, distance, description in local_index.search(self.cell,
+                                                                      limit=limit,
+                                                                      within=(0.01 if no_limit else 0.0)):
+                # Remove anything bigger than 4 letters
+                if len(pdb_code) <= 4:
+                    pdbq_results[pdb_code] = {"description":description,
+                                              "cell_distance":distance}
+        else:
+            pdbq_results = {}
+            counter = 0
 
-            # Connect to and query the PDBQ server
-            pdbq_results = connect_pdbq(pdbq_results, permutations, end)
-
-            # Handle results
-            if pdbq_results:
-                for line in pdbq_results.keys():
-                    # Remove anything bigger than 4 letters
-                    if len(line) > 4:
-                        del pdbq_results[line]
-
-                # Do not limit number of results if many models come out really close in cell
-                # dimensions.
-                if counter in (0, 1):
-                    # Limit output
-                    if no_limit == False:
+            # Limit the unit cell difference to 25%. Also stops it if errors are received.
+            while counter < 25:
+                self.tprint("  Querying server at %s" % PDBQ_SERVER,
+                            level=20,
+                            color="white")
+
+                # Connect to and query the PDBQ server
+                pdbq_results = connect_pdbq(pdbq_results, permutations, end)
+
+                # Handle results
+                if pdbq_results:
+                    for line in pdbq_results.keys():
+                        # Remove anything bigger than 4 letters
+                        if len(line) > 4:
+                            del pdbq_results[line]
+
+                    # Do not limit number of results if many models come out really close in cell
+                    # dimensions.
+                    if counter in (0, 1):
+                        # Limit output
+                        if no_limit == False:
+                            pdbq_results = limit_pdbq_results(pdbq_results, limit)
+                    else:
                         pdbq_results = limit_pdbq_results(pdbq_results, limit)
-                else:
-                    pdbq_results = limit_pdbq_results(pdbq_results, limit)
 
-            # Not enough results
-            if len(pdbq_results) < limit:
-                counter += 1
-                self.percent += 0.01
-                self.logger.debug("Not enough PDB results. Going for more...")
-            else:
-                break
+                # Not enough results
+                if len(pdbq_results) < limit:
+                    counter += 1
+                    self.percent += 0.01
+                    self.logger.debug("Not enough PDB results. Going for more...")
+                else:
+                    break
 
         # There will be results!
         if pdbq_results:
@@ -601,10 +644,15 @@ class RapdPlugin(Thread):
                 # Don't need result queue since results will be sent via Redis
                 queue = False
             else:
-                inp['pool'] = self.pool
+                if self.phaser_service:
+                    inp['service'] = self.pool
+                else:
+                    inp['pool'] = self.pool
                 # Add result queue
                 queue = self.manager.Queue()
                 inp['result_queue'] = queue
+                # The PID of the local job, so it can be killed
+                inp['pid_queue'] = self.manager.Queue()
             
             #if self.pool:
             #    inp['pool'] = self.pool
@@ -614,13 +662,34 @@ class RapdPlugin(Thread):
             job, pid = run_phaser(**inp)
             self.jobs[job] = {'name': inp['name'],
                               'pid' : pid,
+                              'pid_queue': inp.get('pid_queue'),
                               'tag' : tag,
                               'result_queue': queue,
-                              'spacegroup': inp['spacegroup'] # Need for jobs that timeout.
+                              'spacegroup': inp['spacegroup'], # Need for jobs that timeout.
+                              'started': time.time()
                               }
 
+        # Runs the best candidates first and stops at a definitive solution
+        if self.computer_cluster:
+            max_jobs = self.preferences.get("max_jobs", mr_scheduler.MAX_CLUSTER_JOBS)
+        else:
+            max_jobs = self.preferences.get("max_jobs", self.nproc)
+        self.scheduler = mr_scheduler.MRScheduler(
+            launch=launch_job,
+            max_jobs=max_jobs,
+            early_stop=self.preferences.get("early_stop", True),
+            tfz=self.preferences.get("definitive_tfz", mr_scheduler.DEFINITIVE_TFZ),
+            llg=self.preferences.get("definitive_llg", mr_scheduler.DEFINITIVE_LLG),
+            logger=self.logger)
+
+        # Download the models in the order they will run while Phaser starts
+        # on the first ones
+        pdb_codes = sorted(self.cell_output.keys(), key=self.mr_rank)
+        if not self.test:
+            self.repository.prefetch_cifs(pdb_codes)
+
         # Run through the pdbs
-        for pdb_code in self.cell_output.keys():
+        for pdb_code in pdb_codes:
 
             self.tprint("    %s" % pdb_code, level=30, color="white")
 
@@ -717,7 +786,7 @@ class RapdPlugin(Thread):
                     "rapd_python": self.rapd_python}
     
                 if not l:
-                    launch_job(job_description)
+                    self.scheduler.submit(job_description, self.mr_rank(pdb_code))
                 else:
                     for chain in l:
                         new_code = "%s_%s" % (pdb_code, chain)
@@ -731,7 +800,19 @@ class RapdPlugin(Thread):
                             "resolution":xutils.set_phaser_res(pdb_info[chain]["res"],
                                                         self.large_cell,
                                                         self.dres)})
-                        launch_job(job_description)
+                        self.scheduler.submit(job_description, self.mr_rank(pdb_code))
+
+    def mr_rank(self, pdb_code):
+        """
+        Return the order to run MR on a model in - input models first, then
+        search results by cell distance, then contaminants
+        """
+
+        if pdb_code in self.custom_structures:
+            return (0, 0.0)
+        if pdb_code in self.common_contaminants:
+            return (2, 0.0)
+        return (1, self.cell_output[pdb_code].get("cell_distance", cell_index.MAX_DISTANCE))
 
     def postprocess_phaser(self, job_name, results):
         """fix Phaser results and pass back"""
@@ -891,100 +972,101 @@ class RapdPlugin(Thread):
     def jobs_monitor(self):
         """Monitor running jobs and finsh them when they complete."""
 
-        def finish_job(job):
-            """Finish the jobs and send to postprocess_phaser"""
-            info = self.jobs.pop(job)
-            self.tprint('    Finished Phaser on %s with id: %s'%(info['name'], info['tag']), level=30, color="white")
-            self.logger.debug('Finished Phaser on %s'%info['name'])
+        def job_results(job):
+            """Return the results of a job, or None if it is still running"""
+            info = self.jobs[job]
             if self.computer_cluster:
+                # Results are in Redis as soon as Phaser is done with them
+                alive = job.is_alive()
                 results_json = self.redis.get(info['tag'])
-                # This try/except is for when results aren't in Redis in time.
-                try:
-                    results = json.loads(results_json)
-                    self.postprocess_phaser(info['name'], results)
-                    self.redis.delete(info['tag'])
-                except Exception as e:
-                    self.logger.error('Error '+ str(e))
-                    #print 'PROBLEM: %s %s'%(info['name'], info['output_id'])
-                    #print results_json
-            else:
+                if results_json:
+                    return json.loads(results_json)
+                if alive:
+                    return None
+                self.logger.error('No results in Redis for %s' % info['name'])
+                return {"solution": False,
+                        "message": "No results"}
+            elif job.ready():
                 results = info['result_queue'].get()
-                # pprint(results.get('stdout', " "))
-                # pprint(json.loads(results.get('stdout'," ")))
                 # if results["stderr"]:
                 #     print results["stderr"]
-                self.postprocess_phaser(info['name'], json.loads(results.get('stdout', " ")))
-            jobs.remove(job)
-            
-            #results_json = self.redis.get(info['tag'])
-            # This try/except is for when results aren't in Redis in time.
-            #try:
-            #    results = json.loads(results_json)
-            #    self.postprocess_phaser(info['name'], results)
-            #    self.redis.delete(info['tag'])
-            #except Exception as e:
-            #    self.logger.error('Error'+ str(e))
-                # print 'PROBLEM: %s %s'%(info['name'], info['tag'])
-                # print results_json
-                # self.logger.debug('PROBLEM: %s %s'%(info['name'], info['tag']))
-                # self.logger.debug(results_json)
-            
-            #results = json.loads(results_json)
-            #print results
-            #self.postprocess_phaser(info['name'], results)
-            #self.redis.delete(info['tag'])
-            #jobs.remove(job)
+                return json.loads(results.get('stdout', " "))
+            return None
 
-        # Signal to the pool that no more processes will be added
-        if self.pool:
-            self.pool.close()
-
-        timed_out = False
-        timer = 0
-        jobs = self.jobs.keys()
+        def finish_job(job, results):
+            """Finish the jobs and send to postprocess_phaser"""
+            info = self.jobs.pop(job)
+            self.tprint('    Finished Phaser on %s with id: %s'%(info['name'], info['tag']), level=30, color="white")
+            self.logger.debug('Finished Phaser on %s'%info['name'])
+            if self.computer_cluster:
+                self.redis.delete(info['tag'])
+            self.postprocess_phaser(info['name'], results)
+            # Start the next model, or stop if this one is solved
+            if self.scheduler.done(info['name'], results):
+                self.tprint('    Definitive solution from %s' % info['name'], level=30, color="green")
+                cancel_jobs("Cancelled")
+
+        def stop_job(info):
+            """Kill a running job"""
+            if self.computer_cluster:
+                # Kill job on cluster:
+                self.computer_cluster.kill_job(info.get('pid'))
+                self.redis.delete(info['tag'])
+                return
+            try:
+                pid = info['pid_queue'].get_nowait()
+            except Exception:
+                # Still waiting for a worker
+                return
+            if self.phaser_service:
+                self.pool.kill(pid)
+            else:
+                # Stopping the pool leaves the phaser_script.py it started running
+                try:
+                    os.kill(pid, signal.SIGKILL)
+                except OSError:
+                    pass
 
-        # Run loop to see when jobs finish
-        while len(jobs):
-            for job in jobs:
-                if self.pool:
-                    if job.ready():
-                        finish_job(job)
-                elif job.is_alive() == False:
-                    finish_job(job)
-            time.sleep(1)
-            timer += 1
-            """
-            if self.verbose:
-              if round(timer%1,1) in (0.0,1.0):
-                  print 'Waiting for AutoStat jobs to finish '+str(timer)+' seconds'
-            """
-            if self.phaser_timer:
-                if timer >= self.phaser_timer:
-                    timed_out = True
-                    break
-        if timed_out:
-            if self.verbose:
-                self.logger.debug('AutoStat timed out.')
-                print 'AutoStat timed out.'
+        def cancel_jobs(message):
+            """Stop the running jobs and report them and the ones not started"""
             for job in self.jobs.keys():
-                if self.computer_cluster:
-                    # Kill job on cluster:
-                    self.computer_cluster.kill_job(self.jobs[job].get('pid'))
-                else:
-                    # terminate the job
-                    job.terminate()
                 # Get the job info
                 info = self.jobs.pop(job)
-                print 'Timeout Phaser on %s'%info['name']
-                self.logger.debug('Timeout Phaser on %s'%info['name'])
-                # Send timeout result to postprocess
+                stop_job(info)
+                self.tprint('    %s Phaser on %s' % (message, info['name']), level=30, color="white")
+                self.logger.debug('%s Phaser on %s' % (message, info['name']))
                 self.postprocess_phaser(info['name'], {"solution": False,
-                                                       "message": "Timed out"})
-                # Delete the Redis key
-                self.redis.delete(info['tag'])
+                                                       "message": message})
+            for job_description in self.scheduler.cancel():
+                self.postprocess_phaser(job_description['name'], {"solution": False,
+                                                                  "message": message})
+            # Pool jobs are stopped with their workers
+            if self.pool:
+                self.pool.terminate()
+
+        # Run loop to see when jobs finish
+        while self.jobs:
+            for job in self.jobs.keys():
+                # Gone if a solution has cancelled it
+                if job in self.jobs:
+                    results = job_results(job)
+                    # Each job has the whole time from when it was started
+                    if results is None and self.phaser_timer and \
+                       time.time() - self.jobs[job]['started'] >= self.phaser_timer:
+                        self.tprint('    Timed out Phaser on %s' % self.jobs[job]['name'],
+                                    level=30,
+                                    color="white")
+                        self.logger.debug('Timed out Phaser on %s' % self.jobs[job]['name'])
+                        stop_job(self.jobs[job])
+                        results = {"solution": False,
+                                   "message": "Timed out"}
+                    if results is not None:
+                        finish_job(job, results)
+            time.sleep(1)
 
-        # Join the self.pool if used
+        # Signal to the pool that no more processes will be added and join it
         if self.pool:
+            self.pool.close()
             self.pool.join()
 
         if self.verbose and self.logger:
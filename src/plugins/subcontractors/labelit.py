@@ -382,14 +382,14 @@ def decrease_mosflm_resolution(iteration):
     
         return new_res
 
-def decrease_spot_requirements(spot_count):
+def decrease_spot_requirements(spot_count, preferences_file="dataset_preferences.py"):
     """Decrease the required spot count in an attempt to get indexing to work"""
 
     if spot_count < 25:
         return False
     else:
         # Update dataset preferences to have lower spot number requirement
-        with open("dataset_preferences.py", "a") as preferences:
+        with open(preferences_file, "a") as preferences:
             preferences.write("distl_minimum_number_spots_for_indexing=%d\n" % spot_count)
 
         return spot_count
@@ -0,0 +1,169 @@
+"""
+Runs the Phaser jobs of an MR search best candidates first, a few at a time,
+and stops the search once one of them is clearly solved
+"""
+
+"""
+This file is part of RAPD
+
+Copyright (C) 2018, Cornell University
+All rights reserved.
+
+RAPD is free software: you can redistribute it and/or modify
+it under the terms of the GNU Affero General Public License as published by
+the Free Software Foundation, version 3.
+
+RAPD is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU Affero General Public License for more details.
+
+You should have received a copy of the GNU Affero General Public License
+along with this program.  If not, see <http://www.gnu.org/licenses/>.
+"""
+
+__created__ = "2026-10-18"
+__maintainer__ = "Jon Schuermann"
+__email__ = "schuerjp@anl.gov"
+__status__ = "Development"
+
+"""
+A plugin submits each job description with a rank, lowest first. The
+scheduler launches up to max_jobs of them through the plugin's own launch
+function and holds the rest. The plugin's job monitor reports each finished
+job with done(), which starts the next one, or, when the result is a
+definitive solution, tells the plugin to cancel what is left. Jobs still
+held are handed back by cancel() so they can be reported as not run.
+
+A solution is definitive when Phaser's TFZ and LLG both reach the thresholds.
+The defaults are the ones the Phaser documentation gives for a solved
+structure, so a screen is not cut short by a marginal hit.
+"""
+
+# Standard imports
+import heapq
+import itertools
+import logging
+
+# Phaser TFZ a solution must reach to stop the search
+DEFINITIVE_TFZ = 8.0
+# Phaser LLG a solution must reach to stop the search
+DEFINITIVE_LLG = 60.0
+# Most Phaser jobs for one dataset on a computer cluster at once
+MAX_CLUSTER_JOBS = 20
+
+def is_definitive(results, tfz=DEFINITIVE_TFZ, llg=DEFINITIVE_LLG):
+    """
+    Return True if Phaser results are a solution good enough to end the search
+
+    Keyword arguments
+    results -- result dict from rapd_phaser
+    tfz -- TFZ the solution must reach (default DEFINITIVE_TFZ)
+    llg -- LLG the solution must reach (default DEFINITIVE_LLG)
+    """
+
+    if results.get("solution") is not True:
+        return False
+
+    # TFZ is "NC" or "arbitrary" when Phaser has no score for it
+    try:
+        return float(results.get("tfz")) >= tfz and float(results.get("gain")) >= llg
+    except (TypeError, ValueError):
+        return False
+
+class MRScheduler(object):
+    """
+    Holds ranked Phaser jobs and launches them as others finish
+    """
+
+    def __init__(self,
+                 launch,
+                 max_jobs,
+                 early_stop=True,
+                 tfz=DEFINITIVE_TFZ,
+                 llg=DEFINITIVE_LLG,
+                 logger=None):
+        """
+        Keyword arguments
+        launch -- function(job_description) that starts a job
+        max_jobs -- most jobs running at once
+        early_stop -- stop the search at a definitive solution (default True)
+        tfz -- TFZ of a definitive solution (default DEFINITIVE_TFZ)
+        llg -- LLG of a definitive solution (default DEFINITIVE_LLG)
+        logger -- logger instance (default RAPDLogger)
+        """
+
+        self.logger = logger or logging.getLogger("RAPDLogger")
+
+        self.launch = launch
+        self.max_jobs = max(1, max_jobs)
+        self.early_stop = early_stop
+        self.tfz = tfz
+        self.llg = llg
+
+        # Heap of (rank, order submitted, job description)
+        self.pending = []
+        self.order = itertools.count()
+        self.running = 0
+
+        # Name of the job with the definitive solution
+        self.solved = False
+
+    def submit(self, job_description, rank=0):
+        """
+        Add a job, starting it now if there is room. Returns False if the
+        search is already over.
+
+        Keyword arguments
+        job_description -- run_phaser arguments, copied so the caller can reuse it
+        rank -- order to run in, lowest first (default 0)
+        """
+
+        if self.solved:
+            return False
+
+        heapq.heappush(self.pending, (rank, next(self.order), dict(job_description)))
+        self.fill()
+
+        return True
+
+    def fill(self):
+        """Launch held jobs, best ranked first, until max_jobs are running"""
+
+        while self.pending and self.running < self.max_jobs and not self.solved:
+            __, __, job_description = heapq.heappop(self.pending)
+            self.running += 1
+            self.launch(job_description)
+
+    def done(self, name, results):
+        """
+        Record a finished job and return True if the search should stop,
+        otherwise start the next job
+
+        Keyword arguments
+        name -- name of the job
+        results -- its result dict
+        """
+
+        self.running -= 1
+
+        if self.early_stop and not self.solved and \
+           is_definitive(results, self.tfz, self.llg):
+            self.solved = name
+            self.logger.debug("Definitive MR solution from %s (TFZ %s, LLG %s)",
+                              name,
+                              results.get("tfz"),
+                              results.get("gain"))
+            return True
+
+        self.fill()
+
+        return False
+
+    def cancel(self):
+        """Drop the jobs not yet started and return their descriptions"""
+
+        cancelled = [job_description for __, __, job_description in sorted(self.pending)]
+        self.pending = []
+
+        return cancelled
@@ -0,0 +1,196 @@
+"""
+Runs the Phaser MR jobs for one dataset in worker processes that have read
+the reflection data once
+"""
+
+"""
+This file is part of RAPD
+
+Copyright (C) 2018, Cornell University
+All rights reserved.
+
+RAPD is free software: you can redistribute it and/or modify
+it under the terms of the GNU Affero General Public License as published by
+the Free Software Foundation, version 3.
+
+RAPD is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU Affero General Public License for more details.
+
+You should have received a copy of the GNU Affero General Public License
+along with this program.  If not, see <http://www.gnu.org/licenses/>.
+"""
+
+__created__ = "2026-10-18"
+__maintainer__ = "Jon Schuermann"
+__email__ = "schuerjp@anl.gov"
+__status__ = "Development"
+
+"""
+The data are read with runMR_DAT by the process that starts the service,
+before the workers are forked, so every worker begins with Phaser imported
+and the data in memory. A job is then a single MR_AUTO call in a worker,
+with no new interpreter and no MTZ parsing.
+
+The workers are forked, so a plugin starts the service before it starts any
+threads of its own. A thread holding a lock at the fork would leave that
+lock held for good in every worker.
+
+Jobs come in through run_phaser like pool jobs do, and report back the same
+way: a dict with the result JSON as "stdout" goes on the job's result_queue.
+Plugins finish them with the code they already use for phaser_script.py runs.
+"""
+
+# Standard imports
+import json
+import logging
+import multiprocessing
+import os
+import signal
+import traceback
+
+# RAPD imports
+from plugins.subcontractors import rapd_phaser
+from utils.processes import total_nproc
+
+# data_file -> read_data result, set before the workers are forked
+DATA = {}
+
+# run_phaser arguments that MR_AUTO uses
+JOB_KEYS = ("data_file",
+            "struct_file",
+            "spacegroup",
+            "work_dir",
+            "adf",
+            "name",
+            "ncopy",
+            "cell_analysis",
+            "resolution",
+            "full")
+
+def run_job(job, result_queue=False, logfile=False, pid_queue=False):
+    """
+    Run one MR job in a worker and return the result
+
+    Keyword arguments
+    job -- dict of run_mr arguments
+    result_queue -- queue to put the result on as local_subprocess would
+    logfile -- file to write the result to
+    pid_queue -- queue to put the PID of the worker on
+    """
+
+    if pid_queue:
+        pid_queue.put(os.getpid())
+
+    returncode = 0
+    stderr = ""
+    try:
+        # Phaser writes into the working directory
+        os.chdir(job["work_dir"])
+        phaser_result = rapd_phaser.run_mr(data=DATA[job["data_file"]], **job)
+    except Exception:
+        returncode = 1
+        stderr = traceback.format_exc()
+        phaser_result = {"ID": job.get("name"),
+                         "solution": False,
+                         "message": "Phaser error",
+                         "spacegroup": job.get("spacegroup")}
+
+    stdout = json.dumps(phaser_result)
+
+    if result_queue:
+        result_queue.put({"pid": os.getpid(),
+                          "returncode": returncode,
+                          "stdout": stdout,
+                          "stderr": stderr,
+                          "tag": False})
+
+    if logfile:
+        try:
+            with open(logfile, "w") as out_file:
+                out_file.write(stdout)
+                out_file.write(stderr)
+        except IOError:
+            pass
+
+    return phaser_result
+
+class PhaserService(object):
+    """
+    A pool of Phaser workers for one data file. Quacks enough like a
+    multiprocessing.Pool for the plugins' job monitors.
+    """
+
+    def __init__(self, data_file, nproc=None, logger=None):
+        """
+        Read the data and start the workers. Call before starting threads.
+
+        Keyword arguments
+        data_file -- input data as mtz
+        nproc -- number of workers (default one less than the processors)
+        logger -- logger instance (default RAPDLogger)
+        """
+
+        self.logger = logger or logging.getLogger("RAPDLogger")
+
+        self.data_file = data_file
+
+        # Read before forking so the workers inherit it, once per data file
+        if data_file not in DATA:
+            DATA[data_file] = rapd_phaser.read_data(data_file)
+            self.logger.debug("Phaser %s read %s", DATA[data_file][1], data_file)
+
+        self.pool = multiprocessing.Pool(processes=nproc or max(1, total_nproc() - 1))
+
+        # Set once a worker has been killed
+        self.killed = False
+
+    def submit(self, kwargs, result_queue=False, pid_queue=False):
+        """
+        Queue an MR job and return its AsyncResult
+
+        Keyword arguments
+        kwargs -- run_phaser arguments for the job
+        result_queue -- queue to put the result on as local_subprocess would
+        pid_queue -- queue to put the PID of the worker on when the job starts
+        """
+
+        job = dict((key, kwargs[key]) for key in JOB_KEYS if key in kwargs)
+        job["data_file"] = self.data_file
+        job["work_dir"] = job.get("work_dir") or os.getcwd()
+        job["name"] = job.get("name") or job["spacegroup"]
+
+        return self.pool.apply_async(run_job,
+                                     (job,
+                                      result_queue,
+                                      os.path.join(job["work_dir"], "rapd_phaser.log"),
+                                      pid_queue))
+
+    def kill(self, pid):
+        """
+        Stop the job in the worker with pid. The pool replaces the worker,
+        and the job never reports back.
+        """
+
+        try:
+            os.kill(pid, signal.SIGKILL)
+        except OSError:
+            # Already gone
+            return
+        self.killed = True
+
+    def close(self):
+        """Take no more jobs"""
+        self.pool.close()
+
+    def join(self):
+        """Wait for the workers to finish"""
+        # The pool would wait for ever on a job whose worker was killed
+        if self.killed:
+            self.pool.terminate()
+        self.pool.join()
+
+    def terminate(self):
+        """Stop the workers at once"""
+        self.pool.terminate()
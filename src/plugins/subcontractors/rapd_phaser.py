@@ -269,6 +269,8 @@ def mp_job(func):
        'script' - signal to say the script has been written
        'computer_cluster' - signal to launch on computer cluster
        'pool' - The multiprocessing.Pool if launched on local machine
+       'service' - The phaser_service.PhaserService holding the data, used instead of pool
+       'pid_queue' - queue for the PID of a local job, so it can be killed
        'test' - run in test mode (used for debugging)
     """
 
@@ -292,13 +294,23 @@ def mp_job(func):
             batch_queue = kwargs.pop('batch_queue', None)
             # Pop out the results_queue
             result_queue = kwargs.pop('result_queue', None)
+            # Pop out the queue for the PID of a local job
+            local_pid_queue = kwargs.pop('pid_queue', None)
             # Create a unique identifier for Phaser results
             #kwargs['output_id'] = 'Phaser_%d' % random.randint(0, 10000)
             # Grab the RAPD python path (if available)
             rapd_python = kwargs.pop('rapd_python', 'rapd.python')
             # Signal to launch run
             kwargs['script'] = True
-            if kwargs.get('pool', False):
+            if kwargs.get('service', False):
+                # Run in a worker that has already read the data
+                service = kwargs.pop('service')
+                kwargs.pop('pool', None)
+                proc = service.submit(kwargs,
+                                      result_queue=result_queue,
+                                      pid_queue=local_pid_queue)
+                return (proc, 'junk')
+            elif kwargs.get('pool', False):
                 # If running on local machine. Launcher will be 'utils.processes.local_subprocess'
                 pool = kwargs.pop('pool')
                 f = write_script(kwargs)
@@ -306,6 +318,7 @@ def mp_job(func):
                                         kwds={"command": "%s %s" % (rapd_python, f),
                                               "logfile": os.path.join(convert_unicode(kwargs.get('work_dir')), 'rapd_phaser.log'),
                                               "result_queue" : result_queue,
+                                              "pid_queue": local_pid_queue,
                                                })
                 #return (proc, 'junk', kwargs['output_id'])
                 return (proc, 'junk')
@@ -332,6 +345,326 @@ def mp_job(func):
             return func(**kwargs)
     return wrapper
 
+def read_data(data_file):
+    """
+    Read the reflection data for MR, returning the runMR_DAT result and the
+    Phaser version
+
+    data_file - input data as mtz
+    """
+
+    i = phaser.InputMR_DAT()
+    i.setHKLI(convert_unicode(data_file))
+    i.setLABI_F_SIGF('F', 'SIGF')
+    i.setMUTE(True)
+    r1 = phaser.runMR_DAT(i)
+    # Need to determine Phaser version for keyword changes!
+    version = re.search(r'Version:\s*([\d.]+)', r1.logfile()).group(1)
+
+    return r1, version
+
+def mr_auto_input(data,
+                  struct_file,
+                  spacegroup,
+                  name,
+                  ncopy=1,
+                  cell_analysis=False,
+                  resolution=False,
+                  full=False):
+    """
+    Return the InputMR_AUTO for an MR search against data from read_data
+
+    The arguments are as for run_mr
+    """
+
+    r1, version = data
+
+    i = phaser.InputMR_AUTO()
+    # i.setREFL_DATA(r1.getREFL_DATA())
+    # i.setREFL_DATA(r1.DATA_REFL())
+    i.setREFL_F_SIGF(r1.getMiller(), r1.getFobs(), r1.getSigFobs())
+    i.setCELL6(r1.getUnitCell())
+    if struct_file[-3:].lower() == "cif":
+        #i.addENSE_CIF_ID('model', cif, 0.7)
+        ### Typo in PHASER CODE!!! <<<CIT>>> ###
+        i.addENSE_CIT_ID('model', convert_unicode(struct_file), 0.7)
+    else:
+        i.addENSE_PDB_ID('model', convert_unicode(struct_file), 0.7)
+    i.addSEAR_ENSE_NUM("model", ncopy)
+    i.setSPAC_NAME(spacegroup)
+    if cell_analysis:
+        i.setSGAL_SELE("ALL")
+        # Set it for worst case in orth
+        # number of processes to run in parallel where possible
+        i.setJOBS(1)
+    else:
+        i.setSGAL_SELE("NONE")
+    if full:
+        # Picks own resolution
+        # Round 2, pick best solution as long as less that 10% clashes
+        i.setPACK_SELE("PERCENT")
+        i.setPACK_CUTO(0.1)
+        #command += "PACK CUTOFF 10\n"
+    else:
+        # For first round and cell analysis
+        # Only set the resolution limit in the first round or cell analysis.
+        if resolution:
+            i.setRESO_HIGH(resolution)
+        else:
+            i.setRESO_HIGH(6.0)
+         # If Phaser version < 2.6.0
+        if int(version.split('.')[1]) <= 6:
+            i.setSEAR_DEEP(False)
+        else:
+            i.setSEAR_METH("FAST")
+        
+        # Don"t seem to work since it picks the high res limit now.
+        # Get an error when it prunes all the solutions away and TF has no input.
+        # command += "PEAKS ROT SELECT SIGMA CUTOFF 4.0\n"
+        # command += "PEAKS TRA SELECT SIGMA CUTOFF 6.0\n"
+    # Turn off pruning in 2.6.0
+    i.setSEAR_PRUN(False)
+    # Choose more top peaks to help with getting it correct.
+    i.setPURG_ROTA_ENAB(True)
+    i.setPURG_ROTA_NUMB(3)
+    #command += "PURGE ROT ENABLE ON\nPURGE ROT NUMBER 3\n"
+    i.setPURG_TRAN_ENAB(True)
+    i.setPURG_TRAN_NUMB(1)
+    #command += "PURGE TRA ENABLE ON\nPURGE TRA NUMBER 1\n"
+
+    # Only keep the top after refinement.
+    i.setPURG_RNP_ENAB(True)
+    i.setPURG_RNP_NUMB(1)
+    #command += "PURGE RNP ENABLE ON\nPURGE RNP NUMBER 1\n"
+    i.setROOT(convert_unicode(name))
+    # i.setMUTE(False)
+    i.setMUTE(True)
+
+    return i
+
+def run_mr(data,
+           data_file,
+           struct_file,
+           spacegroup,
+           work_dir,
+           adf=False,
+           name=False,
+           ncopy=1,
+           cell_analysis=False,
+           resolution=False,
+           full=False):
+    """
+    Run MR_AUTO in work_dir against data from read_data and return the result
+
+    data - (runMR_DAT result, Phaser version) from read_data
+    The rest are as for run_phaser
+    """
+
+    phaser_log = False
+
+    if not data[0].Success():
+        return {"ID": name,
+                "solution": False,
+                "message": "Unable to read data",
+                "spacegroup": spacegroup}
+
+    i = mr_auto_input(data=data,
+                      struct_file=struct_file,
+                      spacegroup=spacegroup,
+                      name=name,
+                      ncopy=ncopy,
+                      cell_analysis=cell_analysis,
+                      resolution=resolution,
+                      full=full)
+
+    try:
+        r = phaser.runMR_AUTO(i)
+    except RuntimeError as e:
+        # print "Hit error"
+        # Known CIF error - convert to pdb and retry
+        if struct_file[-3:] in ('cif',):
+            # print "Convert to pdb"
+            pdb.cif_as_pdb((struct_file,))
+            pdb_file = struct_file.replace(".cif", ".pdb")
+            
+            i = mr_auto_input(data=data,
+                              struct_file=pdb_file,
+                              spacegroup=spacegroup,
+                              name=name,
+                              ncopy=ncopy,
+                              cell_analysis=cell_analysis,
+                              resolution=resolution,
+                              full=full)
+            r = phaser.runMR_AUTO(i)
+        else:
+            raise e
+
+
+    if r.Success():
+        # print r
+        pass
+        #if r.foundSolutions():
+            #print "Phaser has found MR solutions"
+            #print "Top LLG = %f" % r.getTopLLG()
+            #print "Top PDB file = %s" % r.getTopPdbFile()
+        #else:
+            #print "Phaser has not found any MR solutions"
+    else:
+        print "Job exit status FAILURE"
+        print r.ErrorName(), "ERROR :", r.ErrorMessage()
+    
+    # Save log files for debugging
+    phaser_log = r.logfile()
+    with open('phaser.log', 'w') as log:
+        log.write(r.logfile())
+        log.close()
+
+    if r.foundSolutions():
+        rfz = None
+        tfz = None
+        tncs = False
+        # Parse results
+        for p in r.getTopSet().ANNOTATION.split():
+            # print p
+            # For v 2.8.3
+            # RF*0\nTF*0\nLLG=30699\nTFZ==174.8\nPAK=0\nLLG=30699\nTFZ==174.8\n
+            if p.count('RFZ'):
+                if p.count('=') in [1]:
+                    rfz = float(p.split('=')[-1])
+            if p.count('RF*0'):
+                rfz = "NC"
+            if p.count('TFZ'):
+                if p.count('=') in [1]:
+                    tfz = p.split('=')[-1]
+                    if tfz == '*':
+                        tfz = 'arbitrary'
+                    else:
+                        tfz = float(tfz)
+            if p.count('TF*0'):
+                tfz = "NC"
+        tncs_test = [1 for line in r.getTopSet().unparse().splitlines()
+                     if line.count("+TNCS")]
+        tncs = bool(len(tncs_test))
+        mtz_file = os.path.join(work_dir, r.getTopMtzFile())
+        phaser_result = {"ID": name,
+                         "solution": r.foundSolutions(),
+                         "pdb_file": os.path.join(work_dir, r.getTopPdbFile()),
+                         "mtz": mtz_file,
+                         "gain": float(r.getTopLLG()),
+                         "rfz": rfz,
+                         # "tfz": r.getTopTFZ(),
+                         "tfz": tfz,
+                         "clash": r.getTopSet().PAK,
+                         "dir": os.getcwd(),
+                         "spacegroup": r.getTopSet().getSpaceGroupName().replace(' ', ''),
+                         "tNCS": tncs,
+                         "nmol": r.getTopSet().NUM,
+                         "adf": None,
+                         "peak": None,
+                         }
+
+        # Calculate 2Fo-Fc & Fo-Fc maps
+        # foo.mtz begets foo_2mFo-DFc.ccp4 & foo__mFo-DFc.ccp4
+        local_subprocess(command="phenix.mtz2map %s" % mtz_file,
+                         logfile='map.log',
+                         shell=True)
+        
+        # Map files should now exist
+        map_2_1 = mtz_file.replace(".mtz", "_2mFo-DFc.ccp4")
+        map_1_1 = mtz_file.replace(".mtz", "_mFo-DFc.ccp4")
+
+        # Make sure the maps exist and then package them
+        if os.path.exists(map_2_1):
+            # Compress the map
+            arch_prod_file, arch_prod_hash = archive.compress_file(map_2_1)
+            # Remove the map that was compressed
+            os.unlink(map_2_1)
+            # Store information
+            map_for_display = {
+                "path": arch_prod_file,
+                "hash": arch_prod_hash,
+                "description": "map_2_1"
+            }
+            phaser_result["map_2_1"] = map_for_display
+        
+        if os.path.exists(map_1_1):
+            # Compress the map
+            arch_prod_file, arch_prod_hash = archive.compress_file(map_1_1)
+            # Remove the map that was compressed
+            os.unlink(map_1_1)
+            # Store information
+            map_for_display = {
+                "path": arch_prod_file,
+                "hash": arch_prod_hash,
+                "description": "map_1_1"
+            }
+            phaser_result["map_1_1"] = map_for_display
+            
+        # If PDB exists, package that too
+        if phaser_result.get("pdb_file", False):
+            if os.path.exists(phaser_result.get("pdb_file")):
+                # Compress the file
+                arch_prod_file, arch_prod_hash = archive.compress_file(phaser_result.get("pdb_file"))
+                # Remove the map that was compressed
+                # os.unlink(phaser_result.get("pdb"))
+                # Store information
+                pdb_for_display = {
+                    "path": arch_prod_file,
+                    "hash": arch_prod_hash,
+                    "description": os.path.basename(phaser_result.get("pdb_file"))
+                }
+                phaser_result["pdb"] = pdb_for_display
+
+        # Calc ADF map
+        if adf:
+            if os.path.exists(phaser_result.get("pdb_file", False)) and os.path.exists(phaser_result.get("mtz", False)):
+                adf_results = calc_ADF_map(data_file=data_file,
+                                           mtz=phaser_result["mtz"],
+                                           pdb=phaser_result["pdb_file"])
+                if adf_results.get("adf"):
+                    phaser_result.update({"adf": os.path.join(work_dir, adf_results.get("adf"))})
+                if adf_results.get("peak"):
+                    phaser_result.update({"peak": os.path.join(work_dir, adf_results.get("peak"))})
+                #phaser_result.update({"adf": adf_results.get("adf", None),
+                #                      "peak": adf_results.get("peak", None),})
+
+        # print "1"
+        # print name
+        # New procedure for making tar of results
+        # Create directory
+        # Remove the run # from the name
+        # new_name = name[:-2]  #
+        new_name = phaser_result.get("ID") #
+        # print new_name
+        os.mkdir(new_name)
+        # # Go through and copy files to archive directory
+        file_types = ("pdb_file", "mtz", "adf", "peak")
+        for file_type in file_types:
+            # print file_type
+            target_file = phaser_result.get(file_type, False)
+            # print target_file
+            if target_file:
+                if os.path.exists(target_file):
+                    # Copy the file to the directory to be archived
+                    shutil.copy(target_file, new_name+"/.")
+        # # Create the archive
+        archive_result = archive.create_archive(new_name)
+        archive_result["description"] = '%s_files'%new_name
+        phaser_result["tar"] = archive_result
+
+        # print "2"
+
+    else:
+        phaser_result = {"ID": name,
+                         "solution": False,
+                         "message": "No solution",
+                         "spacegroup": spacegroup}
+    # Add the phaser log
+    if phaser_log:
+        phaser_result.update({"logs": {"phaser": phaser_log}})
+
+    return phaser_result
+
 @mp_job
 def run_phaser(data_file,
                struct_file,
@@ -364,7 +697,6 @@ def run_phaser(data_file,
     full - signal to run more comprehensive MR
     """
 
-    phaser_log = False
     # Change to work_dir
     if not work_dir:
         work_dir = os.getcwd()
@@ -379,331 +711,33 @@ def run_phaser(data_file,
     #     struct_file = struct_file.replace(".cif", ".pdb")
 
     # Read the dataset
-    i = phaser.InputMR_DAT()
-    i.setHKLI(convert_unicode(data_file))
-    i.setLABI_F_SIGF('F', 'SIGF')
-    i.setMUTE(True)
-    r1 = phaser.runMR_DAT(i)
-    # Need to determine Phaser version for keyword changes!
-    version = re.search(r'Version:\s*([\d.]+)', r1.logfile()).group(1)
-
-    if r1.Success():
-        i = phaser.InputMR_AUTO()
-        # i.setREFL_DATA(r1.getREFL_DATA())
-        # i.setREFL_DATA(r1.DATA_REFL())
-        i.setREFL_F_SIGF(r1.getMiller(), r1.getFobs(), r1.getSigFobs())
-        i.setCELL6(r1.getUnitCell())
-        if struct_file[-3:].lower() == "cif":
-            #i.addENSE_CIF_ID('model', cif, 0.7)
-            ### Typo in PHASER CODE!!! <<<CIT>>> ###
-            i.addENSE_CIT_ID('model', convert_unicode(struct_file), 0.7)
-        else:
-            i.addENSE_PDB_ID('model', convert_unicode(struct_file), 0.7)
-        i.addSEAR_ENSE_NUM("model", ncopy)
-        i.setSPAC_NAME(spacegroup)
-        if cell_analysis:
-            i.setSGAL_SELE("ALL")
-            # Set it for worst case in orth
-            # number of processes to run in parallel where possible
-            i.setJOBS(1)
-        else:
-            i.setSGAL_SELE("NONE")
-        if full:
-            # Picks own resolution
-            # Round 2, pick best solution as long as less that 10% clashes
-            i.setPACK_SELE("PERCENT")
-            i.setPACK_CUTO(0.1)
-            #command += "PACK CUTOFF 10\n"
-        else:
-            # For first round and cell analysis
-            # Only set the resolution limit in the first round or cell analysis.
-            if resolution:
-                i.setRESO_HIGH(resolution)
-            else:
-                i.setRESO_HIGH(6.0)
-             # If Phaser version < 2.6.0
-            if int(version.split('.')[1]) <= 6:
-                i.setSEAR_DEEP(False)
-            else:
-                i.setSEAR_METH("FAST")
-            
-            # Don"t seem to work since it picks the high res limit now.
-            # Get an error when it prunes all the solutions away and TF has no input.
-            # command += "PEAKS ROT SELECT SIGMA CUTOFF 4.0\n"
-            # command += "PEAKS TRA SELECT SIGMA CUTOFF 6.0\n"
-        # Turn off pruning in 2.6.0
-        i.setSEAR_PRUN(False)
-        # Choose more top peaks to help with getting it correct.
-        i.setPURG_ROTA_ENAB(True)
-        i.setPURG_ROTA_NUMB(3)
-        #command += "PURGE ROT ENABLE ON\nPURGE ROT NUMBER 3\n"
-        i.setPURG_TRAN_ENAB(True)
-        i.setPURG_TRAN_NUMB(1)
-        #command += "PURGE TRA ENABLE ON\nPURGE TRA NUMBER 1\n"
-
-        # Only keep the top after refinement.
-        i.setPURG_RNP_ENAB(True)
-        i.setPURG_RNP_NUMB(1)
-        #command += "PURGE RNP ENABLE ON\nPURGE RNP NUMBER 1\n"
-        i.setROOT(convert_unicode(name))
-        # i.setMUTE(False)
-        i.setMUTE(True)
-        # Delete the setup results
-        # del(r)
-        # launch the run
-        # r = phaser.runMR_AUTO(i)
-
-        try:
-            r = phaser.runMR_AUTO(i)
-        except RuntimeError as e:
-            # print "Hit error"
-            # Known CIF error - convert to pdb and retry
-            if struct_file[-3:] in ('cif',):
-                # print "Convert to pdb"
-                pdb.cif_as_pdb((struct_file,))
-                pdb_file = struct_file.replace(".cif", ".pdb")
-                
-                i = phaser.InputMR_AUTO()
-                # i.setREFL_DATA(r1.getREFL_DATA())
-                # i.setREFL_DATA(r1.DATA_REFL())
-                i.setREFL_F_SIGF(r1.getMiller(), r1.getFobs(), r1.getSigFobs())
-                i.setCELL6(r1.getUnitCell())
-                i.addENSE_PDB_ID('model', convert_unicode(pdb_file), 0.7)
-                i.addSEAR_ENSE_NUM("model", ncopy)
-                i.setSPAC_NAME(spacegroup)
-                if cell_analysis:
-                    i.setSGAL_SELE("ALL")
-                    # Set it for worst case in orth
-                    # number of processes to run in parallel where possible
-                    i.setJOBS(1)
-                else:
-                    i.setSGAL_SELE("NONE")
-                if full:
-                    # Picks own resolution
-                    # Round 2, pick best solution as long as less that 10% clashes
-                    i.setPACK_SELE("PERCENT")
-                    i.setPACK_CUTO(0.1)
-                    #command += "PACK CUTOFF 10\n"
-                else:
-                    # For first round and cell analysis
-                    # Only set the resolution limit in the first round or cell analysis.
-                    if resolution:
-                        i.setRESO_HIGH(resolution)
-                    else:
-                        i.setRESO_HIGH(6.0)
-                    # If Phaser version < 2.6.0
-                    if int(version.split('.')[1]) <= 6:
-                        i.setSEAR_DEEP(False)
-                    else:
-                        i.setSEAR_METH("FAST")
-                    
-                    # Don"t seem to work since it picks the high res limit now.
-                    # Get an error when it prunes all the solutions away and TF has no input.
-                    # command += "PEAKS ROT SELECT SIGMA CUTOFF 4.0\n"
-                    # command += "PEAKS TRA SELECT SIGMA CUTOFF 6.0\n"
-                # Turn off pruning in 2.6.0
-                i.setSEAR_PRUN(False)
-                # Choose more top peaks to help with getting it correct.
-                i.setPURG_ROTA_ENAB(True)
-                i.setPURG_ROTA_NUMB(3)
-                #command += "PURGE ROT ENABLE ON\nPURGE ROT NUMBER 3\n"
-                i.setPURG_TRAN_ENAB(True)
-                i.setPURG_TRAN_NUMB(1)
-                #command += "PURGE TRA ENABLE ON\nPURGE TRA NUMBER 1\n"
-
-                # Only keep the top after refinement.
-                i.setPURG_RNP_ENAB(True)
-                i.setPURG_RNP_NUMB(1)
-                #command += "PURGE RNP ENABLE ON\nPURGE RNP NUMBER 1\n"
-                i.setROOT(convert_unicode(name))
-                # i.setMUTE(False)
-                i.setMUTE(True)
-                # Delete the setup results
-                # del(r)
-                # launch the run
-                r = phaser.runMR_AUTO(i)
-            else:
-                raise e
-
-
-        if r.Success():
-            # print r
-            pass
-            #if r.foundSolutions():
-                #print "Phaser has found MR solutions"
-                #print "Top LLG = %f" % r.getTopLLG()
-                #print "Top PDB file = %s" % r.getTopPdbFile()
-            #else:
-                #print "Phaser has not found any MR solutions"
-        else:
-            print "Job exit status FAILURE"
-            print r.ErrorName(), "ERROR :", r.ErrorMessage()
-        
-        # Save log files for debugging
-        phaser_log = r.logfile()
-        with open('phaser.log', 'w') as log:
-            log.write(r.logfile())
-            log.close()
-
-        if r.foundSolutions():
-            rfz = None
-            tfz = None
-            tncs = False
-            # Parse results
-            for p in r.getTopSet().ANNOTATION.split():
-                # print p
-                # For v 2.8.3
-                # RF*0\nTF*0\nLLG=30699\nTFZ==174.8\nPAK=0\nLLG=30699\nTFZ==174.8\n
-                if p.count('RFZ'):
-                    if p.count('=') in [1]:
-                        rfz = float(p.split('=')[-1])
-                if p.count('RF*0'):
-                    rfz = "NC"
-                if p.count('TFZ'):
-                    if p.count('=') in [1]:
-                        tfz = p.split('=')[-1]
-                        if tfz == '*':
-                            tfz = 'arbitrary'
-                        else:
-                            tfz = float(tfz)
-                if p.count('TF*0'):
-                    tfz = "NC"
-            tncs_test = [1 for line in r.getTopSet().unparse().splitlines()
-                         if line.count("+TNCS")]
-            tncs = bool(len(tncs_test))
-            mtz_file = os.path.join(work_dir, r.getTopMtzFile())
-            phaser_result = {"ID": name,
-                             "solution": r.foundSolutions(),
-                             "pdb_file": os.path.join(work_dir, r.getTopPdbFile()),
-                             "mtz": mtz_file,
-                             "gain": float(r.getTopLLG()),
-                             "rfz": rfz,
-                             # "tfz": r.getTopTFZ(),
-                             "tfz": tfz,
-                             "clash": r.getTopSet().PAK,
-                             "dir": os.getcwd(),
-                             "spacegroup": r.getTopSet().getSpaceGroupName().replace(' ', ''),
-                             "tNCS": tncs,
-                             "nmol": r.getTopSet().NUM,
-                             "adf": None,
-                             "peak": None,
-                             }
-
-            # Calculate 2Fo-Fc & Fo-Fc maps
-            # foo.mtz begets foo_2mFo-DFc.ccp4 & foo__mFo-DFc.ccp4
-            local_subprocess(command="phenix.mtz2map %s" % mtz_file,
-                             logfile='map.log',
-                             shell=True)
-            
-            # Map files should now exist
-            map_2_1 = mtz_file.replace(".mtz", "_2mFo-DFc.ccp4")
-            map_1_1 = mtz_file.replace(".mtz", "_mFo-DFc.ccp4")
-
-            # Make sure the maps exist and then package them
-            if os.path.exists(map_2_1):
-                # Compress the map
-                arch_prod_file, arch_prod_hash = archive.compress_file(map_2_1)
-                # Remove the map that was compressed
-                os.unlink(map_2_1)
-                # Store information
-                map_for_display = {
-                    "path": arch_prod_file,
-                    "hash": arch_prod_hash,
-                    "description": "map_2_1"
-                }
-                phaser_result["map_2_1"] = map_for_display
-            
-            if os.path.exists(map_1_1):
-                # Compress the map
-                arch_prod_file, arch_prod_hash = archive.compress_file(map_1_1)
-                # Remove the map that was compressed
-                os.unlink(map_1_1)
-                # Store information
-                map_for_display = {
-                    "path": arch_prod_file,
-                    "hash": arch_prod_hash,
-                    "description": "map_1_1"
-                }
-                phaser_result["map_1_1"] = map_for_display
-                
-            # If PDB exists, package that too
-            if phaser_result.get("pdb_file", False):
-                if os.path.exists(phaser_result.get("pdb_file")):
-                    # Compress the file
-                    arch_prod_file, arch_prod_hash = archive.compress_file(phaser_result.get("pdb_file"))
-                    # Remove the map that was compressed
-                    # os.unlink(phaser_result.get("pdb"))
-                    # Store information
-                    pdb_for_display = {
-                        "path": arch_prod_file,
-                        "hash": arch_prod_hash,
-                        "description": os.path.basename(phaser_result.get("pdb_file"))
-                    }
-                    phaser_result["pdb"] = pdb_for_display
-
-            # Calc ADF map
-            if adf:
-                if os.path.exists(phaser_result.get("pdb_file", False)) and os.path.exists(phaser_result.get("mtz", False)):
-                    adf_results = calc_ADF_map(data_file=data_file,
-                                               mtz=phaser_result["mtz"],
-                                               pdb=phaser_result["pdb_file"])
-                    if adf_results.get("adf"):
-                        phaser_result.update({"adf": os.path.join(work_dir, adf_results.get("adf"))})
-                    if adf_results.get("peak"):
-                        phaser_result.update({"peak": os.path.join(work_dir, adf_results.get("peak"))})
-                    #phaser_result.update({"adf": adf_results.get("adf", None),
-                    #                      "peak": adf_results.get("peak", None),})
-
-            # print "1"
-            # print name
-            # New procedure for making tar of results
-            # Create directory
-            # Remove the run # from the name
-            # new_name = name[:-2]  #
-            new_name = phaser_result.get("ID") #
-            # print new_name
-            os.mkdir(new_name)
-            # # Go through and copy files to archive directory
-            file_types = ("pdb_file", "mtz", "adf", "peak")
-            for file_type in file_types:
-                # print file_type
-                target_file = phaser_result.get(file_type, False)
-                # print target_file
-                if target_file:
-                    if os.path.exists(target_file):
-                        # Copy the file to the directory to be archived
-                        shutil.copy(target_file, new_name+"/.")
-            # # Create the archive
-            archive_result = archive.create_archive(new_name)
-            archive_result["description"] = '%s_files'%new_name
-            phaser_result["tar"] = archive_result
-
-            # print "2"
-
-        else:
-            phaser_result = {"ID": name,
-                             "solution": False,
-                             "message": "No solution",
-                             "spacegroup": spacegroup}
-        # Add the phaser log
-        if phaser_log:
-            phaser_result.update({"logs": {"phaser": phaser_log}})
-    
-        # print "3"
-
-        if db_settings and tag:
-            print "db_settings and tag"
-            # Connect to Redis
-            redis = connect_to_redis(db_settings)
-            # Key should be deleted once received, but set the key to expire in 24 hours just in case.
-            redis.setex(tag, 86400, json.dumps(phaser_result))
-            # Do a little sleep to make sure results are in Redis for postprocess_phaser
-            time.sleep(0.1)
-        else:
-            # print "Printing phaser_result"
-            # Print the result so it can be seen thru the queue by reading stdout
-            # print phaser_result
-            print json.dumps(phaser_result)
+    data = read_data(data_file)
+
+    phaser_result = run_mr(data=data,
+                           data_file=data_file,
+                           struct_file=struct_file,
+                           spacegroup=spacegroup,
+                           work_dir=work_dir,
+                           adf=adf,
+                           name=name,
+                           ncopy=ncopy,
+                           cell_analysis=cell_analysis,
+                           resolution=resolution,
+                           full=full)
+
+    if db_settings and tag:
+        print "db_settings and tag"
+        # Connect to Redis
+        redis = connect_to_redis(db_settings)
+        # Key should be deleted once received, but set the key to expire in 24 hours just in case.
+        redis.setex(tag, 86400, json.dumps(phaser_result))
+        # Do a little sleep to make sure results are in Redis for postprocess_phaser
+        time.sleep(0.1)
+    else:
+        # print "Printing phaser_result"
+        # Print the result so it can be seen thru the queue by reading stdout
+        # print phaser_result
+        print json.dumps(phaser_result)
 
 def run_phaser_module(data_file,
                       result_queue=False,
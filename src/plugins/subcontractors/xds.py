@@ -45,12 +45,21 @@ __status__ = "Development"
 # import urllib2
 # import uuid
 
+# Nonstandard imports
+import numpy
+
 # RAPD imports
 # import commandline_utils
 # import detectors.detector_utils as detector_utils
 # import utils
 # import utils.credits as credits
 
+# Title of the CORRECT.LP table of statistics by resolution shell
+SHELL_TABLE_TITLE = "SUBSET OF INTENSITY DATA WITH SIGNAL/NOISE >= -3.0 AS FUNCTION OF RESOLUTION"
+# Default cutoff criteria, as used by aimless
+CUTOFF_ISIGI = 1.5
+CUTOFF_CC_HALF = 30.0
+
 # Software dependencies
 VERSIONS = {
 # "eiger2cbf": ("160415",)
@@ -84,3 +93,103 @@ def get_isa_from_correctlp():
     isa = float(isa_line.strip().split()[-1])
 
     return isa
+
+def get_shells_from_correctlp(correctlp="CORRECT.LP"):
+    """
+    Parse the last table of statistics by resolution shell in CORRECT.LP,
+    returning a dict of numpy arrays of d_min, completeness, isigi and
+    cc_half (percent, NaN if XDS does not report it), lowest resolution
+    first, or None if there is no table
+    """
+
+    lp = open(correctlp, "r").readlines()
+
+    start = None
+    for linenum, line in enumerate(lp):
+        if SHELL_TABLE_TITLE in line:
+            start = linenum
+    if start is None:
+        return None
+
+    rows = []
+    for line in lp[start+1:]:
+        fields = line.replace("*", "").replace("%", "").split()
+        if not fields:
+            if rows:
+                break
+            continue
+        if fields[0] == "total":
+            break
+        try:
+            float(fields[0])
+        except ValueError:
+            # Column headings
+            continue
+        rows.append([float(fields[0]),
+                     float(fields[4]),
+                     float(fields[8]),
+                     float(fields[10]) if len(fields) > 10 else float("nan")])
+
+    if not rows:
+        return None
+
+    table = numpy.array(rows)
+    return {"d_min": table[:, 0],
+            "completeness": table[:, 1],
+            "isigi": table[:, 2],
+            "cc_half": table[:, 3]}
+
+def get_shell_cutoff(d_min, values, threshold):
+    """
+    Return the resolution where values fall to threshold, interpolated
+    between shells. False if the highest resolution shell is above the
+    threshold, or d_min of the first shell if no shell is.
+    """
+
+    passing = numpy.nonzero(values >= threshold)[0]
+    if len(passing) == 0:
+        return float(d_min[0])
+
+    # Last shell counting out from low resolution that is good enough
+    index = passing[-1]
+    if index == len(d_min) - 1:
+        return False
+
+    return float(numpy.interp(threshold,
+                              [values[index+1], values[index]],
+                              [d_min[index+1], d_min[index]]))
+
+def get_resolution_cutoff(shells, isigi=CUTOFF_ISIGI, cc_half=CUTOFF_CC_HALF):
+    """
+    Work out a resolution cutoff in one pass over the statistics by shell
+    from get_shells_from_correctlp. Returns the cutoff, or False if the
+    data are good to the edge, and a dict reporting each criterion. A
+    criterion is reported as False if the data are good to the edge by it,
+    and CC(1/2) as None if CORRECT.LP does not report it.
+
+    Keyword arguments
+    shells -- statistics by resolution shell
+    isigi -- lowest mean I/sigma in a shell
+    cc_half -- lowest CC(1/2) in a shell, in percent
+    """
+
+    report = {"isigi": isigi,
+              "cc_half": cc_half,
+              "d_min": float(shells["d_min"][-1]),
+              "cutoff_isigi": get_shell_cutoff(shells["d_min"], shells["isigi"], isigi),
+              "cutoff_cc_half": None}
+
+    if not numpy.isnan(shells["cc_half"]).any():
+        report["cutoff_cc_half"] = get_shell_cutoff(shells["d_min"], shells["cc_half"], cc_half)
+
+    # The less conservative of the criteria, so CC(1/2) can only extend the
+    # resolution the I/sigma cutoff gives, and data good to the edge by
+    # either criterion are used to the edge
+    cutoffs = [cutoff for cutoff in (report["cutoff_isigi"], report["cutoff_cc_half"])
+               if cutoff is not None]
+    if any(cutoff is False for cutoff in cutoffs):
+        report["cutoff"] = False
+    else:
+        report["cutoff"] = round(min(cutoffs), 2)
+
+    return report["cutoff"], report
@@ -0,0 +1,372 @@
+"""
+Runs the COLSPOT and INTEGRATE steps of XDS as frame blocks spread over
+local processes or the site's computer cluster
+"""
+
+"""
+This file is part of RAPD
+
+Copyright (C) 2018, Cornell University
+All rights reserved.
+
+RAPD is free software: you can redistribute it and/or modify
+it under the terms of the GNU Affero General Public License as published by
+the Free Software Foundation, version 3.
+
+RAPD is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU Affero General Public License for more details.
+
+You should have received a copy of the GNU Affero General Public License
+along with this program.  If not, see <http://www.gnu.org/licenses/>.
+"""
+
+__created__ = "2026-10-18"
+__maintainer__ = "Frank Murphy"
+__email__ = "fmurphy@anl.gov"
+__status__ = "Development"
+
+"""
+An XDS.INP is run as segments of its JOB= steps. COLSPOT and INTEGRATE are
+each run as one XDS job per block of frames, in block_<step>_<first>_<last>
+subdirectories that link to the tables the step reads, and the SPOT.XDS or
+INTEGRATE.HKL of the blocks are gathered back into the directory. Every
+other step is run in the directory as usual. A block that fails is rerun,
+and if it still fails the whole step is run in one piece instead.
+"""
+
+# Standard imports
+import logging
+from multiprocessing.pool import ThreadPool
+import math
+import os
+import shutil
+import subprocess
+
+# Times a block is run before the step is run in one piece
+BLOCK_ATTEMPTS = 3
+# Smallest block, as XDS needs a few degrees to build profiles
+MIN_BLOCK_DEGREES = 5.0
+
+# Files each split step reads, if they exist
+STEP_INPUTS = {
+    "COLSPOT": ("X-CORRECTIONS.cbf",
+                "Y-CORRECTIONS.cbf",
+                "BKGINIT.cbf",
+                "BLANK.cbf",
+                "GAIN.cbf"),
+    "INTEGRATE": ("X-CORRECTIONS.cbf",
+                  "Y-CORRECTIONS.cbf",
+                  "BKGINIT.cbf",
+                  "BLANK.cbf",
+                  "GAIN.cbf",
+                  "BKGPIX.cbf",
+                  "ABS.cbf",
+                  "XPARM.XDS"),
+    }
+# File each split step writes
+STEP_OUTPUTS = {
+    "COLSPOT": "SPOT.XDS",
+    "INTEGRATE": "INTEGRATE.HKL",
+    }
+# Logs gathered from the blocks
+STEP_LOGS = {
+    "COLSPOT": "COLSPOT.LP",
+    "INTEGRATE": "INTEGRATE.LP",
+    }
+
+def split_range(first, last, blocks):
+    """Return a list of (first, last) for blocks of frames covering first to last"""
+
+    total = last - first + 1
+    blocks = max(1, min(blocks, total))
+    ranges = []
+    start = first
+    for index in range(blocks):
+        # Spread the remainder over the first blocks
+        size = total // blocks + (1 if index < total % blocks else 0)
+        ranges.append((start, start + size - 1))
+        start += size
+    return ranges
+
+def get_input_value(xdsinp, keyword):
+    """Return the values of the last line setting keyword in XDS.INP lines, or None"""
+
+    value = None
+    for line in xdsinp:
+        line = line.split("!")[0]
+        if line.strip().startswith(keyword + "="):
+            value = line.split("=", 1)[1].strip()
+    return value
+
+def set_input_value(xdsinp, keyword, value):
+    """Return XDS.INP lines with every line setting keyword replaced by one"""
+
+    output = [line for line in xdsinp if not line.split("!")[0].strip().startswith(keyword + "=")]
+    if value is not None:
+        output.append("%s=%s\n" % (keyword, value))
+    return output
+
+def concatenate(filenames, output):
+    """Write the files that exist one after the other to output"""
+
+    with open(output, "w") as whole:
+        for filename in filenames:
+            if os.path.isfile(filename):
+                with open(filename, "r") as part:
+                    shutil.copyfileobj(part, whole)
+
+def merge_integrate_hkl(hkl_files, hklout, first, last):
+    """
+    Write the reflections of several INTEGRATE.HKL files to one, with the
+    header of the first and a DATA_RANGE of first to last
+
+    Keyword arguments
+    hkl_files -- INTEGRATE.HKL files to merge
+    hklout -- file to write
+    first -- first frame of the merged data
+    last -- last frame of the merged data
+    """
+
+    with open(hklout, "w") as merged:
+        for index, hkl_file in enumerate(hkl_files):
+            with open(hkl_file, "r") as hkl:
+                for line in hkl:
+                    if line.startswith("!"):
+                        if line.startswith("!END_OF_DATA"):
+                            break
+                        if index > 0:
+                            continue
+                        if line.startswith("!DATA_RANGE="):
+                            line = "!DATA_RANGE=%8d%8d\n" % (first, last)
+                    merged.write(line)
+        merged.write("!END_OF_DATA\n")
+
+def read_log(logfile):
+    """Return the contents of a log, or an empty string if there is none"""
+
+    try:
+        with open(logfile, "r") as log:
+            return log.read()
+    except IOError:
+        return ""
+
+def local_runner(directory, command, logfile):
+    """Run command in directory on this machine, writing the output to logfile"""
+
+    with open(os.path.join(directory, logfile), "w") as log:
+        subprocess.call(command.split(), cwd=directory, stdout=log, stderr=subprocess.STDOUT)
+
+class ClusterRunner(object):
+    """Runs a command in a directory through a cluster adapter's process_cluster"""
+
+    def __init__(self, process_cluster, batch_queue=None, nproc=1, logger=None):
+        """
+        Keyword arguments
+        process_cluster -- process_cluster function of the cluster adapter
+        batch_queue -- dict of keyword arguments choosing the batch queue
+        nproc -- processors to reserve for each job
+        logger -- logger instance
+        """
+
+        self.process_cluster = process_cluster
+        self.batch_queue = batch_queue or {}
+        self.nproc = nproc
+        self.logger = logger
+
+    def __call__(self, directory, command, logfile):
+        self.process_cluster(command=command,
+                             work_dir=directory,
+                             logfile=os.path.join(directory, logfile),
+                             nproc=self.nproc,
+                             logger=self.logger,
+                             name=os.path.basename(directory),
+                             **self.batch_queue)
+
+class XdsDistributor(object):
+    """
+    Runs XDS with COLSPOT and INTEGRATE split into blocks of frames
+    """
+
+    def __init__(self, runner, slots, osc_range, command="xds_par",
+                 attempts=BLOCK_ATTEMPTS, nproc=None, logger=None):
+        """
+        Keyword arguments
+        runner -- called with (directory, command, logfile) to run one block
+        slots -- number of blocks run at once, and so the number of blocks
+        osc_range -- oscillation of each frame in degrees
+        command -- XDS command for the blocks (default xds_par)
+        attempts -- times a block is run before giving up (default BLOCK_ATTEMPTS)
+        nproc -- processors shared by the blocks running at once on this
+                 machine (default None leaves the XDS.INP setting)
+        logger -- logger instance (default RAPDLogger)
+        """
+
+        self.logger = logger or logging.getLogger("RAPDLogger")
+
+        self.runner = runner
+        self.slots = max(1, int(slots))
+        self.command = command
+        self.attempts = attempts
+        self.nproc = nproc
+
+        try:
+            self.min_block = max(1, int(math.ceil(MIN_BLOCK_DEGREES / float(osc_range))))
+        except (TypeError, ValueError, ZeroDivisionError):
+            self.min_block = 1
+
+    def run(self, directory, run_whole):
+        """
+        Run the XDS.INP in directory
+
+        Keyword arguments
+        directory -- directory with the XDS.INP
+        run_whole -- called with directory to run XDS there in one piece
+        """
+
+        xdsfile = os.path.join(directory, "XDS.INP")
+        with open(xdsfile, "r") as xds_input:
+            xdsinp = xds_input.readlines()
+
+        steps = (get_input_value(xdsinp, "JOB") or "").split()
+        data_range = [int(value) for value in (get_input_value(xdsinp, "DATA_RANGE") or "").split()]
+
+        # Group the steps into runs of whole steps and the steps to split
+        segments = []
+        for step in steps:
+            if step in STEP_OUTPUTS or not segments or segments[-1][0] in STEP_OUTPUTS:
+                segments.append([step])
+            else:
+                segments[-1].append(step)
+
+        logs = []
+        try:
+            for segment in segments:
+                blocks = []
+                if segment[0] in STEP_OUTPUTS and len(data_range) == 2:
+                    number = (data_range[1] - data_range[0] + 1) // self.min_block
+                    blocks = split_range(data_range[0], data_range[1], min(self.slots, number))
+
+                if len(blocks) > 1 and self.run_blocks(directory, xdsinp, segment[0], blocks, logs):
+                    continue
+
+                # Run in one piece
+                with open(xdsfile, "w") as xds_input:
+                    xds_input.writelines(set_input_value(xdsinp, "JOB", " ".join(segment)))
+                run_whole(directory)
+                logs.append(read_log(os.path.join(directory, "XDS.LOG")))
+
+        finally:
+            # Leave things as a single XDS run would
+            with open(xdsfile, "w") as xds_input:
+                xds_input.writelines(xdsinp)
+            with open(os.path.join(directory, "XDS.LOG"), "w") as xds_log:
+                xds_log.writelines(logs)
+
+    def run_blocks(self, directory, xdsinp, step, blocks, logs):
+        """
+        Run step for each block of frames and gather the output into
+        directory. Returns False if a block could not be run.
+        """
+
+        self.logger.debug("Running %s in %d blocks %s", step, len(blocks), blocks)
+
+        spot_ranges = []
+        for line in xdsinp:
+            line = line.split("!")[0].strip()
+            if line.startswith("SPOT_RANGE="):
+                spot_ranges.append([int(value) for value in line.split("=", 1)[1].split()])
+
+        # Split the local processors between the blocks running at once
+        concurrent = min(self.slots, len(blocks))
+        block_nproc = None
+        if self.nproc:
+            block_nproc = max(1, int(self.nproc) // concurrent)
+
+        block_dirs = []
+        for first, last in blocks:
+            block_inp = set_input_value(xdsinp, "JOB", step)
+            block_inp = set_input_value(block_inp, "DATA_RANGE", "%d %d" % (first, last))
+            block_inp = set_input_value(block_inp, "MAXIMUM_NUMBER_OF_JOBS", "1")
+            if block_nproc:
+                block_inp = set_input_value(block_inp, "MAXIMUM_NUMBER_OF_PROCESSORS", str(block_nproc))
+            if step == "COLSPOT":
+                # Only the parts of the spot ranges in this block
+                block_inp = set_input_value(block_inp, "SPOT_RANGE", None)
+                for spot_first, spot_last in spot_ranges or [(first, last)]:
+                    if spot_first <= last and spot_last >= first:
+                        block_inp.append("SPOT_RANGE=%d %d\n" % (max(first, spot_first),
+                                                                 min(last, spot_last)))
+                if not [line for line in block_inp if line.startswith("SPOT_RANGE=")]:
+                    continue
+
+            block_dir = os.path.join(directory, "block_%s_%d_%d" % (step.lower(), first, last))
+            if os.path.isdir(block_dir):
+                shutil.rmtree(block_dir)
+            os.mkdir(block_dir)
+            for filename in STEP_INPUTS[step]:
+                source = os.path.join(directory, filename)
+                if os.path.isfile(source):
+                    os.symlink(os.path.abspath(source), os.path.join(block_dir, filename))
+            with open(os.path.join(block_dir, "XDS.INP"), "w") as xds_input:
+                xds_input.writelines(block_inp)
+            block_dirs.append(block_dir)
+
+        # Run the blocks, running failures again
+        pending = block_dirs[:]
+        pool = ThreadPool(max(1, min(concurrent, len(block_dirs))))
+        try:
+            for attempt in range(self.attempts):
+                if not pending:
+                    break
+                if attempt:
+                    self.logger.debug("Rerunning %s blocks %s", step, pending)
+                pool.map(self.run_block, pending)
+                pending = [block_dir for block_dir in pending
+                           if not self.check_block(block_dir, step)]
+        finally:
+            pool.close()
+            pool.join()
+
+        if pending:
+            self.logger.debug("%s failed for blocks %s - running it in one piece", step, pending)
+            return False
+
+        # Gather
+        if step == "COLSPOT":
+            concatenate([os.path.join(block_dir, "SPOT.XDS") for block_dir in block_dirs],
+                        os.path.join(directory, "SPOT.XDS"))
+        else:
+            merge_integrate_hkl([os.path.join(block_dir, "INTEGRATE.HKL") for block_dir in block_dirs],
+                                os.path.join(directory, "INTEGRATE.HKL"),
+                                blocks[0][0],
+                                blocks[-1][1])
+        concatenate([os.path.join(block_dir, STEP_LOGS[step]) for block_dir in block_dirs],
+                    os.path.join(directory, STEP_LOGS[step]))
+        for block_dir in block_dirs:
+            logs.append(read_log(os.path.join(block_dir, "XDS.LOG")))
+            shutil.rmtree(block_dir, ignore_errors=True)
+
+        return True
+
+    def run_block(self, block_dir):
+        """Run XDS for one block"""
+
+        try:
+            self.runner(block_dir, self.command, "XDS.LOG")
+        except:
+            self.logger.exception("Error running %s", block_dir)
+
+    def check_block(self, block_dir, step):
+        """Return True if a block wrote all of its output"""
+
+        output = os.path.join(block_dir, STEP_OUTPUTS[step])
+        if not os.path.isfile(output):
+            return False
+        if step == "INTEGRATE":
+            # Written last
+            with open(output, "rb") as hkl:
+                hkl.seek(max(0, os.path.getsize(output) - 256))
+                return "!END_OF_DATA" in hkl.read()
+        return True
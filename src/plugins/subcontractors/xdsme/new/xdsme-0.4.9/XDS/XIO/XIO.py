@@ -26,10 +26,21 @@ import sys
 import struct
 import re
 import time
+from collections import OrderedDict
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
 
 PLUGIN_DIR_NAME = "plugins"
 VERBOSE = 0
 
+# Number of decoded frames kept by Image.getData (0 to disable). Frames are
+# keyed by (path, mtime), so a rewritten file is decoded again.
+DATA_CACHE_SIZE = 2
+_DATA_CACHE = OrderedDict()
+
 # Defines General regexp for the complete image names:
 # dirPath + imageName + externalCompression
 
@@ -423,6 +434,11 @@ class Image:
                            (self.header['Distance'],self.header['Wavelength'])
         try:
             data = self.getData()
+            if numpy is not None:
+                if self.type == 'marccd':
+                    data = data[data != 0]
+                print ">> MaxI: %d, AvgI: %.0f" % (data.max(), data.mean())
+                return
             if self.type == 'marccd':
                 data = filter(None, data)
                 print data[:10]
@@ -442,11 +458,96 @@ class Image:
         """Read the image bytes. For now only support the 16bits unsigned,
 	and uncompressed internaly. Can read compressed file directly
 	(like .gz or .Z).
-        If clipping=True, set I<0 to O and I>2**16 to 2**16"""
+        If clipping=True, set I<0 to O and I>2**16 to 2**16
+
+        With numpy, returns a read-only numpy array: a memory map of the
+        file for uncompressed images. The last DATA_CACHE_SIZE frames
+        decoded are kept. Without numpy, returns a tuple or list."""
 
         if not self.interpreter:
             self.headerInterpreter()
 
+        if numpy is None:
+            return self._getDataStruct(clipping)
+
+        try:
+            _key = (os.path.realpath(self.fileName),
+                    os.path.getmtime(self.fileName), clipping)
+        except OSError:
+            _key = None
+        if _key in _DATA_CACHE:
+            # Most recently used goes last
+            _data = _DATA_CACHE.pop(_key)
+            _DATA_CACHE[_key] = _data
+            return _data
+
+        if not self.intCompression:
+            _data = self._readUncompressed()
+        elif self.intCompression == "CRYSALIS":
+            _data = self._decodeCrysalis(clipping)
+        else:
+            raise XIOError, "Sorry, this image is internaly compressed."
+        _data.flags.writeable = False
+
+        if _key and DATA_CACHE_SIZE > 0:
+            _DATA_CACHE[_key] = _data
+            while len(_DATA_CACHE) > DATA_CACHE_SIZE:
+                _DATA_CACHE.popitem(last=False)
+        return _data
+
+    def _readUncompressed(self):
+        "Map the 16bits unsigned pixels of the file, or read them if compressed."
+
+        _dataSize = self.header['Width']*self.header['Width']
+        _dtype = numpy.dtype(self.header['EndianType'] + "u2")
+
+        if isExtCompressed(os.path.realpath(self.fileName)):
+            _image = self.open()
+            # Jump over the header
+            _image.read(self.header['HeaderSize'])
+            _data = numpy.frombuffer(_image.read(), _dtype)
+            _image.close()
+        else:
+            _data = numpy.memmap(self.fileName, dtype=_dtype, mode="r",
+                                 offset=self.header['HeaderSize'])
+
+        assert _dataSize == len(_data)
+        return _data
+
+    def _decodeCrysalis(self, clipping=False):
+        """Decode the CrysAlis byte offset stream. Each byte is the
+        difference from the previous pixel plus 127, or 254 and 255 to
+        take the difference from the next short or long overload."""
+
+        _dataSize = self.header['Width']*self.header['Width']
+        _image = self.open()
+
+        # Jump over the header
+        _image.read(self.header['HeaderSize'])
+        OI = int(self.RawHeadDict["OI"])
+        OL = int(self.RawHeadDict["OL"])
+        _raw = _image.read(_dataSize + OI*2 + OL*4)
+        _image.close()
+
+        _bytes = numpy.frombuffer(_raw, numpy.uint8, _dataSize)
+        _overloads_short = numpy.frombuffer(_raw, "<i2", OI, _dataSize)
+        _overloads_long = numpy.frombuffer(_raw, "<i4", OL, _dataSize + OI*2)
+
+        # Overloads are used in the order their markers come
+        _delta = _bytes.astype(numpy.int64) - 127
+        _short_pixels = numpy.flatnonzero(_bytes == 254)
+        _long_pixels = numpy.flatnonzero(_bytes == 255)
+        _delta[_short_pixels] = _overloads_short[:len(_short_pixels)]
+        _delta[_long_pixels] = _overloads_long[:len(_long_pixels)]
+        image = numpy.cumsum(_delta).astype(numpy.int32)
+
+        if clipping:
+            numpy.clip(image, 0, 2**16-1, out=image)
+        return image
+
+    def _getDataStruct(self, clipping=False):
+        "getData without numpy."
+
         if not self.intCompression:
             _dataSize = self.header['Width']*self.header['Width']
 
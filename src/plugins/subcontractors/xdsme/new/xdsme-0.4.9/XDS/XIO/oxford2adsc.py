@@ -65,5 +65,8 @@ for oxf in sys.argv[1:]:
     new = open(new_name,"w")
     data = datacoll.image.getData(clipping=True)
     #new.write("%-1024s" % header)
-    new.write(struct.pack("<"+len(data)*"H", *data))
+    if XIO.numpy is not None:
+        new.write(data.astype("<u2").tostring())
+    else:
+        new.write(struct.pack("<"+len(data)*"H", *data))
     new.close()
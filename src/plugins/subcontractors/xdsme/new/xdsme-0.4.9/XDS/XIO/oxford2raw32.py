@@ -66,5 +66,8 @@ for oxf in sys.argv[1:]:
     new = open(new_name,"w")
     data = datacoll.image.getData()
     new.write("%-1024s" % header)
-    new.write(struct.pack("<"+len(data)*"I", *data))
+    if XIO.numpy is not None:
+        new.write(data.astype("<u4").tostring())
+    else:
+        new.write(struct.pack("<"+len(data)*"I", *data))
     new.close()
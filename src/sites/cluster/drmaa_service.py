@@ -0,0 +1,496 @@
+"""
+Cluster submission service that holds one DRMAA session for all the jobs
+RAPD sends to the cluster
+"""
+
+__license__ = """
+This file is part of RAPD
+
+Copyright (C) 2018, Cornell University
+All rights reserved.
+
+RAPD is free software: you can redistribute it and/or modify
+it under the terms of the GNU Affero General Public License as published by
+the Free Software Foundation, version 3.
+
+RAPD is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU Affero General Public License for more details.
+
+You should have received a copy of the GNU Affero General Public License
+along with this program.  If not, see <http://www.gnu.org/licenses/>.
+"""
+
+__created__ = "2026-10-18"
+__maintainer__ = "Frank Murphy"
+__email__ = "fmurphy@anl.gov"
+__status__ = "Development"
+
+"""
+Jobs are submitted over a TCP connection, one job per connection, in lines
+of JSON:
+
+  client  {"command", "work_dir", "logfile", "native_specification", "name"}
+  service {"job_id"}
+  client  {"action":"kill"}                       (optional)
+  service {"job_id", "exit_status", "aborted", "signal"}
+
+A single thread makes every DRMAA call. It submits and kills jobs as they
+are asked for, and collects finished jobs with session.wait on any job in
+the session, so there is no polling of individual jobs. Clients find the
+service through the RAPD_DRMAA_SERVICE environmental variable (host:port).
+
+Anyone who can connect can run commands as the user running the service, so
+it only listens on the loopback interface unless told otherwise. When it has
+to be reached from other hosts, set RAPD_DRMAA_SECRET to the same value for
+the service and its clients, and submissions without it are refused.
+"""
+
+# Standard imports
+import argparse
+import hmac
+import json
+import logging
+import os
+import Queue
+import select
+import socket
+import SocketServer
+import threading
+import time
+
+# Port the service listens on if not given
+SERVICE_PORT = 50010
+# Longest a submission or kill request waits while finished jobs are collected
+WAIT_TIMEOUT = 1
+# Environmental variable clients use to find the service
+SERVICE_VARIABLE = "RAPD_DRMAA_SERVICE"
+# Environmental variable holding the secret shared by the service and clients
+SECRET_VARIABLE = "RAPD_DRMAA_SECRET"
+# Interfaces that are safe to listen on without a secret
+LOOPBACK_HOSTS = ("127.0.0.1", "localhost", "::1")
+
+def get_address():
+    """Return the (host, port) of the DRMAA service or None if there is none"""
+
+    address = os.environ.get(SERVICE_VARIABLE, False)
+    if not address:
+        return None
+    if ":" in address:
+        host, port = address.rsplit(":", 1)
+        return (host, int(port))
+    return (address, SERVICE_PORT)
+
+def get_secret():
+    """Return the secret shared with the DRMAA service or None if there is none"""
+
+    return os.environ.get(SECRET_VARIABLE) or None
+
+def run_job(address,
+            command,
+            work_dir,
+            logfile=False,
+            native_specification="",
+            name=False,
+            mp_event=False,
+            timeout=False,
+            pid_queue=False,
+            logger=False):
+    """
+    Run a job on the cluster through the DRMAA service, returning once it has
+    finished with a dict of job_id, exit_status, aborted and signal
+
+    Raises socket.error if the job could not be submitted. If the service goes
+    away once the job is running, the job is left to run and the dict has
+    "lost" set.
+
+    Keyword arguments
+    address -- (host, port) of the service
+    command -- command to run
+    work_dir -- working directory
+    logfile -- write the output of the command to this file
+    native_specification -- scheduler options for the job
+    name -- name of job as seen by qstat
+    mp_event -- kill the job if this multiprocessing.Event is cleared
+    timeout -- kill the job after this many seconds (default False waits forever)
+    pid_queue -- put the job_id on this queue once submitted
+    logger -- logger instance
+    """
+
+    connection = socket.create_connection(address)
+    # Unbuffered, so a result line that arrives with the job_id line is left
+    # in the socket for select to see
+    stream = connection.makefile("rb", 0)
+    job = None
+
+    try:
+        # Submit
+        spec = {"command":command,
+                "work_dir":work_dir,
+                "logfile":logfile,
+                "native_specification":native_specification,
+                "name":name}
+        secret = get_secret()
+        if secret:
+            spec["secret"] = secret
+        connection.sendall(json.dumps(spec) + "\n")
+        line = stream.readline()
+        if not line:
+            raise socket.error("DRMAA service closed the connection")
+        reply = json.loads(line)
+        if "error" in reply:
+            raise socket.error("DRMAA service could not submit job: %s" % reply["error"])
+
+        job = reply["job_id"]
+        if pid_queue:
+            pid_queue.put(job)
+
+        # Wait for the job to finish, only waking to check on the caller
+        start = time.time()
+        killed = False
+        while True:
+            if not killed:
+                if (mp_event and not mp_event.is_set()) or \
+                   (timeout and time.time() - start > timeout):
+                    connection.sendall(json.dumps({"action":"kill"}) + "\n")
+                    killed = True
+                    if logger:
+                        logger.debug("job:%s terminated on cluster" % job)
+
+            readable, __, __ = select.select([connection], [], [], 1)
+            if readable:
+                line = stream.readline()
+                if line:
+                    return json.loads(line)
+                break
+
+    except socket.error:
+        if job is None:
+            raise
+        if logger:
+            logger.exception("Lost the DRMAA service - job:%s will continue to run" % job)
+
+    finally:
+        stream.close()
+        connection.close()
+
+    return {"job_id":job,
+            "exit_status":None,
+            "aborted":False,
+            "signal":None,
+            "lost":True}
+
+class SubmissionHandler(SocketServer.StreamRequestHandler):
+    """Handles the connection for one job"""
+
+    def handle(self):
+        """Submit the job, pass on kill requests and report completion"""
+
+        service = self.server.service
+
+        write_lock = threading.Lock()
+        submitted = threading.Event()
+
+        def notify(result):
+            """Called from the session thread when the job finishes"""
+            # The job_id goes out first
+            submitted.wait()
+            with write_lock:
+                try:
+                    self.wfile.write(json.dumps(result) + "\n")
+                    self.wfile.flush()
+                except socket.error:
+                    pass
+
+        line = self.rfile.readline()
+        if not line:
+            return
+
+        try:
+            spec = json.loads(line)
+            if not service.authorized(spec.pop("secret", None)):
+                raise ValueError("not authorized")
+            job = service.submit(spec, notify)
+        except Exception as error:
+            self.wfile.write(json.dumps({"error":str(error)}) + "\n")
+            return
+
+        try:
+            try:
+                with write_lock:
+                    self.wfile.write(json.dumps({"job_id":job}) + "\n")
+                    self.wfile.flush()
+            finally:
+                submitted.set()
+
+            # The client closes the connection once it has the result
+            for line in iter(self.rfile.readline, ""):
+                if json.loads(line).get("action") == "kill":
+                    service.kill(job)
+        finally:
+            # Nobody left to tell
+            service.forget(job)
+
+class SubmissionServer(SocketServer.ThreadingMixIn, SocketServer.TCPServer):
+    """Threaded TCP server with a reference to the service"""
+
+    allow_reuse_address = True
+    daemon_threads = True
+
+class DrmaaService(object):
+    """
+    Holds one DRMAA session and runs every job submitted through it
+    """
+
+    def __init__(self, address=("127.0.0.1", SERVICE_PORT), secret=None, logger=None):
+        """
+        Keyword arguments
+        address -- (host, port) to listen on (default loopback, SERVICE_PORT)
+        secret -- submissions must carry this secret (default None accepts all)
+        logger -- logger instance (default RAPDLogger)
+        """
+
+        self.secret = secret
+        self.logger = logger or logging.getLogger("RAPDLogger")
+
+        # Requests for the session thread
+        self.requests = Queue.Queue()
+        # job_id -> function to call with the result
+        self.waiting = {}
+
+        self.running = True
+
+        self.server = SubmissionServer(address, SubmissionHandler)
+        self.server.service = self
+
+    def serve_forever(self):
+        """Start the session thread and accept submissions until stopped"""
+
+        session_thread = threading.Thread(target=self.run_session, name="DrmaaSession")
+        session_thread.start()
+        try:
+            self.server.serve_forever()
+        finally:
+            self.running = False
+            session_thread.join()
+
+    def stop(self):
+        """Stop accepting submissions and close the session"""
+
+        self.server.shutdown()
+
+    def authorized(self, secret):
+        """Return True if a submission carrying secret may be run"""
+
+        if not self.secret:
+            return True
+        if not isinstance(secret, basestring):
+            self.logger.warning("Refused a submission without the secret")
+            return False
+        if not hmac.compare_digest(secret.encode("utf-8"), self.secret.encode("utf-8")):
+            self.logger.warning("Refused a submission with the wrong secret")
+            return False
+        return True
+
+    def submit(self, spec, notify):
+        """
+        Submit a job, returning its job_id. Called from connection threads.
+
+        Keyword arguments
+        spec -- dict of command, work_dir, logfile, native_specification and name
+        notify -- called with the result dict when the job finishes
+        """
+
+        reply = Queue.Queue(1)
+        self.requests.put(("submit", (spec, notify), reply))
+        result = reply.get()
+        if isinstance(result, Exception):
+            raise result
+        return result
+
+    def kill(self, job):
+        """Terminate a job. Called from connection threads."""
+
+        self.requests.put(("kill", job, None))
+
+    def forget(self, job):
+        """Stop reporting on a job whose client has gone. Called from connection threads."""
+
+        self.requests.put(("forget", job, None))
+
+    def run_session(self):
+        """Make all the DRMAA calls for the service"""
+
+        import drmaa
+
+        session = drmaa.Session()
+        session.initialize()
+        self.logger.debug("DRMAA session started")
+
+        try:
+            while self.running:
+                # With nothing running there is nothing to collect
+                block = not self.waiting
+                self.handle_requests(session, drmaa, block)
+                if self.waiting:
+                    self.collect_jobs(session, drmaa)
+        finally:
+            session.exit()
+            self.logger.debug("DRMAA session closed")
+
+    def handle_requests(self, session, drmaa, block):
+        """Act on the queued requests, waiting up to WAIT_TIMEOUT for one if block"""
+
+        while True:
+            try:
+                action, argument, reply = self.requests.get(block, WAIT_TIMEOUT)
+            except Queue.Empty:
+                return
+            block = False
+
+            if action == "submit":
+                spec, notify = argument
+                try:
+                    job = self.run_job(session, spec)
+                except Exception as error:
+                    self.logger.exception("Error submitting %s", spec.get("command"))
+                    reply.put(error)
+                else:
+                    self.waiting[job] = notify
+                    reply.put(job)
+
+            elif action == "kill":
+                try:
+                    session.control(argument, drmaa.JobControlAction.TERMINATE)
+                    self.logger.debug("job:%s terminated on cluster", argument)
+                except drmaa.errors.DrmaaException:
+                    self.logger.exception("Error terminating job:%s", argument)
+
+            elif action == "forget":
+                # The job is still collected, but nobody is told
+                if argument in self.waiting:
+                    self.waiting[argument] = None
+
+    def run_job(self, session, spec):
+        """Submit a job in the session and return its job_id"""
+
+        command = spec["command"].split()
+
+        template = session.createJobTemplate()
+        try:
+            template.workingDirectory = spec.get("work_dir") or os.getcwd()
+            template.joinFiles = True
+            template.nativeSpecification = spec.get("native_specification", "")
+            # Path to the executable command
+            template.remoteCommand = command[0]
+            # Rest of command
+            if len(command) > 1:
+                template.args = command[1:]
+            if spec.get("logfile"):
+                #the ':' is required!
+                template.outputPath = ":%s" % spec["logfile"]
+            if spec.get("name"):
+                template.jobName = spec["name"]
+            return session.runJob(template)
+        finally:
+            session.deleteJobTemplate(template)
+
+    def collect_jobs(self, session, drmaa):
+        """
+        Report every job that has finished, waiting up to WAIT_TIMEOUT for
+        the first of them
+        """
+
+        timeout = WAIT_TIMEOUT
+        while self.waiting:
+            try:
+                info = session.wait(drmaa.Session.JOB_IDS_SESSION_ANY, timeout)
+            except drmaa.errors.ExitTimeoutException:
+                return
+            except drmaa.errors.InvalidJobException:
+                # The session has no jobs left, so anything still waiting was
+                # reaped or removed outside the service
+                for job in self.waiting.keys():
+                    self.finish_job({"job_id":job,
+                                     "exit_status":None,
+                                     "aborted":True,
+                                     "signal":None})
+                return
+
+            self.finish_job({"job_id":info.jobId,
+                             "exit_status":info.exitStatus if info.hasExited else None,
+                             "aborted":info.wasAborted,
+                             "signal":info.terminatedSignal if info.hasSignal else None})
+            # Take the rest that have finished without waiting
+            timeout = drmaa.Session.TIMEOUT_NO_WAIT
+
+    def finish_job(self, result):
+        """Pass the result of a finished job to its client"""
+
+        notify = self.waiting.pop(result["job_id"], None)
+        self.logger.debug("job:%s finished %s", result["job_id"], result)
+        if notify:
+            try:
+                notify(result)
+            except:
+                self.logger.exception("Error reporting job:%s", result["job_id"])
+
+def get_commandline():
+    """
+    Grabs the commandline
+    """
+
+    # Parse the commandline arguments
+    commandline_description = "Cluster submission service holding one DRMAA session"
+    parser = argparse.ArgumentParser(description=commandline_description)
+
+    # Interface to listen on
+    parser.add_argument("--host",
+                        action="store",
+                        dest="host",
+                        default="127.0.0.1",
+                        help="Interface to listen on (needs %s if not loopback)" % SECRET_VARIABLE)
+
+    # Port to listen on
+    parser.add_argument("-p", "--port",
+                        action="store",
+                        dest="port",
+                        type=int,
+                        default=SERVICE_PORT,
+                        help="Port to listen on")
+
+    # Verbose
+    parser.add_argument("-v", "--verbose",
+                        action="store_true",
+                        dest="verbose",
+                        help="More output")
+
+    args = parser.parse_args()
+
+    # Listening beyond this host lets anyone who connects run commands
+    if args.host not in LOOPBACK_HOSTS and not get_secret():
+        parser.error("set %s to listen on %s" % (SECRET_VARIABLE, args.host or "all interfaces"))
+
+    return args
+
+def main(args):
+    """Run the service until interrupted"""
+
+    logging.basicConfig(level=logging.DEBUG if args.verbose else logging.INFO)
+    logger = logging.getLogger("RAPDLogger")
+
+    service = DrmaaService(address=(args.host, args.port), secret=get_secret(), logger=logger)
+    logger.info("DRMAA service listening on %s:%d", args.host or "*", args.port)
+    try:
+        service.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+if __name__ == "__main__":
+
+    # Get the commandline args
+    commandline_args = get_commandline()
+
+    # Execute code
+    main(args=commandline_args)
@@ -30,12 +30,16 @@ Provide generic interface for cluster interactions
 import drmaa
 import os
 import redis
+import socket
 import subprocess
 import time
 import tempfile
 from multiprocessing import Process
 from functools import wraps
 
+# RAPD imports
+import sites.cluster.drmaa_service as drmaa_service
+
 def checkCluster():
     """
     Quick check run at beginning of pipelines to see if job was subitted to computer cluster node (returns True) or
@@ -183,12 +187,13 @@ def mp_job(func):
     """
     wrapper to run processCluster in a multiprocessing.Process to avoid
     threading problems in DRMAA with multiple jobs sent to same session.
+    Not needed when the DRMAA service holds the session.
     """
     # If command starts with rapd.launch then mp.Process it.
     @wraps(func)
     def wrapper(**kwargs):
         job = False
-        if kwargs['command'].count('rapd.launch '):
+        if kwargs['command'].count('rapd.launch ') and not drmaa_service.get_address():
             job = Process(target=func, kwargs=kwargs)
             job.start()
         # wait for the job to finish and join
@@ -248,6 +253,30 @@ def process_cluster(command,
 
     #'-clear' can be added to the options to eliminate the general.q
     options = '-clear -shell y -p -100 -q %s -pe smp %s'%(batch_queue, nproc)
+
+    # Hand the job to the DRMAA service if there is one, so no session is
+    # created and nothing polls the job
+    service_address = drmaa_service.get_address()
+    if service_address:
+        try:
+            job = drmaa_service.run_job(service_address,
+                                        command=command,
+                                        work_dir=work_dir,
+                                        logfile=logfile,
+                                        native_specification=options,
+                                        name=name,
+                                        mp_event=mp_event,
+                                        timeout=timeout,
+                                        pid_queue=pid_queue,
+                                        logger=logger)["job_id"]
+        except socket.error:
+            if logger:
+                logger.exception('DRMAA service not available - starting a session')
+        else:
+            if result_queue:
+                put_result(job, logfile, fd, tag, result_queue)
+            return
+
     s = drmaa.Session()
     s.initialize()
     jt = s.createJobTemplate()
@@ -306,26 +335,30 @@ def process_cluster(command,
     
     # Used for passing back results to queue
     if result_queue:
-        # stdout and stderr are joined
-        stdout = ""
-        if os.path.isfile(logfile):
-            with open(logfile, 'rb') as raw:
-                for line in raw:
-                    stdout += line
-            # Delete logile if it was not asked to be saved
-            if fd:
-                os.unlink(logfile)
-        # Setup the result dict to pass back
-        result = {'pid': job,
-                  #"returncode": proc.returncode,
-                  "stdout": stdout,
-                  "stderr": '',
-                  "tag": tag}
-        result_queue.put(result)
+        put_result(job, logfile, fd, tag, result_queue)
     #Exit cleanly, otherwise master node gets event client timeout errors after 600s.
     if s:
         s.exit()
 
+def put_result(job, logfile, fd, tag, result_queue):
+    """Pass back the output of a finished job on result_queue"""
+    # stdout and stderr are joined
+    stdout = ""
+    if os.path.isfile(logfile):
+        with open(logfile, 'rb') as raw:
+            for line in raw:
+                stdout += line
+        # Delete logile if it was not asked to be saved
+        if fd:
+            os.unlink(logfile)
+    # Setup the result dict to pass back
+    result = {'pid': job,
+              #"returncode": proc.returncode,
+              "stdout": stdout,
+              "stderr": '',
+              "tag": tag}
+    result_queue.put(result)
+
 def kill_job(jobid):
   """
   Kill jobs on cluster. The JobID is sent in and job is killed. Must be launched from
@@ -28,6 +28,7 @@ Provides generic interface for cluster interactions
 
 # Standard imports
 import os
+import socket
 import stat
 import time
 import tempfile
@@ -38,6 +39,9 @@ import drmaa
 import random
 import subprocess
 
+# RAPD imports
+import sites.cluster.drmaa_service as drmaa_service
+
 def check_cluster():
     """
     Quick check run at beginning of pipelines to see if job was subitted to computer cluster node (returns True) or
@@ -182,6 +186,29 @@ def process_cluster_drmaa(self, inp, output=False):
     #options = '-V -l nodes=1:ppn=%s pbs.sh'%smp
     #options = '%s -l nodes=1:ppn=%s -S /bin/tcsh'%(v,smp)
     options = "%s -l nodes=1:ppn=%s" % (v, smp)
+
+    # Hand the job to the DRMAA service if there is one, so no session is
+    # created and nothing polls the job
+    service_address = drmaa_service.get_address()
+    if service_address:
+        if log:
+            log = os.path.join(os.getcwd(), log)
+        try:
+            drmaa_service.run_job(service_address,
+                                  command=command,
+                                  work_dir=os.getcwd(),
+                                  logfile=log,
+                                  native_specification=options,
+                                  name=name,
+                                  mp_event=self.running if running else False,
+                                  pid_queue=output,
+                                  logger=self.logger)
+        except socket.error:
+            self.logger.exception("DRMAA service not available - starting a session")
+        else:
+            print "Job finished"
+            return
+
     s = drmaa.Session()
     s.initialize()
     jt = s.createJobTemplate()
@@ -32,12 +32,12 @@ import argparse
 from collections import OrderedDict
 import os
 from pprint import pprint
-import re
 
 # RAPD imports
 # commandline_utils
 # detectors.detector_utils as detector_utils
 # utils
+import detectors.cbf_header as cbf_header
 
 # Dectris Pilatus 6M
 import detectors.dectris.dectris_eiger16m as detector
@@ -159,6 +159,33 @@ def get_data_root_dir(fullname):
     # Return the determined directory
     return data_root_dir
 
+# item:(pattern,transform)
+HEADER_ITEMS = {
+    "beam_x": ("^# Beam_xy\s*\(([\d\.]+)\,\s[\d\.]+\) pixels", lambda x: float(x)),
+    "beam_y": ("^# Beam_xy\s*\([\d\.]+\,\s([\d\.]+)\) pixels", lambda x: float(x)),
+    "count_cutoff": ("^# Count_cutoff\s*(\d+) counts", lambda x: int(x)),
+    "detector_sn": ("S\/N ([\w\d\-]*)\s*", lambda x: str(x)),
+    # "date": ("^# ([\d\-]+T[\d\.\:]+)\s*", lambda x: str(x)),
+    "distance": ("^# Detector_distance\s*([\d\.]+) m", cbf_header.mmorm),
+    # "excluded_pixels": ("^# Excluded_pixels\:\s*([\w\.]+)", lambda x: str(x)),
+    # "flat_field": ("^# Flat_field\:\s*([\(\)\w\.]+)", lambda x: str(x)),
+    # "gain": ("^# Gain_setting\:\s*([\s\(\)\w\.\-\=]+)", lambda x: str(x).rstrip()),
+    # "n_excluded_pixels": ("^# N_excluded_pixels\s\=\s*(\d+)", lambda x: int(x)),
+    "osc_range": ("^# Angle_increment\s*([\d\.]*)\s*deg", lambda x: float(x)),
+    "osc_start": ("^# Start_angle\s*([\d\.]+)\s*deg", lambda x: float(x)),
+    "period": ("^# Exposure_period\s*([\d\.]+) s", lambda x: float(x)),
+    "pixel_size": ("^# Pixel_size\s*([\.\d]+)e-6 m.*", lambda x: float(x)/1000.0),
+    "sensor_thickness": ("^#\sSilicon\ssensor\,\sthickness\s*([\d\.]+)\sm", lambda x: float(x)*1000),
+    # "tau": ("^#\sTau\s\=\s*([\d\.]+e\-09) s", lambda x: float(x)),
+    # "threshold": ("^#\sThreshold_setting\:\s*([\d\.]+)\seV", lambda x: float(x)),
+    "time": ("^# Exposure_time\s*([\d\.]+) s", lambda x: float(x)),
+    # "transmission": ("^# Filter_transmission\s*([\d\.]+)", lambda x: float(x)),
+    # "trim_file": ("^#\sTrim_file\:\s*([\w\.]+)", lambda x:str(x).rstrip()),
+    # "twotheta": ("^# Detector_2theta\s*([\d\.]*)\s*deg", lambda x: float(x)),
+    "wavelength": ("^# Wavelength\s*([\d\.]+) A", lambda x: float(x))
+    }
+HEADER_PATTERNS = cbf_header.compile_header_items(HEADER_ITEMS)
+
 def base_read_header(image,
                      logger=False):
     """
@@ -172,43 +199,8 @@ def base_read_header(image,
     # Make sure the image is a full path image
     image = os.path.abspath(image)
 
-    def mmorm(x):
-        d = float(x)
-        if (d < 2):
-            return (d*1000)
-        else:
-            return d
-
-    #item:(pattern,transform)
-    header_items = header_items = {
-        "beam_x": ("^# Beam_xy\s*\(([\d\.]+)\,\s[\d\.]+\) pixels", lambda x: float(x)),
-        "beam_y": ("^# Beam_xy\s*\([\d\.]+\,\s([\d\.]+)\) pixels", lambda x: float(x)),
-        "count_cutoff": ("^# Count_cutoff\s*(\d+) counts", lambda x: int(x)),
-        "detector_sn": ("S\/N ([\w\d\-]*)\s*", lambda x: str(x)),
-        # "date": ("^# ([\d\-]+T[\d\.\:]+)\s*", lambda x: str(x)),
-        "distance": ("^# Detector_distance\s*([\d\.]+) m", mmorm),
-        # "excluded_pixels": ("^# Excluded_pixels\:\s*([\w\.]+)", lambda x: str(x)),
-        # "flat_field": ("^# Flat_field\:\s*([\(\)\w\.]+)", lambda x: str(x)),
-        # "gain": ("^# Gain_setting\:\s*([\s\(\)\w\.\-\=]+)", lambda x: str(x).rstrip()),
-        # "n_excluded_pixels": ("^# N_excluded_pixels\s\=\s*(\d+)", lambda x: int(x)),
-        "osc_range": ("^# Angle_increment\s*([\d\.]*)\s*deg", lambda x: float(x)),
-        "osc_start": ("^# Start_angle\s*([\d\.]+)\s*deg", lambda x: float(x)),
-        "period": ("^# Exposure_period\s*([\d\.]+) s", lambda x: float(x)),
-        "pixel_size": ("^# Pixel_size\s*([\.\d]+)e-6 m.*", lambda x: float(x)/1000.0),
-        "sensor_thickness": ("^#\sSilicon\ssensor\,\sthickness\s*([\d\.]+)\sm", lambda x: float(x)*1000),
-        # "tau": ("^#\sTau\s\=\s*([\d\.]+e\-09) s", lambda x: float(x)),
-        # "threshold": ("^#\sThreshold_setting\:\s*([\d\.]+)\seV", lambda x: float(x)),
-        "time": ("^# Exposure_time\s*([\d\.]+) s", lambda x: float(x)),
-        # "transmission": ("^# Filter_transmission\s*([\d\.]+)", lambda x: float(x)),
-        # "trim_file": ("^#\sTrim_file\:\s*([\w\.]+)", lambda x:str(x).rstrip()),
-        # "twotheta": ("^# Detector_2theta\s*([\d\.]*)\s*deg", lambda x: float(x)),
-        "wavelength": ("^# Wavelength\s*([\d\.]+) A", lambda x: float(x))
-        }
-
-    rawdata = open(image,"rb").read(2048)
-    headeropen = 0
-    headerclose= rawdata.index("--CIF-BINARY-FORMAT-SECTION--")
-    header = rawdata[headeropen:headerclose]
+    # Read just the text header
+    header = cbf_header.read_header_block(image, logger=logger)
 
     # try:
     #tease out the info from the file name
@@ -229,14 +221,7 @@ def base_read_header(image,
         # "size2": 2527}
         }
 
-    for label, pat in header_items.iteritems():
-        # print label
-        pattern = re.compile(pat[0], re.MULTILINE)
-        matches = pattern.findall(header)
-        if len(matches) > 0:
-            parameters[label] = pat[1](matches[-1])
-        else:
-            parameters[label] = None
+    cbf_header.parse_header(header, HEADER_PATTERNS, parameters)
 
     # pprint(parameters)
 
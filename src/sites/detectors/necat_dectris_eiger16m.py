@@ -32,8 +32,6 @@ __status__ = "Development"
 import argparse
 import os
 from pprint import pprint
-import re
-import time
 import numpy
 import redis
 import threading
@@ -42,6 +40,7 @@ import threading
 # commandline_utils
 # detectors.detector_utils as detector_utils
 # utils
+import detectors.cbf_header as cbf_header
 
 # Dectris Pilatus 6M
 import detectors
@@ -132,12 +131,12 @@ class FileLocation():
         loc = self.ft_redis.get(dir)
         if loc == 'ram':
             # Tell file_tracker to not remove dataset!
-            #self.hold_data(dir)
+            self.hold_data(dir)
             # Pass back location in RAMDISK
             return os.path.join('%s%s'%(self.ram_prefix,dir), file_name)
         elif loc == 'nvme':
             # Tell file_tracker to not remove dataset!
-            #self.hold_data(dir)
+            self.hold_data(dir)
             # Pass back location on NMVe drive
             return os.path.join('%s%s'%(self.nvme_prefix,dir), file_name)
         else:
@@ -152,12 +151,10 @@ class FileLocation():
     def hold_data(self, dir):
         """Make sure dataset is not deleted during processing."""
         self.ft_redis.sadd('working', dir)
-        print 'holding: %s' %self.ft_redis.smembers('working')
 
     def release_data(self, img_path):
         """Allow dataset in RAMDISK to be deleted."""
         self.ft_redis.srem('working', self.get_redis_key(img_path))
-        print 'release: %s' %self.ft_redis.smembers('working')
 
 def parse_file_name(fullname):
     """
@@ -307,6 +304,38 @@ def get_data_root_dir(fullname):
     #return the determined directory
     return data_root_dir
 
+# item:(pattern,transform)
+HEADER_ITEMS = {
+    "md2_aperture": ("^# MD2_aperture_size\s*(\d+) microns", lambda x: int(x)/1000),
+    "beam_x": ("^# Beam_xy\s*\(([\d\.]+)\,\s[\d\.]+\) pixels", lambda x: float(x)),
+    "beam_y": ("^# Beam_xy\s*\([\d\.]+\,\s([\d\.]+)\) pixels", lambda x: float(x)),
+    "count_cutoff": ("^# Count_cutoff\s*(\d+) counts", lambda x: int(x)),
+    "detector_sn": ("S\/N ([\w\d\-]*)\s*", lambda x: str(x)),
+    "date": ("^# ([\d\-]+T[\d\.\:]+)\s*", lambda x: str(x)),
+    "distance": ("^# Detector_distance\s*([\d\.]+) m", cbf_header.mmorm),
+    "excluded_pixels": ("^# Excluded_pixels\:\s*([\w\.]+)", lambda x: str(x)),
+    "flat_field": ("^# Flat_field\:\s*([\(\)\w\.]+)", lambda x: str(x)),
+    "gain": ("^# Gain_setting\:\s*([\s\(\)\w\.\-\=]+)", lambda x: str(x).rstrip()),
+    "n_excluded_pixels": ("^# N_excluded_pixels\s\=\s*(\d+)", lambda x: int(x)),
+    "osc_range": ("^# Angle_increment\s*([\d\.]*)\s*deg", lambda x: float(x)),
+    "osc_start": ("^# Start_angle\s*([\d\.]+)\s*deg", lambda x: float(x)),
+    "period": ("^# Exposure_period\s*([\d\.]+) s", lambda x: float(x)),
+    "pixel_size": ("^# Pixel_size\s*([\.\d]+)e-6 m.*", lambda x: float(x)/1000.0),
+    "sensor_thickness": ("^#\sSilicon\ssensor\,\sthickness\s*([\d\.]+)\sm", lambda x: float(x)*1000),
+    "tau": ("^#\sTau\s\=\s*([\d\.]+e\-09) s", lambda x: float(x)),
+    "threshold": ("^#\sThreshold_setting\:\s*([\d\.]+)\seV", lambda x: float(x)),
+    "time": ("^# Exposure_time\s*([\d\.]+) s", lambda x: float(x)),
+    "transmission": ("^# Filter_transmission\s*([\d\.]+)", lambda x: float(x)),
+    "trim_file": ("^#\sTrim_file\:\s*([\w\.]+)", lambda x:str(x).rstrip()),
+    "twotheta": ("^# Detector_2theta\s*([\d\.]*)\s*deg", lambda x: float(x)),
+    "wavelength": ("^# Wavelength\s*([\d\.]+) A", lambda x: float(x)),
+    "ring_current": ("^# Ring_current\s*([\d\.]*)\s*mA", lambda x: float(x)),
+    "sample_mounter_position": ("^#\sSample_mounter_position\s*([\w\.]+)", lambda x:str(x).rstrip()),
+    "size1": ("X-Binary-Size-Fastest-Dimension:\s*([\d\.]+)", lambda x: int(x)),
+    "size2": ("X-Binary-Size-Second-Dimension:\s*([\d\.]+)", lambda x: int(x)),
+    }
+HEADER_PATTERNS = cbf_header.compile_header_items(HEADER_ITEMS)
+
 def base_read_header(image,
                      logger=False):
     """
@@ -322,60 +351,8 @@ def base_read_header(image,
     #tease out the info from the file name
     base = os.path.basename(image).rstrip(".cbf")
 
-    def mmorm(x):
-        d = float(x)
-        if (d < 2):
-            return (d*1000)
-        else:
-            return d
-
-    #item:(pattern,transform)
-    header_items = {
-        "md2_aperture": ("^# MD2_aperture_size\s*(\d+) microns", lambda x: int(x)/1000),
-        "beam_x": ("^# Beam_xy\s*\(([\d\.]+)\,\s[\d\.]+\) pixels", lambda x: float(x)),
-        "beam_y": ("^# Beam_xy\s*\([\d\.]+\,\s([\d\.]+)\) pixels", lambda x: float(x)),
-        "count_cutoff": ("^# Count_cutoff\s*(\d+) counts", lambda x: int(x)),
-        "detector_sn": ("S\/N ([\w\d\-]*)\s*", lambda x: str(x)),
-        "date": ("^# ([\d\-]+T[\d\.\:]+)\s*", lambda x: str(x)),
-        "distance": ("^# Detector_distance\s*([\d\.]+) m", mmorm),
-        "excluded_pixels": ("^# Excluded_pixels\:\s*([\w\.]+)", lambda x: str(x)),
-        "flat_field": ("^# Flat_field\:\s*([\(\)\w\.]+)", lambda x: str(x)),
-        "gain": ("^# Gain_setting\:\s*([\s\(\)\w\.\-\=]+)", lambda x: str(x).rstrip()),
-        "n_excluded_pixels": ("^# N_excluded_pixels\s\=\s*(\d+)", lambda x: int(x)),
-        "osc_range": ("^# Angle_increment\s*([\d\.]*)\s*deg", lambda x: float(x)),
-        "osc_start": ("^# Start_angle\s*([\d\.]+)\s*deg", lambda x: float(x)),
-        "period": ("^# Exposure_period\s*([\d\.]+) s", lambda x: float(x)),
-        "pixel_size": ("^# Pixel_size\s*([\.\d]+)e-6 m.*", lambda x: float(x)/1000.0),
-        "sensor_thickness": ("^#\sSilicon\ssensor\,\sthickness\s*([\d\.]+)\sm", lambda x: float(x)*1000),
-        "tau": ("^#\sTau\s\=\s*([\d\.]+e\-09) s", lambda x: float(x)),
-        "threshold": ("^#\sThreshold_setting\:\s*([\d\.]+)\seV", lambda x: float(x)),
-        "time": ("^# Exposure_time\s*([\d\.]+) s", lambda x: float(x)),
-        "transmission": ("^# Filter_transmission\s*([\d\.]+)", lambda x: float(x)),
-        "trim_file": ("^#\sTrim_file\:\s*([\w\.]+)", lambda x:str(x).rstrip()),
-        "twotheta": ("^# Detector_2theta\s*([\d\.]*)\s*deg", lambda x: float(x)),
-        "wavelength": ("^# Wavelength\s*([\d\.]+) A", lambda x: float(x)),
-        "ring_current": ("^# Ring_current\s*([\d\.]*)\s*mA", lambda x: float(x)),
-        "sample_mounter_position": ("^#\sSample_mounter_position\s*([\w\.]+)", lambda x:str(x).rstrip()),
-        "size1": ("X-Binary-Size-Fastest-Dimension:\s*([\d\.]+)", lambda x: int(x)),
-        "size2": ("X-Binary-Size-Second-Dimension:\s*([\d\.]+)", lambda x: int(x)),
-        }
-
-    count = 0
-    while (count < 10):
-        try:
-            # Use 'with' to make sure file closes properly. Only read header.
-            header = ""
-            with open(image, "rb") as raw:
-                for line in raw:
-                    header += line
-                    if line.count("X-Binary-Size-Padding"):
-                        break
-            break
-        except:
-            count +=1
-            if logger:
-                logger.exception('Error opening %s' % image)
-            time.sleep(0.1)
+    # Read just the text header
+    header = cbf_header.read_header_block(image, logger=logger)
 
     parameters = {
         "fullname": image,
@@ -392,14 +369,7 @@ def base_read_header(image,
         # "size2": 2527}
         }
 
-    for label, pat in header_items.iteritems():
-        # print label
-        pattern = re.compile(pat[0], re.MULTILINE)
-        matches = pattern.findall(header)
-        if len(matches) > 0:
-            parameters[label] = pat[1](matches[-1])
-        else:
-            parameters[label] = None
+    cbf_header.parse_header(header, HEADER_PATTERNS, parameters)
 
     # pprint(parameters)
 
@@ -0,0 +1,113 @@
+"""Tests for control.image_pipeline"""
+
+"""
+This file is part of RAPD
+
+Copyright (C) 2018, Cornell University
+All rights reserved.
+
+RAPD is free software: you can redistribute it and/or modify
+it under the terms of the GNU Affero General Public License as published by
+the Free Software Foundation, version 3.
+
+RAPD is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU Affero General Public License for more details.
+
+You should have received a copy of the GNU Affero General Public License
+along with this program.  If not, see <http://www.gnu.org/licenses/>.
+"""
+
+__created__ = "2026-10-18"
+__maintainer__ = "Frank Murphy"
+__email__ = "fmurphy@anl.gov"
+__status__ = "Development"
+
+# Standard imports
+import random
+import threading
+import time
+import unittest
+
+# RAPD imports
+import control.image_pipeline as image_pipeline
+
+class TestImagePipeline(unittest.TestCase):
+    """Ordering, dropping and clean up of the image pipeline"""
+
+    def setUp(self):
+
+        self.handed_off = []
+        self.dropped = []
+        self.lock = threading.Lock()
+
+        def slow(job):
+            """Finish jobs out of order"""
+            time.sleep(random.random() * 0.01)
+            if job.get("drop"):
+                return None
+            return job
+
+        def dispatch(job):
+            with self.lock:
+                self.handed_off.append((job["key"], job["number"]))
+
+        self.pipeline = image_pipeline.ImagePipeline(
+            stages=(("slow", slow, 4),),
+            final_stage=("dispatch", dispatch),
+            drop_callback=lambda job: self.dropped.append(job["number"]))
+
+    def tearDown(self):
+        self.pipeline.stop()
+
+    def wait_for(self, count):
+        """Wait for count jobs to be handed off or dropped"""
+        for __ in range(500):
+            if len(self.handed_off) + len(self.dropped) >= count:
+                return
+            time.sleep(0.01)
+
+    def test_order_kept_per_key(self):
+        """Jobs sharing a key are dispatched in the order they were put"""
+
+        for number in range(20):
+            for key in ("run1", "run2"):
+                self.pipeline.put({"key":key, "number":number}, order_key=key)
+        self.wait_for(40)
+
+        for key in ("run1", "run2"):
+            self.assertEqual([number for job_key, number in self.handed_off if job_key == key],
+                             range(20))
+
+    def test_dropped_jobs_do_not_block(self):
+        """A dropped job goes to the drop callback and later jobs still arrive"""
+
+        for number in range(5):
+            self.pipeline.put({"key":"run", "number":number, "drop":number == 2},
+                              order_key="run")
+        self.wait_for(5)
+
+        self.assertEqual(self.dropped, [2])
+        self.assertEqual([number for __, number in self.handed_off], [0, 1, 3, 4])
+
+    def test_drained_keys_are_forgotten(self):
+        """The ordering state of a key goes once all its jobs are handed off"""
+
+        for number in range(10):
+            self.pipeline.put({"key":"run", "number":number}, order_key="run")
+        self.wait_for(10)
+        time.sleep(0.05)
+
+        self.assertEqual(self.pipeline.order_issued, {})
+        self.assertEqual(self.pipeline.order_next, {})
+        self.assertEqual(self.pipeline.order_waiting, {})
+
+        # The key can be used again
+        self.pipeline.put({"key":"run", "number":10}, order_key="run")
+        self.wait_for(11)
+        self.assertEqual(self.handed_off[-1], ("run", 10))
+
+if __name__ == "__main__":
+
+    unittest.main(verbosity=2)
@@ -0,0 +1,122 @@
+"""Tests for control.run_index"""
+
+"""
+This file is part of RAPD
+
+Copyright (C) 2018, Cornell University
+All rights reserved.
+
+RAPD is free software: you can redistribute it and/or modify
+it under the terms of the GNU Affero General Public License as published by
+the Free Software Foundation, version 3.
+
+RAPD is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU Affero General Public License for more details.
+
+You should have received a copy of the GNU Affero General Public License
+along with this program.  If not, see <http://www.gnu.org/licenses/>.
+"""
+
+__created__ = "2026-10-18"
+__maintainer__ = "Frank Murphy"
+__email__ = "fmurphy@anl.gov"
+__status__ = "Development"
+
+# Standard imports
+import time
+import unittest
+
+# RAPD imports
+import control.run_index as run_index
+
+def make_run(start, number, run_number=1, prefix="thaum"):
+    """Return a run dict"""
+    return {"site_tag":"NECAT_C",
+            "directory":"/data/x",
+            "image_prefix":prefix,
+            "run_number":run_number,
+            "start_image_number":start,
+            "number_images":number}
+
+class TestRunIndex(unittest.TestCase):
+    """Lookups and eviction of the run index"""
+
+    def find(self, index, image_number, run_number=1, prefix="thaum"):
+        return index.find("NECAT_C", "/data/x", prefix, run_number, image_number)
+
+    def test_find_in_range(self):
+        """Images resolve to the run whose range holds them"""
+
+        index = run_index.RunIndex()
+        index["a"] = make_run(1, 100)
+        index["b"] = make_run(101, 100)
+
+        self.assertIs(self.find(index, 1), index.runs["a"])
+        self.assertIs(self.find(index, 100), index.runs["a"])
+        self.assertIs(self.find(index, 101), index.runs["b"])
+        self.assertIsNone(self.find(index, 201))
+        self.assertIsNone(self.find(index, 50, run_number=2))
+        self.assertIsNone(self.find(index, 50, prefix="other"))
+        self.assertEqual((index.hits, index.misses), (3, 3))
+
+    def test_latest_overlapping_run_wins(self):
+        """When runs overlap, the one stored last is found"""
+
+        index = run_index.RunIndex()
+        index["old"] = make_run(1, 100)
+        index["new"] = make_run(50, 10)
+
+        self.assertEqual(self.find(index, 55)["start_image_number"], 50)
+        self.assertEqual(self.find(index, 70)["start_image_number"], 1)
+
+    def test_replace_and_delete(self):
+        """Storing under an existing id replaces the range, deleting drops it"""
+
+        index = run_index.RunIndex()
+        index["a"] = make_run(1, 10)
+        index["a"] = make_run(20, 10)
+        self.assertIsNone(self.find(index, 5))
+        self.assertIsNotNone(self.find(index, 25))
+
+        del index["a"]
+        self.assertIsNone(self.find(index, 25))
+        self.assertEqual(index.ranges, {})
+        self.assertEqual(len(index), 0)
+
+    def test_unindexable_run_is_stored(self):
+        """A run without image numbers is kept but not findable"""
+
+        index = run_index.RunIndex()
+        index["a"] = {"site_tag":"NECAT_C", "directory":"/data/x"}
+        self.assertIn("a", index)
+        self.assertEqual(index.get("a"), {"site_tag":"NECAT_C", "directory":"/data/x"})
+        self.assertEqual(index.get("b", False), False)
+
+    def test_evict_least_recently_used(self):
+        """Over max_runs, the run used longest ago goes first"""
+
+        index = run_index.RunIndex(max_runs=2)
+        index["a"] = make_run(1, 10)
+        index["b"] = make_run(11, 10)
+        # Use a so b is the oldest
+        index["a"]
+        index["c"] = make_run(21, 10)
+
+        self.assertEqual(sorted(run_id for run_id, __ in index.iteritems()), ["a", "c"])
+        self.assertIsNone(self.find(index, 15))
+
+    def test_evict_old(self):
+        """Runs unused for max_age are evicted"""
+
+        index = run_index.RunIndex(max_age=60)
+        index["a"] = make_run(1, 10)
+        index.last_used["a"] = time.time() - 120
+
+        self.assertIsNone(self.find(index, 5))
+        self.assertNotIn("a", index)
+
+if __name__ == "__main__":
+
+    unittest.main(verbosity=2)
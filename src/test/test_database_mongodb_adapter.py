@@ -0,0 +1,314 @@
+"""Tests for database.mongodb_adapter"""
+
+"""
+This file is part of RAPD
+
+Copyright (C) 2018, Cornell University
+All rights reserved.
+
+RAPD is free software: you can redistribute it and/or modify
+it under the terms of the GNU Affero General Public License as published by
+the Free Software Foundation, version 3.
+
+RAPD is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU Affero General Public License for more details.
+
+You should have received a copy of the GNU Affero General Public License
+along with this program.  If not, see <http://www.gnu.org/licenses/>.
+"""
+
+__created__ = "2026-10-18"
+__maintainer__ = "Frank Murphy"
+__email__ = "fmurphy@anl.gov"
+__status__ = "Development"
+
+# Standard imports
+import base64
+import random
+import StringIO
+import threading
+import time
+import unittest
+
+# RAPD imports
+import pymongo
+import database.mongodb_adapter as mongodb_adapter
+
+class FakeCollection(object):
+    """Records insert_many calls, failing with duplicates if asked to"""
+
+    def __init__(self):
+        self.inserts = []
+        self.duplicates = 0
+        self.failures = 0
+        self.lock = threading.Lock()
+
+    def insert_many(self, documents, ordered=True):
+        with self.lock:
+            self.inserts.append(list(documents))
+        write_errors = [{"code":11000}] * self.duplicates + [{"code":121}] * self.failures
+        if write_errors:
+            raise pymongo.errors.BulkWriteError({"writeErrors":write_errors})
+
+class FakeDatabase(dict):
+    """Collections made on first use"""
+
+    def __missing__(self, key):
+        self[key] = FakeCollection()
+        return self[key]
+
+class TestWriteBuffer(unittest.TestCase):
+    """Batching, flushing and error handling of the write buffer"""
+
+    def setUp(self):
+        self.db = FakeDatabase()
+        self.buffer = False
+
+    def tearDown(self):
+        if self.buffer:
+            self.buffer.stop()
+
+    def make_buffer(self, batch=3, delay=60.0):
+        """Start a buffer that only writes full batches unless told otherwise"""
+        self.buffer = mongodb_adapter.WriteBuffer(lambda: self.db, batch=batch, delay=delay)
+        return self.buffer
+
+    def wait_for(self, collection, count):
+        """Wait for count insert_many calls to collection"""
+        for __ in range(200):
+            if len(self.db[collection].inserts) >= count:
+                return
+            time.sleep(0.01)
+
+    def test_full_batch_written(self):
+        """A full batch is written in one insert_many, in the order added"""
+
+        write_buffer = self.make_buffer()
+        for number in range(3):
+            write_buffer.add("images", {"number":number})
+        self.wait_for("images", 1)
+
+        self.assertEqual(self.db["images"].inserts, [[{"number":0}, {"number":1}, {"number":2}]])
+        self.assertEqual(write_buffer.stats["documents"], 3)
+
+    def test_partial_batch_waits(self):
+        """Fewer than a batch are held until the delay has passed"""
+
+        write_buffer = self.make_buffer(delay=0.1)
+        write_buffer.add("runs", {"number":0})
+        time.sleep(0.02)
+        self.assertEqual(self.db["runs"].inserts, [])
+
+        self.wait_for("runs", 1)
+        self.assertEqual(self.db["runs"].inserts, [[{"number":0}]])
+        self.assertGreaterEqual(write_buffer.stats["last_latency"], 0.1)
+
+    def test_collections_written_apart(self):
+        """Each collection gets its own insert_many"""
+
+        write_buffer = self.make_buffer()
+        write_buffer.add("images", {"number":0})
+        write_buffer.add("runs", {"number":1})
+        write_buffer.flush()
+
+        self.assertEqual(self.db["images"].inserts, [[{"number":0}]])
+        self.assertEqual(self.db["runs"].inserts, [[{"number":1}]])
+
+    def test_flush_writes_at_once(self):
+        """flush returns only once what was buffered is written"""
+
+        write_buffer = self.make_buffer()
+        write_buffer.add("images", {"number":0})
+        write_buffer.flush("images")
+
+        self.assertEqual(self.db["images"].inserts, [[{"number":0}]])
+        self.assertEqual(write_buffer.pending, {})
+
+    def test_flush_other_collection(self):
+        """Flushing a collection with nothing buffered leaves the rest alone"""
+
+        write_buffer = self.make_buffer()
+        write_buffer.add("images", {"number":0})
+        write_buffer.flush("runs")
+
+        self.assertEqual(self.db["images"].inserts, [])
+        self.assertIn("images", write_buffer.pending)
+
+    def test_duplicates_not_errors(self):
+        """Duplicate keys are dropped, other write errors are counted"""
+
+        write_buffer = self.make_buffer()
+        self.db["images"].duplicates = 2
+        write_buffer.add("images", {"number":0})
+        write_buffer.flush()
+        self.assertEqual(write_buffer.stats["errors"], 0)
+
+        self.db["images"].failures = 1
+        write_buffer.add("images", {"number":1})
+        write_buffer.flush()
+        self.assertEqual(write_buffer.stats["errors"], 1)
+
+    def test_stop_drains(self):
+        """Stopping writes what is buffered and ends the writer thread"""
+
+        write_buffer = self.make_buffer()
+        write_buffer.add("images", {"number":0})
+        write_buffer.add("runs", {"number":1})
+        write_buffer.stop()
+        self.buffer = False
+
+        self.assertFalse(write_buffer.thread.is_alive())
+        self.assertEqual(self.db["images"].inserts, [[{"number":0}]])
+        self.assertEqual(self.db["runs"].inserts, [[{"number":1}]])
+
+class TestBase64Reader(unittest.TestCase):
+    """Streaming a file as base64 in pieces"""
+
+    def setUp(self):
+        # Small encoding chunks so the tests cross many of them
+        self.encode_bytes = mongodb_adapter.ENCODE_BYTES
+        mongodb_adapter.ENCODE_BYTES = 6
+
+    def tearDown(self):
+        mongodb_adapter.ENCODE_BYTES = self.encode_bytes
+
+    def read_all(self, data, size):
+        """Read data through a Base64Reader size bytes at a time"""
+
+        reader = mongodb_adapter.Base64Reader(StringIO.StringIO(data))
+        pieces = []
+        while True:
+            piece = reader.read(size)
+            if not piece:
+                break
+            self.assertLessEqual(len(piece), size)
+            pieces.append(piece)
+        return pieces
+
+    def test_chunked_read(self):
+        """Pieces of any size join up to the encoding of the whole file"""
+
+        for length in (0, 1, 2, 3, 13, 14, 15):
+            data = "".join(chr(random.randint(0, 255)) for __ in range(length))
+            for size in (1, 3, 4, 7, 100):
+                self.assertEqual("".join(self.read_all(data, size)), base64.b64encode(data))
+
+    def test_padding_only_at_end(self):
+        """Chunk boundaries inside the file add no padding"""
+
+        data = "x" * 14
+        pieces = self.read_all(data, 4)
+
+        self.assertNotIn("=", "".join(pieces[:-1]))
+        self.assertEqual(pieces[-1], base64.b64encode("xx"))
+        self.assertEqual(base64.b64decode("".join(pieces)), data)
+
+    def test_read_rest(self):
+        """A negative size reads everything left"""
+
+        reader = mongodb_adapter.Base64Reader(StringIO.StringIO("abcdefghij"))
+        first = reader.read(5)
+
+        self.assertEqual(first + reader.read(), base64.b64encode("abcdefghij"))
+        self.assertEqual(reader.read(), "")
+
+class FakeFiles(object):
+    """GridFS files collection that counts lookups"""
+
+    def __init__(self, files):
+        self.files = files
+        self.lookups = 0
+
+    def find_one(self, query, projection=None):
+        self.lookups += 1
+        file_id = self.files.get(query["metadata.hash"])
+        if file_id:
+            return {"_id":file_id}
+        return None
+
+class FakeGridDatabase(object):
+    """Just the fs.files collection"""
+
+    def __init__(self, files):
+        self.fs = type("FakeFS", (object,), {})()
+        self.fs.files = FakeFiles(files)
+
+class TestFileHashes(unittest.TestCase):
+    """Cache of GridFS _ids by file hash"""
+
+    def setUp(self):
+        self.db = FakeGridDatabase({"known":"file_id"})
+        self.adapter = mongodb_adapter.Database()
+        self.adapter.get_db_connection = lambda: self.db
+
+    def test_hit(self):
+        """A hash found once is not looked up again"""
+
+        self.assertEqual(self.adapter.find_file_hash("known"), "file_id")
+        self.assertEqual(self.adapter.find_file_hash("known"), "file_id")
+        self.assertEqual(self.db.fs.files.lookups, 1)
+
+    def test_miss(self):
+        """An unknown hash is looked up each time, and not cached"""
+
+        self.assertIsNone(self.adapter.find_file_hash("unknown"))
+        self.assertIsNone(self.adapter.find_file_hash("unknown"))
+        self.assertEqual(self.db.fs.files.lookups, 2)
+        self.assertNotIn("unknown", self.adapter.file_hashes)
+
+    def test_forget(self):
+        """A forgotten hash is looked up again"""
+
+        self.adapter.find_file_hash("known")
+        self.adapter.forget_file_hash("known")
+        self.adapter.find_file_hash("known")
+        self.assertEqual(self.db.fs.files.lookups, 2)
+
+class TestResultWriters(unittest.TestCase):
+    """Saving plugin results on the writer threads"""
+
+    def setUp(self):
+        self.adapter = mongodb_adapter.Database()
+        self.saved = []
+        self.touched = []
+        self.lock = threading.Lock()
+        self.adapter.save_plugin_result = self.save_plugin_result
+        self.adapter.touch_session = lambda session_id, timestamp: self.touched.append((session_id, timestamp))
+
+    def tearDown(self):
+        self.adapter.stop_result_writers()
+
+    def save_plugin_result(self, plugin_result, update_session=True):
+        """Record the result and the thread saving it, at uneven speeds"""
+
+        time.sleep(random.random() * 0.002)
+        with self.lock:
+            self.saved.append((plugin_result["process"]["result_id"],
+                               plugin_result["sequence"],
+                               threading.current_thread().name))
+
+    def test_results_in_order(self):
+        """Results for one result_id are saved in order by one writer"""
+
+        for sequence in range(20):
+            for result_id in ("a", "b", "c", "d", "e"):
+                self.adapter.queue_plugin_result({"process":{"result_id":result_id,
+                                                             "session_id":"session"},
+                                                  "timestamp":sequence,
+                                                  "sequence":sequence})
+        self.adapter.stop_result_writers()
+
+        self.assertEqual(len(self.saved), 100)
+        for result_id in ("a", "b", "c", "d", "e"):
+            saved = [entry for entry in self.saved if entry[0] == result_id]
+            self.assertEqual([entry[1] for entry in saved], range(20))
+            self.assertEqual(len(set(entry[2] for entry in saved)), 1)
+
+        # Sessions are touched with the latest timestamp
+        self.assertEqual(max(self.touched), ("session", 19))
+
+if __name__ == "__main__":
+
+    unittest.main(verbosity=2)
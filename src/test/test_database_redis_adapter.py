@@ -0,0 +1,136 @@
+"""Tests for database.redis_adapter"""
+
+"""
+This file is part of RAPD
+
+Copyright (C) 2018, Cornell University
+All rights reserved.
+
+RAPD is free software: you can redistribute it and/or modify
+it under the terms of the GNU Affero General Public License as published by
+the Free Software Foundation, version 3.
+
+RAPD is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU Affero General Public License for more details.
+
+You should have received a copy of the GNU Affero General Public License
+along with this program.  If not, see <http://www.gnu.org/licenses/>.
+"""
+
+__created__ = "2026-10-18"
+__maintainer__ = "Frank Murphy"
+__email__ = "fmurphy@anl.gov"
+__status__ = "Development"
+
+# Standard imports
+import json
+import unittest
+
+# RAPD imports
+import fakeredis
+import database.redis_adapter as redis_adapter
+
+KEY = "RAPD_JOBS"
+
+class FakeRedisDatabase(redis_adapter.Database):
+    """Talks to an in-process redis instead of connecting"""
+
+    def _connect(self):
+        self.redis = fakeredis.FakeStrictRedis()
+
+class TestReliableQueue(unittest.TestCase):
+    """Reservation, acknowledgement and redelivery of queued jobs"""
+
+    def setUp(self):
+        self.db = FakeRedisDatabase()
+        self.db.redis.flushall()
+
+    def test_ack_removes_lease(self):
+        """Acked jobs leave neither the in-flight list nor a lease behind"""
+        job_id = self.db.enqueue_job(KEY, {"command":"INDEX"})
+        job, raw = self.db.reserve_job(KEY, timeout=1)
+        self.assertEqual(job["job_id"], job_id)
+
+        # Start the lease clock
+        self.assertEqual(self.db.requeue_expired_jobs(KEY), (0, 0))
+        self.assertTrue(self.db.redis.hexists(KEY+redis_adapter.LEASES_SUFFIX, job_id))
+
+        self.assertTrue(self.db.ack_job(KEY, raw))
+        self.assertEqual(self.db.redis.llen(KEY+redis_adapter.INFLIGHT_SUFFIX), 0)
+        self.assertFalse(self.db.redis.hexists(KEY+redis_adapter.LEASES_SUFFIX, job_id))
+        self.assertFalse(self.db.ack_job(KEY, raw))
+
+    def test_redelivery_after_visibility_timeout(self):
+        """Expired jobs go back to be taken next, with their delivery counted"""
+        first_id = self.db.enqueue_job(KEY, {"command":"INDEX"})
+        self.db.enqueue_job(KEY, {"command":"INTEGRATE"})
+        self.db.reserve_job(KEY, timeout=1)
+
+        # Not expired yet
+        self.assertEqual(self.db.requeue_expired_jobs(KEY), (0, 0))
+        self.assertEqual(self.db.redis.llen(KEY+redis_adapter.INFLIGHT_SUFFIX), 1)
+
+        self.assertEqual(self.db.requeue_expired_jobs(KEY, visibility_timeout=0), (1, 0))
+        self.assertEqual(self.db.redis.llen(KEY+redis_adapter.INFLIGHT_SUFFIX), 0)
+        self.assertEqual(self.db.redis.hlen(KEY+redis_adapter.LEASES_SUFFIX), 0)
+
+        job, __ = self.db.reserve_job(KEY, timeout=1)
+        self.assertEqual(job["job_id"], first_id)
+        self.assertEqual(job["deliveries"], 2)
+
+    def test_dead_letter_at_max_deliveries(self):
+        """Jobs delivered max_deliveries times are dead-lettered"""
+        job_id = self.db.enqueue_job(KEY, {"command":"INDEX"})
+
+        for delivery in range(1, redis_adapter.MAX_DELIVERIES):
+            job, __ = self.db.reserve_job(KEY, timeout=1)
+            self.assertEqual(job.get("deliveries", 1), delivery)
+            self.assertEqual(self.db.requeue_expired_jobs(KEY, visibility_timeout=0), (1, 0))
+
+        self.db.reserve_job(KEY, timeout=1)
+        self.assertEqual(self.db.requeue_expired_jobs(KEY, visibility_timeout=0), (0, 1))
+
+        self.assertEqual(self.db.redis.llen(KEY), 0)
+        self.assertEqual(self.db.redis.llen(KEY+redis_adapter.INFLIGHT_SUFFIX), 0)
+        self.assertEqual(self.db.redis.hlen(KEY+redis_adapter.LEASES_SUFFIX), 0)
+        dead = json.loads(self.db.redis.lindex(KEY+redis_adapter.DEAD_SUFFIX, 0))
+        self.assertEqual(dead["job_id"], job_id)
+        self.assertEqual(dead["deliveries"], redis_adapter.MAX_DELIVERIES+1)
+
+    def test_stale_leases_removed(self):
+        """Leases of jobs acked before the reaper saw them go are dropped"""
+        self.db.enqueue_job(KEY, {"command":"INDEX"})
+        __, raw = self.db.reserve_job(KEY, timeout=1)
+        self.db.requeue_expired_jobs(KEY)
+
+        # An ack that lost its lease removal, as by an older client
+        self.db.redis.lrem(KEY+redis_adapter.INFLIGHT_SUFFIX, 1, raw)
+        self.db.redis.hset(KEY+redis_adapter.LEASES_SUFFIX, "gone", 0)
+
+        self.assertEqual(self.db.requeue_expired_jobs(KEY), (0, 0))
+        self.assertEqual(self.db.redis.hlen(KEY+redis_adapter.LEASES_SUFFIX), 0)
+
+    def test_requeue_skips_job_taken_by_other_reaper(self):
+        """A job another reaper already moved is not pushed twice"""
+        self.db.enqueue_job(KEY, {"command":"INDEX"})
+        __, raw = self.db.reserve_job(KEY, timeout=1)
+        self.db.requeue_expired_jobs(KEY)
+
+        moved = self.db.redis.eval(redis_adapter.MOVE_JOB_SCRIPT,
+                                   3,
+                                   KEY+redis_adapter.INFLIGHT_SUFFIX,
+                                   KEY,
+                                   KEY+redis_adapter.LEASES_SUFFIX,
+                                   raw,
+                                   raw,
+                                   "RPUSH",
+                                   redis_adapter.get_job_id(raw))
+        self.assertEqual(moved, 1)
+        self.assertEqual(self.db.requeue_expired_jobs(KEY, visibility_timeout=0), (0, 0))
+        self.assertEqual(self.db.redis.llen(KEY), 1)
+
+if __name__ == "__main__":
+
+    unittest.main(verbosity=2)
@@ -0,0 +1,143 @@
+"""Tests for detectors.cbf_header"""
+
+"""
+This file is part of RAPD
+
+Copyright (C) 2018, Cornell University
+All rights reserved.
+
+RAPD is free software: you can redistribute it and/or modify
+it under the terms of the GNU Affero General Public License as published by
+the Free Software Foundation, version 3.
+
+RAPD is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU Affero General Public License for more details.
+
+You should have received a copy of the GNU Affero General Public License
+along with this program.  If not, see <http://www.gnu.org/licenses/>.
+"""
+
+__created__ = "2026-10-18"
+__maintainer__ = "Frank Murphy"
+__email__ = "fmurphy@anl.gov"
+__status__ = "Development"
+
+# Standard imports
+import os
+import shutil
+import tempfile
+import unittest
+
+# RAPD imports
+import detectors.cbf_header as cbf_header
+
+HEADER = """###CBF: VERSION 1.5, CBFlib v0.7.8 - PILATUS detectors
+
+data_thaum1_01s-01d_1_0001
+
+_array_data.header_convention "PILATUS_1.2"
+_array_data.header_contents
+;
+# Detector: PILATUS3 6M, S/N 60-0123
+# 2018-03-01T10:11:12.123
+# Pixel_size 172e-6 m x 172e-6 m
+# Exposure_time 0.2000000 s
+# Wavelength 0.97918 A
+# Detector_distance 0.30000 m
+# Start_angle 10.0000 deg.
+# Angle_increment 0.2000 deg.
+;
+
+_array_data.data
+;
+--CIF-BINARY-FORMAT-SECTION--
+Content-Type: application/octet-stream;
+X-Binary-Size-Fastest-Dimension: 2463
+X-Binary-Size-Padding: 4095
+
+"""
+
+ITEMS = {
+    "detector_sn": ("S\/N ([\w\d\-]*)\s*", lambda x: str(x)),
+    "distance": ("^# Detector_distance\s*([\d\.]+) m", cbf_header.mmorm),
+    "osc_start": ("^# Start_angle\s*([\d\.]+)\s*deg", lambda x: float(x)),
+    "time": ("^# Exposure_time\s*([\d\.]+) s", lambda x: float(x)),
+    "wavelength": ("^# Wavelength\s*([\d\.]+) A", lambda x: float(x)),
+    "twotheta": ("^# Detector_2theta\s*([\d\.]*)\s*deg", lambda x: float(x)),
+    "version": ("^###CBF: VERSION ([\d\.]+)", lambda x: str(x)),
+    }
+
+class TestCbfHeader(unittest.TestCase):
+    """Reading and parsing of miniCBF text headers"""
+
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def write_image(self, header, binary_size=20000):
+        """Write header followed by binary data and return the file name"""
+        fullname = os.path.join(self.tmp_dir, "image.cbf")
+        with open(fullname, "wb") as image:
+            image.write(header)
+            image.write("\x0c\x1a\x04\xd5")
+            image.write("\xff" * binary_size)
+        return fullname
+
+    def test_read_stops_at_padding_line(self):
+        """The header ends with the X-Binary-Size-Padding line"""
+
+        header = cbf_header.read_header_block(self.write_image(HEADER))
+        self.assertTrue(header.endswith("X-Binary-Size-Padding: 4095\n"))
+        self.assertEqual(header, HEADER[:HEADER.index("\n\n", HEADER.index("Padding")) + 1])
+
+    def test_read_marker_across_blocks(self):
+        """A marker split between two reads is still found"""
+
+        padding = " " * (cbf_header.READ_BLOCK - HEADER.index("X-Binary-Size-Padding") - 5)
+        header = HEADER.replace("--CIF", padding + "--CIF")
+        self.assertTrue(cbf_header.read_header_block(self.write_image(header))
+                        .endswith("X-Binary-Size-Padding: 4095\n"))
+
+    def test_read_without_marker_is_bounded(self):
+        """A file with no marker returns at most MAX_HEADER_BYTES"""
+
+        fullname = self.write_image("#" * 100, binary_size=2 * cbf_header.MAX_HEADER_BYTES)
+        header = cbf_header.read_header_block(fullname)
+        self.assertEqual(len(header), cbf_header.MAX_HEADER_BYTES)
+
+    def test_read_missing_file(self):
+        """A file that cannot be opened raises IOError"""
+
+        self.assertRaises(IOError,
+                          cbf_header.read_header_block,
+                          os.path.join(self.tmp_dir, "missing.cbf"),
+                          attempts=1)
+
+    def test_parse_header(self):
+        """Values are typed, missing items are None and the first line matches"""
+
+        parameters = cbf_header.parse_header(HEADER,
+                                             cbf_header.compile_header_items(ITEMS),
+                                             {"site":"test"})
+        self.assertEqual(parameters, {"site":"test",
+                                      "detector_sn":"60-0123",
+                                      "distance":300.0,
+                                      "osc_start":10.0,
+                                      "time":0.2,
+                                      "wavelength":0.97918,
+                                      "twotheta":None,
+                                      "version":"1.5"})
+
+    def test_mmorm(self):
+        """Distances in m are converted, those in mm are not"""
+
+        self.assertEqual(cbf_header.mmorm("0.3"), 300.0)
+        self.assertEqual(cbf_header.mmorm("250.0"), 250.0)
+
+if __name__ == "__main__":
+
+    unittest.main(verbosity=2)
@@ -0,0 +1,113 @@
+"""Tests for launch.job_scheduler"""
+
+"""
+This file is part of RAPD
+
+Copyright (C) 2018, Cornell University
+All rights reserved.
+
+RAPD is free software: you can redistribute it and/or modify
+it under the terms of the GNU Affero General Public License as published by
+the Free Software Foundation, version 3.
+
+RAPD is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU Affero General Public License for more details.
+
+You should have received a copy of the GNU Affero General Public License
+along with this program.  If not, see <http://www.gnu.org/licenses/>.
+"""
+
+__created__ = "2026-10-18"
+__maintainer__ = "Frank Murphy"
+__email__ = "fmurphy@anl.gov"
+__status__ = "Development"
+
+# Standard imports
+import unittest
+
+# RAPD imports
+import launch.job_scheduler as job_scheduler
+
+def make_job(command, site_tag, number):
+    """Return a job dict for a site"""
+    return {"command":command, "image1":{"site_tag":site_tag}, "number":number}
+
+class TestJobScheduler(unittest.TestCase):
+    """Ordering of held jobs by priority, fair share and arrival"""
+
+    def drain(self, scheduler):
+        """Dispatch everything in candidate order and return the numbers"""
+        order = []
+        while len(scheduler):
+            job, raw = scheduler.candidates()[0]
+            scheduler.remove(job)
+            order.append(raw)
+        return order
+
+    def test_get_priority(self):
+        """Compound commands take the priority of their leading word"""
+
+        self.assertEqual(job_scheduler.get_priority("INDEX"), 0)
+        self.assertEqual(job_scheduler.get_priority("INDEX+STRATEGY"), 0)
+        self.assertEqual(job_scheduler.get_priority("MR"), 3)
+        self.assertEqual(job_scheduler.get_priority("UNKNOWN"),
+                         job_scheduler.DEFAULT_PRIORITY)
+
+    def test_priority_then_arrival(self):
+        """Higher priority classes go first, then jobs in the order added"""
+
+        scheduler = job_scheduler.JobScheduler()
+        scheduler.add(make_job("MR", "A", 1), 1)
+        scheduler.add(make_job("INTEGRATE", "A", 2), 2)
+        scheduler.add(make_job("INDEX", "A", 3), 3)
+        scheduler.add(make_job("INTEGRATE", "A", 4), 4)
+
+        self.assertEqual(len(scheduler), 4)
+        self.assertEqual(self.drain(scheduler), [3, 2, 4, 1])
+        self.assertEqual(scheduler.queues, {})
+
+    def test_fair_share(self):
+        """Sites alternate by share within a priority class"""
+
+        scheduler = job_scheduler.JobScheduler(shares={"A":2})
+        for number in range(6):
+            scheduler.add(make_job("INDEX", "A", number), "A%d" % number)
+        for number in range(3):
+            scheduler.add(make_job("INDEX", "B", number), "B%d" % number)
+
+        self.assertEqual(self.drain(scheduler),
+                         ["A0", "B0", "A1", "A2", "B1", "A3", "A4", "B2", "A5"])
+
+    def test_idle_site_cannot_burst(self):
+        """A site that was idle starts level with the busy sites"""
+
+        scheduler = job_scheduler.JobScheduler()
+        for number in range(4):
+            scheduler.add(make_job("INDEX", "A", number), "A%d" % number)
+        for __ in range(3):
+            scheduler.remove(scheduler.candidates()[0][0])
+
+        for number in range(2):
+            scheduler.add(make_job("INDEX", "B", number), "B%d" % number)
+
+        self.assertEqual(self.drain(scheduler), ["A3", "B0", "B1"])
+
+    def test_stats(self):
+        """Dispatched and waiting jobs are counted per priority and site"""
+
+        scheduler = job_scheduler.JobScheduler()
+        scheduler.add(make_job("INDEX", "A", 1), 1)
+        scheduler.add(make_job("INDEX", "A", 2), 2)
+        scheduler.remove(scheduler.candidates()[0][0])
+
+        stats = scheduler.get_stats()
+        self.assertEqual(stats.keys(), ["0:A"])
+        self.assertEqual(stats["0:A"]["count"], 1)
+        self.assertEqual(stats["0:A"]["waiting"], 1)
+        self.assertGreaterEqual(stats["0:A"]["max_wait"], 0.0)
+
+if __name__ == "__main__":
+
+    unittest.main(verbosity=2)
@@ -0,0 +1,145 @@
+"""Tests for launch.launcher_adapters.shell_warm"""
+
+"""
+This file is part of RAPD
+
+Copyright (C) 2018, Cornell University
+All rights reserved.
+
+RAPD is free software: you can redistribute it and/or modify
+it under the terms of the GNU Affero General Public License as published by
+the Free Software Foundation, version 3.
+
+RAPD is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU Affero General Public License for more details.
+
+You should have received a copy of the GNU Affero General Public License
+along with this program.  If not, see <http://www.gnu.org/licenses/>.
+"""
+
+__created__ = "2026-10-18"
+__maintainer__ = "Frank Murphy"
+__email__ = "fmurphy@anl.gov"
+__status__ = "Development"
+
+# Standard imports
+import imp
+import logging
+import os
+import shutil
+import sys
+import tempfile
+import time
+import unittest
+
+# RAPD imports
+import launch
+import launch.launcher_adapters.shell_warm as shell_warm
+import utils.site
+
+class FakeLaunch(object):
+    """
+    Stands in for rapd_launch.Launch, writing the worker PID and site to the
+    command file, or killing the worker for a command file ending in "die"
+    """
+
+    def __init__(self, site, command_file):
+        if command_file.endswith("die"):
+            os._exit(1)
+        with open(command_file, "w") as output_file:
+            output_file.write("%d %s" % (os.getpid(), site.__name__))
+        self.plugin_process = None
+        self.new_logger = logging.getLogger("RAPDLogger")
+
+class TestWarmPool(unittest.TestCase):
+    """Running jobs in warm workers and replacing dead ones"""
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+
+        # The workers are forked, so they see these in place of the real ones
+        fake_launch = imp.new_module("launch.rapd_launch")
+        fake_launch.Launch = FakeLaunch
+        self.saved = (sys.modules.get("launch.rapd_launch"),
+                      getattr(launch, "rapd_launch", None),
+                      utils.site.determine_site)
+        sys.modules["launch.rapd_launch"] = fake_launch
+        launch.rapd_launch = fake_launch
+        sys.modules["fake_site"] = imp.new_module("fake_site")
+        utils.site.determine_site = lambda site_arg=False: "fake_site"
+
+        self.pool = shell_warm.WarmPool(size=1, warm_modules=())
+
+    def tearDown(self):
+        self.pool.stop()
+
+        saved_module, saved_attribute, utils.site.determine_site = self.saved
+        if saved_module:
+            sys.modules["launch.rapd_launch"] = saved_module
+        else:
+            del sys.modules["launch.rapd_launch"]
+        if saved_attribute:
+            launch.rapd_launch = saved_attribute
+        else:
+            del launch.rapd_launch
+        del sys.modules["fake_site"]
+
+        shutil.rmtree(self.directory)
+
+    def wait_for(self, test):
+        """Wait up to 10 s for test() to be true"""
+        for __ in range(1000):
+            if test():
+                return True
+            time.sleep(0.01)
+        return False
+
+    def run_job(self, name):
+        """Submit a job and return what it wrote"""
+        command_file = os.path.join(self.directory, name)
+        open(command_file, "w").close()
+        self.pool.submit("SITE", command_file)
+        self.assertTrue(self.wait_for(lambda: os.path.getsize(command_file)))
+        self.assertTrue(self.wait_for(lambda: self.pool.busy.value == 0))
+        pid, site = open(command_file).read().split()
+        return int(pid), site
+
+    def test_jobs_run_in_prestarted_worker(self):
+        """Queued jobs run in the worker started with the pool"""
+
+        worker_pid = self.pool.workers[0].pid
+
+        self.assertEqual(self.run_job("first"), (worker_pid, "fake_site"))
+        self.assertEqual(self.run_job("second"), (worker_pid, "fake_site"))
+        self.assertEqual(self.pool.workers[0].pid, worker_pid)
+
+    def test_dead_worker_replaced(self):
+        """A worker that dies is replaced and its job is no longer counted"""
+
+        dead_pid = self.pool.workers[0].pid
+        self.pool.submit("SITE", os.path.join(self.directory, "die"))
+        self.assertTrue(self.wait_for(lambda: not self.pool.workers[0].is_alive()))
+        self.assertEqual(self.pool.busy.value, 1)
+
+        self.assertEqual(self.pool.replace_dead(), 1)
+        self.assertEqual(self.pool.busy.value, 0)
+        self.assertNotEqual(self.pool.workers[0].pid, dead_pid)
+        self.assertEqual(self.pool.replace_dead(), 0)
+
+        pid, __ = self.run_job("after")
+        self.assertEqual(pid, self.pool.workers[0].pid)
+
+    def test_submit_replaces_dead_worker(self):
+        """Submitting to a pool whose worker died still runs the job"""
+
+        self.pool.submit("SITE", os.path.join(self.directory, "die"))
+        self.assertTrue(self.wait_for(lambda: not self.pool.workers[0].is_alive()))
+
+        pid, __ = self.run_job("after")
+        self.assertEqual(pid, self.pool.workers[0].pid)
+
+if __name__ == "__main__":
+
+    unittest.main(verbosity=2)
@@ -0,0 +1,148 @@
+"""Tests for plugins.pdbquery.cell_index"""
+
+"""
+This file is part of RAPD
+
+Copyright (C) 2018, Cornell University
+All rights reserved.
+
+RAPD is free software: you can redistribute it and/or modify
+it under the terms of the GNU Affero General Public License as published by
+the Free Software Foundation, version 3.
+
+RAPD is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU Affero General Public License for more details.
+
+You should have received a copy of the GNU Affero General Public License
+along with this program.  If not, see <http://www.gnu.org/licenses/>.
+"""
+
+__created__ = "2026-10-18"
+__maintainer__ = "Frank Murphy"
+__email__ = "fmurphy@anl.gov"
+__status__ = "Development"
+
+# Standard imports
+import os
+import Queue
+import shutil
+import tempfile
+import unittest
+
+# RAPD imports
+import plugins.pdbquery.cell_index as cell_index
+
+CRYSTAL_LINES = [
+    "IDCODE       CELL_A   CELL_B   CELL_C  ALPHA   BETA  GAMMA  SPACEGROUP",
+    "------       ------   ------   ------  -----   ----  -----  ----------",
+    "1abc          50.00    60.00    70.00  90.00  90.00  90.00  P 21 21 21",
+    "2abc          50.20    60.10    70.30  90.00  90.00  90.00  P 21 21 21",
+    "3abc          55.00    66.00    77.00  90.00  90.00  90.00  P 21 21 21",
+    "4abc          80.00    80.00   120.00  90.00  90.00 120.00  P 61",
+    "1nmr           1.00     1.00     1.00  90.00  90.00  90.00  P 1",
+]
+
+COMPOUND_LINES = [
+    "1ABC\tLYSOZYME",
+    "2ABC\tLYSOZYME MUTANT",
+    "4ABC\tTHAUMATIN",
+]
+
+class TestCellIndex(unittest.TestCase):
+    """Building, searching and saving the cell index"""
+
+    def setUp(self):
+        # Test the sorted reduction whether or not cctbx is here
+        self.uctbx = cell_index.uctbx
+        cell_index.uctbx = None
+        self.index = cell_index.CellIndex.build(CRYSTAL_LINES, COMPOUND_LINES)
+        self.directory = tempfile.mkdtemp()
+
+    def tearDown(self):
+        cell_index.uctbx = self.uctbx
+        shutil.rmtree(self.directory)
+
+    def test_build_skips_headers_and_placeholders(self):
+        """Header lines and placeholder cells are left out"""
+
+        self.assertEqual(sorted(self.index.codes), ["1ABC", "2ABC", "3ABC", "4ABC"])
+        descriptions = dict(zip(self.index.codes, self.index.descriptions))
+        self.assertEqual(descriptions["2ABC"], "LYSOZYME MUTANT")
+        self.assertEqual(descriptions["3ABC"], "")
+
+    def test_search_nearest_first(self):
+        """Entries come nearest first and far ones are left out"""
+
+        found = self.index.search([50.0, 60.0, 70.0, 90.0, 90.0, 90.0], limit=10, max_distance=0.05)
+
+        self.assertEqual([code for code, __, __ in found], ["1ABC", "2ABC"])
+        self.assertAlmostEqual(found[0][1], 0.0)
+        # The largest relative difference is in c
+        self.assertAlmostEqual(found[1][1], 0.3 / 70.0)
+        self.assertEqual(found[0][2], "LYSOZYME")
+
+    def test_search_reduces_query(self):
+        """A cell with its edges in another order finds the same entry"""
+
+        found = self.index.search([70.0, 50.0, 60.0, 90.0, 90.0, 90.0], limit=1)
+
+        self.assertEqual(found[0][0], "1ABC")
+
+    def test_search_limit_and_within(self):
+        """limit caps the entries, except those closer than within"""
+
+        query = [50.0, 60.0, 70.0, 90.0, 90.0, 90.0]
+
+        self.assertEqual(len(self.index.search(query, limit=1)), 1)
+        self.assertEqual(len(self.index.search(query, limit=1, within=0.01)), 2)
+
+    def test_save_and_load(self):
+        """An index read back matches the one saved"""
+
+        path = os.path.join(self.directory, "cells", "index.npz")
+        self.index.save(path)
+        loaded = cell_index.CellIndex.load(path)
+
+        self.assertEqual(list(loaded.codes), list(self.index.codes))
+        self.assertEqual(loaded.descriptions, self.index.descriptions)
+        self.assertAlmostEqual(loaded.built, self.index.built)
+        self.assertEqual(os.listdir(os.path.dirname(path)), ["index.npz"])
+
+    def test_refresh_held_by_another(self):
+        """A refresh does nothing while another holds the lock"""
+
+        path = os.path.join(self.directory, "index.npz")
+        open(path + ".lock", "w").close()
+
+        self.assertIsNone(cell_index.refresh_index(path))
+        self.assertFalse(os.path.exists(path))
+
+    def test_get_index_refreshes_old(self):
+        """An old index is returned and rebuilt in the background"""
+
+        path = os.path.join(self.directory, "index.npz")
+        refreshed = Queue.Queue()
+        refresh_index = cell_index.refresh_index
+        cell_index.refresh_index = lambda path, logger: refreshed.put(path)
+        try:
+            # None yet, so one is built
+            self.assertIsNone(cell_index.get_index(path))
+            self.assertEqual(refreshed.get(timeout=5), path)
+
+            # Up to date
+            self.index.save(path)
+            self.assertEqual(len(cell_index.get_index(path)), 4)
+
+            # Out of date
+            self.assertEqual(len(cell_index.get_index(path, max_age=-1)), 4)
+            self.assertEqual(refreshed.get(timeout=5), path)
+        finally:
+            cell_index.refresh_index = refresh_index
+
+        self.assertTrue(refreshed.empty())
+
+if __name__ == "__main__":
+
+    unittest.main(verbosity=2)
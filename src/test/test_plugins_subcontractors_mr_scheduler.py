@@ -0,0 +1,121 @@
+"""Tests for plugins.subcontractors.mr_scheduler"""
+
+"""
+This file is part of RAPD
+
+Copyright (C) 2018, Cornell University
+All rights reserved.
+
+RAPD is free software: you can redistribute it and/or modify
+it under the terms of the GNU Affero General Public License as published by
+the Free Software Foundation, version 3.
+
+RAPD is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU Affero General Public License for more details.
+
+You should have received a copy of the GNU Affero General Public License
+along with this program.  If not, see <http://www.gnu.org/licenses/>.
+"""
+
+__created__ = "2026-10-18"
+__maintainer__ = "Frank Murphy"
+__email__ = "fmurphy@anl.gov"
+__status__ = "Development"
+
+# Standard imports
+import unittest
+
+# RAPD imports
+import plugins.subcontractors.mr_scheduler as mr_scheduler
+
+SOLVED = {"solution": True, "tfz": "12.1", "gain": "250.3"}
+MARGINAL = {"solution": True, "tfz": "6.5", "gain": "250.3"}
+UNSOLVED = {"solution": False}
+
+class TestIsDefinitive(unittest.TestCase):
+    """Which Phaser results end the search"""
+
+    def test_solved(self):
+        """A solution past both thresholds is definitive"""
+        self.assertTrue(mr_scheduler.is_definitive(SOLVED))
+
+    def test_thresholds(self):
+        """A solution short of either threshold is not"""
+        self.assertFalse(mr_scheduler.is_definitive(MARGINAL))
+        self.assertFalse(mr_scheduler.is_definitive({"solution": True, "tfz": "9.0", "gain": "40.0"}))
+        self.assertTrue(mr_scheduler.is_definitive(MARGINAL, tfz=6.0))
+
+    def test_not_a_solution(self):
+        """No solution, or scores Phaser could not give, are not definitive"""
+        self.assertFalse(mr_scheduler.is_definitive(UNSOLVED))
+        self.assertFalse(mr_scheduler.is_definitive({"solution": True, "tfz": "NC", "gain": "250.3"}))
+        self.assertFalse(mr_scheduler.is_definitive({"solution": True}))
+
+class TestMRScheduler(unittest.TestCase):
+    """Launch order, job limit and early stopping of the scheduler"""
+
+    def setUp(self):
+        self.launched = []
+        self.scheduler = mr_scheduler.MRScheduler(
+            launch=lambda job_description: self.launched.append(job_description["name"]),
+            max_jobs=2)
+
+    def submit(self, *ranked):
+        for name, rank in ranked:
+            self.scheduler.submit({"name": name}, rank)
+
+    def test_max_jobs_in_rank_order(self):
+        """Up to max_jobs run and the rest start best ranked first"""
+
+        self.submit(("c", 3), ("a", 1), ("d", 4), ("b", 2))
+        self.assertEqual(self.launched, ["c", "a"])
+
+        self.assertFalse(self.scheduler.done("c", UNSOLVED))
+        self.assertEqual(self.launched, ["c", "a", "b"])
+
+        self.assertFalse(self.scheduler.done("a", MARGINAL))
+        self.assertEqual(self.launched, ["c", "a", "b", "d"])
+        self.assertEqual(self.scheduler.running, 2)
+
+    def test_definitive_stops(self):
+        """A definitive solution stops launching and hands back the held jobs"""
+
+        self.submit(("a", 1), ("b", 2), ("d", 4), ("c", 3))
+
+        self.assertTrue(self.scheduler.done("a", SOLVED))
+        self.assertEqual(self.scheduler.solved, "a")
+        self.assertEqual(self.launched, ["a", "b"])
+        self.assertEqual([job["name"] for job in self.scheduler.cancel()], ["c", "d"])
+        self.assertEqual(self.scheduler.cancel(), [])
+
+        # Nothing more is taken or started
+        self.assertFalse(self.scheduler.submit({"name": "e"}))
+        self.assertFalse(self.scheduler.done("b", SOLVED))
+        self.assertEqual(self.launched, ["a", "b"])
+
+    def test_no_early_stop(self):
+        """Without early_stop every job runs"""
+
+        self.scheduler.early_stop = False
+        self.submit(("a", 1), ("b", 2), ("c", 3))
+
+        self.assertFalse(self.scheduler.done("a", SOLVED))
+        self.assertEqual(self.launched, ["a", "b", "c"])
+
+    def test_description_copied(self):
+        """The caller can reuse the description it submitted"""
+
+        self.scheduler.max_jobs = 1
+        job_description = {"name": "a"}
+        self.scheduler.submit(job_description)
+        job_description["name"] = "b"
+        self.scheduler.submit(job_description)
+
+        self.assertEqual(self.launched, ["a"])
+        self.assertEqual([job["name"] for job in self.scheduler.cancel()], ["b"])
+
+if __name__ == "__main__":
+
+    unittest.main(verbosity=2)
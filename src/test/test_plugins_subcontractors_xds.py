@@ -0,0 +1,173 @@
+"""Tests for the CORRECT.LP resolution cutoff in plugins.subcontractors.xds"""
+
+"""
+This file is part of RAPD
+
+Copyright (C) 2018, Cornell University
+All rights reserved.
+
+RAPD is free software: you can redistribute it and/or modify
+it under the terms of the GNU Affero General Public License as published by
+the Free Software Foundation, version 3.
+
+RAPD is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU Affero General Public License for more details.
+
+You should have received a copy of the GNU Affero General Public License
+along with this program.  If not, see <http://www.gnu.org/licenses/>.
+"""
+
+__created__ = "2026-10-18"
+__maintainer__ = "Frank Murphy"
+__email__ = "fmurphy@anl.gov"
+__status__ = "Development"
+
+# Standard imports
+import os
+import shutil
+import tempfile
+import unittest
+
+# Nonstandard imports
+import numpy
+
+# RAPD imports
+from plugins.subcontractors.xds import get_shells_from_correctlp, get_resolution_cutoff
+
+# Statistics by resolution shell laid out as CORRECT.LP writes them, with an
+# earlier table that is superseded by the last one
+CORRECT_LP = """
+ ******************************************************************************
+                    CORRECT ***
+ ******************************************************************************
+
+ SUBSET OF INTENSITY DATA WITH SIGNAL/NOISE >= -3.0 AS FUNCTION OF RESOLUTION
+ RESOLUTION     NUMBER OF REFLECTIONS    COMPLETENESS R-FACTOR  R-FACTOR COMPARED I/SIGMA   R-meas  CC(1/2)  Anomal  SigAno   Nano
+   LIMIT     OBSERVED  UNIQUE  POSSIBLE     OF DATA   observed  expected                                      Corr
+
+     5.37        9874    1402      1421       98.7%       2.9%      3.1%     9862  120.30      3.1%    99.9*    -4    0.812    1188
+     3.80       17513    2421      2433       99.5%       3.3%      3.5%    17498  105.60      3.6%    99.9*    -2    0.844    2211
+     3.10       22687    3078      3091       99.6%       4.6%      4.8%    22671   75.90      4.9%    99.8*     1    0.861    2862
+     2.69       26521    3611      3624       99.6%       7.5%      7.8%    26503   51.00      8.1%    99.5*     3    0.902    3380
+     2.40       30209    4062      4076       99.7%      12.1%     12.5%    30185   33.60     13.0%    99.0*     2    0.871    3820
+     2.19       32894    4448      4463       99.7%      20.4%     21.2%    32870   20.40     21.9%    97.1*     0    0.823    4190
+     2.03       35671    4819      4836       99.6%      34.8%     36.1%    35643   12.30     37.4%    91.2*    -1    0.790    4541
+     1.90       37816    5132      5151       99.6%      58.2%     60.5%    37788    7.50     62.6%    76.5*     1    0.771    4838
+     1.79       39722    5434      5458       99.6%      83.0%     87.4%    39690    5.70     89.2%    55.3*    -2    0.744    5121
+     1.70       38914    5687      5772       98.5%     141.9%    149.3%    38870    2.70    153.2%    28.0*     0    0.702    5263
+    total      291821   39994     40155       99.6%       7.9%      8.2%   291680   11.43      8.5%    99.9*    0    0.802   37414
+
+ STATISTICS OF SAVED DATA SET "XDS_ASCII.HKL" (DATA_RANGE=       1     360)
+ FILE TYPE:         XDS_ASCII      MERGE=FALSE          FRIEDEL'S_LAW=FALSE
+
+ SUBSET OF INTENSITY DATA WITH SIGNAL/NOISE >= -3.0 AS FUNCTION OF RESOLUTION
+ RESOLUTION     NUMBER OF REFLECTIONS    COMPLETENESS R-FACTOR  R-FACTOR COMPARED I/SIGMA   R-meas  CC(1/2)  Anomal  SigAno   Nano
+   LIMIT     OBSERVED  UNIQUE  POSSIBLE     OF DATA   observed  expected                                      Corr
+
+     5.37        9874    1402      1421       98.7%       2.9%      3.1%     9862   40.10      3.1%    99.9*    -4    0.812    1188
+     3.80       17513    2421      2433       99.5%       3.3%      3.5%    17498   35.20      3.6%    99.9*    -2    0.844    2211
+     3.10       22687    3078      3091       99.6%       4.6%      4.8%    22671   25.30      4.9%    99.8*     1    0.861    2862
+     2.69       26521    3611      3624       99.6%       7.5%      7.8%    26503   17.00      8.1%    99.5*     3    0.902    3380
+     2.40       30209    4062      4076       99.7%      12.1%     12.5%    30185   11.20     13.0%    99.0*     2    0.871    3820
+     2.19       32894    4448      4463       99.7%      20.4%     21.2%    32870    6.80     21.9%    97.1*     0    0.823    4190
+     2.03       35671    4819      4836       99.6%      34.8%     36.1%    35643    4.10     37.4%    91.2*    -1    0.790    4541
+     1.90       37816    5132      5151       99.6%      58.2%     60.5%    37788    2.50     62.6%    76.5*     1    0.771    4838
+     1.79       39722    5434      5458       99.6%      83.0%     87.4%    39690    1.90     89.2%    55.3*    -2    0.744    5121
+     1.70       38914    5687      5772       98.5%     141.9%    149.3%    38870    0.90    153.2%    28.0*     0    0.702    5263
+    total      291821   39994     40155       99.6%       7.9%      8.2%   291680   11.43      8.5%    99.9*    0    0.802   37414
+
+    NUMBER OF REFLECTIONS IN SELECTED SUBSET OF IMAGES  291821
+"""
+
+class TestResolutionCutoff(unittest.TestCase):
+    """Resolution cutoff from the CORRECT.LP statistics by shell"""
+
+    def setUp(self):
+
+        self.tmp_dir = tempfile.mkdtemp()
+        self.correctlp = os.path.join(self.tmp_dir, "CORRECT.LP")
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def write(self, text):
+        with open(self.correctlp, "w") as correct_lp:
+            correct_lp.write(text)
+
+    def test_last_table_parsed(self):
+        """The shells come from the last table, lowest resolution first"""
+
+        self.write(CORRECT_LP)
+        shells = get_shells_from_correctlp(self.correctlp)
+
+        self.assertEqual(list(shells["d_min"]),
+                         [5.37, 3.80, 3.10, 2.69, 2.40, 2.19, 2.03, 1.90, 1.79, 1.70])
+        self.assertEqual(shells["isigi"][0], 40.1)
+        self.assertEqual(shells["completeness"][-1], 98.5)
+        self.assertEqual(shells["cc_half"][-1], 28.0)
+
+    def test_less_conservative_cutoff(self):
+        """The cutoff is the higher resolution of the I/sigma and CC(1/2) cutoffs"""
+
+        self.write(CORRECT_LP)
+        cutoff, report = get_resolution_cutoff(get_shells_from_correctlp(self.correctlp))
+
+        self.assertAlmostEqual(report["cutoff_isigi"], 1.754)
+        self.assertAlmostEqual(report["cutoff_cc_half"], 1.70659, places=4)
+        self.assertEqual(cutoff, 1.71)
+        self.assertEqual(report["d_min"], 1.70)
+
+    def test_cc_half_to_edge(self):
+        """With CC(1/2) good to the edge, all the data are used"""
+
+        self.write(CORRECT_LP)
+        cutoff, report = get_resolution_cutoff(get_shells_from_correctlp(self.correctlp),
+                                               cc_half=20.0)
+
+        self.assertIs(report["cutoff_cc_half"], False)
+        self.assertAlmostEqual(report["cutoff_isigi"], 1.754)
+        self.assertIs(cutoff, False)
+
+    def test_isigi_to_edge(self):
+        """With I/sigma good to the edge, all the data are used"""
+
+        shells = {"d_min": numpy.array([4.0, 3.0, 2.5, 2.0, 1.8]),
+                  "isigi": numpy.array([20.0, 10.0, 5.0, 3.0, 2.0]),
+                  "cc_half": numpy.array([99.0, 98.0, 90.0, 40.0, 20.0])}
+        cutoff, report = get_resolution_cutoff(shells)
+
+        self.assertIs(report["cutoff_isigi"], False)
+        self.assertAlmostEqual(report["cutoff_cc_half"], 1.9)
+        self.assertIs(cutoff, False)
+
+    def test_isigi_only(self):
+        """Without CC(1/2) in CORRECT.LP, the I/sigma cutoff is used"""
+
+        shells = {"d_min": numpy.array([4.0, 3.0, 2.5, 2.0, 1.8]),
+                  "isigi": numpy.array([20.0, 10.0, 5.0, 1.0, 0.5]),
+                  "cc_half": numpy.array([numpy.nan] * 5)}
+        cutoff, report = get_resolution_cutoff(shells)
+
+        self.assertIsNone(report["cutoff_cc_half"])
+        self.assertEqual(cutoff, 2.06)
+
+    def test_no_cutoff_needed(self):
+        """Data good to the edge need no cutoff"""
+
+        self.write(CORRECT_LP)
+        cutoff, __ = get_resolution_cutoff(get_shells_from_correctlp(self.correctlp),
+                                           isigi=0.5,
+                                           cc_half=20.0)
+        self.assertFalse(cutoff)
+
+    def test_no_table(self):
+        """A CORRECT.LP without the table has no shells"""
+
+        self.write(" CORRECT ***\n")
+        self.assertIsNone(get_shells_from_correctlp(self.correctlp))
+
+if __name__ == "__main__":
+
+    unittest.main(verbosity=2)
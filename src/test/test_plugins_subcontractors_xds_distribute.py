@@ -0,0 +1,213 @@
+"""Tests for plugins.subcontractors.xds_distribute"""
+
+"""
+This file is part of RAPD
+
+Copyright (C) 2018, Cornell University
+All rights reserved.
+
+RAPD is free software: you can redistribute it and/or modify
+it under the terms of the GNU Affero General Public License as published by
+the Free Software Foundation, version 3.
+
+RAPD is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU Affero General Public License for more details.
+
+You should have received a copy of the GNU Affero General Public License
+along with this program.  If not, see <http://www.gnu.org/licenses/>.
+"""
+
+__created__ = "2026-10-18"
+__maintainer__ = "Frank Murphy"
+__email__ = "fmurphy@anl.gov"
+__status__ = "Development"
+
+# Standard imports
+import os
+import shutil
+import tempfile
+import threading
+import unittest
+
+# RAPD imports
+import plugins.subcontractors.xds_distribute as xds_distribute
+
+XDS_INP = ["JOB=XYCORR INIT COLSPOT IDXREF\n",
+           "DATA_RANGE=1 100\n",
+           "SPOT_RANGE=1 10 ! first wedge\n",
+           "SPOT_RANGE=91 100\n",
+           "MAXIMUM_NUMBER_OF_PROCESSORS=4\n",
+           "MAXIMUM_NUMBER_OF_JOBS=2\n"]
+
+def hkl_file(first, last, reflections):
+    """Return the lines of a small INTEGRATE.HKL"""
+    return (["!FORMAT=XDS_ASCII    MERGE=FALSE\n",
+             "!DATA_RANGE=%8d%8d\n" % (first, last),
+             "!END_OF_HEADER\n"] +
+            ["%s\n" % reflection for reflection in reflections] +
+            ["!END_OF_DATA\n"])
+
+class TestInputHelpers(unittest.TestCase):
+    """Splitting frame ranges and editing XDS.INP lines"""
+
+    def test_split_range(self):
+        """Blocks cover the range with the remainder spread over the first"""
+
+        self.assertEqual(xds_distribute.split_range(1, 10, 3), [(1, 4), (5, 7), (8, 10)])
+        self.assertEqual(xds_distribute.split_range(1, 2, 5), [(1, 1), (2, 2)])
+        self.assertEqual(xds_distribute.split_range(5, 9, 0), [(5, 9)])
+
+    def test_input_values(self):
+        """Comments are ignored, the last setting wins and None removes a keyword"""
+
+        self.assertEqual(xds_distribute.get_input_value(XDS_INP, "SPOT_RANGE"), "91 100")
+        self.assertIsNone(xds_distribute.get_input_value(XDS_INP, "BEAM"))
+
+        xdsinp = xds_distribute.set_input_value(XDS_INP, "JOB", "COLSPOT")
+        self.assertEqual(xds_distribute.get_input_value(xdsinp, "JOB"), "COLSPOT")
+        self.assertEqual(len(xdsinp), len(XDS_INP))
+
+        xdsinp = xds_distribute.set_input_value(XDS_INP, "SPOT_RANGE", None)
+        self.assertIsNone(xds_distribute.get_input_value(xdsinp, "SPOT_RANGE"))
+
+class TestMerge(unittest.TestCase):
+    """Gathering the output of blocks"""
+
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def test_merge_integrate_hkl(self):
+        """One header with the whole data range, then every block's reflections"""
+
+        hkl_files = []
+        for first, last, reflection in ((1, 50, "1 2 3"), (51, 100, "4 5 6")):
+            hkl_files.append(os.path.join(self.tmp_dir, "%d.HKL" % first))
+            with open(hkl_files[-1], "w") as hkl:
+                hkl.writelines(hkl_file(first, last, [reflection]))
+
+        hklout = os.path.join(self.tmp_dir, "INTEGRATE.HKL")
+        xds_distribute.merge_integrate_hkl(hkl_files, hklout, 1, 100)
+
+        self.assertEqual(open(hklout).readlines(), hkl_file(1, 100, ["1 2 3", "4 5 6"]))
+
+    def test_concatenate(self):
+        """Files are joined in order and missing ones skipped"""
+
+        for name, text in (("a", "one\n"), ("b", "two\n")):
+            with open(os.path.join(self.tmp_dir, name), "w") as part:
+                part.write(text)
+
+        output = os.path.join(self.tmp_dir, "out")
+        xds_distribute.concatenate([os.path.join(self.tmp_dir, name) for name in ("a", "c", "b")],
+                                   output)
+        self.assertEqual(open(output).read(), "one\ntwo\n")
+
+class TestXdsDistributor(unittest.TestCase):
+    """Running COLSPOT and INTEGRATE in blocks with a fake XDS"""
+
+    def setUp(self):
+
+        self.tmp_dir = tempfile.mkdtemp()
+        self.lock = threading.Lock()
+        self.block_inputs = {}
+        self.whole_runs = []
+        self.fail = set()
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def runner(self, directory, command, logfile):
+        """Write the output of a block as XDS would"""
+
+        with open(os.path.join(directory, "XDS.INP")) as xds_input:
+            xdsinp = xds_input.readlines()
+        with self.lock:
+            self.block_inputs[os.path.basename(directory)] = xdsinp
+        first, last = [int(value) for value in
+                       xds_distribute.get_input_value(xdsinp, "DATA_RANGE").split()]
+        if (first, last) in self.fail:
+            return
+        step = xds_distribute.get_input_value(xdsinp, "JOB")
+        with open(os.path.join(directory, xds_distribute.STEP_OUTPUTS[step]), "w") as output:
+            if step == "COLSPOT":
+                output.write("spots %d %d\n" % (first, last))
+            else:
+                output.writelines(hkl_file(first, last, ["%d" % first]))
+
+    def run_whole(self, directory):
+        """Record the steps run in one piece"""
+
+        with open(os.path.join(directory, "XDS.INP")) as xds_input:
+            self.whole_runs.append(xds_distribute.get_input_value(xds_input.readlines(), "JOB"))
+
+    def run_xds(self, xdsinp, **kwargs):
+        """Run the distributor on xdsinp"""
+
+        with open(os.path.join(self.tmp_dir, "XDS.INP"), "w") as xds_input:
+            xds_input.writelines(xdsinp)
+        distributor = xds_distribute.XdsDistributor(self.runner, osc_range=1.0, **kwargs)
+        distributor.run(self.tmp_dir, self.run_whole)
+
+    def test_colspot_blocks(self):
+        """Steps around COLSPOT run whole and COLSPOT runs in blocks of its spot ranges"""
+
+        self.run_xds(XDS_INP, slots=4, nproc=8)
+
+        self.assertEqual(self.whole_runs, ["XYCORR INIT", "IDXREF"])
+        self.assertEqual(sorted(self.block_inputs), ["block_colspot_1_25", "block_colspot_76_100"])
+        self.assertEqual(open(os.path.join(self.tmp_dir, "SPOT.XDS")).read(),
+                         "spots 1 25\nspots 76 100\n")
+        # Left as it was
+        self.assertEqual(open(os.path.join(self.tmp_dir, "XDS.INP")).readlines(), XDS_INP)
+        self.assertEqual([name for name in os.listdir(self.tmp_dir) if name.startswith("block_")], [])
+
+    def test_block_processors(self):
+        """Each block gets its share of the local processors and one job"""
+
+        xdsinp = xds_distribute.set_input_value(XDS_INP, "JOB", "INTEGRATE")
+        self.run_xds(xdsinp, slots=4, nproc=8)
+
+        self.assertEqual(len(self.block_inputs), 4)
+        for block_inp in self.block_inputs.values():
+            self.assertEqual(xds_distribute.get_input_value(block_inp, "MAXIMUM_NUMBER_OF_PROCESSORS"), "2")
+            self.assertEqual(xds_distribute.get_input_value(block_inp, "MAXIMUM_NUMBER_OF_JOBS"), "1")
+
+        self.assertEqual(open(os.path.join(self.tmp_dir, "INTEGRATE.HKL")).readlines(),
+                         hkl_file(1, 100, ["1", "26", "51", "76"]))
+
+    def test_cluster_keeps_processors(self):
+        """Without nproc the XDS.INP processor setting is kept"""
+
+        xdsinp = xds_distribute.set_input_value(XDS_INP, "JOB", "INTEGRATE")
+        self.run_xds(xdsinp, slots=2)
+
+        for block_inp in self.block_inputs.values():
+            self.assertEqual(xds_distribute.get_input_value(block_inp, "MAXIMUM_NUMBER_OF_PROCESSORS"), "4")
+
+    def test_failed_block_runs_whole(self):
+        """A block that keeps failing makes the step run in one piece"""
+
+        self.fail.add((51, 100))
+        xdsinp = xds_distribute.set_input_value(XDS_INP, "JOB", "INTEGRATE")
+        self.run_xds(xdsinp, slots=2, attempts=2)
+
+        self.assertEqual(self.whole_runs, ["INTEGRATE"])
+
+    def test_small_range_runs_whole(self):
+        """Too few frames for more than one block runs the step in one piece"""
+
+        xdsinp = xds_distribute.set_input_value(XDS_INP, "JOB", "INTEGRATE")
+        xdsinp = xds_distribute.set_input_value(xdsinp, "DATA_RANGE", "1 8")
+        self.run_xds(xdsinp, slots=4)
+
+        self.assertEqual(self.whole_runs, ["INTEGRATE"])
+        self.assertEqual(self.block_inputs, {})
+
+if __name__ == "__main__":
+
+    unittest.main(verbosity=2)
@@ -0,0 +1,179 @@
+"""Tests for sites.cluster.drmaa_service"""
+
+"""
+This file is part of RAPD
+
+Copyright (C) 2018, Cornell University
+All rights reserved.
+
+RAPD is free software: you can redistribute it and/or modify
+it under the terms of the GNU Affero General Public License as published by
+the Free Software Foundation, version 3.
+
+RAPD is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU Affero General Public License for more details.
+
+You should have received a copy of the GNU Affero General Public License
+along with this program.  If not, see <http://www.gnu.org/licenses/>.
+"""
+
+__created__ = "2026-10-18"
+__maintainer__ = "Frank Murphy"
+__email__ = "fmurphy@anl.gov"
+__status__ = "Development"
+
+# Standard imports
+import json
+import socket
+import threading
+import time
+import unittest
+
+# RAPD imports
+import sites.cluster.drmaa_service as drmaa_service
+
+class TestRunJob(unittest.TestCase):
+    """The client side of a job submitted to the DRMAA service"""
+
+    def setUp(self):
+
+        self.listener = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        self.listener.bind(("127.0.0.1", 0))
+        self.listener.listen(1)
+        self.address = self.listener.getsockname()
+        self.received = []
+
+    def tearDown(self):
+        self.listener.close()
+
+    def serve(self, replies):
+        """Accept one connection, read the submission and send replies in one write"""
+
+        def handle():
+            connection, __ = self.listener.accept()
+            self.received.append(json.loads(connection.makefile("rb").readline()))
+            connection.sendall("".join(json.dumps(reply) + "\n" for reply in replies))
+            connection.recv(1024)
+            connection.close()
+
+        thread = threading.Thread(target=handle)
+        thread.daemon = True
+        thread.start()
+        return thread
+
+    def test_result_with_job_id(self):
+        """A result sent together with the job_id is returned without waiting"""
+
+        result = {"job_id":"12", "exit_status":0, "aborted":False, "signal":None}
+        thread = self.serve([{"job_id":"12"}, result])
+
+        start = time.time()
+        self.assertEqual(drmaa_service.run_job(self.address, "sleep 1", "/tmp", name="test", timeout=5),
+                         result)
+        self.assertLess(time.time() - start, 2)
+        thread.join(5)
+        self.assertEqual(self.received[0]["command"], "sleep 1")
+
+    def test_error(self):
+        """A submission the service rejects raises socket.error"""
+
+        self.serve([{"error":"no session"}])
+        self.assertRaises(socket.error, drmaa_service.run_job, self.address, "sleep 1", "/tmp")
+
+    def test_get_address(self):
+        """The service address comes from the environment"""
+
+        environ = drmaa_service.os.environ
+        try:
+            drmaa_service.os.environ = {drmaa_service.SERVICE_VARIABLE:"host:123"}
+            self.assertEqual(drmaa_service.get_address(), ("host", 123))
+            drmaa_service.os.environ = {drmaa_service.SERVICE_VARIABLE:"host"}
+            self.assertEqual(drmaa_service.get_address(), ("host", drmaa_service.SERVICE_PORT))
+            drmaa_service.os.environ = {}
+            self.assertIsNone(drmaa_service.get_address())
+        finally:
+            drmaa_service.os.environ = environ
+
+    def test_secret_sent(self):
+        """The shared secret goes with the submission when it is set"""
+
+        environ = drmaa_service.os.environ
+        try:
+            drmaa_service.os.environ = {drmaa_service.SECRET_VARIABLE:"sesame"}
+            self.serve([{"error":"no session"}])
+            self.assertRaises(socket.error, drmaa_service.run_job, self.address, "sleep 1", "/tmp")
+        finally:
+            drmaa_service.os.environ = environ
+        self.assertEqual(self.received[0]["secret"], "sesame")
+
+class TestService(unittest.TestCase):
+    """Who the DRMAA service accepts submissions from"""
+
+    def setUp(self):
+
+        self.submitted = []
+        self.service = False
+
+    def tearDown(self):
+        if self.service:
+            self.service.stop()
+            self.service.server.server_close()
+
+    def start(self, secret=None):
+        """Serve on a free port without a DRMAA session, recording submissions"""
+
+        self.service = drmaa_service.DrmaaService(address=("127.0.0.1", 0), secret=secret)
+
+        def submit(spec, notify):
+            self.submitted.append(spec)
+            return "7"
+        self.service.submit = submit
+        self.service.forget = lambda job: None
+
+        thread = threading.Thread(target=self.service.server.serve_forever)
+        thread.daemon = True
+        thread.start()
+        return self.service.server.server_address
+
+    def submit(self, address, spec):
+        """Send a submission and return the first reply"""
+
+        connection = socket.create_connection(address)
+        try:
+            connection.sendall(json.dumps(spec) + "\n")
+            return json.loads(connection.makefile("rb").readline())
+        finally:
+            connection.close()
+
+    def test_loopback_default(self):
+        """The service only listens on the loopback interface unless told otherwise"""
+
+        defaults = drmaa_service.DrmaaService.__init__.__defaults__
+        self.assertEqual(defaults[0], ("127.0.0.1", drmaa_service.SERVICE_PORT))
+
+    def test_no_secret(self):
+        """Without a secret every submission is run"""
+
+        address = self.start()
+        self.assertEqual(self.submit(address, {"command":"sleep 1"}), {"job_id":"7"})
+        self.assertEqual(self.submitted, [{"command":"sleep 1"}])
+
+    def test_secret_required(self):
+        """With a secret, submissions without it or with another are refused"""
+
+        address = self.start(secret="sesame")
+        self.assertIn("error", self.submit(address, {"command":"sleep 1"}))
+        self.assertIn("error", self.submit(address, {"command":"sleep 1", "secret":"open"}))
+        self.assertIn("error", self.submit(address, {"command":"sleep 1", "secret":1}))
+        self.assertEqual(self.submitted, [])
+
+        self.assertEqual(self.submit(address, {"command":"sleep 1", "secret":"sesame"}),
+                         {"job_id":"7"})
+        # The secret is not passed on with the job
+        self.assertEqual(self.submitted, [{"command":"sleep 1"}])
+
+if __name__ == "__main__":
+
+    unittest.main(verbosity=2)
@@ -31,14 +31,15 @@ import argparse
 # import json
 # import logging
 # import multiprocessing
-# import os
+import os
 # import pprint
 # import pymongo
 # import re
 # import redis
-# import shutil
+import shutil
 import subprocess
-# import sys
+import tempfile
+import sys
 # import time
 import unittest
 
@@ -96,6 +97,66 @@ class TestDependencies(unittest.TestCase):
 
         assert found == True
 
+class TestConvertRanges(unittest.TestCase):
+    """Chunked conversion, with eiger2cbf replaced by a fake"""
+
+    def setUp(self):
+        self.output_dir = tempfile.mkdtemp()
+        self.convert_chunk = convert_hdf5_cbf.convert_chunk
+        convert_hdf5_cbf.convert_chunk = self.fake_convert_chunk
+        self.fail_from = sys.maxint
+        self.streamed = []
+
+    def tearDown(self):
+        convert_hdf5_cbf.convert_chunk = self.convert_chunk
+        shutil.rmtree(self.output_dir)
+
+    def fake_convert_chunk(self, input_args):
+        """Name the images of a chunk, failing those from fail_from on"""
+
+        master_file, start, end, output_prefix, verbose = input_args
+        if start >= self.fail_from:
+            return (start, end, False, convert_hdf5_cbf.CHUNK_ATTEMPTS)
+        return (start, end, ["%s_%06d.cbf" % (output_prefix, n) for n in range(start, end+1)], 1)
+
+    def make_converter(self, image_range):
+        """A one process converter of a six image dataset"""
+
+        converter = convert_hdf5_cbf.hdf5_to_cbf_converter(master_file="test_master.h5",
+                                                           output_dir=self.output_dir,
+                                                           prefix="test",
+                                                           image_range=image_range,
+                                                           nproc=1,
+                                                           verbose=False,
+                                                           callback=self.streamed.append)
+        converter.get_number_of_images = lambda: 6
+        return converter
+
+    def image(self, number):
+        return os.path.join(self.output_dir, "test_%06d.cbf" % number)
+
+    def test_chunks_streamed(self):
+        """Each converted chunk goes to the callback as it finishes"""
+
+        images = self.make_converter("1-2,5-6").run()
+
+        self.assertEqual(images, [self.image(n) for n in (1, 2, 5, 6)])
+        self.assertEqual(self.streamed, [[self.image(1), self.image(2)],
+                                         [self.image(5), self.image(6)]])
+
+    def test_failed_chunks_raise(self):
+        """Images that could not be converted are reported"""
+
+        self.fail_from = 5
+        converter = self.make_converter("1-2,5-6")
+
+        with self.assertRaises(Exception) as context:
+            converter.run()
+        self.assertIn("5-6", str(context.exception))
+        self.assertEqual(converter.failed_images, [5, 6])
+        # The images that were converted still went out
+        self.assertEqual(self.streamed, [[self.image(1), self.image(2)]])
+
 def get_commandline():
     """
     Grabs the commandline
@@ -0,0 +1,125 @@
+"""Tests for utils.frame_tracker"""
+
+"""
+This file is part of RAPD
+
+Copyright (C) 2018, Cornell University
+All rights reserved.
+
+RAPD is free software: you can redistribute it and/or modify
+it under the terms of the GNU Affero General Public License as published by
+the Free Software Foundation, version 3.
+
+RAPD is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU Affero General Public License for more details.
+
+You should have received a copy of the GNU Affero General Public License
+along with this program.  If not, see <http://www.gnu.org/licenses/>.
+"""
+
+__created__ = "2026-10-18"
+__maintainer__ = "Frank Murphy"
+__email__ = "fmurphy@anl.gov"
+__status__ = "Development"
+
+# Standard imports
+import os
+import shutil
+import tempfile
+import threading
+import unittest
+
+# RAPD imports
+import utils.frame_tracker as frame_tracker
+
+class TestFrameTracker(unittest.TestCase):
+    """Frame arrivals followed by listing the run directory"""
+
+    def setUp(self):
+
+        self.tmp_dir = tempfile.mkdtemp()
+        # Follow the frames without inotify or redis
+        self.pyinotify = frame_tracker.pyinotify
+        frame_tracker.pyinotify = None
+
+        self.tracker = frame_tracker.FrameTracker(directory=self.tmp_dir,
+                                                  image_template="thaum_1_?????.cbf",
+                                                  first_frame=1,
+                                                  last_frame=10)
+
+    def tearDown(self):
+
+        self.tracker.stop()
+        frame_tracker.pyinotify = self.pyinotify
+        shutil.rmtree(self.tmp_dir)
+
+    def write(self, frame, name=None):
+        """Write a frame of the run"""
+        open(name or self.tracker.frame_path(frame), "w").close()
+
+    def test_frame_path(self):
+        """Frame numbers are padded to the template"""
+
+        self.assertEqual(self.tracker.frame_path(12),
+                         os.path.join(self.tmp_dir, "thaum_1_00012.cbf"))
+
+    def test_start_lists_directory(self):
+        """Frames present at start are found and other files ignored"""
+
+        for frame in (1, 2, 4):
+            self.write(frame)
+        self.write(0, os.path.join(self.tmp_dir, "thaum_2_00003.cbf"))
+
+        self.tracker.start()
+
+        self.assertEqual(self.tracker.source, "rescan")
+        self.assertEqual(self.tracker.first_last(), (1, 4))
+        self.assertEqual(self.tracker.contiguous_last(), 2)
+        self.assertTrue(self.tracker.has_frame(4))
+        self.assertFalse(self.tracker.has_frame(3))
+
+    def test_contiguous_range(self):
+        """Filling a gap moves the end of the contiguous range past it"""
+
+        self.tracker.start()
+        self.assertEqual(self.tracker.first_last(), (0, 0))
+
+        for frame in (1, 2, 4, 5):
+            self.tracker.add_file(self.tracker.frame_path(frame))
+        self.assertEqual(self.tracker.contiguous_last(), 2)
+
+        self.tracker.add_file(self.tracker.frame_path(3))
+        self.assertEqual(self.tracker.contiguous_last(), 5)
+
+    def test_add_file_other_directory(self):
+        """Files with the same name in another directory are not frames of the run"""
+
+        self.tracker.start()
+        self.tracker.add_file(os.path.join("/elsewhere", "thaum_1_00001.cbf"))
+        self.assertFalse(self.tracker.has_frame(1))
+
+    def test_frames_past_run(self):
+        """Frames beyond the run count as present between the lowest and highest seen"""
+
+        self.tracker.start()
+        self.tracker.add_file(self.tracker.frame_path(12))
+        self.tracker.add_file(self.tracker.frame_path(14))
+        self.assertTrue(self.tracker.has_frame(13))
+        self.assertFalse(self.tracker.has_frame(15))
+
+    def test_wait_for(self):
+        """A frame written while waiting is found and a missing one times out"""
+
+        self.tracker.start()
+        writer = threading.Timer(0.2, self.write, (6,))
+        writer.start()
+
+        self.assertTrue(self.tracker.wait_for(6, timeout=5))
+        self.assertFalse(self.tracker.wait_for(7, timeout=0.2))
+        writer.join()
+
+if __name__ == "__main__":
+
+    unittest.main(verbosity=2)
@@ -0,0 +1,214 @@
+"""Tests for utils.model_cache"""
+
+"""
+This file is part of RAPD
+
+Copyright (C) 2018, Cornell University
+All rights reserved.
+
+RAPD is free software: you can redistribute it and/or modify
+it under the terms of the GNU Affero General Public License as published by
+the Free Software Foundation, version 3.
+
+RAPD is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU Affero General Public License for more details.
+
+You should have received a copy of the GNU Affero General Public License
+along with this program.  If not, see <http://www.gnu.org/licenses/>.
+"""
+
+__created__ = "2026-10-18"
+__maintainer__ = "Frank Murphy"
+__email__ = "fmurphy@anl.gov"
+__status__ = "Development"
+
+# Standard imports
+import os
+import shutil
+import tempfile
+import threading
+import time
+import unittest
+
+# RAPD imports
+import utils.model_cache as model_cache
+
+REVISION_LOOP = """data_1ABC
+#
+loop_
+_pdbx_audit_revision_history.ordinal
+_pdbx_audit_revision_history.data_content_type
+_pdbx_audit_revision_history.major_revision
+_pdbx_audit_revision_history.minor_revision
+_pdbx_audit_revision_history.revision_date
+1 'Structure model' 1 0 2001-01-01
+2 'Structure model' 1 1 2008-04-27
+3 'Structure model' 2 0 2020-03-11
+#
+_cell.length_a 50.0
+"""
+
+REVISION_SINGLE = """data_1ABC
+#
+_pdbx_audit_revision_history.ordinal             1
+_pdbx_audit_revision_history.data_content_type   'Structure model'
+_pdbx_audit_revision_history.major_revision      1
+_pdbx_audit_revision_history.minor_revision      0
+_pdbx_audit_revision_history.revision_date       2018-01-01
+#
+"""
+
+class FakeFetch(object):
+    """Writes the next of its contents to the file, counting calls"""
+
+    def __init__(self, *contents):
+        self.contents = list(contents)
+        self.calls = 0
+        self.lock = threading.Lock()
+
+    def __call__(self, pdb_code, fname):
+        with self.lock:
+            self.calls += 1
+            content = self.contents.pop(0) if len(self.contents) > 1 else self.contents[0]
+        if content is None:
+            return False
+        # Let other threads pile up behind the download
+        time.sleep(0.05)
+        with open(fname, "w") as output_file:
+            output_file.write(content)
+        return fname
+
+class TestReadRevision(unittest.TestCase):
+    """Revision read from an mmCIF file"""
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def revision(self, content):
+        path = os.path.join(self.directory, "model.cif")
+        with open(path, "w") as output_file:
+            output_file.write(content)
+        return model_cache.read_revision(path)
+
+    def test_loop(self):
+        """The last row of a revision loop is the revision"""
+        self.assertEqual(self.revision(REVISION_LOOP), "2.0")
+
+    def test_single(self):
+        """A single revision is read from its key value pairs"""
+        self.assertEqual(self.revision(REVISION_SINGLE), "1.0")
+
+    def test_none(self):
+        """A file without a revision history is revision 0"""
+        self.assertEqual(self.revision("data_1ABC\n_cell.length_a 50.0\n"), "0")
+
+class TestModelCache(unittest.TestCase):
+    """Fetching, sharing, refreshing and evicting cached models"""
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.cache = model_cache.ModelCache(root=os.path.join(self.directory, "cache"))
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def ledger(self):
+        with self.cache.ledger() as ledger:
+            return ledger
+
+    def test_fetched_once(self):
+        """A model is fetched once and then read from the cache"""
+
+        fetch = FakeFetch(REVISION_LOOP)
+        path = self.cache.get("1abc", "cif", fetch)
+
+        self.assertEqual(self.cache.get("1ABC", "cif", fetch), path)
+        self.assertEqual(fetch.calls, 1)
+        self.assertEqual(open(path).read(), REVISION_LOOP)
+        self.assertEqual(self.ledger()["cif/1ABC"]["revision"], "2.0")
+        self.assertEqual(os.listdir(os.path.join(self.cache.root, "tmp")), [])
+
+    def test_concurrent_jobs_share_download(self):
+        """Jobs wanting the same model wait for one download"""
+
+        fetch = FakeFetch(REVISION_LOOP)
+        paths = []
+        threads = [threading.Thread(target=lambda: paths.append(self.cache.get("1abc", "cif", fetch)))
+                   for __ in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(fetch.calls, 1)
+        self.assertEqual(len(set(paths)), 1)
+
+    def test_new_revision_replaces(self):
+        """An old model is fetched again and a new revision replaces the file"""
+
+        self.cache.max_age = -1
+        fetch = FakeFetch(REVISION_SINGLE, REVISION_LOOP)
+        old_path = self.cache.get("1abc", "cif", fetch)
+        new_path = self.cache.get("1abc", "cif", fetch)
+
+        self.assertNotEqual(new_path, old_path)
+        self.assertFalse(os.path.exists(old_path))
+        self.assertEqual(self.ledger()["cif/1ABC"]["revision"], "2.0")
+
+    def test_stale_copy_when_fetch_fails(self):
+        """A failed refetch falls back to the copy already cached"""
+
+        path = self.cache.get("1abc", "cif", FakeFetch(REVISION_LOOP))
+        self.cache.max_age = -1
+
+        self.assertEqual(self.cache.get("1abc", "cif", FakeFetch(None)), path)
+        self.assertIsNone(self.cache.get("2abc", "cif", FakeFetch(None)))
+
+    def test_evict_least_recently_used(self):
+        """Over the quota, the models used least recently go first"""
+
+        # Room for two of the models
+        self.cache.quota = 2 * len(REVISION_LOOP) + 10
+        self.cache.get("1abc", "cif", FakeFetch(REVISION_LOOP))
+        self.cache.get("2abc", "cif", FakeFetch(REVISION_LOOP + "#\n"))
+        # 1abc is now the more recently used
+        time.sleep(0.01)
+        self.cache.get("1abc", "cif", FakeFetch(None))
+        self.cache.get("3abc", "cif", FakeFetch(REVISION_LOOP + "##\n"))
+
+        self.assertEqual(sorted(self.ledger()), ["cif/1ABC", "cif/3ABC"])
+
+    def test_install_links_copy(self):
+        """install puts the cached file at fname and leaves an existing one"""
+
+        fname = os.path.join(self.directory, "1abc.cif")
+        fetch = FakeFetch(REVISION_LOOP)
+
+        self.assertEqual(self.cache.install("1abc", "cif", fname, fetch), fname)
+        self.assertEqual(open(fname).read(), REVISION_LOOP)
+        self.assertEqual(self.cache.install("1abc", "cif", fname, FakeFetch(None)), fname)
+        self.assertFalse(self.cache.install("2abc", "cif",
+                                            os.path.join(self.directory, "2abc.cif"),
+                                            FakeFetch(None)))
+
+    def test_prefetch_missing(self):
+        """prefetch only downloads the models not cached"""
+
+        fetch = FakeFetch(REVISION_LOOP)
+        self.cache.get("1abc", "cif", fetch)
+
+        for thread in self.cache.prefetch(["1abc", "2abc", "3abc"], "cif", fetch):
+            thread.join()
+
+        self.assertEqual(fetch.calls, 3)
+        self.assertTrue(self.cache.has("2abc"))
+        self.assertTrue(self.cache.has("3abc"))
+
+if __name__ == "__main__":
+
+    unittest.main(verbosity=2)
@@ -0,0 +1,113 @@
+"""Tests for utils.processes"""
+
+"""
+This file is part of RAPD
+
+Copyright (C) 2018, Cornell University
+All rights reserved.
+
+RAPD is free software: you can redistribute it and/or modify
+it under the terms of the GNU Affero General Public License as published by
+the Free Software Foundation, version 3.
+
+RAPD is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU Affero General Public License for more details.
+
+You should have received a copy of the GNU Affero General Public License
+along with this program.  If not, see <http://www.gnu.org/licenses/>.
+"""
+
+__created__ = "2026-10-18"
+__maintainer__ = "Frank Murphy"
+__email__ = "fmurphy@anl.gov"
+__status__ = "Development"
+
+# Standard imports
+import os
+import signal
+import threading
+import time
+import unittest
+
+# RAPD imports
+import utils.processes as processes
+
+class TestJobExecutor(unittest.TestCase):
+    """Callback order, waiting and cancelling of the job executor"""
+
+    def setUp(self):
+        self.executor = processes.JobExecutor(nproc=4)
+        self.finished = []
+        self.lock = threading.Lock()
+
+    def tearDown(self):
+        self.executor.close()
+
+    def callback(self, name):
+        """Return a callback recording name"""
+        def finished(result):
+            self.finished.append((name, result["returncode"]))
+        return finished
+
+    def test_callbacks_in_finishing_order(self):
+        """Callbacks come as jobs finish, not in the order submitted"""
+
+        for name, seconds in (("slow", 0.6), ("fast", 0.1), ("middle", 0.3)):
+            self.executor.submit(name, self.callback(name), command="sleep %s" % seconds)
+
+        self.assertTrue(self.executor.wait(timeout=5))
+        self.assertEqual(self.finished, [("fast", 0), ("middle", 0), ("slow", 0)])
+
+    def test_callbacks_one_at_a_time(self):
+        """A callback does not start while another is running"""
+
+        running = []
+        overlapped = []
+
+        def callback(result):
+            with self.lock:
+                if running:
+                    overlapped.append(result["tag"])
+                running.append(result["tag"])
+            time.sleep(0.1)
+            with self.lock:
+                running.remove(result["tag"])
+
+        for name in ("a", "b", "c"):
+            self.executor.submit(name, callback, command="sleep 0.1", tag=name)
+
+        self.assertTrue(self.executor.wait(timeout=5))
+        self.assertEqual(overlapped, [])
+
+    def test_failed_command(self):
+        """A command that cannot start still calls back"""
+
+        self.executor.submit("missing",
+                             self.callback("missing"),
+                             command="/nonexistent/command")
+
+        self.assertTrue(self.executor.wait(timeout=5))
+        self.assertEqual(self.finished, [("missing", -1)])
+
+    def test_cancel_on_timeout(self):
+        """After a timed out wait, cancel hands back the PIDs and drops the callbacks"""
+
+        self.executor.submit("fast", self.callback("fast"), command="sleep 0.1")
+        self.executor.submit("hung", self.callback("hung"), command="sleep 30")
+
+        self.assertFalse(self.executor.wait(timeout=1))
+        self.assertEqual(self.finished, [("fast", 0)])
+
+        pids = self.executor.cancel()
+        self.assertEqual(pids.keys(), ["hung"])
+        os.kill(pids["hung"], signal.SIGKILL)
+
+        # The killed job finishes without calling back
+        self.assertTrue(self.executor.wait(timeout=5))
+        self.assertEqual(self.finished, [("fast", 0)])
+
+if __name__ == "__main__":
+
+    unittest.main(verbosity=2)
@@ -0,0 +1,96 @@
+"""Tests for utils.schedule"""
+
+"""
+This file is part of RAPD
+
+Copyright (C) 2018, Cornell University
+All rights reserved.
+
+RAPD is free software: you can redistribute it and/or modify
+it under the terms of the GNU Affero General Public License as published by
+the Free Software Foundation, version 3.
+
+RAPD is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU Affero General Public License for more details.
+
+You should have received a copy of the GNU Affero General Public License
+along with this program.  If not, see <http://www.gnu.org/licenses/>.
+"""
+
+__created__ = "2026-10-18"
+__maintainer__ = "Frank Murphy"
+__email__ = "fmurphy@anl.gov"
+__status__ = "Development"
+
+# Standard imports
+import unittest
+
+# RAPD imports
+import utils.schedule as schedule
+
+class TestPeriodicTasks(unittest.TestCase):
+    """Timing of periodic tasks against a controlled clock"""
+
+    def setUp(self):
+
+        self.now = 100.0
+        self.monotonic = schedule.monotonic
+        schedule.monotonic = lambda: self.now
+
+        self.calls = []
+        self.tasks = schedule.PeriodicTasks()
+
+    def tearDown(self):
+        schedule.monotonic = self.monotonic
+
+    def test_monotonic(self):
+        """The clock never goes backwards"""
+
+        first = self.monotonic()
+        self.assertGreaterEqual(self.monotonic(), first)
+
+    def test_no_tasks(self):
+        """With no tasks there is nothing to wait for"""
+
+        self.assertIsNone(self.tasks.run_pending())
+
+    def test_run_now_and_wait(self):
+        """Tasks run when due and the wait is to the next due task"""
+
+        self.tasks.add(10, lambda: self.calls.append("a"))
+        self.tasks.add(4, lambda: self.calls.append("b"), run_now=False)
+
+        self.assertEqual(self.tasks.run_pending(), 4.0)
+        self.assertEqual(self.calls, ["a"])
+
+        self.now = 104.0
+        self.assertEqual(self.tasks.run_pending(), 4.0)
+        self.assertEqual(self.calls, ["a", "b"])
+
+    def test_missed_intervals_skipped(self):
+        """A late loop runs a task once and keeps it on its original beat"""
+
+        self.tasks.add(10, lambda: self.calls.append(self.now))
+        self.tasks.run_pending()
+
+        self.now = 135.0
+        self.assertEqual(self.tasks.run_pending(), 5.0)
+        self.assertEqual(self.calls, [100.0, 135.0])
+
+    def test_error_does_not_stop_tasks(self):
+        """A task that raises is logged and rescheduled like any other"""
+
+        def broken():
+            raise ValueError("broken")
+
+        self.tasks.add(5, broken)
+        self.tasks.add(5, lambda: self.calls.append("ok"))
+
+        self.assertEqual(self.tasks.run_pending(), 5.0)
+        self.assertEqual(self.calls, ["ok"])
+
+if __name__ == "__main__":
+
+    unittest.main(verbosity=2)
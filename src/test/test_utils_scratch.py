@@ -0,0 +1,161 @@
+"""Tests for utils.scratch"""
+
+"""
+This file is part of RAPD
+
+Copyright (C) 2018, Cornell University
+All rights reserved.
+
+RAPD is free software: you can redistribute it and/or modify
+it under the terms of the GNU Affero General Public License as published by
+the Free Software Foundation, version 3.
+
+RAPD is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU Affero General Public License for more details.
+
+You should have received a copy of the GNU Affero General Public License
+along with this program.  If not, see <http://www.gnu.org/licenses/>.
+"""
+
+__created__ = "2026-10-18"
+__maintainer__ = "Frank Murphy"
+__email__ = "fmurphy@anl.gov"
+__status__ = "Development"
+
+# Standard imports
+import json
+import os
+import shutil
+import subprocess
+import tempfile
+import unittest
+
+# RAPD imports
+import utils.scratch as scratch
+
+def dead_pid():
+    """Return the pid of a process that has finished"""
+    process = subprocess.Popen(["true"])
+    process.wait()
+    return process.pid
+
+class TestScratch(unittest.TestCase):
+    """Job directories and staged datasets in a scratch space"""
+
+    def setUp(self):
+
+        self.tmp_dir = tempfile.mkdtemp()
+        self.root = os.path.join(self.tmp_dir, "scratch")
+        self.disk = os.path.join(self.tmp_dir, "disk")
+        os.makedirs(self.disk)
+        self.scratch = scratch.Scratch(root=self.root, quota=1000)
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def read_ledger(self):
+        with open(os.path.join(self.root, scratch.LEDGER)) as ledger:
+            return json.load(ledger)
+
+    def write_ledger(self, ledger):
+        with open(os.path.join(self.root, scratch.LEDGER), "w") as output:
+            json.dump(ledger, output)
+
+    def make_files(self, name, sizes):
+        """Write files of the given sizes and return their paths"""
+        files = []
+        for index, size in enumerate(sizes):
+            files.append(os.path.join(self.disk, "%s_%d.cbf" % (name, index)))
+            with open(files[-1], "w") as image:
+                image.write("x" * size)
+        return files
+
+    def test_allocate_and_release(self):
+        """A job directory is copied back to disk and freed"""
+
+        destination = os.path.join(self.disk, "index")
+        path = self.scratch.allocate(destination, nbytes=100)
+        self.assertTrue(path.startswith(self.root))
+        self.assertIsNone(self.scratch.allocate(destination, nbytes=100))
+
+        with open(os.path.join(path, "result.json"), "w") as result:
+            result.write("{}")
+        self.scratch.release(path, destination, wait=True)
+
+        self.assertTrue(os.path.isfile(os.path.join(destination, "result.json")))
+        self.assertFalse(os.path.exists(path))
+        self.assertEqual(self.scratch.usage()["jobs"], 0)
+
+    def test_no_room(self):
+        """A job that does not fit in the quota is refused"""
+
+        self.assertIsNone(self.scratch.allocate(os.path.join(self.disk, "big"), nbytes=2000))
+
+    def test_abandoned_job_removed(self):
+        """Jobs of processes that have gone are removed"""
+
+        path = self.scratch.allocate(os.path.join(self.disk, "index"), nbytes=100)
+        ledger = self.read_ledger()
+        ledger["jobs"][path]["pid"] = dead_pid()
+        self.write_ledger(ledger)
+
+        self.assertEqual(self.scratch.usage()["jobs"], 0)
+        self.assertFalse(os.path.exists(path))
+
+    def test_failed_copy_kept(self):
+        """A job that could not be copied back is marked and never cleaned up"""
+
+        # A file where the directory should go makes the copy fail
+        destination = os.path.join(self.disk, "index")
+        open(destination, "w").close()
+
+        path = self.scratch.allocate(destination, nbytes=100)
+        with open(os.path.join(path, "result.json"), "w") as result:
+            result.write("{}")
+        self.scratch.release(path, destination, wait=True)
+
+        ledger = self.read_ledger()
+        self.assertEqual(ledger["jobs"][path]["failed"], destination)
+
+        # Even once its process has gone
+        ledger["jobs"][path]["pid"] = dead_pid()
+        self.write_ledger(ledger)
+
+        self.assertEqual(self.scratch.usage()["jobs"], 100)
+        self.assertTrue(os.path.isfile(os.path.join(path, "result.json")))
+
+    def test_stage(self):
+        """Files are staged once and found again by their key"""
+
+        files = self.make_files("thaum", (100, 100))
+        staged = self.scratch.stage("thaum", files)
+
+        for name in files:
+            self.assertEqual(open(staged[name]).read(), open(name).read())
+        self.assertEqual(self.scratch.stage("thaum", files), staged)
+        self.assertEqual(self.scratch.usage()["pinned"], 200)
+
+    def test_evict_unpinned(self):
+        """Unpinned datasets are evicted least recently used first, pinned ones never"""
+
+        first = self.scratch.stage("first", self.make_files("first", (400,)))
+        second = self.scratch.stage("second", self.make_files("second", (400,)))
+
+        # Both pinned, so there is no room
+        self.assertIsNone(self.scratch.stage("third", self.make_files("third", (400,))))
+
+        self.scratch.unpin("first")
+        self.scratch.unpin("second")
+        self.assertTrue(self.scratch.pin("second"))
+        self.scratch.unpin("second")
+
+        self.assertIsNotNone(self.scratch.stage("third", self.make_files("third", (400,))))
+        self.assertFalse(os.path.exists(first.values()[0]))
+        self.assertTrue(os.path.exists(second.values()[0]))
+        self.assertFalse(self.scratch.pin("first"))
+
+if __name__ == "__main__":
+
+    unittest.main(verbosity=2)
@@ -26,7 +26,7 @@ __status__ = "Development"
 
 # Standard imports
 import argparse
-from itertools import groupby
+from itertools import groupby, imap
 import multiprocessing
 from operator import itemgetter
 import os
@@ -41,6 +41,12 @@ import shlex
 VERSIONS = {
     "eiger2cbf": ("160415",)
 }
+
+# Most images converted by one eiger2cbf call
+CHUNK_SIZE = 10
+# Tries at converting a chunk before giving up on it
+CHUNK_ATTEMPTS = 3
+
 # Create function for running
 def run_process(input_args, output=False):
     """Run the command in a subprocess.Popen call"""
@@ -61,9 +67,35 @@ def run_process(input_args, output=False):
         job = subprocess.Popen(shlex.split(command))
         job.wait()
 
+def convert_chunk(input_args):
+    """
+    Convert a chunk of images with eiger2cbf, trying again if any of the
+    images are missing afterwards. Returns (start, end, images, attempts)
+    with images False if the chunk could not be converted.
+    """
+
+    master_file, start, end, output_prefix, verbose = input_args
+
+    images = ["%s_%06d.cbf" % (output_prefix, n) for n in range(start, end+1)]
+    if start == end:
+        command = "eiger2cbf %s %d %s" % (master_file, start, images[0])
+    else:
+        command = "eiger2cbf %s %d:%d %s_" % (master_file, start, end, output_prefix)
+
+    for attempt in range(1, CHUNK_ATTEMPTS+1):
+        run_process((command, verbose))
+        if all(os.path.exists(image) and os.path.getsize(image) for image in images):
+            return (start, end, images, attempt)
+
+    return (start, end, False, CHUNK_ATTEMPTS)
+
 class hdf5_to_cbf_converter(object):
 
     output_images = []
+    failed_images = []
+
+    # Pool of workers shared by all the conversions of a run
+    pool = None
     
     # Parameters used when calculating second image in a pair to convert
     user_overwrite = False
@@ -79,6 +111,7 @@ class hdf5_to_cbf_converter(object):
                  nproc=False,
                  overwrite=False,
                  verbose=False,
+                 callback=False,
                  #logger=False
                  ):
         """
@@ -92,6 +125,7 @@ class hdf5_to_cbf_converter(object):
         wedge_range -- separation in oscillation axis between 2 images
         nproc -- number of processors to use
         overwrite -- overwrite files already present
+        callback -- called with each list of images as soon as they are converted
         returns header
         """
 
@@ -112,16 +146,41 @@ class hdf5_to_cbf_converter(object):
             self.user_overwrite = overwrite
             self.overwrite = True
         self.verbose = verbose
+        self.callback = callback
         #self.logger = logger
 
         # Clear out output images on init
         self.output_images = []
+        self.failed_images = []
 
     def run(self):
-        """Coordinates the running of the conversion process"""
+        """
+        Coordinates the running of the conversion process. Returns the list of
+        converted images, or raises an Exception naming the images that could
+        not be converted.
+        """
 
         self.preprocess()
-        self.process()
+        try:
+            self.process()
+        finally:
+            if self.pool:
+                self.pool.close()
+                self.pool.join()
+                self.pool = None
+
+        if self.failed_images:
+            failed_ranges = []
+            for k, g in groupby(enumerate(sorted(self.failed_images)), lambda (i, x):i - x):
+                failed_range = map(itemgetter(1), g)
+                if len(failed_range) == 1:
+                    failed_ranges.append(str(failed_range[0]))
+                else:
+                    failed_ranges.append("%d-%d" % (failed_range[0], failed_range[-1]))
+            raise Exception("Unable to convert images %s of %s" % (",".join(failed_ranges),
+                                                                    self.master_file))
+
+        return self.output_images
 
     def preprocess(self):
         """Set up the conversion"""
@@ -143,7 +202,7 @@ class hdf5_to_cbf_converter(object):
 
         # Multiprocessing
         if not self.nproc:
-            self.nproc = multiprocessing.cpu_count() - 1
+            self.nproc = max(1, multiprocessing.cpu_count() - 1)
 
         # Calculate total number of images in dataset
         self.total_nimages = self.get_number_of_images()
@@ -160,9 +219,17 @@ class hdf5_to_cbf_converter(object):
         self.check_for_output_images()
         
         # Convert images
+        ranges = []
         for range_to_make in self.ranges_to_make:
-            self.convert_images(start_image=range_to_make[0],
-                                end_image=range_to_make[-1])
+            # Single images are done here so the second of a pair can be worked out
+            if range_to_make[0] == range_to_make[-1]:
+                self.convert_images(start_image=range_to_make[0],
+                                    end_image=range_to_make[-1])
+            else:
+                ranges.append(range_to_make)
+        # All the ranges share the workers
+        if ranges:
+            self.convert_ranges(ranges)
 
         # Add previously converted images to output
         for range_not_to_make in self.ranges_not_to_make:
@@ -200,53 +267,65 @@ class hdf5_to_cbf_converter(object):
                 run_process((command, self.verbose))
 
             self.output_images.append(img)
+            if self.callback:
+                self.callback([img])
+
+            self.output_images.sort()
 
         else:
-            # One processor
-            if self.nproc == 1:
-                command = "%s %d:%d %s_" % (command0, start_image, end_image, os.path.join(self.output_dir, self.prefix))
-                run_process((command, self.verbose))
+            self.convert_ranges([range(start_image, end_image+1)])
+
+    def get_pool(self):
+        """Return the pool of workers, starting it on first use"""
+
+        if not self.pool:
+            self.pool = multiprocessing.Pool(processes=self.nproc)
+        return self.pool
+
+    def convert_ranges(self, ranges):
+        """
+        Convert lists of consecutive image numbers in small chunks. The workers
+        each take the next chunk when they finish one, so a slow chunk does not
+        hold up the rest, and images are passed to the callback as their chunk
+        finishes.
+        """
+
+        output_prefix = os.path.join(self.output_dir, self.prefix)
 
-            # Multiple processors
+        number_of_images = sum(len(range_to_make) for range_to_make in ranges)
+        # One processor converts each range in one call
+        if self.nproc == 1:
+            chunk_size = max(len(range_to_make) for range_to_make in ranges)
+        # Keep every worker busy for small conversions
+        else:
+            chunk_size = max(1, min(CHUNK_SIZE, number_of_images / self.nproc))
+
+        chunks = []
+        for range_to_make in ranges:
+            for start in range(range_to_make[0], range_to_make[-1]+1, chunk_size):
+                end = min(start + chunk_size - 1, range_to_make[-1])
+                chunks.append((self.master_file, start, end, output_prefix, self.verbose))
+
+        if self.verbose:
+            print "Converting %d images in %d chunks" % (number_of_images, len(chunks))
+
+        # No workers to start for one processor
+        if self.nproc == 1:
+            results = imap(convert_chunk, chunks)
+        else:
+            results = self.get_pool().imap_unordered(convert_chunk, chunks)
+
+        for start, end, images, attempts in results:
+            if images:
+                if self.verbose:
+                    print "Converted images %d - %d" % (start, end)
+                self.output_images.extend(images)
+                if self.callback:
+                    self.callback(images)
             else:
-                #if active:
-                print "Employing multiple threads"
-
-                # Construct commands to run in parallel
-                number_of_images = end_image - start_image + 1
-                commands = []
-                iteration = 0
-
-                # In case the command may have single image to convert, run this...
-                if number_of_images < 2 * self.nproc:
-                    while iteration < number_of_images:
-                        img = "%s_%06d.cbf" % (os.path.join(self.output_dir, self.prefix), start_image)
-                        commands.append(("%s %d %s" % (command0, start_image, img), self.verbose))
-                        iteration += 1
-                        start_image += 1
-
-                # IF more than 1 image per processor
-                else:
-                    batch = int(number_of_images / self.nproc)
-                    final_batch = batch + (number_of_images % self.nproc)
-
-                    start = start_image
-                    stop = 0
-                    while iteration < self.nproc:
-                        if iteration == (self.nproc - 1) :
-                            batch = final_batch
-                        stop = start + batch -1
-                        commands.append(("%s %d:%d %s_" % (command0, start, stop, os.path.join(self.output_dir, self.prefix)), self.verbose))
-                        iteration += 1
-                        start = stop + 1
-
-                # Run in pool
-                pool = multiprocessing.Pool(processes=self.nproc)
-                pool.map_async(run_process, commands)
-                pool.close()
-                pool.join()
-
-            self.output_images.extend(self.make_image_list(start_image, end_image))
+                print "Unable to convert images %d - %d after %d attempts" % (start, end, attempts)
+                self.failed_images.extend(range(start, end+1))
+
         self.output_images.sort()
 
     def make_image_list(self, start, end):
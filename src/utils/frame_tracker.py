@@ -0,0 +1,308 @@
+"""
+Tracks the frames of a run arriving on disk so plugins can wait for them
+without globbing the run directory or polling for files
+"""
+
+"""
+This file is part of RAPD
+
+Copyright (C) 2018, Cornell University
+All rights reserved.
+
+RAPD is free software: you can redistribute it and/or modify
+it under the terms of the GNU Affero General Public License as published by
+the Free Software Foundation, version 3.
+
+RAPD is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU Affero General Public License for more details.
+
+You should have received a copy of the GNU Affero General Public License
+along with this program.  If not, see <http://www.gnu.org/licenses/>.
+"""
+
+__created__ = "2026-10-18"
+__maintainer__ = "Frank Murphy"
+__email__ = "fmurphy@anl.gov"
+__status__ = "Development"
+
+"""
+Arrivals come from, in order of preference:
+
+  inotify    pyinotify watch on the run directory (IN_CLOSE_WRITE, IN_MOVED_TO)
+  redis      image_collected:* published by the gatherers
+  rescan     a check for the awaited frame once a second while waiting
+
+The directory is listed once when the tracker starts and again only when a
+wait would otherwise fail, so a missed event costs one listdir instead of a
+wrongly detected stall.
+"""
+
+# Standard imports
+import logging
+import os
+import re
+import threading
+
+# RAPD imports
+from utils.schedule import monotonic
+
+try:
+    import pyinotify
+except ImportError:
+    pyinotify = None
+
+# Channel pattern the gatherers publish new images on
+IMAGE_CHANNEL = "image_collected:*"
+# Longest the redis listener blocks before checking if it should stop
+LISTEN_TIMEOUT = 1
+
+class FrameTracker(object):
+    """
+    Keeps a bitmap of the frames of one run that are on disk and the end of
+    the contiguous range from the first frame, and lets callers wait on a
+    condition for a frame to arrive
+    """
+
+    def __init__(self, directory, image_template, first_frame, last_frame,
+                 redis=None, logger=None):
+        """
+        Keyword arguments
+        directory -- directory the run is written to
+        image_template -- image file name with ? for the frame number digits
+        first_frame -- first frame number of the run
+        last_frame -- last frame number of the run
+        redis -- redis_adapter.Database to listen on if inotify is unavailable
+        logger -- logger instance (default RAPDLogger)
+        """
+
+        self.logger = logger or logging.getLogger("RAPDLogger")
+
+        self.directory = directory
+        self.image_template = image_template
+        self.pattern = re.compile("^" + re.sub(r"(\\\?)+", "([0-9]+)", re.escape(image_template)) + "$")
+        self.first_frame = int(first_frame)
+        self.last_frame = int(last_frame)
+        self.redis = redis
+
+        # One byte per frame of the run
+        self.bitmap = bytearray(self.last_frame - self.first_frame + 1)
+        # Highest frame with every frame before it present
+        self.contiguous = self.first_frame - 1
+        # Lowest and highest frame numbers seen, including any outside the run
+        self.lowest = None
+        self.highest = None
+
+        self.condition = threading.Condition()
+        self.running = False
+        self.source = None
+
+        self.notifier = None
+        self.listener = None
+
+    def start(self):
+        """List the directory once and start listening for new frames"""
+
+        self.running = True
+        self.rescan()
+
+        if pyinotify and self.start_inotify():
+            self.source = "inotify"
+        elif self.redis and self.start_redis():
+            self.source = "redis"
+        else:
+            self.source = "rescan"
+
+        self.logger.debug("Tracking frames in %s by %s", self.directory, self.source)
+
+    def stop(self):
+        """Stop listening"""
+
+        self.running = False
+        if self.notifier:
+            self.notifier.stop()
+            self.notifier = None
+        if self.listener:
+            self.listener.join()
+            self.listener = None
+
+    def start_inotify(self):
+        """Watch the run directory, returning False if it cannot be watched"""
+
+        tracker = self
+
+        class EventHandler(pyinotify.ProcessEvent):
+            """Pass finished files to the tracker"""
+            def process_IN_CLOSE_WRITE(self, event):
+                tracker.add_file(event.pathname)
+            def process_IN_MOVED_TO(self, event):
+                tracker.add_file(event.pathname)
+
+        notifier = None
+        try:
+            watch_manager = pyinotify.WatchManager()
+            notifier = pyinotify.ThreadedNotifier(watch_manager, EventHandler())
+            notifier.daemon = True
+            notifier.start()
+            watches = watch_manager.add_watch(self.directory,
+                                              pyinotify.IN_CLOSE_WRITE | pyinotify.IN_MOVED_TO,
+                                              quiet=False)
+        except (pyinotify.WatchManagerError, OSError):
+            self.logger.exception("Unable to watch %s", self.directory)
+            if notifier:
+                notifier.stop()
+            return False
+
+        self.notifier = notifier
+
+        # Frames written while the watch was being set up
+        self.rescan()
+
+        self.logger.debug("inotify watches %s", watches)
+        return True
+
+    def start_redis(self):
+        """Subscribe to new images, returning False if there is no connection"""
+
+        try:
+            pubsub_id = self.redis.psubscribe(pattern=IMAGE_CHANNEL)
+        except Exception:
+            self.logger.exception("Unable to subscribe to %s", IMAGE_CHANNEL)
+            return False
+
+        self.listener = threading.Thread(target=self.listen, args=(pubsub_id,))
+        self.listener.daemon = True
+        self.listener.start()
+
+        # Frames published before the subscription
+        self.rescan()
+
+        return True
+
+    def listen(self, pubsub_id):
+        """Pass published images to the tracker until stopped"""
+
+        try:
+            while self.running:
+                message = self.redis.get_message(pubsub_id, timeout=LISTEN_TIMEOUT)
+                if message and message["type"] == "pmessage":
+                    self.add_file(message["data"])
+        except Exception:
+            self.logger.exception("Lost the image_collected subscription")
+            self.source = "rescan"
+        finally:
+            try:
+                self.redis.pubsubs[pubsub_id].close()
+            except Exception:
+                pass
+
+    def rescan(self):
+        """List the run directory and add every frame found"""
+
+        try:
+            names = os.listdir(self.directory)
+        except OSError:
+            self.logger.debug("Unable to list %s", self.directory)
+            return
+
+        with self.condition:
+            for name in names:
+                match = self.pattern.match(name)
+                if match:
+                    self._add(int(match.group(1)))
+            self.condition.notify_all()
+
+    def add_file(self, fullname):
+        """Add a frame by its file name if it is part of the run"""
+
+        directory, name = os.path.split(fullname)
+        if directory and os.path.normpath(directory) != os.path.normpath(self.directory):
+            return
+        match = self.pattern.match(name)
+        if match:
+            with self.condition:
+                self._add(int(match.group(1)))
+                self.condition.notify_all()
+
+    def _add(self, frame):
+        """Record a frame - call with the condition held"""
+
+        if self.lowest is None or frame < self.lowest:
+            self.lowest = frame
+        if self.highest is None or frame > self.highest:
+            self.highest = frame
+
+        index = frame - self.first_frame
+        if 0 <= index < len(self.bitmap):
+            self.bitmap[index] = 1
+            # Move the end of the contiguous range past everything now present
+            while self.contiguous < self.last_frame and \
+                  self.bitmap[self.contiguous - self.first_frame + 1]:
+                self.contiguous += 1
+
+    def frame_path(self, frame):
+        """Return the full path of a frame"""
+
+        pad = self.image_template.count("?")
+        name = re.sub(r"\?+", "%0*d" % (pad, frame), self.image_template)
+        return os.path.join(self.directory, name)
+
+    def has_frame(self, frame):
+        """Return True if the frame has arrived"""
+
+        with self.condition:
+            return self._has(frame)
+
+    def _has(self, frame):
+        """Return True if the frame has arrived - call with the condition held"""
+
+        index = frame - self.first_frame
+        if 0 <= index < len(self.bitmap):
+            return bool(self.bitmap[index])
+        return self.lowest is not None and self.lowest <= frame <= self.highest
+
+    def first_last(self):
+        """Return the lowest and highest frame numbers present, or (0, 0) if none"""
+
+        with self.condition:
+            if self.lowest is None:
+                return 0, 0
+            return self.lowest, self.highest
+
+    def contiguous_last(self):
+        """Return the highest frame with every frame of the run before it present"""
+
+        with self.condition:
+            return self.contiguous
+
+    def wait_for(self, frame, timeout):
+        """
+        Wait for a frame to arrive, returning True if it has or False if
+        timeout seconds pass first
+
+        Keyword arguments
+        frame -- frame number to wait for
+        timeout -- longest to wait in seconds
+        """
+
+        deadline = monotonic() + timeout
+
+        with self.condition:
+            while not self._has(frame):
+                remaining = deadline - monotonic()
+                if remaining <= 0:
+                    break
+                if self.source == "rescan":
+                    # Nothing will notify, so look for the one file at intervals
+                    self.condition.wait(min(remaining, LISTEN_TIMEOUT))
+                    if os.path.isfile(self.frame_path(frame)):
+                        self._add(frame)
+                else:
+                    self.condition.wait(remaining)
+            else:
+                return True
+
+        # Check the directory before reporting a stall in case an event was missed
+        self.rescan()
+        return self.has_frame(frame)
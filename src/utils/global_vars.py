@@ -52,6 +52,8 @@ __status__ = "Development"
 # Caches for data
 CIF_CACHE = "/tmp/rapd_cache/cif_files"
 TEST_CACHE = "/tmp/rapd_cache/test_data"
+# Local index of PDB unit cells for pdbquery
+PDBQ_CELL_INDEX = "/tmp/rapd_cache/pdbq_cells.npz"
 
 # NE-CAT PDBQ Server
 # tries in order
@@ -0,0 +1,410 @@
+"""
+Shared on-disk cache of structure files from the PDB
+"""
+
+"""
+This file is part of RAPD
+
+Copyright (C) 2018, Cornell University
+All rights reserved.
+
+RAPD is free software: you can redistribute it and/or modify
+it under the terms of the GNU Affero General Public License as published by
+the Free Software Foundation, version 3.
+
+RAPD is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU Affero General Public License for more details.
+
+You should have received a copy of the GNU Affero General Public License
+along with this program.  If not, see <http://www.gnu.org/licenses/>.
+"""
+
+__created__ = "2026-10-18"
+__maintainer__ = "Frank Murphy"
+__email__ = "fmurphy@anl.gov"
+__status__ = "Development"
+
+"""
+Files are stored once by the sha1 of their contents under objects/, read
+only, and a ledger kept under an flock maps each model to its file:
+
+  "cif/1E1O" -> {"sha", "revision", "bytes", "fetched", "used"}
+
+revision is the last entry of _pdbx_audit_revision_history in the file. A
+model fetched more than MODEL_MAX_AGE ago is fetched again, and if the PDB
+has released a new revision the ledger moves to the new file. If the fetch
+fails the old file is still used, so screens keep running offline.
+
+Downloads go to tmp/ and are renamed into objects/, so a file in the cache is
+always complete. Each model has a lock file, so when several jobs want the
+same model only one downloads it and the rest wait and use its copy. When the
+cache is over its quota, the models used least recently are removed.
+"""
+
+# Standard imports
+from contextlib import contextmanager
+import errno
+import fcntl
+import hashlib
+import json
+import logging
+import os
+import Queue
+import shlex
+import shutil
+import threading
+import time
+
+# RAPD imports
+import utils.global_vars as rglobals
+
+# Bytes the cache may hold
+MODEL_CACHE_BYTES = 2 * 1024 * 1024 * 1024
+# Seconds before a model is fetched again to look for a new revision
+MODEL_MAX_AGE = 30 * 24 * 3600
+# Threads downloading models ahead of use
+PREFETCH_THREADS = 4
+# Name of the ledger and its lock in the cache root
+LEDGER = "ledger.json"
+LOCK = "ledger.lock"
+
+# The cache for this process
+MODEL_CACHE = None
+
+def read_revision(path):
+    """
+    Return the latest revision of an mmCIF file as "major.minor", or "0" if
+    it has no revision history
+
+    Keyword arguments
+    path -- mmCIF file
+    """
+
+    prefix = "_pdbx_audit_revision_history."
+    # Column names when the history is a loop
+    columns = []
+    values = {}
+
+    with open(path, "r") as input_file:
+        for line in input_file:
+            if line.startswith(prefix):
+                name, __, value = line.strip().partition(" ")
+                # A single revision has the value on the same line
+                if value.strip():
+                    values[name[len(prefix):]] = value.strip()
+                else:
+                    columns.append(name[len(prefix):])
+            elif columns:
+                # The rows run to the end of the category, latest last
+                if line.startswith(("#", "_", "loop_")):
+                    break
+                fields = shlex.split(line)
+                if len(fields) == len(columns):
+                    values = dict(zip(columns, fields))
+            elif values:
+                break
+
+    if "major_revision" in values:
+        return "%s.%s" % (values["major_revision"], values.get("minor_revision", "0"))
+    return "0"
+
+def get_model_cache(logger=None):
+    """
+    Return the model cache, making it on first use
+
+    Keyword arguments
+    logger -- logger instance (default RAPDLogger)
+    """
+
+    global MODEL_CACHE
+
+    if MODEL_CACHE is None:
+        MODEL_CACHE = ModelCache(logger=logger)
+
+    return MODEL_CACHE
+
+class ModelCache(object):
+    """
+    Gets structure files for jobs, fetching each model once for all of them
+    """
+
+    def __init__(self, root=rglobals.CIF_CACHE, quota=MODEL_CACHE_BYTES,
+                 max_age=MODEL_MAX_AGE, logger=None):
+        """
+        Keyword arguments
+        root -- directory to keep the cache in (default rglobals.CIF_CACHE)
+        quota -- bytes the cache may hold (default MODEL_CACHE_BYTES)
+        max_age -- seconds before a model is fetched again (default MODEL_MAX_AGE)
+        logger -- logger instance (default RAPDLogger)
+        """
+
+        self.logger = logger or logging.getLogger("RAPDLogger")
+
+        self.root = root
+        self.quota = quota
+        self.max_age = max_age
+
+        for directory in ("objects", "locks", "tmp"):
+            try:
+                os.makedirs(os.path.join(self.root, directory))
+            except OSError as error:
+                if error.errno != errno.EEXIST:
+                    raise
+
+    @contextmanager
+    def ledger(self):
+        """Hold the ledger lock and yield the ledger, saving it on the way out"""
+
+        with open(os.path.join(self.root, LOCK), "a") as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            try:
+                ledger_file = os.path.join(self.root, LEDGER)
+                try:
+                    with open(ledger_file, "r") as input_file:
+                        ledger = json.load(input_file)
+                except (IOError, ValueError):
+                    ledger = {}
+
+                yield ledger
+
+                # Replace rather than rewrite so a crash cannot leave half a ledger
+                with open(ledger_file + ".tmp", "w") as output_file:
+                    json.dump(ledger, output_file)
+                os.rename(ledger_file + ".tmp", ledger_file)
+            finally:
+                fcntl.flock(lock, fcntl.LOCK_UN)
+
+    @contextmanager
+    def fetching(self, key):
+        """Hold the lock for fetching one model"""
+
+        lock_file = os.path.join(self.root, "locks", key.replace("/", "_") + ".lock")
+        with open(lock_file, "a") as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock, fcntl.LOCK_UN)
+
+    def object_path(self, sha, kind):
+        """Return where the file with sha is kept"""
+
+        return os.path.join(self.root, "objects", sha[:2], "%s.%s" % (sha, kind))
+
+    def lookup(self, key, kind, fresh=True):
+        """
+        Return the cached file for key and mark it used, or None if it is not
+        cached or, when fresh, is due to be fetched again
+        """
+
+        with self.ledger() as ledger:
+            entry = ledger.get(key)
+            if not entry:
+                return None
+            path = self.object_path(entry["sha"], kind)
+            if not os.path.exists(path):
+                del ledger[key]
+                return None
+            if fresh and time.time() - entry["fetched"] > self.max_age:
+                return None
+            entry["used"] = time.time()
+            return path
+
+    def has(self, pdb_code, kind="cif"):
+        """Return True if the model is in the cache and does not need fetching"""
+
+        key = "%s/%s" % (kind, pdb_code.upper())
+        with self.ledger() as ledger:
+            entry = ledger.get(key)
+            return bool(entry) and \
+                   time.time() - entry["fetched"] <= self.max_age and \
+                   os.path.exists(self.object_path(entry["sha"], kind))
+
+    def get(self, pdb_code, kind, fetch):
+        """
+        Return the path of the cached file for a model, fetching it if needed,
+        or None if it cannot be had
+
+        Keyword arguments
+        pdb_code -- PDB code of the model
+        kind -- file type, "cif" or "pdb"
+        fetch -- function(pdb_code, fname) that downloads the uncompressed
+                 file to fname and returns fname, or False if it cannot
+        """
+
+        key = "%s/%s" % (kind, pdb_code.upper())
+
+        path = self.lookup(key, kind)
+        if path:
+            return path
+
+        with self.fetching(key):
+
+            # Fetched by someone else while waiting for the lock
+            path = self.lookup(key, kind)
+            if path:
+                return path
+
+            path = self.fetch(key, pdb_code, kind, fetch)
+            if path:
+                return path
+
+            # An out of date copy beats none
+            return self.lookup(key, kind, fresh=False)
+
+    def fetch(self, key, pdb_code, kind, fetch):
+        """Download a model and install it in the cache, returning its path or None"""
+
+        temp_path = os.path.join(self.root,
+                                 "tmp",
+                                 "%s.%d.%d.%s" % (pdb_code.lower(),
+                                                  os.getpid(),
+                                                  threading.current_thread().ident,
+                                                  kind))
+        start = time.time()
+        try:
+            fetched = fetch(pdb_code, temp_path)
+        except Exception:
+            self.logger.exception("Error fetching %s", key)
+            fetched = False
+
+        if not fetched or not os.path.exists(temp_path):
+            for leftover in (temp_path, temp_path + ".gz"):
+                if os.path.exists(leftover):
+                    os.remove(leftover)
+            return None
+
+        sha = hashlib.sha1()
+        with open(temp_path, "rb") as input_file:
+            for block in iter(lambda: input_file.read(1024 * 1024), ""):
+                sha.update(block)
+        sha = sha.hexdigest()
+        revision = read_revision(temp_path) if kind == "cif" else "0"
+        nbytes = os.path.getsize(temp_path)
+
+        # Install by rename so the cache never holds part of a file
+        path = self.object_path(sha, kind)
+        if os.path.exists(path):
+            os.remove(temp_path)
+        else:
+            if not os.path.isdir(os.path.dirname(path)):
+                try:
+                    os.makedirs(os.path.dirname(path))
+                except OSError as error:
+                    if error.errno != errno.EEXIST:
+                        raise
+            os.chmod(temp_path, 0444)
+            os.rename(temp_path, path)
+
+        now = time.time()
+        with self.ledger() as ledger:
+            old = ledger.get(key)
+            ledger[key] = {"sha":sha,
+                           "revision":revision,
+                           "bytes":nbytes,
+                           "fetched":now,
+                           "used":now}
+            if old and old["sha"] != sha:
+                self.logger.debug("%s revision %s replaces %s", key, revision, old["revision"])
+                self.remove_unused(ledger, old["sha"], kind)
+            self.evict(ledger, keep=key)
+
+        self.logger.debug("Fetched %s revision %s in %.1f s", key, revision, time.time() - start)
+
+        return path
+
+    def remove_unused(self, ledger, sha, kind):
+        """Remove the file with sha if no model in the ledger uses it"""
+
+        if not any(entry["sha"] == sha for entry in ledger.itervalues()):
+            try:
+                os.remove(self.object_path(sha, kind))
+            except OSError:
+                pass
+
+    def evict(self, ledger, keep=None):
+        """Remove the models used least recently until the cache fits its quota"""
+
+        sizes = dict((entry["sha"], entry["bytes"]) for entry in ledger.itervalues())
+        used = sum(sizes.itervalues())
+        if used <= self.quota:
+            return
+
+        for __, key in sorted((entry["used"], key) for key, entry in ledger.iteritems()):
+            if key == keep:
+                continue
+            entry = ledger.pop(key)
+            self.logger.debug("Evicting %s from the model cache", key)
+            kind = key.split("/")[0]
+            if not any(other["sha"] == entry["sha"] for other in ledger.itervalues()):
+                used -= entry["bytes"]
+                self.remove_unused(ledger, entry["sha"], kind)
+            if used <= self.quota:
+                return
+
+    def install(self, pdb_code, kind, fname, fetch):
+        """
+        Put the file for a model at fname, returning fname or False if it
+        cannot be had. An existing fname is left alone.
+
+        Keyword arguments
+        pdb_code -- PDB code of the model
+        kind -- file type, "cif" or "pdb"
+        fname -- where the file is wanted
+        fetch -- function(pdb_code, fname) that downloads the uncompressed file
+        """
+
+        if os.path.exists(fname):
+            return fname
+
+        path = self.get(pdb_code, kind, fetch)
+        if not path:
+            return False
+
+        # Link where possible - the cached file is read only
+        try:
+            os.link(path, fname)
+        except OSError:
+            shutil.copyfile(path, fname)
+
+        return fname
+
+    def prefetch(self, pdb_codes, kind, fetch, threads=PREFETCH_THREADS):
+        """
+        Start fetching the models that are not cached in background threads,
+        returning the threads
+
+        Keyword arguments
+        pdb_codes -- PDB codes of the models
+        kind -- file type, "cif" or "pdb"
+        fetch -- function(pdb_code, fname) that downloads the uncompressed file
+        threads -- most downloads at once (default PREFETCH_THREADS)
+        """
+
+        missing = Queue.Queue()
+        for pdb_code in pdb_codes:
+            if not self.has(pdb_code, kind):
+                missing.put(pdb_code)
+
+        def worker():
+            """Fetch models until there are none left"""
+            while True:
+                try:
+                    pdb_code = missing.get_nowait()
+                except Queue.Empty:
+                    return
+                try:
+                    self.get(pdb_code, kind, fetch)
+                except Exception:
+                    self.logger.exception("Error prefetching %s", pdb_code)
+
+        workers = []
+        for __ in range(min(threads, missing.qsize())):
+            thread = threading.Thread(target=worker)
+            thread.daemon = True
+            thread.start()
+            workers.append(thread)
+
+        return workers
@@ -38,7 +38,7 @@ from multiprocessing.pool import ThreadPool
 from multiprocessing.managers import BaseManager
 from utils.site import get_ip_address
 from queue import Queue
-from threading import Thread
+from threading import Event, Lock, Thread
 
 import traceback
 #from multiprocessing.pool import Pool
@@ -215,7 +215,8 @@ def local_subprocess(command,
                      pid_queue=False,
                      result_queue=False,
                      tag=False,
-                     shell=False):
+                     shell=False,
+                     work_dir=False):
     """
     Run job as subprocess on local machine. based on xutils.processLocal
 
@@ -226,6 +227,7 @@ def local_subprocess(command,
         logfile - name of a logfile to be generated. The logfile will be STDOUT+STDERR
         pid_queue - a multiprocessing.Queue for placing PID of subprocess in
         tag - an identifying tag to be useful to the caller
+        work_dir - directory to run the command in (default the current one)
     """
     # Need the PIPE otherwise PHENIX jobs dont finish for some reason... 
     if shell:
@@ -234,18 +236,21 @@ def local_subprocess(command,
                      stdout=PIPE,
                      stderr=PIPE,
                      shell=True,
+                     cwd=work_dir or None,
                      bufsize=-1)
     elif isinstance(command, basestring):
         # If command is a string and no shell.
         proc = Popen(shlex.split(command), 
                      stdout=PIPE,
                      stderr=PIPE,
+                     cwd=work_dir or None,
                      bufsize=-1)
     else:
         # no shell and command is a list already.
         proc = Popen(command, 
                      stdout=PIPE,
                      stderr=PIPE,
+                     cwd=work_dir or None,
                      bufsize=-1)
     # print "  running...", command
     # Send back PID if have pid_queue
@@ -301,3 +306,98 @@ def mp_pool_TESTING(nproc=8):
 
 def thread_pool(nproc=8):
     return ThreadPool(processes=nproc)
+
+class JobExecutor(object):
+    """
+    Runs local_subprocess jobs in a ThreadPool and calls back as each one
+    finishes, so results can be handled in the order the jobs complete.
+    Callbacks run one at a time and none run after cancel().
+    """
+
+    def __init__(self, nproc=8, logger=False):
+
+        self.logger = logger
+
+        self.pool = ThreadPool(processes=nproc)
+
+        # name -> pid_queue of the jobs still running
+        self.running = {}
+        # Held while a callback runs
+        self.lock = Lock()
+        # Set when no jobs are running
+        self.idle = Event()
+        self.idle.set()
+        self.cancelled = False
+
+    def submit(self, name, callback, **kwargs):
+        """
+        Run local_subprocess(**kwargs) and call callback(result) when it is
+        done. Returns the AsyncResult.
+        """
+
+        pid_queue = Queue()
+        kwargs["pid_queue"] = pid_queue
+
+        def finished(result):
+            """Hand the result to the callback and note the job is done"""
+            with self.lock:
+                try:
+                    if not self.cancelled:
+                        callback(result)
+                except Exception:
+                    if self.logger:
+                        self.logger.exception("Error finishing %s" % name)
+                finally:
+                    self.running.pop(name, None)
+                    if not self.running:
+                        self.idle.set()
+
+        with self.lock:
+            self.running[name] = pid_queue
+            self.idle.clear()
+
+        return self.pool.apply_async(run_job, (kwargs,), callback=finished)
+
+    def wait(self, timeout=None):
+        """Wait for the jobs, returning False if timeout seconds pass first"""
+
+        # Wait in steps so the thread still sees signals
+        waited = 0
+        while not self.idle.wait(1):
+            waited += 1
+            if timeout and waited >= timeout:
+                return False
+        return True
+
+    def cancel(self):
+        """Drop the callbacks of running jobs and return a dict of their name:pid"""
+
+        with self.lock:
+            self.cancelled = True
+            pids = {}
+            for name, pid_queue in self.running.iteritems():
+                try:
+                    pids[name] = pid_queue.get_nowait()
+                except Exception:
+                    # Not started
+                    pids[name] = None
+            return pids
+
+    def close(self):
+        """Take no more jobs"""
+
+        self.pool.close()
+
+def run_job(kwargs):
+    """Run local_subprocess for a JobExecutor, returning an error result if it fails"""
+
+    result_queue = Queue()
+    try:
+        local_subprocess(result_queue=result_queue, **kwargs)
+        return result_queue.get()
+    except Exception:
+        return {"pid": None,
+                "returncode": -1,
+                "stdout": "",
+                "stderr": traceback.format_exc(),
+                "tag": kwargs.get("tag", False)}
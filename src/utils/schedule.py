@@ -0,0 +1,96 @@
+"""
+Monotonic clock and a simple schedule of periodic tasks for service loops
+"""
+
+"""
+This file is part of RAPD
+
+Copyright (C) 2018, Cornell University
+All rights reserved.
+
+RAPD is free software: you can redistribute it and/or modify
+it under the terms of the GNU Affero General Public License as published by
+the Free Software Foundation, version 3.
+
+RAPD is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU Affero General Public License for more details.
+
+You should have received a copy of the GNU Affero General Public License
+along with this program.  If not, see <http://www.gnu.org/licenses/>.
+"""
+
+__created__ = "2026-10-18"
+__maintainer__ = "Frank Murphy"
+__email__ = "fmurphy@anl.gov"
+__status__ = "Development"
+
+# Standard imports
+import logging
+import os
+import time
+
+try:
+    monotonic = time.monotonic
+except AttributeError:
+    def monotonic():
+        """
+        Return seconds from an arbitrary point that never goes backwards
+
+        Python 2 has no time.monotonic. The elapsed real time from os.times
+        comes from the kernel tick counter, so it is not affected by changes
+        to the wall clock.
+        """
+        return os.times()[4]
+
+class PeriodicTasks(object):
+    """
+    Runs functions at fixed intervals of the monotonic clock from inside a
+    service loop. Missed intervals are skipped rather than run in a burst.
+    """
+
+    def __init__(self, logger=None):
+        """
+        Keyword arguments
+        logger -- logger instance (default RAPDLogger)
+        """
+
+        self.logger = logger or logging.getLogger("RAPDLogger")
+
+        # List of [next due time, interval, function]
+        self.tasks = []
+
+    def add(self, interval, function, run_now=True):
+        """
+        Add a task
+
+        Keyword arguments
+        interval -- seconds between runs
+        function -- called with no arguments
+        run_now -- run on the next call to run_pending (default True)
+        """
+
+        due = monotonic()
+        if not run_now:
+            due += interval
+        self.tasks.append([due, interval, function])
+
+    def run_pending(self):
+        """Run the tasks that are due and return the seconds until the next one"""
+
+        now = monotonic()
+        for task in self.tasks:
+            due, interval, function = task
+            if due <= now:
+                try:
+                    function()
+                except:
+                    self.logger.exception("Error running periodic task %s", function)
+                # Stay on the original beat
+                missed = int((now - due) / interval)
+                task[0] = due + (missed + 1) * interval
+
+        if not self.tasks:
+            return None
+        return max(0.0, min(task[0] for task in self.tasks) - monotonic())
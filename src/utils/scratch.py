@@ -0,0 +1,336 @@
+"""
+Shared RAM disk scratch space for plugin working directories and staged
+source images
+"""
+
+"""
+This file is part of RAPD
+
+Copyright (C) 2018, Cornell University
+All rights reserved.
+
+RAPD is free software: you can redistribute it and/or modify
+it under the terms of the GNU Affero General Public License as published by
+the Free Software Foundation, version 3.
+
+RAPD is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU Affero General Public License for more details.
+
+You should have received a copy of the GNU Affero General Public License
+along with this program.  If not, see <http://www.gnu.org/licenses/>.
+"""
+
+__created__ = "2026-10-18"
+__maintainer__ = "Frank Murphy"
+__email__ = "fmurphy@anl.gov"
+__status__ = "Development"
+
+"""
+Every process on a machine shares one ledger in the scratch root, kept under
+an flock, that records:
+
+  jobs       working directories, the bytes reserved for each, the pid
+             that owns it and, if copying it back failed, where it was
+             meant to go
+  datasets   staged copies of source images, their size, when they were last
+             used and the pids that have them pinned
+
+Space is handed out against a byte quota. When a job or dataset does not fit,
+unpinned datasets are evicted least recently used first, and if that is not
+enough the caller is told there is no room and works on the original disk.
+A pinned dataset is never evicted, so frames cannot disappear from under a
+running job. Entries owned by pids that no longer exist are cleaned up the
+next time the ledger is read, except for working directories that could not
+be copied back, which hold the only copy of their results and are kept.
+"""
+
+# Standard imports
+from contextlib import contextmanager
+from distutils.dir_util import copy_tree
+import errno
+import fcntl
+import hashlib
+import json
+import logging
+import os
+import shutil
+import threading
+import time
+
+# Root of the scratch space
+SCRATCH_ROOT = "/dev/shm/rapd"
+# Fraction of the scratch filesystem to use when no quota is given
+QUOTA_FRACTION = 0.5
+# Bytes reserved for a job working directory when the caller has no estimate
+JOB_BYTES = 256 * 1024 * 1024
+# Name of the ledger and its lock in the scratch root
+LEDGER = "ledger.json"
+LOCK = "ledger.lock"
+
+def pid_alive(pid):
+    """Return True if the process exists"""
+
+    try:
+        os.kill(pid, 0)
+    except OSError as error:
+        return error.errno == errno.EPERM
+    return True
+
+class Scratch(object):
+    """
+    Allocates job directories and stages datasets in the scratch space
+    """
+
+    def __init__(self, root=SCRATCH_ROOT, quota=None, logger=None):
+        """
+        Keyword arguments
+        root -- directory on the RAM disk to work in (default SCRATCH_ROOT)
+        quota -- bytes that may be used (default QUOTA_FRACTION of the filesystem)
+        logger -- logger instance (default RAPDLogger)
+        """
+
+        self.logger = logger or logging.getLogger("RAPDLogger")
+
+        self.root = root
+        if not os.path.isdir(self.root):
+            os.makedirs(self.root)
+
+        if quota is None:
+            stat = os.statvfs(self.root)
+            quota = int(stat.f_blocks * stat.f_frsize * QUOTA_FRACTION)
+        self.quota = quota
+
+        self.pid = os.getpid()
+
+        # Copies back to disk still running
+        self.copies = []
+
+    @contextmanager
+    def ledger(self):
+        """Hold the ledger lock and yield the ledger, saving it on the way out"""
+
+        with open(os.path.join(self.root, LOCK), "a") as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            try:
+                ledger_file = os.path.join(self.root, LEDGER)
+                try:
+                    with open(ledger_file, "r") as input_file:
+                        ledger = json.load(input_file)
+                except (IOError, ValueError):
+                    ledger = {"jobs":{}, "datasets":{}}
+
+                self.clean(ledger)
+
+                yield ledger
+
+                # Replace rather than rewrite so a crash cannot leave half a ledger
+                with open(ledger_file + ".tmp", "w") as output_file:
+                    json.dump(ledger, output_file)
+                os.rename(ledger_file + ".tmp", ledger_file)
+            finally:
+                fcntl.flock(lock, fcntl.LOCK_UN)
+
+    def clean(self, ledger):
+        """Remove the jobs and pins of processes that have gone"""
+
+        for path, job in ledger["jobs"].items():
+            # The only copy of the results
+            if job.get("failed"):
+                continue
+            if not pid_alive(job["pid"]):
+                self.logger.debug("Removing abandoned scratch directory %s", path)
+                shutil.rmtree(path, ignore_errors=True)
+                del ledger["jobs"][path]
+
+        for key, dataset in ledger["datasets"].items():
+            dataset["pins"] = [pid for pid in dataset["pins"] if pid_alive(pid)]
+            # A copy that never finished
+            if not dataset["ready"] and not dataset["pins"]:
+                shutil.rmtree(dataset["path"], ignore_errors=True)
+                del ledger["datasets"][key]
+
+    def used(self, ledger):
+        """Return the bytes taken by the jobs and datasets in the ledger"""
+
+        return sum(job["bytes"] for job in ledger["jobs"].itervalues()) + \
+               sum(dataset["bytes"] for dataset in ledger["datasets"].itervalues())
+
+    def make_room(self, ledger, nbytes):
+        """
+        Evict unpinned datasets, least recently used first, until nbytes fit
+        in the quota, returning False if they cannot
+        """
+
+        if self.used(ledger) + nbytes <= self.quota:
+            return True
+
+        unpinned = sorted((dataset["used"], key) for key, dataset in ledger["datasets"].iteritems()
+                          if not dataset["pins"])
+        for __, key in unpinned:
+            dataset = ledger["datasets"].pop(key)
+            self.logger.debug("Evicting %s from scratch", key)
+            shutil.rmtree(dataset["path"], ignore_errors=True)
+            if self.used(ledger) + nbytes <= self.quota:
+                return True
+
+        return False
+
+    def allocate(self, work_dir, nbytes=JOB_BYTES):
+        """
+        Make a working directory in the scratch space mirroring work_dir and
+        return its path, or None if there is no room
+
+        Keyword arguments
+        work_dir -- directory the results belong in
+        nbytes -- bytes to reserve for the job (default JOB_BYTES)
+        """
+
+        path = os.path.join(self.root, "jobs", work_dir.lstrip(os.sep))
+
+        with self.ledger() as ledger:
+            if path in ledger["jobs"]:
+                self.logger.debug("%s is already in use", path)
+                return None
+            if not self.make_room(ledger, nbytes):
+                self.logger.debug("No room in scratch for %s", work_dir)
+                return None
+            if not os.path.isdir(path):
+                os.makedirs(path)
+            ledger["jobs"][path] = {"bytes":nbytes, "pid":self.pid}
+
+        return path
+
+    def release(self, path, destination, wait=False):
+        """
+        Copy a working directory back to disk in a thread, then free it
+
+        Keyword arguments
+        path -- directory returned by allocate
+        destination -- directory to copy the contents into
+        wait -- do not return until the copy is done
+        """
+
+        thread = threading.Thread(target=self._copy_back, args=(path, destination))
+        thread.start()
+        self.copies.append(thread)
+
+        if wait:
+            thread.join()
+
+        return thread
+
+    def _copy_back(self, path, destination):
+        """Copy the contents of path into destination and remove path"""
+
+        try:
+            copy_tree(path, destination, preserve_symlinks=1)
+        except Exception:
+            self.logger.exception("Could not copy %s back to %s - leaving it in scratch",
+                                  path,
+                                  destination)
+            # Keep the only copy of the results from being cleaned up
+            with self.ledger() as ledger:
+                if path in ledger["jobs"]:
+                    ledger["jobs"][path]["failed"] = destination
+            return
+
+        shutil.rmtree(path, ignore_errors=True)
+        with self.ledger() as ledger:
+            ledger["jobs"].pop(path, None)
+
+    def wait(self):
+        """Wait for copies back to disk to finish"""
+
+        for thread in self.copies:
+            thread.join()
+        self.copies = []
+
+    def stage(self, key, files):
+        """
+        Copy source files into the scratch space, or find an earlier copy,
+        and pin them. Returns a dict of original path:staged path, or None if
+        the files should be read where they are.
+
+        Keyword arguments
+        key -- name of the dataset
+        files -- list of files in the dataset
+        """
+
+        path = os.path.join(self.root, "data", hashlib.sha1(key).hexdigest()[:16])
+        staged = dict((name, os.path.join(path, os.path.basename(name))) for name in files)
+
+        with self.ledger() as ledger:
+            dataset = ledger["datasets"].get(key)
+            if dataset:
+                # Another process is still copying it in
+                if not dataset["ready"]:
+                    return None
+                dataset["pins"].append(self.pid)
+                dataset["used"] = time.time()
+                return staged
+
+            try:
+                nbytes = sum(os.path.getsize(name) for name in files)
+            except OSError:
+                return None
+            if not self.make_room(ledger, nbytes):
+                self.logger.debug("No room in scratch to stage %s", key)
+                return None
+
+            # Reserve the space and keep it from eviction while copying
+            ledger["datasets"][key] = {"path":path,
+                                       "bytes":nbytes,
+                                       "used":time.time(),
+                                       "pins":[self.pid],
+                                       "ready":False}
+
+        try:
+            if not os.path.isdir(path):
+                os.makedirs(path)
+            for name in files:
+                shutil.copy(name, staged[name])
+        except (IOError, OSError):
+            self.logger.exception("Could not stage %s", key)
+            shutil.rmtree(path, ignore_errors=True)
+            with self.ledger() as ledger:
+                ledger["datasets"].pop(key, None)
+            return None
+
+        with self.ledger() as ledger:
+            ledger["datasets"][key]["ready"] = True
+
+        return staged
+
+    def pin(self, key):
+        """Keep a staged dataset from eviction, returning False if it is not staged"""
+
+        with self.ledger() as ledger:
+            dataset = ledger["datasets"].get(key)
+            if not dataset or not dataset["ready"]:
+                return False
+            dataset["pins"].append(self.pid)
+            dataset["used"] = time.time()
+            return True
+
+    def unpin(self, key):
+        """Let a staged dataset be evicted once nobody else has it pinned"""
+
+        with self.ledger() as ledger:
+            dataset = ledger["datasets"].get(key)
+            if dataset and self.pid in dataset["pins"]:
+                dataset["pins"].remove(self.pid)
+                dataset["used"] = time.time()
+
+    def usage(self):
+        """Return a dict of the quota and the bytes used by jobs and datasets"""
+
+        with self.ledger() as ledger:
+            return {"quota":self.quota,
+                    "jobs":sum(job["bytes"] for job in ledger["jobs"].itervalues()),
+                    "datasets":sum(dataset["bytes"]
+                                   for dataset in ledger["datasets"].itervalues()),
+                    "pinned":sum(dataset["bytes"]
+                                 for dataset in ledger["datasets"].itervalues()
+                                 if dataset["pins"])}